@@ -17,6 +17,11 @@ import Actions
 #TODO: Don't import Entity, use some other way to check if instance is
 #   entity in the method functions below
 import Entity
+import Metrics
+
+#Actions performed, by action key
+ACTIONS_PERFORMED = Metrics.Counter('vasir_actions_total',
+    'Actions performed, by action', ('action',))
 
 """=============================================================================
 
@@ -33,12 +38,28 @@ class Action(object):
     which inheirt this Action class, along with keeping track of all Action
     objects which have been instantiated
     -------------------------------------
-    Actions are events that entities perform to help them accomplish goals.'''
-
-    _ACTIONS = {
-        'converse': Actions.converse_definition,
-        'move': Actions.move_definition,
-    }
+    Actions are events that entities perform to help them accomplish goals.
+
+    Millions of actions can be created, so Action uses __slots__ instead of
+    a per instance __dict__.  Actions created from a registered definition
+    (see Actions.register_action) share the definition's requirements and
+    compiled effects, and only store their own dynamic values'''
+    __slots__ = (
+        'source',
+        'target',
+        'requirements',
+        'effects',
+        'add_to_memory',
+        'string_repr',
+        'definition',
+        'values',
+    )
+
+    #All registered actions (see Actions.register_action)
+    _ACTIONS = Actions.ACTIONS
+    #Write-ahead log performed actions are recorded to (see
+    #   WriteAheadLog.attach), or None
+    _journal = None
 
     '''ACTIONS_BY_GOALS
     --------------------
@@ -47,9 +68,23 @@ class Action(object):
     '''
     _ACTIONS_BY_GOALS = {
         #Example:
-        #'goal': [ action_object1, action_object2 ]
+        #'goal': [ action_key1, action_key2 ]
     }
 
+    @classmethod
+    def _build_actions_by_goals(cls):
+        '''_build_actions_by_goals:
+        ------------------
+        Class method which fills in the _ACTIONS_BY_GOALS dict from the
+        'goals' of each action definition in _ACTIONS'''
+        cls._ACTIONS_BY_GOALS = {}
+        for action_key in cls._ACTIONS:
+            for goal in cls._ACTIONS[action_key].get('goals', {}):
+                try:
+                    cls._ACTIONS_BY_GOALS[goal].append(action_key)
+                except KeyError:
+                    cls._ACTIONS_BY_GOALS[goal] = [action_key]
+
     @classmethod
     def _create_action(
         cls,
@@ -62,15 +97,22 @@ class Action(object):
         of factory to create Action objects.  Takes in an action key (
         which is used to get an action from the _ACTIONS dict), a source,
         and optional target (when necessary)'''
-        #Get the parameters
-        action_params = Action._ACTIONS[action_key]['function'](
+        definition = Action._ACTIONS[action_key]
+
+        #Get the dynamic values.  Everything else comes from the definition
+        values = definition['function'](
             source=source,
             target=target,
         )
 
-        if isinstance(action_params, dict):
+        if isinstance(values, dict):
             #Return an action object
-            return Action(**action_params)
+            return Action(
+                source=source,
+                target=values.get('target', target),
+                definition=definition,
+                values=values,
+            )
         else:
             #If the action could NOT be created (the action itself returned
             #   something other than a dict)
@@ -135,17 +177,44 @@ class Action(object):
         #String representation of action
         #--------------------------------
         string_repr=None,
+
+        #--------------------------------
+        #Registered definition
+        #--------------------------------
+        #If a definition (from Actions.register_action) is passed in, the
+        #   requirements, effects, add_to_memory, and string_repr all come
+        #   from the definition, and values holds the dynamic values the
+        #   compiled effects need
+        definition=None,
+        values=None,
             ):
         '''These are properties that every action class will receive by
         default. Sub classes can override and provide more properties.'''
         self.source = source
         self.target = target
+        self.definition = definition
+        self.values = values
+
+        if definition is not None:
+            requirements = definition['requirements']
+            effects = definition['effects']
+            add_to_memory = definition['add_to_memory']
+            string_repr = definition['string_repr']
+
         self.requirements = requirements
         self.effects = effects
         self.add_to_memory = add_to_memory
 
         self.string_repr = string_repr
 
+    def __getstate__(self):
+        #Objects with __slots__ need to provide their own state to be pickled
+        return dict([(slot, getattr(self, slot)) for slot in Action.__slots__])
+
+    def __setstate__(self, state):
+        for slot in state:
+            setattr(self, slot, state[slot])
+
     '''====================================================================
     
     Base overrides
@@ -184,65 +253,36 @@ class Action(object):
         elif target is not None:
             target_to_check = target
 
-        #Assume the requirements are met.  If we encounter something
-        #   that doesn't meet requirements, set this as False and return
-        meets_requirements = True
-   
-        #Now, check for requirements.  The target_to_check could be either
-        #   an entity, object, or location, so we need to do different
-        #   checks depending on the target type
-        #-------------------------------
-        #ENTITY Check
-        #--------------------------------
-        if isinstance(target_to_check, Entity.Entity):
-            for requirement in requirements:
-                #If the current requirement object is a dictionary
-                if isinstance(requirements[requirement], dict):
-                    #Loop through each item in the current requirement dict
-                    for item in requirements[requirement]:
-                        #--------------------
-                        #Check for min and max values
-                        #--------------------
-                        if 'min' in item or 'max' in item:
-                            #Min or max values are provided, so check on the
-                            #   supplied value
-                            if 'min' in item:
-                                #Make sure to remove the min_ text
-                                if target_to_check.__dict__[requirement][item.replace(
-                                        'min', '').replace('_', '')] \
-                                    < requirements[requirement][item]:
-                                    meets_requirements = False
-                                    break
-                            elif 'max' in item:
-                                #Make sure to remove the max_ text
-                                if target_to_check.__dict__[requirement][item.replace(
-                                        'max', '').replace('_','')] \
-                                    > requirements[requirement][item]:
-                                    meets_requirements = False
-                                    break
-
-                        #--------------------
-                        #Min / max not specified, so assume min
-                        #--------------------
-                        elif 'min' not in item and 'max' not in item:
-                            #There is no min or max, so assume it's a minimum
-                            #   value
-                            if target_to_check.__dict__[requirement][item] \
-                                < requirements[requirement][item]:
-                                meets_requirements = False
-                                break
-
-        return meets_requirements
+        #Only entities have requirements to check.  The checks are the same
+        #   compiled checks registered actions use (see
+        #   Actions.compile_requirements)
+        if not isinstance(target_to_check, Entity.Entity):
+            return True
+        return Actions.meets_requirements(target_to_check,
+            Actions.compile_requirements({'target': requirements})['target'])
 
     def perform(self):
         '''perform(self)
         ------------------------------------------
         This function performs the action'''
+        #Log the action before its effects are applied
+        if Action._journal is not None:
+            Action._journal.record_action(self)
+
+        if self.definition is not None:
+            ACTIONS_PERFORMED.labels(self.definition['key']).inc()
+        else:
+            ACTIONS_PERFORMED.labels(self.string_repr).inc()
+
         #If this action has no effects, return True
         if self.effects is None:
             #This action doesn't have any effects, so we're done
             return True
 
+        #Actions from a registered definition use the compiled effects
+        if self.definition is not None:
+            return self.perform_compiled()
+
         #-------------------------------
         #ENTITY Check
         #--------------------------------
@@ -272,7 +312,7 @@ class Action(object):
                     if isinstance(self.effects[target][effect], dict):
                         #Loop through each item in the current dict
                         for item in self.effects[target][effect]:
-                            target_to_use.__dict__[effect][item] \
+                            getattr(target_to_use, effect)[item] \
                                 += self.effects[target][effect][item]
 
                     #------------------------
@@ -311,8 +351,69 @@ class Action(object):
                     #   whatnot
                     #------------------------
                     elif effect == 'position':
-                        target_to_use.__dict__[effect] = self.effects[target][effect]
+                        #Always store positions as a list, so positions
+                        #   can be updated in place (e.g., by Movement)
+                        setattr(target_to_use, effect, list(
+                            self.effects[target][effect]))
+
+        #We're done here
+        return True
+
+    def perform_compiled(self):
+        '''perform_compiled(self)
+        ------------------------------------------
+        Performs the action using the definition's compiled effects (see
+        Actions.compile_effects), filled in with this action's values'''
+        roles = {
+            'source': self.source,
+            'target': self.target,
+        }
+        values = self.values
+
+        for role, operations in self.definition['compiled_effects']:
+            #Get the current target to do effects on
+            target_to_use = roles[role]
+
+            #Update this target's memory, adding this action object
+            if self.add_to_memory:
+                target_to_use.memory.append(self)
+
+            for operation in operations:
+                #------------------------
+                #Network: update the value associated with the other
+                #   role's Entity
+                #------------------------
+                if operation[0] == 'network':
+                    other = roles[operation[1]]
+                    value = values[operation[2]]
+                    try:
+                        target_to_use.network[other.id]['value'] += value
+                    except KeyError:
+                        #Entity is not in this entity's network
+                        target_to_use.network[other.id] = {
+                            'entity': other,
+                            'value': value}
+
+                #------------------------
+                #Position: always stored as a list, so positions can be
+                #   updated in place (e.g., by Movement)
+                #------------------------
+                elif operation[0] == 'position':
+                    target_to_use.position = list(values[operation[1]])
+
+                #------------------------
+                #Add: add a value to a field's attribute (e.g., persona)
+                #------------------------
+                elif operation[0] == 'add':
+                    if operation[4]:
+                        value = operation[3]
+                    else:
+                        value = values[operation[3]]
+                    getattr(target_to_use, operation[1])[operation[2]] \
+                        += value
 
         #We're done here
         return True
 
+#Fill in the goals each action helps accomplish
+Action._build_actions_by_goals()
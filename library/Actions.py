@@ -3,8 +3,12 @@
     ------------
     Contains all possible actions.
 
-    Actions are functions here.  When the action function gets called, it will
-    create an Action object (from the Action class)  
+    Actions are registered here with register_action.  The static parts of
+    an action (requirements, the shape of its effects, target type) are
+    declared and compiled once, when the action is registered.  The action
+    function itself only works out the dynamic values (e.g., how much a
+    conversation changes the network value) each time it is called, and an
+    Action object (from the Action class) is created from the two
 ==========================================================================="""
 """========================================================================
 
@@ -33,6 +37,159 @@ POSSIBLE_TARGETS = {
     'location': 'location',
     'item': 'item',
 }
+
+#CONVERSE_RANGE
+#----------------
+#Entities must be within this distance of each other to converse.  If they
+#   are further apart (but still within CONVERSE_MAX_RANGE), the source entity
+#   will move towards the target first
+CONVERSE_RANGE = 3.0
+CONVERSE_MAX_RANGE = 50.0
+
+#ACTIONS
+#----------------
+#Registry of every action definition, keyed by action key.  Filled in by
+#   register_action
+ACTIONS = {}
+
+#EFFECT_ROLES
+#----------------
+#Effects are declared in terms of these roles, which are filled in with the
+#   action's source and target when the action is performed
+EFFECT_ROLES = ('source', 'target')
+"""=========================================================================
+
+ACTIONS - REGISTRY
+
+============================================================================"""
+def compile_requirements(requirements=None):
+    '''compile_requirements(requirements)
+    -------------------------
+    Takes in a requirements dict (see Action.action_meets_requirements for
+    the format) and returns a dict of role to a tuple of
+    (field, attribute, is_max, value) checks.  Parsing the min_ / max_
+    parts of the keys is done once here instead of on every check'''
+    compiled = {}
+    if requirements is None:
+        return compiled
+
+    for role in requirements:
+        checks = []
+        for field in requirements[role]:
+            for item in requirements[role][field]:
+                is_max = 'max' in item and 'min' not in item
+                attribute = item.replace('min', '').replace(
+                    'max', '').replace('_', '')
+                checks.append((field, attribute, is_max,
+                    requirements[role][field][item]))
+        compiled[role] = tuple(checks)
+
+    return compiled
+
+def meets_requirements(entity, checks):
+    '''meets_requirements(entity, checks)
+    -------------------------
+    Returns True if the entity passes every compiled requirement check
+    (from compile_requirements)'''
+    for field, attribute, is_max, value in checks:
+        current = getattr(entity, field)[attribute]
+        if is_max:
+            if current > value:
+                return False
+        elif current < value:
+            return False
+    return True
+
+def meets_action_requirements(definition, source, target=None):
+    '''meets_action_requirements(definition, source, target)
+    -------------------------
+    Returns True if the source (and the target, if it's an entity) meet
+    an action definition's compiled source and target requirements'''
+    requirements = definition['compiled_requirements']
+    if not meets_requirements(source, requirements.get('source', ())):
+        return False
+    if target is not None and hasattr(target, 'persona'):
+        return meets_requirements(target, requirements.get('target', ()))
+    return True
+
+def compile_effects(effects=None):
+    '''compile_effects(effects)
+    -------------------------
+    Takes in an effects template and returns a tuple of
+    (role, operations) tuples which Action.perform runs through.
+
+    The template is a dict of effect names to dicts which contain the role
+    of the entity affected ('target') and what happens to it:
+        'network': (other role, value name) - adds the value to the
+            affected entity's network value for the other role's entity
+        'position': value name - moves the affected entity
+        <field>: {attribute: value name or number} - adds the value to the
+            affected entity's field[attribute] (e.g., persona, stats)
+    Value names are keys in the dict the action function returns'''
+    compiled = []
+    if effects is None:
+        return tuple(compiled)
+
+    for effect in effects:
+        role = effects[effect]['target']
+        if role not in EFFECT_ROLES:
+            raise ValueError('Invalid effect role: %s' % (role))
+
+        operations = []
+        for field in effects[effect]:
+            if field == 'target':
+                continue
+            value = effects[effect][field]
+
+            if field == 'network':
+                operations.append(('network', value[0], value[1]))
+            elif field == 'position':
+                operations.append(('position', value))
+            elif isinstance(value, dict):
+                for attribute in value:
+                    #Strings are value names, anything else is a constant
+                    is_constant = not isinstance(value[attribute], basestring)
+                    operations.append(('add', field, attribute,
+                        value[attribute], is_constant))
+
+        compiled.append((role, tuple(operations)))
+
+    return tuple(compiled)
+
+def register_action(action_key,
+    function=None,
+    target_required=POSSIBLE_TARGETS['none'],
+    requirements=None,
+    effects=None,
+    add_to_memory=True,
+    string_repr=None,
+    **kwargs):
+    '''register_action(action_key, function, target_required, requirements,
+        effects, add_to_memory, string_repr, **kwargs)
+    -------------------------
+    Compiles and registers an action definition.  The function is called
+    with (source, target) each time the action is created, and returns a
+    dict of the dynamic values the effects need (or something other than a
+    dict if the action can't be performed).  The dict can also contain a
+    'target' key to replace the action's target.
+
+    Any other keyword arguments (goals, preconditions, postconditions,
+    cost, ...) are stored in the definition as is'''
+    definition = {
+        'key': action_key,
+        'function': function,
+        'target_required': target_required,
+        'requirements': requirements,
+        'compiled_requirements': compile_requirements(requirements),
+        'effects': effects,
+        'compiled_effects': compile_effects(effects),
+        'add_to_memory': add_to_memory,
+        'string_repr': string_repr,
+    }
+    definition.update(kwargs)
+
+    ACTIONS[action_key] = definition
+    return definition
 """=========================================================================
 
 ACTIONS - GEOGRAPHY RELATED
@@ -70,9 +227,8 @@ def move(
     #--------------------------------
     #REQUIREMENTS
     #--------------------------------
-    #No requirements to move. 
+    #No requirements to move (see move_definition)
     #TODO: Add in requirements? Must not be sleeping? Etc.?
-    requirements = None 
 
     #--------------------------------
     #Effects
@@ -84,8 +240,8 @@ def move(
     #   more than once, we'll just call the entitiy's move function until
     #   we've moved it to the desired position
     
-    #TODO: This should be set on some sort of timer, shouldn't
-    #   teleport to the location
+    #TODO: This still teleports to the location.  For multi tick movement
+    #   along a path, use Pathfinding.PathMover (see Server) instead
     new_position = target
 
     ''' OLD WAY (Grid based movement)
@@ -117,33 +273,48 @@ def move(
         source.perform_action('move', target)
     '''
 
-    effects = {
-        #Move this entity to the new_position
-        #----------------------------
-        'source': {
-            'target': source,
-            'position': new_position
-        },
-
-    }
-    #Return a dict of all the sources / effects, which will be used to
-    #   generate an Action object (in Action.py)
+    #Return the dynamic values for the effects (see move_definition), which
+    #   will be used to generate an Action object (in Action.py)
     return {
-        'source':source,
-        'target':target,
-        'requirements':requirements,
-        'effects':effects,
-        'add_to_memory': False,
-        'string_repr': 'Moved',
+        'target': target,
+        'position': new_position,
     }
 
 '''--------------------------------------
     Function Definition
     -------------------------------------'''
-move_definition = {
-    'function': move,
-    'target_required': POSSIBLE_TARGETS['location']
-}
+move_definition = register_action('move',
+    function=move,
+    target_required=POSSIBLE_TARGETS['location'],
+    #No requirements to move
+    requirements=None,
+    effects={
+        #Move this entity to the new_position
+        #----------------------------
+        'source': {
+            'target': 'source',
+            'position': 'position',
+        },
+    },
+    add_to_memory=False,
+    string_repr='Moved',
+    #Abstract world state (see Planner.py) needed before, and true after,
+    #   performing this action
+    preconditions={
+        'has_target': True,
+    },
+    postconditions={
+        'near_target': True,
+    },
+    #Goals (from Goals.py) this action helps accomplish, and how much it
+    #   helps (0 to 1)
+    goals={
+        'creativity': 0.4,
+        'self_preservation': 0.3,
+        'wealth': 0.2,
+        'profession': 0.2,
+    },
+)
 """=========================================================================
 
 ACTIONS - ENTITY INTERACTION RELATED
@@ -152,6 +323,28 @@ ACTIONS - ENTITY INTERACTION RELATED
 '''-------------------------------------------------------------------------
     CONVERSE
     ------------------------------------------------------------------------'''
+'''--------------------------------------
+    Requirements
+    -------------------------------------'''
+CONVERSE_REQUIREMENTS = {
+    #Define the source (this entity's) requirements for this action
+    'source': {
+        'persona': {
+            'extraversion_min': -80,
+            'agreeableness_min': -50,
+        },
+    },
+    'target': {
+        'persona': {
+            'extraversion_min': -80, 
+            'agreeableness_min': -50,
+        },
+    },
+}
+
+'''--------------------------------------
+    Function
+    -------------------------------------'''
 #Actions are events that entities perform to help them accomplish goals.
 #   Most actions have a source and target entity (or object or location),
 #   requirements that must be met to perform the action, and effects the
@@ -170,38 +363,23 @@ def converse(
     #--------------------------------
     #REQUIREMENTS
     #--------------------------------
-    #Define requirements Entity must have to preform this action
-    requirements = {
-        #Define the source (this entity's) requirements for this action
-        'source': {
-            'persona': {
-                'extraversion_min': -80,
-                'agreeableness_min': -50,
-            },
-        },
-        'target': {
-            'persona': {
-                'extraversion_min': -80, 
-                'agreeableness_min': -50,
-            },
-        },
-    }
+    #Requirements Entity must have to preform this action are
+    #   CONVERSE_REQUIREMENTS (see converse_definition)
 
     #--------------------------------
     #Position Check
     #--------------------------------
     #We must make sure the entities are within range of each other
-    #   We'll use a distance of 3 as the max
-    #Get distance between both entities
-    dist = math.sqrt(
-        math.pow((source.position[0] - target.position[0]), 
-            2) + math.pow(
-            (source.position[1] - target.position[1]),2)
-    )
-    if dist > 3.0:
-        #If distance is greater then 3, we need to move the entity
-        #   closer
-        if dist < 50.0: 
+    #   We'll use a distance of CONVERSE_RANGE as the max
+    #Get squared distance between both entities (no need to take the square
+    #   root, we can compare against the squared ranges instead)
+    dist_x = source.position[0] - target.position[0]
+    dist_y = source.position[1] - target.position[1]
+    dist_sq = dist_x * dist_x + dist_y * dist_y
+    if dist_sq > CONVERSE_RANGE * CONVERSE_RANGE:
+        #If distance is greater then CONVERSE_RANGE, we need to move the
+        #   entity closer
+        if dist_sq < CONVERSE_MAX_RANGE * CONVERSE_MAX_RANGE: 
             #Just make sure entity is TOO far away
             #TODO: pass in new position that isn't exactly on top of
             #   the exisiting entity
@@ -219,24 +397,9 @@ def converse(
     #--------------------------------
     #Effects
     #--------------------------------
-    #effects is an array of dictionary objects containing the effects
-    #   this action has.  Each effect contains a target, which can be
-    #   an entity / object / location, etc., along with persona (if
-    #   Entity) and other effects
-    effects = {
-        #First effect affects source
-        #----------------------------
-        'source': {
-            'target': source,
-            'network': [ [target, 0] ],
-        },
-        #Second effect affects target
-        #----------------------------
-        'target': {
-            'target': target,
-            'network': [ [source, 0] ],
-        }
-    }
+    #The shape of the effects is declared once in converse_definition.
+    #   Here we only need to work out how much the conversation changes
+    #   both Entities' network values
 
     #Update the 'network' value of the effect
     #   First, get the distance between the extraversion and agreeableness
@@ -280,24 +443,55 @@ def converse(
     if total_dist == 0:
         total_dist = 1
 
-    #   For this entity, update value of the target entity's network effect
-    effects['source']['network'][0][1] = total_dist 
-    effects['target']['network'][0][1] = total_dist 
-
-    #Return a dict of all the sources / effects, which will be used to
-    #   generate an Action object (in Action.py)
+    #Return the dynamic values for the effects (see converse_definition),
+    #   which will be used to generate an Action object (in Action.py)
     return {
-        'source':source,
-        'target':target,
-        'requirements':requirements,
-        'effects':effects,
-        'string_repr': 'Conversation',
+        'network_value': total_dist,
     }
 
 '''--------------------------------------
     Function Definition
     -------------------------------------'''
-converse_definition = {
-    'function': converse,
-    'target_required': POSSIBLE_TARGETS['entity']
-}
+converse_definition = register_action('converse',
+    function=converse,
+    target_required=POSSIBLE_TARGETS['entity'],
+    requirements=CONVERSE_REQUIREMENTS,
+    #effects is a dict of effect templates.  Each effect contains the role
+    #   of the entity it affects ('target'), along with what happens to
+    #   that entity.  Both entities' network values for each other change
+    #   by network_value (which converse() works out)
+    effects={
+        #First effect affects source
+        #----------------------------
+        'source': {
+            'target': 'source',
+            'network': ('target', 'network_value'),
+        },
+        #Second effect affects target
+        #----------------------------
+        'target': {
+            'target': 'target',
+            'network': ('source', 'network_value'),
+        },
+    },
+    string_repr='Conversation',
+    #Abstract world state (see Planner.py) needed before, and true after,
+    #   performing this action
+    preconditions={
+        'has_target': True,
+        'near_target': True,
+    },
+    postconditions={
+        'knows_target': True,
+    },
+    #Goals (from Goals.py) this action helps accomplish, and how much it
+    #   helps (0 to 1)
+    goals={
+        'friendship': 1.0,
+        'romance': 0.8,
+        'respect': 0.6,
+        'power': 0.5,
+        'other_preservation': 0.4,
+        'profession': 0.3,
+    },
+)
@@ -0,0 +1,861 @@
+"""=============================================================================
+    Checkpoint.py
+    ------------
+    Chunked, columnar world checkpoints.  A checkpoint is a directory with a
+    manifest and one file per column of each table:
+
+        world.ckpt/
+            manifest.json
+            entities/id.data, entities/id.index, entities/money.col, ...
+            network/source.col, network/target.col, network/value.col
+            events/key.data, events/key.index, events/state.data, ...
+            memories/owner.col, memories/event.col
+
+    Tables:
+        entities: one row per entity (in handle order).  IDs, names,
+            positions, money, gender, race, persona and stats get a column
+            each (persona and stats values as persona.<trait> and
+            stats.<stat>), and everything else goes in an 'extra' column
+        network: one row per network edge (source row, target row, value)
+        events: one row per action in any entity's memory (the event log)
+        memories: which events are in which entity's memory, in order
+
+    Each column is split into chunks of CHUNK_SIZE rows.  Numbers are stored
+    as arrays of doubles (or ints, for row numbers), and strings / pickled
+    values as a data file plus an index of offsets.  Loading memory maps
+    the files, so a CheckpointReader can look at a column (e.g., every
+    entity's money) without loading the world, and load() only has to copy
+    the arrays into entities.  If numpy is installed, columns are read as
+    numpy arrays straight from the memory map.
+
+    Saving a checkpoint copies the world into arrays and serialized strings
+    (which has to happen in the game loop, so the world doesn't change half
+    way through), then writes the files from a background thread.  Files
+    are fsynced before the checkpoint is moved into place, and the previous
+    checkpoint is kept as <path>.old until then, so a crash always leaves a
+    whole checkpoint to load.
+
+    Usage:
+
+        python Checkpoint.py world.ckpt
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import array
+import cPickle
+import cStringIO
+import json
+import marshal
+import mmap
+import optparse
+import os
+import shutil
+import sys
+import threading
+
+#Vasir Engine imports
+import Action
+import Entity
+import Lazy
+import Race
+
+#Third party (optional)
+numpy = Lazy.lazy_import('numpy')
+
+"""=============================================================================
+
+CHECKPOINT - GLOBAL SETTINGS
+
+============================================================================="""
+CHECKPOINT_VERSION = 1
+
+MANIFEST_FILE = 'manifest.json'
+
+#Number of rows in each chunk
+CHUNK_SIZE = 65536
+
+#Array type codes.  Numbers are stored as doubles (integers are exact up to
+#   2 ** 53), row numbers and string offsets as 32 bit ints
+NUMBER_TYPECODE = 'd'
+ROW_TYPECODE = 'i'
+OFFSET_TYPECODE = 'I'
+#numpy dtypes for the type codes (without the byte order)
+NUMPY_DTYPES = {
+    'd': 'f8',
+    'i': 'i4',
+    'I': 'u4',
+}
+
+#Row number stored for a missing entity (e.g., no target)
+NO_ROW = -1
+
+#Entity attributes stored in their own columns.  Everything else is in the
+#   entity's extra column
+ENTITY_NUMBER_COLUMNS = ('age', 'hunger', 'restedness', 'money')
+ENTITY_STRING_COLUMNS = ('id', 'name')
+
+#Values in 'extra' and 'state' columns start with a tag saying how they're
+#   stored.  Plain data (dicts, lists, numbers, strings) is marshalled,
+#   which loads much faster than pickles; anything else is pickled
+MARSHAL_TAG = 'm'
+PICKLE_TAG = 'p'
+
+"""=============================================================================
+
+CLASS DEFINITIONS
+
+============================================================================="""
+class TableWriter(object):
+    '''TableWriter
+    -------------------------------------
+    Collects a table's columns, a chunk at a time.  Numbers are kept in
+    arrays, strings in a data string plus an array of offsets'''
+    def __init__(self, name, chunk_size=CHUNK_SIZE):
+        self.name = name
+        self.chunk_size = chunk_size
+        self.rows = 0
+        #Dict of column names to a dict of kind ('number', 'row', or
+        #   'string') and the list of chunks
+        self.columns = {}
+        #Order the columns were added in
+        self.column_order = []
+
+    def add_column(self, name, kind):
+        if name not in self.columns:
+            self.columns[name] = {'kind': kind, 'chunks': []}
+            self.column_order.append(name)
+
+    def add_chunk(self, rows, numbers=None, row_numbers=None, strings=None):
+        '''add_chunk(self, rows, numbers, row_numbers, strings)
+        ---------------------------------
+        Adds a chunk of rows.  numbers and row_numbers are dicts of column
+        names to lists of numbers, strings is a dict of column names to
+        lists of strings'''
+        for kind, columns in (('number', numbers),
+            ('row', row_numbers), ('string', strings)):
+            for name in sorted(columns or {}):
+                self.add_column(name, kind)
+                values = columns[name]
+                if kind == 'number':
+                    chunk = {
+                        'values': array.array(NUMBER_TYPECODE, values),
+                        #Integers are given back as ints when loaded
+                        'integer': all([isinstance(value, (int, long))
+                            for value in values]),
+                    }
+                elif kind == 'row':
+                    chunk = {'values': array.array(ROW_TYPECODE, values)}
+                else:
+                    offsets = array.array(OFFSET_TYPECODE, [0])
+                    total = 0
+                    for value in values:
+                        total += len(value)
+                        offsets.append(total)
+                    chunk = {'data': ''.join(values), 'offsets': offsets}
+                self.columns[name]['chunks'].append(chunk)
+        self.rows += rows
+
+    def write(self, path):
+        '''write(self, path)
+        ---------------------------------
+        Writes the column files to the table's directory in path.  Returns
+        the table's manifest entry'''
+        table_path = os.path.join(path, self.name)
+        os.mkdir(table_path)
+
+        manifest = {
+            'rows': self.rows,
+            'columns': {},
+            'column_order': self.column_order,
+        }
+        for name in self.column_order:
+            column = self.columns[name]
+            chunks = []
+            if column['kind'] == 'string':
+                with open(os.path.join(table_path, name + '.data'),
+                    'wb') as data_file:
+                    with open(os.path.join(table_path, name + '.index'),
+                        'wb') as index_file:
+                        for chunk in column['chunks']:
+                            chunks.append({
+                                'offset': data_file.tell(),
+                                'index_offset': index_file.tell(),
+                                'count': len(chunk['offsets']) - 1,
+                            })
+                            data_file.write(chunk['data'])
+                            chunk['offsets'].tofile(index_file)
+                        sync_file(index_file)
+                    sync_file(data_file)
+            else:
+                with open(os.path.join(table_path, name + '.col'),
+                    'wb') as column_file:
+                    for chunk in column['chunks']:
+                        chunks.append({
+                            'offset': column_file.tell(),
+                            'count': len(chunk['values']),
+                        })
+                        if 'integer' in chunk:
+                            chunks[-1]['integer'] = chunk['integer']
+                        chunk['values'].tofile(column_file)
+                    sync_file(column_file)
+            manifest['columns'][name] = {
+                'kind': column['kind'],
+                'chunks': chunks,
+            }
+        sync_directory(table_path)
+        return manifest
+
+class WorldSnapshot(object):
+    '''WorldSnapshot
+    -------------------------------------
+    A copy of the world in columnar form, ready to be written.  Creating
+    one reads every entity, so it has to happen between ticks; writing it
+    doesn't touch the world, so it can happen in another thread'''
+    def __init__(self, tick=0, seed=None, chunk_size=CHUNK_SIZE):
+        self.header = {
+            'version': CHECKPOINT_VERSION,
+            'tick': tick,
+            'seed': seed,
+            'created_count': Entity.Entity._entity_created_count,
+            'chunk_size': chunk_size,
+            'byteorder': sys.byteorder,
+            'itemsizes': dict([(typecode, array.array(typecode).itemsize)
+                for typecode in NUMPY_DTYPES]),
+        }
+        self.tables = {}
+
+        entities = sorted(Entity.Entity._entities.itervalues(),
+            key=lambda entity: entity.handle)
+        #Dict of entity IDs to their row
+        rows = dict([(entity.id, row) for row, entity
+            in enumerate(entities)])
+        persona_keys, stats_keys = get_attribute_keys(entities)
+
+        entity_table = TableWriter('entities', chunk_size)
+        network_table = TableWriter('network', chunk_size)
+        event_table = TableWriter('events', chunk_size)
+        memory_table = TableWriter('memories', chunk_size)
+
+        #Dict of id(action) to event row, so actions shared between
+        #   memories are only stored once
+        events = {}
+        pending_events = []
+        network = {'source': [], 'target': [], 'value': []}
+        memories = {'owner': [], 'event': []}
+
+        for start in xrange(0, len(entities), chunk_size):
+            chunk = entities[start:start + chunk_size]
+            numbers = {}
+            for name in ENTITY_NUMBER_COLUMNS + ('x', 'y', 'z'):
+                numbers[name] = []
+            for key in persona_keys:
+                numbers['persona.' + key] = []
+            for key in stats_keys:
+                numbers['stats.' + key] = []
+            numbers['gender'] = []
+            strings = {'id': [], 'name': [], 'race': [], 'extra': []}
+            targets = []
+
+            pickler = RowPickler(rows)
+            for entity in chunk:
+                for name in ENTITY_STRING_COLUMNS:
+                    strings[name].append(getattr(entity, name))
+                for name in ENTITY_NUMBER_COLUMNS:
+                    numbers[name].append(getattr(entity, name))
+                numbers['x'].append(entity.position[0])
+                numbers['y'].append(entity.position[1])
+                numbers['z'].append(entity.position[2])
+
+                extra = {
+                    'mood': entity.mood,
+                    'goals': entity.goals,
+                    'DEFAULT_ATTRIBUTE_VALUE':
+                        entity.DEFAULT_ATTRIBUTE_VALUE,
+                }
+                #Genders are stored as their index in Entity.Entity.GENDER, and
+                #   races by name.  Anything else goes in extra
+                if entity.gender in Entity.Entity.GENDER:
+                    numbers['gender'].append(
+                        Entity.Entity.GENDER.index(entity.gender))
+                else:
+                    numbers['gender'].append(NO_ROW)
+                    extra['gender'] = entity.gender
+                if type(entity.race) is Race.Race \
+                    and entity.race.__dict__.keys() == ['name']:
+                    strings['race'].append(entity.race.name)
+                else:
+                    strings['race'].append('')
+                    extra['race'] = entity.race
+                #Entities whose persona / stats have different keys than
+                #   the columns keep them in extra instead
+                for field, keys in (('persona', persona_keys),
+                    ('stats', stats_keys)):
+                    values = getattr(entity, field)
+                    if len(values) == len(keys) and all([key in values
+                        for key in keys]):
+                        for key in keys:
+                            numbers['%s.%s' % (field, key)].append(
+                                values[key])
+                    else:
+                        extra[field] = values
+                        for key in keys:
+                            numbers['%s.%s' % (field, key)].append(0)
+
+                target = entity.target
+                if isinstance(target, Entity.Entity) and target.id in rows:
+                    targets.append(rows[target.id])
+                else:
+                    targets.append(NO_ROW)
+                    if target is not None:
+                        extra['target'] = target
+                strings['extra'].append(pickler.dumps(extra))
+
+                row = rows[entity.id]
+                for other_id in entity.network:
+                    if other_id in rows:
+                        network['source'].append(row)
+                        network['target'].append(rows[other_id])
+                        network['value'].append(
+                            entity.network[other_id]['value'])
+
+                for action in entity.memory:
+                    try:
+                        event = events[id(action)]
+                    except KeyError:
+                        event = events[id(action)] = len(events)
+                        pending_events.append(action)
+                    memories['owner'].append(row)
+                    memories['event'].append(event)
+
+            entity_table.add_chunk(len(chunk), numbers=numbers,
+                row_numbers={'target': targets}, strings=strings)
+
+        for start in xrange(0, len(network['source']), chunk_size):
+            end = start + chunk_size
+            network_table.add_chunk(len(network['source'][start:end]),
+                numbers={'value': network['value'][start:end]},
+                row_numbers={
+                    'source': network['source'][start:end],
+                    'target': network['target'][start:end],
+                })
+
+        for start in xrange(0, len(memories['owner']), chunk_size):
+            end = start + chunk_size
+            memory_table.add_chunk(len(memories['owner'][start:end]),
+                row_numbers={
+                    'owner': memories['owner'][start:end],
+                    'event': memories['event'][start:end],
+                })
+
+        for start in xrange(0, len(pending_events), chunk_size):
+            chunk = pending_events[start:start + chunk_size]
+            pickler = RowPickler(rows)
+            columns = {'source': [], 'target': []}
+            strings = {'key': [], 'state': []}
+            for action in chunk:
+                state = action.__getstate__()
+                definition = state.pop('definition')
+                key = ''
+                if definition is not None:
+                    key = definition['key']
+                    #Everything else comes from the definition
+                    for slot in ('requirements', 'effects',
+                        'add_to_memory', 'string_repr'):
+                        state.pop(slot)
+                strings['key'].append(key)
+                for role in ('source', 'target'):
+                    value = state[role]
+                    if value is None:
+                        columns[role].append(NO_ROW)
+                        del state[role]
+                    elif isinstance(value, Entity.Entity) \
+                        and value.id in rows:
+                        columns[role].append(rows[value.id])
+                        del state[role]
+                    else:
+                        columns[role].append(NO_ROW)
+                strings['state'].append(pickler.dumps(state))
+            event_table.add_chunk(len(chunk), row_numbers=columns,
+                strings=strings)
+
+        for table in (entity_table, network_table, event_table,
+            memory_table):
+            self.tables[table.name] = table
+
+    def write(self, path):
+        '''write(self, path)
+        ---------------------------------
+        Writes the checkpoint to the directory path.  It's written (and
+        fsynced) next to path first, then moved into place, so a crash
+        never leaves a half written checkpoint.  The previous checkpoint is
+        moved to <path>.old while the new one is moved into place, and
+        load() falls back to it if path is missing'''
+        temp_path = '%s.tmp' % (path)
+        if os.path.exists(temp_path):
+            shutil.rmtree(temp_path)
+        os.mkdir(temp_path)
+
+        manifest = dict(self.header)
+        manifest['tables'] = {}
+        for name in sorted(self.tables):
+            manifest['tables'][name] = self.tables[name].write(temp_path)
+
+        with open(os.path.join(temp_path, MANIFEST_FILE), 'w') \
+            as manifest_file:
+            json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+            sync_file(manifest_file)
+        sync_directory(temp_path)
+
+        old_path = get_old_path(path)
+        parent_path = os.path.dirname(os.path.abspath(path))
+        if os.path.exists(path):
+            if os.path.exists(old_path):
+                shutil.rmtree(old_path)
+            os.rename(path, old_path)
+        os.rename(temp_path, path)
+        sync_directory(parent_path)
+        if os.path.exists(old_path):
+            shutil.rmtree(old_path)
+
+class RowPickler(object):
+    '''RowPickler
+    -------------------------------------
+    Serializes values one row at a time, marshalling plain data and
+    pickling anything else.  Entities are pickled as their row in the
+    entities table, so a row never pulls in the rest of the world'''
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = cStringIO.StringIO()
+        self.pickler = cPickle.Pickler(self.buffer, 2)
+        self.pickler.persistent_id = self.get_persistent_id
+
+    def get_persistent_id(self, obj):
+        if isinstance(obj, Entity.Entity):
+            #Entities which aren't in the world are stored as None
+            return str(self.rows.get(obj.id, NO_ROW))
+        return None
+
+    def dumps(self, value):
+        try:
+            return MARSHAL_TAG + marshal.dumps(value, 2)
+        except ValueError:
+            #Not plain data
+            pass
+
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        #Each row has to be loadable on its own
+        self.pickler.clear_memo()
+        self.pickler.dump(value)
+        return PICKLE_TAG + self.buffer.getvalue()
+
+class CheckpointReader(object):
+    '''CheckpointReader
+    -------------------------------------
+    Reads a checkpoint's columns straight from memory mapped files, without
+    loading the world.  e.g.:
+
+        reader = CheckpointReader('world.ckpt')
+        money = reader.get_column('entities', 'money')
+        names = reader.get_column('entities', 'name')'''
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE)) as manifest_file:
+            self.manifest = json.load(manifest_file)
+        if self.manifest.get('version') != CHECKPOINT_VERSION:
+            raise ValueError('Unsupported checkpoint version: %s' % (
+                self.manifest.get('version')))
+        for typecode in NUMPY_DTYPES:
+            if self.manifest['itemsizes'][typecode] \
+                != array.array(typecode).itemsize:
+                raise ValueError('Checkpoint was saved on an incompatible '
+                    'platform')
+        self.swap_bytes = self.manifest['byteorder'] != sys.byteorder
+
+        #Dict of file paths to their memory maps
+        self.maps = {}
+
+    def close(self):
+        for memory_map in self.maps.itervalues():
+            if memory_map is not None:
+                memory_map.close()
+        self.maps = {}
+
+    def get_rows(self, table):
+        return self.manifest['tables'][table]['rows']
+
+    def get_columns(self, table):
+        return list(self.manifest['tables'][table]['column_order'])
+
+    def get_map(self, table, filename):
+        '''get_map(self, table, filename)
+        ---------------------------------
+        Returns the memory map of one of a table's files (or None, if the
+        file is empty - empty files can't be memory mapped)'''
+        path = os.path.join(self.path, table, filename)
+        try:
+            return self.maps[path]
+        except KeyError:
+            memory_map = None
+            with open(path, 'rb') as map_file:
+                if os.fstat(map_file.fileno()).st_size > 0:
+                    memory_map = mmap.mmap(map_file.fileno(), 0,
+                        access=mmap.ACCESS_READ)
+            self.maps[path] = memory_map
+            return memory_map
+
+    def read_array(self, table, filename, typecode, offset, count):
+        '''read_array(self, table, filename, typecode, offset, count)
+        ---------------------------------
+        Returns count values of typecode, starting at byte offset of a
+        table's file.  With numpy, this is a view of the memory map (no
+        copy); otherwise it's an array'''
+        memory_map = self.get_map(table, filename)
+        if numpy is not None:
+            byteorder = '<'
+            if self.manifest['byteorder'] == 'big':
+                byteorder = '>'
+            if memory_map is None or count == 0:
+                return numpy.zeros(0, byteorder + NUMPY_DTYPES[typecode])
+            return numpy.frombuffer(memory_map,
+                dtype=byteorder + NUMPY_DTYPES[typecode],
+                count=count, offset=offset)
+
+        values = array.array(typecode)
+        if memory_map is not None and count > 0:
+            values.fromstring(memory_map[offset:
+                offset + count * values.itemsize])
+            if self.swap_bytes:
+                values.byteswap()
+        return values
+
+    def get_chunk(self, table, column, chunk_index):
+        '''get_chunk(self, table, column, chunk_index)
+        ---------------------------------
+        Returns one chunk of a column: an array of numbers, or a list of
+        strings.  Number chunks which were all integers are given back as
+        a list of ints'''
+        info = self.manifest['tables'][table]['columns'][column]
+        chunk = info['chunks'][chunk_index]
+        if info['kind'] == 'string':
+            offsets = self.read_array(table, column + '.index',
+                OFFSET_TYPECODE, chunk['index_offset'], chunk['count'] + 1)
+            memory_map = self.get_map(table, column + '.data')
+            start = chunk['offset']
+            values = []
+            for i in xrange(chunk['count']):
+                values.append(memory_map[start + int(offsets[i]):
+                    start + int(offsets[i + 1])] if memory_map is not None
+                    else '')
+            return values
+
+        typecode = ROW_TYPECODE
+        if info['kind'] == 'number':
+            typecode = NUMBER_TYPECODE
+        values = self.read_array(table, column + '.col', typecode,
+            chunk['offset'], chunk['count'])
+        if chunk.get('integer'):
+            return [int(value) for value in values]
+        return values
+
+    def get_chunk_count(self, table, column):
+        '''get_chunk_count(self, table, column)
+        ---------------------------------
+        Returns the number of chunks in a column (0 for an empty table,
+        whose columns aren't saved)'''
+        try:
+            return len(self.manifest['tables'][table]['columns'][column][
+                'chunks'])
+        except KeyError:
+            return 0
+
+    def get_column(self, table, column):
+        '''get_column(self, table, column)
+        ---------------------------------
+        Returns a whole column, as a list'''
+        values = []
+        for chunk_index in xrange(self.get_chunk_count(table, column)):
+            values.extend(self.get_chunk(table, column, chunk_index))
+        return values
+
+class CheckpointWriter(object):
+    '''CheckpointWriter
+    -------------------------------------
+    Saves checkpoints, writing the files from a background thread.  Only one
+    checkpoint is written at a time; save() skips a checkpoint if the last
+    one is still being written'''
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.thread = None
+        #Error raised by the last background write, if any
+        self.error = None
+        self.saved = 0
+
+    def is_writing(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def save(self, path, tick=0, seed=None, background=True):
+        '''save(self, path, tick, seed, background)
+        ---------------------------------
+        Copies the world and writes it to path (in a background thread, if
+        background is True).  Returns False if the last checkpoint is still
+        being written'''
+        if self.is_writing():
+            return False
+        snapshot = WorldSnapshot(tick, seed, self.chunk_size)
+        if not background:
+            snapshot.write(path)
+            self.saved += 1
+            return True
+
+        self.error = None
+        self.thread = threading.Thread(target=self.write,
+            args=(snapshot, path))
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+    def write(self, snapshot, path):
+        try:
+            snapshot.write(path)
+            self.saved += 1
+        except Exception as error:
+            self.error = error
+
+    def wait(self):
+        '''wait(self)
+        ---------------------------------
+        Waits for the checkpoint being written (if any) to finish.  Raises
+        the error the write failed with, if it failed'''
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+def get_attribute_keys(entities):
+    '''get_attribute_keys(entities)
+    ---------------------------------
+    Returns a tuple of the (persona keys, stats keys) which get their own
+    columns - those of the first entity'''
+    if len(entities) < 1:
+        return ((), ())
+    return (tuple(sorted(entities[0].persona)),
+        tuple(sorted(entities[0].stats)))
+
+def sync_file(open_file):
+    '''sync_file(open_file)
+    ---------------------------------
+    Flushes and fsyncs an open file, so its contents survive a crash'''
+    open_file.flush()
+    os.fsync(open_file.fileno())
+
+def sync_directory(path):
+    '''sync_directory(path)
+    ---------------------------------
+    Makes sure files created in (or renamed into) the directory survive a
+    crash'''
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    handle = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(handle)
+    finally:
+        os.close(handle)
+
+def get_old_path(path):
+    '''get_old_path(path)
+    ---------------------------------
+    Returns the path the previous checkpoint is kept at while a new one is
+    moved into place'''
+    return '%s.old' % (path)
+
+def get_path(path):
+    '''get_path(path)
+    ---------------------------------
+    Returns path, or the previous checkpoint (<path>.old) if a crash left
+    only that one'''
+    if not os.path.isfile(os.path.join(path, MANIFEST_FILE)) \
+        and os.path.isfile(os.path.join(get_old_path(path),
+        MANIFEST_FILE)):
+        return get_old_path(path)
+    return path
+
+def save(path, tick=0, seed=None, chunk_size=CHUNK_SIZE):
+    '''save(path, tick, seed, chunk_size)
+    ---------------------------------
+    Saves the world to the checkpoint directory path (in this thread)'''
+    WorldSnapshot(tick, seed, chunk_size).write(path)
+
+def load(path):
+    '''load(path)
+    ---------------------------------
+    Replaces the world with the one saved in the checkpoint directory at
+    path (or <path>.old, see get_path).  Entities get new handles.  Returns
+    the checkpoint's manifest (a dict with tick and seed keys, among
+    others)'''
+    reader = CheckpointReader(get_path(path))
+    try:
+        return load_world(reader)
+    finally:
+        reader.close()
+
+def load_world(reader):
+    '''load_world(reader)
+    ---------------------------------
+    Replaces the world with the one in a CheckpointReader's checkpoint'''
+    manifest = reader.manifest
+    table = manifest['tables']['entities']
+    count = table['rows']
+
+    #Create every entity first, so references to entities which haven't
+    #   been loaded yet can be filled in
+    entities = [Entity.Entity.__new__(Entity.Entity)
+        for i in xrange(count)]
+
+    def get_entity(row):
+        row = int(row)
+        if row == NO_ROW:
+            return None
+        return entities[row]
+
+    def loads(value):
+        if value[0] == MARSHAL_TAG:
+            return marshal.loads(value[1:])
+        unpickler = cPickle.Unpickler(cStringIO.StringIO(value[1:]))
+        unpickler.persistent_load = get_entity
+        return unpickler.load()
+
+    persona_keys = [name[len('persona.'):] for name in table['column_order']
+        if name.startswith('persona.')]
+    stats_keys = [name[len('stats.'):] for name in table['column_order']
+        if name.startswith('stats.')]
+
+    row = 0
+    for chunk_index in xrange(reader.get_chunk_count('entities', 'id')):
+        columns = {}
+        for name in table['column_order']:
+            columns[name] = reader.get_chunk('entities', name, chunk_index)
+
+        for i in xrange(len(columns['id'])):
+            entity = entities[row]
+            #IDs are interned, the same as when entities spawn
+            entity.id = intern(columns['id'][i])
+            entity.name = columns['name'][i]
+            for name in ENTITY_NUMBER_COLUMNS:
+                setattr(entity, name, columns[name][i])
+            entity.position = [columns['x'][i], columns['y'][i],
+                columns['z'][i]]
+            entity.target = get_entity(columns['target'][i])
+            entity.memory = []
+            entity.network = {}
+            if columns['gender'][i] != NO_ROW:
+                entity.gender = Entity.Entity.GENDER[int(columns['gender'][i])]
+            if columns['race'][i]:
+                entity.race = Race.Race()
+                entity.race.name = columns['race'][i]
+
+            extra = loads(columns['extra'][i])
+            entity.persona = extra.pop('persona', None)
+            if entity.persona is None:
+                entity.persona = dict([(key, columns['persona.' + key][i])
+                    for key in persona_keys])
+            entity.stats = extra.pop('stats', None)
+            if entity.stats is None:
+                entity.stats = dict([(key, columns['stats.' + key][i])
+                    for key in stats_keys])
+            for name in extra:
+                setattr(entity, name, extra[name])
+            row += 1
+
+    for chunk_index in xrange(reader.get_chunk_count('network', 'source')):
+        sources = reader.get_chunk('network', 'source', chunk_index)
+        targets = reader.get_chunk('network', 'target', chunk_index)
+        values = reader.get_chunk('network', 'value', chunk_index)
+        for i in xrange(len(sources)):
+            other = entities[targets[i]]
+            entities[sources[i]].network[other.id] = {
+                'entity': other,
+                'value': values[i],
+            }
+
+    events = []
+    for chunk_index in xrange(reader.get_chunk_count('events', 'key')):
+        keys = reader.get_chunk('events', 'key', chunk_index)
+        sources = reader.get_chunk('events', 'source', chunk_index)
+        targets = reader.get_chunk('events', 'target', chunk_index)
+        states = reader.get_chunk('events', 'state', chunk_index)
+        for i in xrange(len(keys)):
+            state = loads(states[i])
+            state.setdefault('source', get_entity(sources[i]))
+            state.setdefault('target', get_entity(targets[i]))
+            state['definition'] = None
+            if keys[i]:
+                definition = Action.Action._ACTIONS[keys[i]]
+                state['definition'] = definition
+                state['requirements'] = definition['requirements']
+                state['effects'] = definition['effects']
+                state['add_to_memory'] = definition['add_to_memory']
+                state['string_repr'] = definition['string_repr']
+            action = Action.Action.__new__(Action.Action)
+            action.__setstate__(state)
+            events.append(action)
+
+    for chunk_index in xrange(reader.get_chunk_count('memories', 'owner')):
+        owners = reader.get_chunk('memories', 'owner', chunk_index)
+        event_rows = reader.get_chunk('memories', 'event', chunk_index)
+        for i in xrange(len(owners)):
+            entities[owners[i]].memory.append(events[event_rows[i]])
+
+    Entity.Entity.reset_world()
+    for entity in entities:
+        Entity.Entity._registry.spawn(entity)
+    Entity.Entity._entity_created_count = manifest['created_count']
+    return manifest
+
+def get_size(path):
+    '''get_size(path)
+    ---------------------------------
+    Returns the size, in bytes, of the checkpoint directory at path'''
+    size = 0
+    for directory, names, filenames in os.walk(path):
+        for filename in filenames:
+            size += os.path.getsize(os.path.join(directory, filename))
+    return size
+
+def is_checkpoint(path):
+    '''is_checkpoint(path)
+    ---------------------------------
+    Returns True if path is a checkpoint directory (or was, and a crash
+    left only <path>.old, see get_path)'''
+    return os.path.isfile(os.path.join(get_path(path), MANIFEST_FILE))
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(usage='%prog [options] checkpoint')
+    parser.add_option('--column', default=None,
+        help='Print the values of a column (e.g., entities.money)')
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('A checkpoint is required')
+
+    reader = CheckpointReader(args[0])
+    if options.column is not None:
+        table, column = options.column.split('.', 1)
+        for value in reader.get_column(table, column):
+            print value
+    else:
+        print 'Tick %s, seed %s' % (reader.manifest['tick'],
+            reader.manifest['seed'])
+        for table in sorted(reader.manifest['tables']):
+            print '%s: %s rows' % (table, reader.get_rows(table))
+            print '    %s' % (', '.join(reader.get_columns(table)))
+    reader.close()
@@ -11,20 +11,23 @@ IMPORTS
 
 ============================================================================="""
 #Standard python imports
-import datetime
 import math
 import random 
 #Other imports
+import Lazy
 import Race
 import Goals
+import Registry
 
 #Actions Entity will inherit / can perform 
 import Action
-import data.names_list
+import Names
+import Utility
 
-#Third party
-#import cairo_plot_new.cairoplot as CairoPlot
-#import cairo
+#Third party (optional)
+#   CairoPlot is only used by visualize_persona, so it's imported the first
+#   time it's used
+CairoPlot = Lazy.lazy_import('cairo_plot_new.cairoplot')
 
 def log_message(message='',show_log=True):
     if show_log:
@@ -41,12 +44,56 @@ class Entity(object):
     entities (characters, creatures, etc.).  When instaniating an Entity object
     we can pass in persona, name, etc. values OR have the entity automatically
     generate those attributes for us.  By default, it will automatically 
-    generate values'''
+    generate values
+
+    Entities use __slots__ instead of a per instance __dict__, which keeps
+    the memory used by each entity down when there are millions of them'''
+    __slots__ = (
+        #Description (str)
+        'name',
+        'id',
+        #Generational handle from the registry (int), None once despawned
+        'handle',
+        #Characteristics
+        'age',              #int
+        'race',             #Race object
+        'gender',           #tuple of (int, str), from GENDER
+        'hunger',           #int
+        'restedness',       #int
+        #Stats (dict of str to int)
+        'stats',
+        #Wealth (int)
+        'money',
+        #Persona (dict of str to int), and the default persona value
+        'persona',
+        'DEFAULT_ATTRIBUTE_VALUE',
+        #Memory (list of Action objects)
+        'memory',
+        #Network (dict of entity IDs to {'entity': Entity, 'value': int})
+        'network',
+        #Mood (dict)
+        'mood',
+        #Goals (dict of goal keys to dicts, from get_goals)
+        'goals',
+        #Position (list of [x, y, z])
+        'position',
+        #Target (None, an Entity, a list of Entities, or a location)
+        'target',
+        #Lets other objects keep weak references to an entity
+        '__weakref__',
+    )
+
     #Keep a count of how many entities have been created
     _entity_created_count = 0
     #_entities will be a dict of all created entity objects, represented
     #   by their ID and the value being the object itself
     _entities = {}
+    #_registry owns all live entities (and keeps _entities up to date).
+    #   Entities are added when created and removed with despawn()
+    _registry = Registry.EntityRegistry(_entities)
+    #_journal is the write-ahead log changes to entities are recorded to
+    #   (see WriteAheadLog.attach), or None
+    _journal = None
 
     #Store gender values
     GENDER = (
@@ -438,7 +485,10 @@ class Entity(object):
         Entity._entity_created_count += 1
 
         #Add this entity to the list of entities created
-        Entity._entities[self.id] = self
+        Entity._registry.spawn(self)
+
+        if Entity._journal is not None:
+            Entity._journal.record_spawn(self)
 
 
     '''====================================================================
@@ -454,6 +504,45 @@ class Entity(object):
     def __repr__(self):
         return '''< %s >''' % (self.id)
 
+    def __getstate__(self):
+        #Objects with __slots__ need to provide their own state to be pickled
+        state = {}
+        for slot in Entity.__slots__:
+            #Weak references can't be pickled
+            if slot == '__weakref__':
+                continue
+            try:
+                state[slot] = getattr(self, slot)
+            except AttributeError:
+                pass
+        return state
+
+    def __setstate__(self, state):
+        for slot in state:
+            setattr(self, slot, state[slot])
+
+    def despawn(self):
+        '''despawn(self)
+        ---------------------------------
+        Removes this entity from the world.  Other entities forget about
+        it (see Registry.EntityRegistry.despawn_many).  Returns False if the
+        entity was already despawned'''
+        entity_id = self.id
+        despawned = Entity._registry.despawn(self)
+        if despawned and Entity._journal is not None:
+            Entity._journal.record_despawn(entity_id)
+        return despawned
+
+    @classmethod
+    def reset_world(cls):
+        '''reset_world(cls)
+        ---------------------------------
+        Removes all entities and cached decisions, so a world can be loaded
+        into (or a session started from) an empty world'''
+        cls._registry.clear()
+        cls._entity_created_count = 0
+        Utility.get_planner().clear()
+
     def print_info(self):
         print '''
 ID: %s
@@ -497,6 +586,7 @@ Network: %s
 
         return '''({
             id: '%s',
+            handle: %s,
             name: '%s',
             target: %s,
             gender: '%s',
@@ -508,6 +598,7 @@ Network: %s
             network: %s
         })''' % (
             self.id,
+            self.handle,
             self.name,
             target,
             self.gender[1],
@@ -566,27 +657,24 @@ Network: %s
         and returns the value if it is found.  If it is NOT found,
         it will return the alternative_return_value'''
 
-        #Get the dict representation of the entity and return the 
+        #Get the attribute of the entity and return the 
         #   disired value from the passed in parameters
         ret_value = alternative_return_value
 
         if dict_key is not None:
             #First key passed in
-            try:
-                ret_value = self.__dict__[dict_key]
-            except KeyError:
-                ret_value = alternative_return_value
+            ret_value = getattr(self, dict_key, alternative_return_value)
             if dict_key_2 is not None:
                 #Second key passed in key passed in
                 try:
-                    ret_value = self.__dict__[dict_key][dict_key_2]
-                except KeyError:
+                    ret_value = getattr(self, dict_key)[dict_key_2]
+                except (AttributeError, KeyError):
                     ret_value = alternative_return_value
                 if dict_key_3 is not None:
                     #Third key passed in
                     try:
-                        ret_value = self.__dict__[dict_key][dict_key_2][dict_key_3]
-                    except KeyError:
+                        ret_value = getattr(self, dict_key)[dict_key_2][dict_key_3]
+                    except (AttributeError, KeyError):
                         ret_value = alternative_return_value
         #return it
         return ret_value
@@ -737,7 +825,11 @@ Network: %s
         now, we'll just print an ASCII bar graph
         
         If other entity_entity is passed in, this will print a scattor plot
-        with both entity values'''
+        with both entity values.  Returns False if CairoPlot isn't
+        installed (or can't be imported)'''
+        if Lazy.load(CairoPlot) is None:
+            print 'CairoPlot is not installed, can not visualize persona'
+            return False
 
         #--------------------------------
         #Print bar graph of self persona
@@ -870,9 +962,10 @@ Network: %s
     def generate_name(self):
         '''generate_name(self)
         ---------------------------------
-        This method randomly generates a name for the entity'''
-        name = data.names_list.names[random.randint(0, 
-            len(data.names_list.names) - 1)]
+        This method randomly generates a name for the entity.  Names are
+        synthesized from the name list (see Names.py), so there is no limit
+        to how many different names there are'''
+        name = Names.generate_name()
         return name
 
     #=====================================================================
@@ -897,8 +990,8 @@ Network: %s
         '''randomize_persona(self)
         ---------------------------------
         This method goes through each persona attribute and assigns a random
-        value to it'''
-        random.seed(datetime.datetime.now())
+        value to it.  Uses the global random generator, which the server
+        seeds (see Server.seed) so sessions can be replayed'''
         for attribute in self.persona:
             self.persona[attribute] = random.randint(
                 Entity.MIN_PERSONA_ATTRIBUTE_VALUE,
@@ -988,6 +1081,9 @@ Network: %s
 
         #Calculate the Pearson score
         attr_len = len(attribute_list)
+        if attr_len == 0:
+            #Nothing to compare (e.g., neither entity has any goals)
+            return 0
         pearson_numerator = product_sum - (ent1_sum * ent2_sum / attr_len)
         pearson_den = math.sqrt((ent1_sum_sq - pow(ent1_sum,2) / attr_len) \
             * (ent2_sum_sq - pow(ent2_sum,2) / attr_len))
@@ -1109,11 +1205,18 @@ Network: %s
         ----------------------------
         Set's this entity's target to the passed in target. Can be
         a list of targets, an individual target, or None (will clear target).
-        Can also be set as self.'''
+        Can also be set as self.  An entity ID or handle can be passed in
+        instead of an entity'''
         if isinstance(target, str):
             target = Entity._entities[target]
+        elif isinstance(target, (int, long)):
+            #Stale handles (of despawned entities) clear the target
+            target = Entity._registry.get(target)
         self.target = target
 
+        if Entity._journal is not None:
+            Entity._journal.record_target(self)
+
     def get_target(self):
         '''get_target(self):
         ----------------------------
@@ -1133,15 +1236,23 @@ Network: %s
     #TODO: General: Get rid of target parameter (use self.target)
     #   (How to handle position / object / item as targets?)
     def get_action(self, 
-        action_key='converse',
+        action_key=None,
         target=None):
         '''get_action(self)
         ----------------------------------------------
         Determines which action the Entity should perform.  Will return an
-        Action object, but not actually perform the action'''
+        Action object, but not actually perform the action.  If no action_key
+        is passed in, the utility planner picks the action which best helps
+        the Entity's goals'''
         if target is None:
             target = self.target
 
+        if action_key is None:
+            action_key = Utility.get_planner().choose_action(self, target)
+            if action_key is None:
+                #Nothing useful to do
+                return False
+
         return Action.Action._create_action(action_key, self, target)
 
     def perform_action(self, action=None,
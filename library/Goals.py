@@ -15,7 +15,9 @@ Goals
 
 ============================================================================="""
 '''Persona values are a tuple of (MIN, MAX), where MIN and MAX are
-percentage values that indicate the range of possible persona values'''
+percentage values that indicate the range of possible persona values.
+desired_state (optional) is the abstract world state (see Planner.py) the
+entity tries to reach to pursue the goal'''
 GOALS = {
     'self_preservation': {
         'persona': {
@@ -42,18 +44,27 @@ GOALS = {
             'conscientiousness': (.4, 1.0),
             
         },
+        'desired_state': {
+            'knows_target': True,
+        },
     },
     'wealth': {
         'persona': {
             'openness': (-1.0, .7),
             'conscientiousness': (0.0, 1.0),
         },
+        'desired_state': {
+            'knows_target': True,
+        },
     },
     'profession': {
         'persona': {
             'conscientiousness': (.3,1.0),
             'neuroticism': (-1.0, .5),
         },
+        'desired_state': {
+            'knows_target': True,
+        },
     },
     'friendship': {
         'persona': {
@@ -61,18 +72,27 @@ GOALS = {
             'extraversion': (0.0, 1.0),
             'agreeableness': (-.5, 1.0),
         },
+        'desired_state': {
+            'knows_target': True,
+        },
     },
     'romance': {
         'persona': {
             'openness': (-.2, 1.0),
             'agreeableness': (-.5, 1.0),
         },
+        'desired_state': {
+            'knows_target': True,
+        },
     },
     'respect': {
         'persona': {
             'conscientiousness': (.4,1.0),
             'extraversion': (.5,1.0),
         },
+        'desired_state': {
+            'knows_target': True,
+        },
     },
     'creativity': {
         'persona': {
@@ -0,0 +1,258 @@
+"""=============================================================================
+    Interest.py
+    ------------
+    Contains the InterestManager class definition.  Publishing every entity
+    to every client each tick means fan-out bandwidth grows with the size
+    of the world times the number of clients, even though each client only
+    looks at a small part of it.  Instead, clients subscribe to a viewport
+    (a rectangle of the world) and / or a set of entity IDs they follow,
+    and get their own channel with only those entities on it.
+
+    Viewports are resolved with a spatial hash built once per tick, and
+    each entity's JSON is only generated once per tick no matter how many
+    clients see it, so the cost of publishing scales with what clients
+    actually see.
+
+    JSON messages always have every entity the client sees.  Binary updates
+    (see Wire.py) are a stream, so each client gets its own Wire.Encoder,
+    and between keyframes only the entities which changed this tick are
+    looked at.  Binary updates only say when an entity despawns, not when
+    it leaves the client's viewport; clients drop entities outside their
+    viewport themselves (keyframes have everything the client sees, so
+    anything left over is cleared then too).
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+#Vasir Engine imports
+import Metrics
+import Spatial
+import Wire
+
+"""=============================================================================
+
+INTEREST - GLOBAL SETTINGS
+
+============================================================================="""
+#Each client's updates are published to this channel plus the client ID
+CHANNEL_PREFIX = 'engine:game_state:client:'
+
+#Size of the spatial hash cells used to find the entities in viewports.
+#   Viewports are usually much bigger than the converse range the default
+#   cell size is tuned for
+DEFAULT_CELL_SIZE = 10.0
+
+#Metrics
+SUBSCRIBERS = Metrics.Gauge('vasir_interest_subscribers',
+    'Clients subscribed to their own game state channel')
+ENTITIES_SENT = Metrics.Counter('vasir_interest_entities_sent_total',
+    'Entities published to subscribed clients (an entity seen by two '
+    'clients counts twice)')
+
+"""=============================================================================
+
+CLASS DEFINITIONS
+
+============================================================================="""
+class InterestManager(object):
+    '''InterestManager
+    -------------------------------------
+    Keeps track of what each subscribed client is interested in (a viewport
+    and / or a set of entity IDs) and builds the game state message for
+    each client's channel, as JSON or (if wire_format is
+    Wire.FORMAT_BINARY) binary updates'''
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE,
+        wire_format=Wire.FORMAT_JSON):
+        self.cell_size = cell_size
+        self.wire_format = wire_format
+
+        #Dict of client IDs to their viewport, as
+        #   ((min_x, min_y), (max_x, max_y))
+        self.viewports = {}
+        #Dict of client IDs to a set of the entity IDs they follow
+        self.followed = {}
+        #Dict of client IDs to their Wire.Encoder, for binary updates
+        self.encoders = {}
+
+    def __len__(self):
+        return len(self.get_clients())
+
+    def __contains__(self, client_id):
+        return client_id in self.viewports or client_id in self.followed
+
+    def get_clients(self):
+        '''get_clients(self)
+        ---------------------------------
+        Returns a set of the IDs of every subscribed client'''
+        return set(self.viewports) | set(self.followed)
+
+    def get_viewport_center(self, client_id):
+        '''get_viewport_center(self, client_id)
+        ---------------------------------
+        Returns the (x, y) centre of the client's viewport.  Raises a
+        KeyError if the client has no viewport'''
+        min_position, max_position = self.viewports[client_id]
+        return ((min_position[0] + max_position[0]) / 2.0,
+            (min_position[1] + max_position[1]) / 2.0)
+
+    '''====================================================================
+
+    Subscriptions
+
+    ======================================================================='''
+    def subscribe_viewport(self, client_id, corner_a, corner_b):
+        '''subscribe_viewport(self, client_id, corner_a, corner_b)
+        ---------------------------------
+        Sets (or moves) the client's viewport to the rectangle between two
+        opposite (x, y) corners'''
+        self.viewports[client_id] = (
+            (min(corner_a[0], corner_b[0]), min(corner_a[1], corner_b[1])),
+            (max(corner_a[0], corner_b[0]), max(corner_a[1], corner_b[1])),
+        )
+        SUBSCRIBERS.set(len(self))
+
+    def subscribe_entities(self, client_id, entity_ids):
+        '''subscribe_entities(self, client_id, entity_ids)
+        ---------------------------------
+        Replaces the set of entity IDs the client follows.  Followed
+        entities are sent wherever they are, even outside the client's
+        viewport'''
+        self.followed[client_id] = set(entity_ids)
+        SUBSCRIBERS.set(len(self))
+
+    def unsubscribe(self, client_id):
+        '''unsubscribe(self, client_id)
+        ---------------------------------
+        Removes the client's viewport and followed entities.  Returns False
+        if the client wasn't subscribed'''
+        found = client_id in self
+        self.viewports.pop(client_id, None)
+        self.followed.pop(client_id, None)
+        self.encoders.pop(client_id, None)
+        SUBSCRIBERS.set(len(self))
+        return found
+
+    '''====================================================================
+
+    Publishing
+
+    ======================================================================='''
+    def get_visible(self, entities):
+        '''get_visible(self, entities)
+        ---------------------------------
+        Takes in a dict of entity IDs to entities (e.g., the entities
+        simulated this tick) and returns a dict of client IDs to a list of
+        the IDs of the entities each client sees'''
+        spatial_hash = None
+        if len(self.viewports) > 0:
+            spatial_hash = Spatial.SpatialHash.from_entities(entities,
+                cell_size=self.cell_size)
+
+        visible = {}
+        for client_id in self.get_clients():
+            if client_id in self.viewports:
+                min_position, max_position = self.viewports[client_id]
+                entity_ids = spatial_hash.query_rect(min_position,
+                    max_position)
+            else:
+                entity_ids = []
+
+            followed = self.followed.get(client_id)
+            if followed:
+                seen = set(entity_ids)
+                for entity_id in followed:
+                    if entity_id in entities and entity_id not in seen:
+                        entity_ids.append(entity_id)
+
+            visible[client_id] = entity_ids
+
+        return visible
+
+    def get_messages(self, entities, tick=0, changed=None):
+        '''get_messages(self, entities, tick, changed)
+        ---------------------------------
+        Takes in a dict of entity IDs to every entity (e.g.,
+        Entity._entities) and returns a list of (channel, message) tuples,
+        one for each subscribed client.  Messages are in the same format as
+        the engine:game_state broadcast.  changed is a dict of the entities
+        which changed this tick (e.g., the ones simulated), which is all
+        binary updates need between keyframes'''
+        if self.wire_format == Wire.FORMAT_BINARY:
+            return self.get_binary_messages(entities, tick, changed)
+
+        #Entity JSON, by entity ID, shared between clients
+        entities_json = {}
+        messages = []
+
+        visible = self.get_visible(entities)
+        for client_id in visible:
+            client_json = []
+            for entity_id in visible[client_id]:
+                try:
+                    client_json.append(entities_json[entity_id])
+                except KeyError:
+                    #Remove the first and trailing ( )'s, since we're
+                    #   returning a list, not an individual object
+                    entity_json = entities[entity_id].get_info_json()[1:-1]
+                    entities_json[entity_id] = entity_json
+                    client_json.append(entity_json)
+
+            ENTITIES_SENT.inc(len(client_json))
+            messages.append((
+                get_channel(client_id),
+                '({game_state: { entities: [%s] } })' % (
+                    ','.join(client_json)),
+            ))
+
+        return messages
+
+    def get_binary_messages(self, entities, tick, changed=None):
+        '''get_binary_messages(self, entities, tick, changed)
+        ---------------------------------
+        Returns a list of (channel, binary update) tuples, one for each
+        subscribed client.  Keyframes are built from every entity, and
+        updates from the changed entities (every entity if changed is
+        None)'''
+        if changed is None:
+            changed = entities
+        messages = []
+
+        #Only found if some client needs it this tick
+        visible = None
+        keyframe_visible = None
+        for client_id in self.get_clients():
+            try:
+                encoder = self.encoders[client_id]
+            except KeyError:
+                encoder = self.encoders[client_id] = Wire.Encoder()
+
+            if encoder.is_keyframe_due(tick):
+                if keyframe_visible is None:
+                    keyframe_visible = self.get_visible(entities)
+                client_entities = [entities[entity_id]
+                    for entity_id in keyframe_visible[client_id]]
+            else:
+                if visible is None:
+                    visible = self.get_visible(changed)
+                client_entities = [changed[entity_id]
+                    for entity_id in visible[client_id]]
+            ENTITIES_SENT.inc(len(client_entities))
+            messages.append((
+                get_channel(client_id),
+                encoder.encode(client_entities, tick),
+            ))
+
+        return messages
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+def get_channel(client_id):
+    '''get_channel(client_id)
+    ---------------------------------
+    Returns the channel a client's game state updates are published to'''
+    return CHANNEL_PREFIX + client_id
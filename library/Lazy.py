@@ -0,0 +1,104 @@
+"""=============================================================================
+    Lazy.py
+    ------------
+    Lazy imports.  Heavy modules (numpy, zmq, redis, plotting, etc.) are
+    only needed by some parts of the engine, so instead of importing them
+    when the engine starts up, modules get a LazyModule which imports the
+    real module the first time one of its attributes is used.  This keeps
+    startup fast for tests and worker processes which only simulate
+    entities.
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import importlib
+import pkgutil
+
+"""=============================================================================
+
+CLASS DEFINITIONS
+
+============================================================================="""
+class LazyModule(object):
+    '''LazyModule
+    -------------------------------------
+    Stands in for a module until one of its attributes is used, then
+    imports it.  After the import, the module's attributes are copied onto
+    this object so later lookups are as fast as they are on the module'''
+    def __init__(self, name):
+        self.__dict__['_lazy_name'] = name
+        self.__dict__['_lazy_module'] = None
+
+    def __repr__(self):
+        return '<lazy module %s>' % (self._lazy_name)
+
+    def _lazy_load(self):
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            module = importlib.import_module(self._lazy_name)
+            self.__dict__['_lazy_module'] = module
+            self.__dict__.update(module.__dict__)
+        return module
+
+    def __getattr__(self, attribute):
+        #Only called for attributes which aren't copied over yet
+        return getattr(self._lazy_load(), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self._lazy_load(), attribute, value)
+        self.__dict__[attribute] = value
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+def is_available(name):
+    '''is_available(name)
+    ---------------------------------
+    Returns True if the module can be imported, without importing it (the
+    parent packages of a dotted name are imported)'''
+    try:
+        return pkgutil.find_loader(name) is not None
+    except ImportError:
+        return False
+
+def lazy_import(name):
+    '''lazy_import(name)
+    ---------------------------------
+    Returns a LazyModule for the module name, or None if the module isn't
+    installed.  Use it for optional dependencies the same way as:
+
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+
+    except the module is only imported when it's first used'''
+    if not is_available(name):
+        return None
+    return LazyModule(name)
+
+def load(module):
+    '''load(module)
+    ---------------------------------
+    Imports the passed in LazyModule now and returns it.  Returns None if
+    the module is None or can't be imported (a module can be installed but
+    fail to import, e.g., when one of its own dependencies is missing)'''
+    if isinstance(module, LazyModule):
+        try:
+            module._lazy_load()
+        except ImportError:
+            return None
+    return module
+
+def is_loaded(module):
+    '''is_loaded(module)
+    ---------------------------------
+    Returns True if the passed in module (or LazyModule) has been
+    imported'''
+    if isinstance(module, LazyModule):
+        return module.__dict__['_lazy_module'] is not None
+    return module is not None
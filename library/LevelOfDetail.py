@@ -0,0 +1,253 @@
+"""=============================================================================
+    LevelOfDetail.py
+    ------------
+    Contains the LevelOfDetail class definition.  Not every entity needs to
+    be fully simulated every tick - entities far away from anyone watching
+    can be updated less often (or just get rough, statistical updates),
+    which lets the world grow much larger than full rate simulation allows.
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import math
+import random
+
+#Vasir Engine imports
+import Spatial
+
+"""=============================================================================
+
+LEVEL OF DETAIL - GLOBAL SETTINGS
+
+============================================================================="""
+#TIERS
+#----------------
+#   full: Updated every tick.  Entities near an observer, or which were in a
+#       conversation recently
+#   reduced: Updated every reduced_interval ticks.  Entities somewhat near an
+#       observer
+#   coarse: Only get a statistical update every coarse_interval ticks
+#       (persona drift and network decay), no movement or actions
+TIER_FULL = 'full'
+TIER_REDUCED = 'reduced'
+TIER_COARSE = 'coarse'
+TIERS = (TIER_FULL, TIER_REDUCED, TIER_COARSE)
+
+#How much (standard deviation) persona values drift each tick, for coarse
+#   entities
+PERSONA_DRIFT_PER_TICK = 0.2
+#How much network values decay (towards 0) each tick, for coarse entities
+NETWORK_DECAY_PER_TICK = 0.001
+
+"""=============================================================================
+
+CLASS DEFINITIONS
+
+============================================================================="""
+class LevelOfDetail(object):
+    '''LevelOfDetail
+    -------------------------------------
+    Assigns entities to simulation tiers based on how close they are to
+    observers (e.g., the positions clients are looking at) and how recently
+    they were in a conversation.  When there are no observers, every entity
+    is in the full tier.  The Server makes the centre of every subscribed
+    client's viewport (see Interest.py) an observer, under the client's ID,
+    so the entities clients see are fully simulated; observers can also be
+    set directly, for clients which don't subscribe to a viewport.
+
+    Tiers are only reassigned every reassign_interval ticks, since finding
+    the entities around each observer is the expensive part'''
+    def __init__(self,
+        full_radius=25.0,
+        reduced_radius=75.0,
+        reduced_interval=5,
+        coarse_interval=25,
+        conversation_ticks=50,
+        reassign_interval=5,
+        seed=None):
+        self.full_radius = full_radius
+        self.reduced_radius = reduced_radius
+        self.reduced_interval = reduced_interval
+        self.coarse_interval = coarse_interval
+        self.conversation_ticks = conversation_ticks
+        self.reassign_interval = reassign_interval
+
+        self.rng = random.Random(seed)
+
+        #Dict of observer IDs to their (x, y) position
+        self.observers = {}
+        #Dict of entity IDs to the last tick they were in a conversation
+        self.recent_conversations = {}
+        #Dict of entity IDs to their tier.  Entities not in here are coarse
+        self.tiers = {}
+        self.last_assigned_tick = None
+        #List of the entities given a coarse update on the last update.
+        #   They changed, but aren't in the entities update returns
+        self.coarse_updated = []
+
+    '''====================================================================
+
+    Observers / Conversations
+
+    ======================================================================='''
+    def set_observer(self, observer_id, position):
+        '''set_observer(self, observer_id, position)
+        ---------------------------------
+        Adds (or moves) an observer.  Tiers are reassigned on the next
+        update'''
+        self.observers[observer_id] = (position[0], position[1])
+        self.last_assigned_tick = None
+
+    def remove_observer(self, observer_id):
+        '''remove_observer(self, observer_id)
+        ---------------------------------
+        Removes an observer.  Returns False if it didn't exist'''
+        try:
+            del self.observers[observer_id]
+        except KeyError:
+            return False
+        self.last_assigned_tick = None
+        return True
+
+    def mark_conversation(self, entity_ids, tick):
+        '''mark_conversation(self, entity_ids, tick)
+        ---------------------------------
+        Keeps entities which were just in a conversation at full detail for
+        the next conversation_ticks ticks'''
+        for entity_id in entity_ids:
+            self.recent_conversations[entity_id] = tick
+            self.tiers[entity_id] = TIER_FULL
+
+    '''====================================================================
+
+    Tiers
+
+    ======================================================================='''
+    def get_tier(self, entity_id):
+        if len(self.observers) < 1:
+            return TIER_FULL
+        return self.tiers.get(entity_id, TIER_COARSE)
+
+    def assign_tiers(self, entities, tick):
+        '''assign_tiers(self, entities, tick)
+        ---------------------------------
+        Takes in a dict of entity IDs to entities and reassigns every
+        entity's tier'''
+        self.last_assigned_tick = tick
+        tiers = {}
+
+        if len(self.observers) > 0:
+            spatial_hash = Spatial.SpatialHash.from_entities(entities,
+                cell_size=self.full_radius)
+            for position in self.observers.itervalues():
+                for entity_id, dist in spatial_hash.query_radius(position,
+                    self.reduced_radius):
+                    if dist <= self.full_radius:
+                        tiers[entity_id] = TIER_FULL
+                    elif entity_id not in tiers:
+                        tiers[entity_id] = TIER_REDUCED
+
+        #Recent conversations are always fully simulated
+        for entity_id in self.recent_conversations.keys():
+            if tick - self.recent_conversations[entity_id] \
+                > self.conversation_ticks or entity_id not in entities:
+                del self.recent_conversations[entity_id]
+            else:
+                tiers[entity_id] = TIER_FULL
+
+        self.tiers = tiers
+        return tiers
+
+    def is_due(self, entity_id, tier, tick):
+        '''is_due(self, entity_id, tier, tick)
+        ---------------------------------
+        Returns True if an entity in the passed in tier should be updated
+        this tick.  Entities are spread out over the interval (based on
+        their ID) so they don't all update on the same tick'''
+        if tier == TIER_FULL:
+            return True
+        elif tier == TIER_REDUCED:
+            interval = self.reduced_interval
+        else:
+            interval = self.coarse_interval
+
+        return (tick + hash(entity_id)) % interval == 0
+
+    def update(self, entities, tick):
+        '''update(self, entities, tick)
+        ---------------------------------
+        Takes in a dict of entity IDs to entities (e.g., Entity._entities)
+        and the current tick.  Reassigns tiers if needed, applies coarse
+        updates to coarse entities which are due, and returns a dict of
+        entity IDs to entities which should be fully simulated (moved,
+        perform actions, published) this tick'''
+        if len(self.observers) < 1:
+            #Nobody is watching a particular part of the world, so
+            #   simulate everything
+            self.coarse_updated = []
+            return entities
+
+        if self.last_assigned_tick is None \
+            or tick - self.last_assigned_tick >= self.reassign_interval:
+            self.assign_tiers(entities, tick)
+
+        tiers = self.tiers
+        active = {}
+        coarse = []
+        for entity_id in entities:
+            tier = tiers.get(entity_id, TIER_COARSE)
+            if not self.is_due(entity_id, tier, tick):
+                continue
+
+            if tier == TIER_COARSE:
+                coarse.append(entities[entity_id])
+            else:
+                active[entity_id] = entities[entity_id]
+
+        self.coarse_update(coarse, self.coarse_interval)
+        self.coarse_updated = coarse
+
+        return active
+
+    '''====================================================================
+
+    Coarse updates
+
+    ======================================================================='''
+    def coarse_update(self, entities, ticks):
+        '''coarse_update(self, entities, ticks)
+        ---------------------------------
+        Applies a statistical approximation of ticks worth of simulation to
+        each of the passed in entities.  Persona values drift a little
+        (a random walk, so the drift grows with the square root of the
+        number of ticks) and network values decay towards 0'''
+        if len(entities) < 1:
+            return
+
+        drift = PERSONA_DRIFT_PER_TICK * math.sqrt(ticks)
+        decay = math.pow(1.0 - NETWORK_DECAY_PER_TICK, ticks)
+        gauss = self.rng.gauss
+        uniform = self.rng.random
+
+        for entity in entities:
+            min_value = entity.MIN_PERSONA_ATTRIBUTE_VALUE
+            max_value = entity.MAX_PERSONA_ATTRIBUTE_VALUE
+
+            persona = entity.persona
+            for attribute in persona:
+                value = int(round(persona[attribute] + gauss(0, drift)))
+                persona[attribute] = min(max(value, min_value), max_value)
+
+            #Network values are whole numbers, and small values decay by
+            #   less than one each pass (so rounding would never decay
+            #   them).  They're rounded up or down at random instead, in
+            #   proportion to the fraction, so they decay by the right
+            #   amount on average
+            for network_item in entity.network.itervalues():
+                value = network_item['value'] * decay
+                rounded = math.floor(value)
+                if uniform() < value - rounded:
+                    rounded += 1
+                network_item['value'] = int(rounded)
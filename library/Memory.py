@@ -0,0 +1,315 @@
+"""=============================================================================
+    Memory.py
+    ------------
+    Memory accounting.  get_report() estimates how many bytes each part of
+    the engine uses (entities, personas, networks, memories, pending
+    actions, and serialization buffers), so growth in any one of them shows
+    up long before the process runs out of memory.  Sizes are worked out by
+    walking each subsystem's containers with sys.getsizeof, counting every
+    object once.  In big worlds only a sample of the entities is walked,
+    and the sizes are scaled up to the whole world.
+
+    A MemoryTracer reports where memory is being allocated.  It uses
+    tracemalloc when it's installed; otherwise it reports the object types
+    with the most instances (from the garbage collector).  Both report how
+    much each allocator grew since the last report, to help find leaks.
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import collections
+import gc
+import itertools
+import sys
+import types
+
+#Vasir Engine imports
+import Actions
+import Entity
+import Lazy
+import Names
+
+#Third party (optional)
+#   tracemalloc is part of python 3.4+ (and available for python 2 as
+#   pytracemalloc)
+tracemalloc = Lazy.lazy_import('tracemalloc')
+
+"""=============================================================================
+
+MEMORY - GLOBAL SETTINGS
+
+============================================================================="""
+#Number of entities walked to estimate the per entity subsystems.  None
+#   walks every entity
+DEFAULT_SAMPLE_SIZE = 1000
+
+#Number of allocators a MemoryTracer reports
+DEFAULT_TOP = 20
+#Number of stack frames tracemalloc keeps for each allocation
+TRACEMALLOC_FRAMES = 1
+
+#SUBSYSTEMS
+#----------------
+#Subsystems get_report() reports, in order
+SUBSYSTEMS = (
+    'entities',
+    'personas',
+    'networks',
+    'memories',
+    'pending_actions',
+    'serialization',
+)
+
+#Objects of these types are never walked into.  Entities are accounted
+#   for by the entities subsystem, and modules, classes and functions are
+#   shared code rather than data
+STOP_TYPES = (
+    Entity.Entity,
+    types.ModuleType,
+    type,
+    types.ClassType,
+    types.FunctionType,
+    types.BuiltinFunctionType,
+    types.MethodType,
+)
+
+"""=============================================================================
+
+CLASS DEFINITIONS
+
+============================================================================="""
+class MemoryTracer(object):
+    '''MemoryTracer
+    -------------------------------------
+    Reports the top allocators (source lines with tracemalloc, otherwise
+    object types), and how much each grew since the last report'''
+    def __init__(self, top=DEFAULT_TOP):
+        self.top = top
+        self.enabled = False
+        #Last tracemalloc snapshot, or tuple of dicts of type names to
+        #   (counts, sizes)
+        self.previous = None
+
+    def start(self):
+        '''start(self)
+        ---------------------------------
+        Starts tracing.  Returns False if it's already tracing'''
+        if self.enabled:
+            return False
+        if tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        self.enabled = True
+        self.previous = None
+        return True
+
+    def stop(self):
+        '''stop(self)
+        ---------------------------------
+        Stops tracing.  Returns False if it wasn't tracing'''
+        if not self.enabled:
+            return False
+        if tracemalloc is not None:
+            tracemalloc.stop()
+        self.enabled = False
+        self.previous = None
+        return True
+
+    def get_stats(self):
+        '''get_stats(self)
+        ---------------------------------
+        Returns a dict of whether tracing is enabled, how the allocators
+        were found ('tracemalloc' or 'gc'), the top allocators by size, and
+        the allocators which grew the most since the last call'''
+        if not self.enabled:
+            return {'enabled': False}
+        if tracemalloc is not None:
+            return self.get_tracemalloc_stats()
+        return self.get_gc_stats()
+
+    def get_tracemalloc_stats(self):
+        snapshot = tracemalloc.take_snapshot()
+        stats = {
+            'enabled': True,
+            'source': 'tracemalloc',
+            'traced_bytes': tracemalloc.get_traced_memory()[0],
+            'top': [],
+            'growth': [],
+        }
+        for statistic in snapshot.statistics('lineno')[:self.top]:
+            stats['top'].append({
+                'allocator': format_traceback(statistic.traceback),
+                'bytes': statistic.size,
+                'count': statistic.count,
+            })
+        if self.previous is not None:
+            for statistic in snapshot.compare_to(self.previous,
+                'lineno')[:self.top]:
+                stats['growth'].append({
+                    'allocator': format_traceback(statistic.traceback),
+                    'bytes': statistic.size_diff,
+                    'count': statistic.count_diff,
+                })
+        self.previous = snapshot
+        return stats
+
+    def get_gc_stats(self):
+        counts = collections.defaultdict(int)
+        sizes = collections.defaultdict(int)
+        for obj in gc.get_objects():
+            name = type(obj).__name__
+            counts[name] += 1
+            sizes[name] += sys.getsizeof(obj, 0)
+
+        stats = {
+            'enabled': True,
+            'source': 'gc',
+            'top': [],
+            'growth': [],
+        }
+        for name in sorted(sizes, key=sizes.get, reverse=True)[:self.top]:
+            stats['top'].append({
+                'allocator': name,
+                'bytes': sizes[name],
+                'count': counts[name],
+            })
+        if self.previous is not None:
+            previous_counts, previous_sizes = self.previous
+            growth = dict([(name, sizes[name] - previous_sizes.get(name, 0))
+                for name in sizes])
+            for name in sorted(growth, key=lambda name: abs(growth[name]),
+                reverse=True)[:self.top]:
+                stats['growth'].append({
+                    'allocator': name,
+                    'bytes': growth[name],
+                    'count': counts[name] - previous_counts.get(name, 0),
+                })
+        self.previous = (dict(counts), dict(sizes))
+        return stats
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+def get_size(obj, seen):
+    '''get_size(obj, seen)
+    ---------------------------------
+    Returns the size, in bytes, of obj and everything it contains (the
+    items of containers, and the attributes of objects).  seen is a set of
+    the IDs of objects which have already been counted; they aren't
+    counted again, and the objects counted here are added to it.  Objects
+    of STOP_TYPES aren't counted or walked into'''
+    size = 0
+    stack = [obj]
+    while len(stack) > 0:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, STOP_TYPES):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj, 0)
+
+        if isinstance(obj, dict):
+            stack.extend(obj.iterkeys())
+            stack.extend(obj.itervalues())
+        elif isinstance(obj, (list, tuple, set, frozenset,
+            collections.deque)):
+            stack.extend(obj)
+        elif isinstance(obj, basestring):
+            continue
+        else:
+            if hasattr(obj, '__dict__'):
+                stack.append(obj.__dict__)
+            for slot in get_slots(type(obj)):
+                try:
+                    stack.append(getattr(obj, slot))
+                except AttributeError:
+                    pass
+    return size
+
+def get_slots(cls):
+    '''get_slots(cls)
+    ---------------------------------
+    Returns the names of every slot of a class (including its bases')'''
+    slots = []
+    for base in getattr(cls, '__mro__', ()):
+        base_slots = base.__dict__.get('__slots__', ())
+        if isinstance(base_slots, basestring):
+            base_slots = (base_slots,)
+        for slot in base_slots:
+            if slot not in ('__dict__', '__weakref__'):
+                slots.append(slot)
+    return slots
+
+def get_shared(seen):
+    '''get_shared(seen)
+    ---------------------------------
+    Marks the data entities share (the registered action definitions) as
+    seen, so it isn't counted as part of any subsystem'''
+    get_size(Actions.ACTIONS, seen)
+
+def get_report(pending=(), buffers=(), shared=(),
+    sample_size=DEFAULT_SAMPLE_SIZE):
+    '''get_report(pending, buffers, shared, sample_size)
+    ---------------------------------
+    Returns a dict of the estimated bytes each of SUBSYSTEMS uses, the
+    total, the number of entities, and how many of them were walked.
+    pending is a list of objects which hold pending actions (path movers,
+    planners, etc.) and buffers is a list of serialization buffers (e.g.,
+    a serialized game state being held on to).  The shared name buffer is
+    always counted as a serialization buffer.  Objects in shared (e.g.,
+    the world map) aren't counted, even if a pending object refers to
+    them'''
+    seen = set()
+    get_shared(seen)
+    for obj in shared:
+        get_size(obj, seen)
+
+    entities = Entity.Entity._entities
+    registry = Entity.Entity._registry
+    if sample_size is None:
+        sample = entities.values()
+    else:
+        sample = list(itertools.islice(entities.itervalues(), sample_size))
+    scale = len(entities) / float(max(len(sample), 1))
+
+    sizes = dict([(subsystem, 0) for subsystem in SUBSYSTEMS])
+    for entity in sample:
+        sizes['entities'] += sys.getsizeof(entity, 0)
+        for obj in (entity.name, entity.id, entity.handle, entity.position):
+            sizes['entities'] += get_size(obj, seen)
+        for obj in (entity.persona, entity.stats, entity.mood, entity.goals):
+            sizes['personas'] += get_size(obj, seen)
+        sizes['networks'] += get_size(entity.network, seen)
+        sizes['memories'] += get_size(entity.memory, seen)
+
+    for subsystem in ('entities', 'personas', 'networks', 'memories'):
+        sizes[subsystem] = int(sizes[subsystem] * scale)
+
+    #The registry is counted in full (not sampled), but not the entities in
+    #   it
+    for obj in (entities, registry.slots, registry.generations,
+        registry.free_slots):
+        sizes['entities'] += sys.getsizeof(obj, 0)
+
+    for obj in pending:
+        sizes['pending_actions'] += get_size(obj, seen)
+
+    sizes['serialization'] += get_size(Names._name_buffer, seen)
+    for obj in buffers:
+        sizes['serialization'] += get_size(obj, seen)
+
+    return {
+        'entities': len(entities),
+        'sampled_entities': len(sample),
+        'subsystems': sizes,
+        'total': sum(sizes.values()),
+    }
+
+def format_traceback(traceback):
+    '''format_traceback(traceback)
+    ---------------------------------
+    Returns a tracemalloc traceback's most recent frame as file:line'''
+    frame = traceback[0]
+    return '%s:%s' % (frame.filename, frame.lineno)
@@ -0,0 +1,371 @@
+"""=============================================================================
+    Metrics.py
+    ------------
+    Engine health metrics (entity counts, tick rate, request latencies,
+    publish payload sizes, snapshot durations, etc.), exported in the
+    Prometheus text exposition format.  Metrics are created once, at module
+    level, and registered with REGISTRY:
+
+        TICKS = Metrics.Counter('vasir_ticks_total', 'Game loop iterations')
+        TICKS.inc()
+
+    Metrics are updated from the game loop and read from whichever thread
+    serves them, so each thread which updates a metric gets its own cell to
+    add to.  Updates never take a lock (only the first update from a new
+    thread does), and reading a metric adds up the cells.
+
+    The metrics can be served over HTTP with start_http_server(), or
+    through the server's ZeroMQ socket with the get_metrics command.
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import bisect
+#Metrics are created when Entity is imported, so the low level thread
+#   module is used for locks and thread local cells (threading takes
+#   longer to import)
+import thread
+
+#Vasir Engine imports
+import Lazy
+
+#Only needed when the metrics are served over HTTP
+BaseHTTPServer = Lazy.LazyModule('BaseHTTPServer')
+threading = Lazy.LazyModule('threading')
+
+"""=============================================================================
+
+METRICS - GLOBAL SETTINGS
+
+============================================================================="""
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+#Histogram buckets, for durations in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+#Histogram buckets, for sizes in bytes
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304,
+    16777216)
+
+DEFAULT_HTTP_ADDRESS = '127.0.0.1'
+
+"""=============================================================================
+
+CLASS DEFINITIONS
+
+============================================================================="""
+class Registry(object):
+    '''Registry
+    -------------------------------------
+    Keeps every metric, by name, and renders them all in the Prometheus
+    text format'''
+    def __init__(self):
+        self.metrics = {}
+        self.lock = thread.allocate_lock()
+
+    def register(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError('Metric already registered: %s' % (
+                    metric.name))
+            self.metrics[metric.name] = metric
+
+    def unregister(self, metric):
+        with self.lock:
+            self.metrics.pop(metric.name, None)
+
+    def get(self, name):
+        return self.metrics.get(name)
+
+    def render(self):
+        '''render(self)
+        ---------------------------------
+        Returns every metric in the Prometheus text exposition format'''
+        with self.lock:
+            metrics = [self.metrics[name] for name in sorted(self.metrics)]
+
+        lines = []
+        for metric in metrics:
+            lines.append('# HELP %s %s' % (metric.name,
+                metric.documentation.replace('\\', '\\\\').replace(
+                    '\n', '\\n')))
+            lines.append('# TYPE %s %s' % (metric.name, metric.type_name))
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+#All metrics are registered here unless another registry is passed in
+REGISTRY = Registry()
+
+class Cells(object):
+    '''Cells
+    -------------------------------------
+    A list of numbers each thread adds to without locking.  Every thread
+    gets its own list (its cell) the first time it asks for one, and only
+    that thread writes to it.  get_totals() adds up all the cells'''
+    def __init__(self, size):
+        self.size = size
+        self.cells = []
+        self.local = thread._local()
+        self.lock = thread.allocate_lock()
+
+    def get_cell(self):
+        try:
+            return self.local.cell
+        except AttributeError:
+            cell = [0] * self.size
+            with self.lock:
+                self.cells.append(cell)
+            self.local.cell = cell
+            return cell
+
+    def get_totals(self):
+        totals = [0] * self.size
+        with self.lock:
+            cells = list(self.cells)
+        for cell in cells:
+            for i in xrange(self.size):
+                totals[i] += cell[i]
+        return totals
+
+class Metric(object):
+    '''Metric
+    -------------------------------------
+    Base class for metrics.  A metric with labelnames has a child for each
+    combination of label values (see labels()); a metric without any is
+    updated directly'''
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+        #Dict of label values tuples to children
+        self.children = {}
+        self.lock = thread.allocate_lock()
+        if len(self.labelnames) < 1:
+            self.child = self.children[()] = self.create_child()
+
+        if registry is None:
+            registry = REGISTRY
+        registry.register(self)
+
+    def create_child(self):
+        raise NotImplementedError
+
+    def labels(self, *labelvalues):
+        '''labels(self, *labelvalues)
+        ---------------------------------
+        Returns the child for the label values (in the same order as
+        labelnames), creating it the first time'''
+        try:
+            return self.children[labelvalues]
+        except KeyError:
+            if len(labelvalues) != len(self.labelnames):
+                raise ValueError('%s takes labels %s' % (self.name,
+                    self.labelnames))
+            with self.lock:
+                child = self.children.get(labelvalues)
+                if child is None:
+                    child = self.children[labelvalues] = self.create_child()
+            return child
+
+    def get_children(self):
+        with self.lock:
+            return sorted(self.children.items())
+
+    def format_labels(self, labelvalues, extra=()):
+        pairs = zip(self.labelnames, labelvalues) + list(extra)
+        if len(pairs) < 1:
+            return ''
+        return '{%s}' % (','.join(['%s="%s"' % (name, escape_label(value))
+            for name, value in pairs]))
+
+    def render(self):
+        lines = []
+        for labelvalues, child in self.get_children():
+            lines.append('%s%s %s' % (self.name,
+                self.format_labels(labelvalues), format_value(child.get())))
+        return lines
+
+class CounterChild(Cells):
+    def __init__(self):
+        super(CounterChild, self).__init__(1)
+
+    def inc(self, amount=1):
+        self.get_cell()[0] += amount
+
+    def get(self):
+        return self.get_totals()[0]
+
+class Counter(Metric):
+    '''Counter
+    -------------------------------------
+    A number which only goes up (e.g., ticks, requests)'''
+    type_name = 'counter'
+
+    def create_child(self):
+        return CounterChild()
+
+    def inc(self, amount=1):
+        self.child.inc(amount)
+
+    def get(self):
+        return self.child.get()
+
+class GaugeChild(object):
+    def __init__(self):
+        #Setting an attribute is atomic, so gauges don't need cells
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        '''set_function(self, function)
+        ---------------------------------
+        Makes the gauge call function for its value each time it's read,
+        instead of being set'''
+        self.function = function
+
+    def get(self):
+        if self.function is not None:
+            return self.function()
+        return self.value
+
+class Gauge(Metric):
+    '''Gauge
+    -------------------------------------
+    A number which can go up or down (e.g., number of entities).  Gauges
+    are set, or read from a function when the metrics are rendered'''
+    type_name = 'gauge'
+
+    def create_child(self):
+        return GaugeChild()
+
+    def set(self, value):
+        self.child.set(value)
+
+    def set_function(self, function):
+        self.child.set_function(function)
+
+    def get(self):
+        return self.child.get()
+
+class HistogramChild(Cells):
+    def __init__(self, buckets):
+        #One count per bucket, one for +Inf, then the sum of the values
+        super(HistogramChild, self).__init__(len(buckets) + 2)
+        self.buckets = buckets
+
+    def observe(self, value):
+        cell = self.get_cell()
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def get(self):
+        '''get(self)
+        ---------------------------------
+        Returns a tuple of (cumulative bucket counts, including +Inf,
+        count, sum)'''
+        totals = self.get_totals()
+        counts = []
+        count = 0
+        for bucket_count in totals[:-1]:
+            count += bucket_count
+            counts.append(count)
+        return (counts, count, totals[-1])
+
+class Histogram(Metric):
+    '''Histogram
+    -------------------------------------
+    Counts values (e.g., durations, sizes) in buckets, along with their
+    count and sum.  buckets are the upper bounds, in increasing order'''
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None,
+        buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super(Histogram, self).__init__(name, documentation, labelnames,
+            registry)
+
+    def create_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.child.observe(value)
+
+    def get(self):
+        return self.child.get()
+
+    def render(self):
+        lines = []
+        bounds = [format_value(bucket) for bucket in self.buckets] + ['+Inf']
+        for labelvalues, child in self.get_children():
+            counts, count, total = child.get()
+            for bound, bucket_count in zip(bounds, counts):
+                lines.append('%s_bucket%s %s' % (self.name,
+                    self.format_labels(labelvalues, [('le', bound)]),
+                    bucket_count))
+            labels = self.format_labels(labelvalues)
+            lines.append('%s_count%s %s' % (self.name, labels, count))
+            lines.append('%s_sum%s %s' % (self.name, labels,
+                format_value(total)))
+        return lines
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+def format_value(value):
+    '''format_value(value)
+    ---------------------------------
+    Returns a number as a string Prometheus can read'''
+    if isinstance(value, float):
+        if value != value:
+            return 'NaN'
+        elif value == float('inf'):
+            return '+Inf'
+        elif value == float('-inf'):
+            return '-Inf'
+        return repr(value)
+    return str(value)
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+def start_http_server(port, address=DEFAULT_HTTP_ADDRESS, registry=None):
+    '''start_http_server(port, address, registry)
+    ---------------------------------
+    Serves the registry's metrics at http://address:port/metrics from a
+    background thread.  Returns the HTTP server (call shutdown() on it to
+    stop it)'''
+    if registry is None:
+        registry = REGISTRY
+
+    class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            output = registry.render()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(output)))
+            self.end_headers()
+            self.wfile.write(output)
+
+        def log_message(self, format, *args):
+            #Don't print a line for every scrape
+            pass
+
+    http_server = BaseHTTPServer.HTTPServer((address, port), MetricsHandler)
+    thread = threading.Thread(target=http_server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return http_server
@@ -0,0 +1,240 @@
+"""=============================================================================
+    Movement.py
+    ------------
+    Contains batch movement systems.  Instead of creating a move Action for
+    every entity every tick, a movement system updates the positions of all
+    entities in one step and returns the movement deltas (which can be
+    published to clients)
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import random
+
+#Vasir Engine imports
+import Lazy
+
+#Third party (optional)
+#   numpy is used to vectorize the batch movement step.  If it isn't
+#   installed, we fall back to a (slower) pure python loop.  It's imported
+#   the first time it's used
+numpy = Lazy.lazy_import('numpy')
+
+"""=============================================================================
+
+MOVEMENT - GLOBAL SETTINGS
+
+============================================================================="""
+#DEFAULT_BOUNDS
+#----------------
+#The ((min_x, max_x), (min_y, max_y)) bounds of the world.  Entities are
+#   clamped to stay inside these bounds (inclusive)
+DEFAULT_BOUNDS = ((0, 100), (0, 100))
+
+#STEP_DISTRIBUTIONS
+#----------------
+#Possible distributions for the size of each random step.  A callable can
+#   also be passed in instead (see RandomWalk)
+STEP_DISTRIBUTIONS = {
+    #Each axis moves by a random integer in [-step_size, step_size]
+    'uniform': 'uniform',
+    #Each axis moves by a normally distributed amount (with a standard
+    #   deviation of step_size), rounded to the nearest integer
+    'gaussian': 'gaussian',
+}
+
+"""=============================================================================
+
+CLASS DEFINITIONS
+
+============================================================================="""
+class RandomWalk(object):
+    '''RandomWalk
+    -------------------------------------
+    Moves every entity a random step in the x and y directions each time
+    step() is called.  Positions are clamped to the world bounds.
+
+    step_distribution can be one of the STEP_DISTRIBUTIONS keys or a
+    callable which takes in (count, step_size, rng) and returns a tuple of
+    (x_steps, y_steps), each a sequence of count integers.  rng will be a
+    numpy RandomState if numpy is being used, otherwise a random.Random'''
+    def __init__(self,
+        bounds=DEFAULT_BOUNDS,
+        step_distribution='uniform',
+        step_size=1,
+        seed=None,
+        use_numpy=True):
+        self.bounds = bounds
+        self.step_size = step_size
+
+        if not callable(step_distribution) \
+            and step_distribution not in STEP_DISTRIBUTIONS:
+            raise ValueError('Invalid step distribution: %s' % (
+                step_distribution))
+        self.step_distribution = step_distribution
+
+        #Only use numpy if it's available
+        self.use_numpy = use_numpy and numpy is not None
+        self.seed(seed)
+
+        #The deltas from the last step, stored so the publisher can grab
+        #   them after the step has been taken
+        self.last_deltas = []
+
+    def seed(self, seed=None):
+        '''seed(self, seed)
+        ---------------------------------
+        Resets the random number generator with the passed in seed'''
+        if self.use_numpy:
+            self.rng = numpy.random.RandomState(seed)
+        else:
+            self.rng = random.Random(seed)
+
+    '''====================================================================
+
+    Steps
+
+    ======================================================================='''
+    def get_steps(self, count):
+        '''get_steps(self, count)
+        ---------------------------------
+        Returns a tuple of (x_steps, y_steps) for count entities, based on
+        this walk's step distribution'''
+        if callable(self.step_distribution):
+            return self.step_distribution(count, self.step_size, self.rng)
+
+        if self.use_numpy:
+            if self.step_distribution == 'uniform':
+                return (
+                    self.rng.randint(-self.step_size, self.step_size + 1,
+                        size=count),
+                    self.rng.randint(-self.step_size, self.step_size + 1,
+                        size=count),
+                )
+            elif self.step_distribution == 'gaussian':
+                return (
+                    numpy.rint(self.rng.normal(0, self.step_size,
+                        size=count)).astype(numpy.int64),
+                    numpy.rint(self.rng.normal(0, self.step_size,
+                        size=count)).astype(numpy.int64),
+                )
+        else:
+            randint = self.rng.randint
+            step_size = self.step_size
+            if self.step_distribution == 'uniform':
+                return (
+                    [randint(-step_size, step_size) for i in xrange(count)],
+                    [randint(-step_size, step_size) for i in xrange(count)],
+                )
+            elif self.step_distribution == 'gaussian':
+                gauss = self.rng.gauss
+                return (
+                    [int(round(gauss(0, step_size))) for i in xrange(count)],
+                    [int(round(gauss(0, step_size))) for i in xrange(count)],
+                )
+
+    def step(self, entities):
+        '''step(self, entities)
+        ---------------------------------
+        Takes in a dict (e.g., Entity._entities) or list of entities and
+        moves all of them one random step.  Returns a list of
+        (entity_id, delta_x, delta_y) tuples for every entity that actually
+        moved'''
+        if isinstance(entities, dict):
+            entities = entities.values()
+        count = len(entities)
+        if count < 1:
+            self.last_deltas = []
+            return self.last_deltas
+
+        x_steps, y_steps = self.get_steps(count)
+
+        if self.use_numpy:
+            deltas = self._step_numpy(entities, count, x_steps, y_steps)
+        else:
+            deltas = self._step_python(entities, count, x_steps, y_steps)
+
+        self.last_deltas = deltas
+        return deltas
+
+    def _step_numpy(self, entities, count, x_steps, y_steps):
+        '''_step_numpy(self, entities, count, x_steps, y_steps)
+        ---------------------------------
+        Vectorized step.  Gathers all positions into arrays, moves and
+        clamps them all at once, then only writes back positions that
+        changed'''
+        (min_x, max_x), (min_y, max_y) = self.bounds
+
+        positions = [entity.position for entity in entities]
+        old_x = numpy.fromiter((position[0] for position in positions),
+            dtype=numpy.int64, count=count)
+        old_y = numpy.fromiter((position[1] for position in positions),
+            dtype=numpy.int64, count=count)
+
+        new_x = numpy.clip(old_x + numpy.asarray(x_steps), min_x, max_x)
+        new_y = numpy.clip(old_y + numpy.asarray(y_steps), min_y, max_y)
+
+        delta_x = new_x - old_x
+        delta_y = new_y - old_y
+
+        #Only write back entities which actually moved
+        moved = numpy.flatnonzero((delta_x != 0) | (delta_y != 0))
+
+        deltas = []
+        for index, x, y, dx, dy in zip(moved.tolist(),
+            new_x[moved].tolist(), new_y[moved].tolist(),
+            delta_x[moved].tolist(), delta_y[moved].tolist()):
+            position = positions[index]
+            position[0] = x
+            position[1] = y
+            deltas.append((entities[index].id, dx, dy))
+
+        return deltas
+
+    def _step_python(self, entities, count, x_steps, y_steps):
+        '''_step_python(self, entities, count, x_steps, y_steps)
+        ---------------------------------
+        Pure python step, used when numpy is not available'''
+        (min_x, max_x), (min_y, max_y) = self.bounds
+
+        deltas = []
+        for i in xrange(count):
+            entity = entities[i]
+            position = entity.position
+
+            new_x = position[0] + x_steps[i]
+            if new_x < min_x:
+                new_x = min_x
+            elif new_x > max_x:
+                new_x = max_x
+
+            new_y = position[1] + y_steps[i]
+            if new_y < min_y:
+                new_y = min_y
+            elif new_y > max_y:
+                new_y = max_y
+
+            delta_x = new_x - position[0]
+            delta_y = new_y - position[1]
+            if delta_x != 0 or delta_y != 0:
+                position[0] = new_x
+                position[1] = new_y
+                deltas.append((entity.id, delta_x, delta_y))
+
+        return deltas
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+def get_deltas_json(deltas):
+    '''get_deltas_json(deltas)
+    ---------------------------------
+    Returns a JSON friendly string of the passed in movement deltas, in the
+    same format the rest of the game state is published in'''
+    return '({movement: [%s]})' % (','.join([
+        "['%s', %s, %s]" % (delta[0], delta[1], delta[2]) \
+            for delta in deltas]))
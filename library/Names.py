@@ -0,0 +1,455 @@
+"""=============================================================================
+    Names.py
+    ------------
+    Contains name generation.  The names from data.names_list are compiled
+    into an array once (NAMES), and a character level Markov model trained
+    on them (NameGenerator) synthesizes as many new, similar sounding names
+    as we need, in bulk.  A bloom filter (BloomFilter) can be used to make
+    sure generated names are unique.
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import array
+import bisect
+import math
+import random
+import zlib
+
+#Vasir Engine imports
+import Lazy
+import data.names_list
+
+#Third party (optional)
+#   numpy is used to generate names in bulk.  If it isn't installed, we fall
+#   back to generating names one at a time.  It's imported the first time
+#   it's used
+numpy = Lazy.lazy_import('numpy')
+
+"""=============================================================================
+
+NAMES - GLOBAL SETTINGS
+
+============================================================================="""
+#NAMES
+#----------------
+#The name list, compiled into a tuple once
+NAMES = tuple(data.names_list.names)
+
+#Number of previous characters the Markov model looks at
+DEFAULT_ORDER = 2
+#Generated names are between these lengths (inclusive)
+DEFAULT_MIN_LENGTH = 3
+DEFAULT_MAX_LENGTH = 12
+
+#How many names generate_name() makes at a time.  Bigger batches are
+#   faster per name, but the entity which empties the buffer waits for the
+#   whole batch (without numpy, see get_generator).  benchmarks/names.py
+#   compares batch sizes; here, names per second levels off at 256
+#   (~140,000, about the same as 1024 or 4096), while a batch of 256 takes
+#   ~2 ms instead of ~7 ms for 1024, which keeps the first entity created
+#   well inside benchmarks/startup.py's budget
+NAME_BUFFER_SIZE = 256
+
+#Bits of precision for the random numbers used to pick characters (numpy
+#   only), and the number of guide table buckets per context (see
+#   NameGenerator.compile_numpy)
+RANDOM_BITS = 16
+GUIDE_BITS = 6
+
+"""=============================================================================
+
+CLASS DEFINITIONS
+
+============================================================================="""
+class BloomFilter(object):
+    '''BloomFilter
+    -------------------------------------
+    Set like structure which only stores bits, so it uses a small fixed
+    amount of memory no matter how long the strings in it are.  Checking
+    for a string which was added is always True.  Checking for one which
+    wasn't is False, except for a small chance (error_rate, once capacity
+    strings have been added) of a false positive'''
+    def __init__(self, capacity=1000000, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+
+        #Optimal number of bits and hashes for the capacity and error rate
+        #   (ln(2) ** 2 = 0.4805, ln(2) = 0.6931)
+        num_bits = int(-capacity * math.log(error_rate) / 0.4805) + 1
+        self.num_hashes = max(1, int(round(num_bits / float(capacity)
+            * 0.6931)))
+        self.num_bits = num_bits
+        self.bits = bytearray((num_bits + 7) // 8)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def get_indexes(self, value):
+        '''get_indexes(self, value)
+        ---------------------------------
+        Returns the bit indexes for a string, using double hashing (two
+        hashes combined num_hashes ways)'''
+        hash_1 = zlib.crc32(value) & 0xffffffff
+        hash_2 = (zlib.adler32(value) & 0xffffffff) | 1
+        num_bits = self.num_bits
+        return [(hash_1 + i * hash_2) % num_bits
+            for i in xrange(self.num_hashes)]
+
+    def add(self, value):
+        '''add(self, value)
+        ---------------------------------
+        Adds a string.  Returns True if it was (probably) already added'''
+        bits = self.bits
+        found = True
+        for index in self.get_indexes(value):
+            byte = index >> 3
+            mask = 1 << (index & 7)
+            if not bits[byte] & mask:
+                found = False
+                bits[byte] |= mask
+        if not found:
+            self.count += 1
+        return found
+
+    def add_many(self, values):
+        '''add_many(self, values)
+        ---------------------------------
+        Adds a list of strings.  Returns a list of the strings which were
+        (probably) not already added, in order.  Duplicates in values are
+        only returned once.  Uses numpy, when available, to check and set
+        the bits of every string at once'''
+        #Remove duplicates first, so every string left is only checked
+        #   once
+        batch_seen = set()
+        add_seen = batch_seen.add
+        values = [value for value in values
+            if not (value in batch_seen or add_seen(value))]
+
+        if numpy is None:
+            return [value for value in values if not self.add(value)]
+        if len(values) < 1:
+            return values
+
+        count = len(values)
+        hash_1 = numpy.fromiter((zlib.crc32(value) & 0xffffffff
+            for value in values), dtype=numpy.uint64, count=count)
+        hash_2 = numpy.fromiter(((zlib.adler32(value) & 0xffffffff) | 1
+            for value in values), dtype=numpy.uint64, count=count)
+        indexes = (hash_1[:, None] + numpy.arange(self.num_hashes,
+            dtype=numpy.uint64)[None, :] * hash_2[:, None]) \
+            % numpy.uint64(self.num_bits)
+
+        bits = numpy.frombuffer(self.bits, dtype=numpy.uint8)
+        byte_indexes = (indexes >> numpy.uint64(3)).astype(numpy.int64)
+        masks = numpy.left_shift(1, (indexes & numpy.uint64(7)).astype(
+            numpy.uint8)).astype(numpy.uint8)
+        found = (bits[byte_indexes] & masks).all(axis=1)
+
+        new = numpy.flatnonzero(~found)
+        numpy.bitwise_or.at(bits, byte_indexes[new].ravel(),
+            masks[new].ravel())
+        self.count += len(new)
+        return [values[index] for index in new.tolist()]
+
+    def __contains__(self, value):
+        bits = self.bits
+        for index in self.get_indexes(value):
+            if not bits[index >> 3] & (1 << (index & 7)):
+                return False
+        return True
+
+class NameGenerator(object):
+    '''NameGenerator
+    -------------------------------------
+    Character level Markov model.  Trained on a list of names, it learns
+    how likely each character is to follow the previous order characters,
+    then generates new names one character at a time from those
+    probabilities.
+
+    The model is compiled into flat arrays so, when numpy is available,
+    whole batches of names are generated at once: every name in the batch
+    takes its next step together.
+
+    If unique is True, generated names are checked against a bloom filter
+    and names which were already generated are thrown away'''
+    def __init__(self,
+        names=NAMES,
+        order=DEFAULT_ORDER,
+        min_length=DEFAULT_MIN_LENGTH,
+        max_length=DEFAULT_MAX_LENGTH,
+        unique=False,
+        capacity=1000000,
+        seed=None,
+        use_numpy=True):
+        self.order = order
+        self.min_length = min_length
+        self.max_length = max_length
+
+        self.use_numpy = use_numpy and numpy is not None
+        if self.use_numpy:
+            self.rng = numpy.random.RandomState(seed)
+        else:
+            self.rng = random.Random(seed)
+
+        self.seen = None
+        if unique:
+            self.seen = BloomFilter(capacity=capacity)
+
+        self.train(names)
+
+    '''====================================================================
+
+    Training
+
+    ======================================================================='''
+    def train(self, names):
+        '''train(self, names)
+        ---------------------------------
+        Builds the model from a list of names.  Characters are numbered
+        from 1 (0 marks the start and end of a name), and a context (the
+        previous order characters) is numbered as a base alphabet_size
+        number, so the next context is just (context * alphabet_size + char)
+        % context_count'''
+        alphabet = sorted(set(''.join(names)))
+        #Index 0 is the start / end of a name
+        self.alphabet = ['\0'] + alphabet
+        char_indexes = dict([(char, i + 1) for i, char in enumerate(alphabet)])
+        size = len(self.alphabet)
+        self.alphabet_size = size
+        self.context_count = size ** self.order
+
+        #Count how often each character follows each context
+        counts = {}
+        for name in names:
+            context = 0
+            for char in name:
+                char_index = char_indexes[char]
+                counts.setdefault(context, {})
+                counts[context][char_index] = \
+                    counts[context].get(char_index, 0) + 1
+                context = (context * size + char_index) % self.context_count
+            counts.setdefault(context, {})
+            counts[context][0] = counts[context].get(0, 0) + 1
+
+        #Compile the counts into cumulative probabilities.  Each context's
+        #   keys are context + cumulative probability, so the keys of every
+        #   context fit in one sorted array (context's keys are in
+        #   (context, context + 1]) and the next character for a context
+        #   and a random number in [0, 1) is found with one binary search
+        #   of context + random number
+        keys = []
+        next_chars = []
+        for context in sorted(counts):
+            total = float(sum(counts[context].itervalues()))
+            cumulative = 0
+            for char_index in sorted(counts[context]):
+                cumulative += counts[context][char_index]
+                keys.append(context + cumulative / total)
+                next_chars.append(char_index)
+            #Make sure the last key is exactly at the end of the context
+            keys[-1] = context + 1.0
+
+        self.keys = array.array('d', keys)
+        self.next_chars = array.array('l', next_chars)
+        if self.use_numpy:
+            self.compile_numpy(counts)
+
+    def compile_numpy(self, counts):
+        '''compile_numpy(self, counts)
+        ---------------------------------
+        Compiles the counts (dict of contexts to dicts of character indexes
+        to counts) into the arrays used by _generate_numpy.  Each context
+        seen in training gets a row, and each row's possible next
+        characters are stored together in key order:
+
+            thresholds: cumulative probability of the character, as an
+                integer out of 2 ** RANDOM_BITS
+            next_chars: the character's byte
+            next_guide_rows: the first guide table entry of the row for
+                the context after this character
+
+        Finding a character by searching a row's thresholds for a random
+        number is slow for big batches (the searches jump all over
+        memory), so the guide table has the first key past each of
+        2 ** GUIDE_BITS evenly spaced values in every row.  The right key
+        is then at most a step or two past the guide entry'''
+        size = self.alphabet_size
+        scale = 1 << RANDOM_BITS
+        guide_size = 1 << GUIDE_BITS
+        bucket_size = 1 << (RANDOM_BITS - GUIDE_BITS)
+
+        contexts = sorted(counts)
+        rows = dict([(context, row) for row, context in enumerate(contexts)])
+
+        thresholds = []
+        next_chars = []
+        next_guide_rows = []
+        guide = []
+        for context in contexts:
+            row_start = len(thresholds)
+            total = float(sum(counts[context].itervalues()))
+            cumulative = 0
+            for char_index in sorted(counts[context]):
+                cumulative += counts[context][char_index]
+                thresholds.append(int(round(cumulative / total * scale)))
+                next_chars.append(ord(self.alphabet[char_index]))
+                next_context = (context * size + char_index) \
+                    % self.context_count
+                #Names end after the \0 character, so it has no next row
+                next_guide_rows.append(rows.get(next_context, 0)
+                    * guide_size)
+            thresholds[-1] = scale
+
+            key = row_start
+            for bucket in xrange(guide_size):
+                while thresholds[key] <= bucket * bucket_size:
+                    key += 1
+                guide.append(key)
+
+        self.start_guide_row = rows[0] * guide_size
+        self.thresholds = numpy.array(thresholds, dtype=numpy.int32)
+        self.next_byte = numpy.array(next_chars, dtype=numpy.uint8)
+        self.next_guide_rows = numpy.array(next_guide_rows,
+            dtype=numpy.int64)
+        self.guide = numpy.array(guide, dtype=numpy.int64)
+
+    '''====================================================================
+
+    Generation
+
+    ======================================================================='''
+    def generate(self, count):
+        '''generate(self, count)
+        ---------------------------------
+        Returns a list of count generated names'''
+        names = []
+        while len(names) < count:
+            #Some names are thrown away (too short / long, or not unique),
+            #   so generate a few extra
+            needed = count - len(names)
+            if self.use_numpy:
+                batch = self._generate_numpy(needed + needed // 4 + 16)
+            else:
+                batch = self._generate_python(needed + needed // 4 + 16)
+
+            if self.seen is not None:
+                batch = self.seen.add_many(batch)
+
+            names.extend(batch[:needed])
+        return names
+
+    def _generate_numpy(self, count):
+        '''_generate_numpy(self, count)
+        ---------------------------------
+        Generates a batch of names with numpy, one character of every name
+        at a time.  Returns the names which are a valid length'''
+        length = self.max_length + 1
+        thresholds = self.thresholds
+        next_byte = self.next_byte
+        next_guide_rows = self.next_guide_rows
+        guide = self.guide
+        randint = self.rng.randint
+        scale = 1 << RANDOM_BITS
+        shift = RANDOM_BITS - GUIDE_BITS
+
+        #One row per step, so each step writes to contiguous memory
+        chars = numpy.zeros((length, count), dtype=numpy.uint8)
+        guide_rows = numpy.empty(count, dtype=numpy.int64)
+        guide_rows.fill(self.start_guide_row)
+        #Only names which haven't ended yet are worked on each step
+        active = numpy.arange(count)
+
+        for step in xrange(length):
+            randoms = randint(0, scale, size=len(active),
+                dtype=numpy.int32)
+            keys = guide.take(guide_rows + (randoms >> shift))
+            while True:
+                past = thresholds.take(keys) <= randoms
+                if not past.any():
+                    break
+                keys += past
+
+            step_chars = next_byte.take(keys)
+            chars[step, active] = step_chars
+
+            #Drop names which just ended
+            continuing = step_chars.nonzero()[0]
+            if len(continuing) < 1:
+                break
+            active = active.take(continuing)
+            guide_rows = next_guide_rows.take(keys.take(continuing))
+
+        #Turn each name's character bytes into a string.  Trailing \0s
+        #   (the end of the name) are stripped
+        lengths = numpy.count_nonzero(chars, axis=0)
+        valid = (lengths >= self.min_length) & (lengths <= self.max_length)
+        name_bytes = numpy.ascontiguousarray(chars[:, valid].T)
+        return name_bytes.view('S%s' % (length)).ravel().tolist()
+
+    def _generate_python(self, count):
+        '''_generate_python(self, count)
+        ---------------------------------
+        Generates names one at a time, used when numpy is not available'''
+        keys = self.keys
+        next_chars = self.next_chars
+        alphabet = self.alphabet
+        size = self.alphabet_size
+        context_count = self.context_count
+        rand = self.rng.random
+        search = bisect.bisect_right
+
+        names = []
+        for i in xrange(count):
+            context = 0
+            name = []
+            for step in xrange(self.max_length + 1):
+                char_index = next_chars[search(keys, context + rand())]
+                if char_index == 0:
+                    break
+                name.append(alphabet[char_index])
+                context = (context * size + char_index) % context_count
+
+            if self.min_length <= len(name) <= self.max_length:
+                names.append(''.join(name))
+        return names
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+#Shared generator (created on first use) and a buffer of names from it
+_generator = None
+_name_buffer = []
+
+def get_generator():
+    '''get_generator()
+    ---------------------------------
+    Returns the shared NameGenerator, training it the first time.  It
+    doesn't use numpy: names are only needed a buffer at a time, and
+    creating entities shouldn't have to wait for numpy to import'''
+    global _generator
+    if _generator is None:
+        _generator = NameGenerator(use_numpy=False)
+    return _generator
+
+def seed(seed=None):
+    '''seed(seed)
+    ---------------------------------
+    Reseeds the shared generator and throws away any buffered names, so
+    the names generate_name() returns next only depend on the seed'''
+    get_generator().rng.seed(seed)
+    del _name_buffer[:]
+
+def generate_name():
+    '''generate_name()
+    ---------------------------------
+    Returns a single generated name.  Names are generated NAME_BUFFER_SIZE
+    at a time, since generating them in bulk is much faster'''
+    if len(_name_buffer) < 1:
+        _name_buffer.extend(get_generator().generate(NAME_BUFFER_SIZE))
+    return _name_buffer.pop()
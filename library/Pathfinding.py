@@ -0,0 +1,651 @@
+"""=============================================================================
+    Pathfinding.py
+    ------------
+    Contains the GridMap, PathSearch, and PathMover class definitions.
+    Entities shouldn't teleport to where they want to go - instead, a path is
+    planned (with A*) over a grid map of the world, and the entity is moved
+    one cell along that path each tick.
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import collections
+import heapq
+import math
+
+#Vasir Engine imports
+import Movement
+
+"""=============================================================================
+
+PATHFINDING - GLOBAL SETTINGS
+
+============================================================================="""
+#NEIGHBOR_OFFSETS
+#----------------
+#Entities can move to any of the 8 cells around them (the old grid based
+#   move action moved x and y at the same time, so diagonals are allowed)
+NEIGHBOR_OFFSETS = (
+    (1, 0), (-1, 0), (0, 1), (0, -1),
+    (1, 1), (1, -1), (-1, 1), (-1, -1),
+)
+DIAGONAL_COST = math.sqrt(2)
+
+#Default number of A* node expansions the PathMover will do each tick
+DEFAULT_EXPANSIONS_PER_TICK = 5000
+#Default number of destinations to keep cached paths for
+DEFAULT_MAX_CACHED_GOALS = 256
+#Default number of flow fields to keep cached
+DEFAULT_MAX_FLOW_FIELDS = 32
+#Default number of (start, goal) pairs to remember there's no path for
+DEFAULT_MAX_FAILED = 1024
+#When at least this many entities are moving to the same goal, the
+#   PathMover builds a flow field for the goal instead of searching for
+#   individual paths
+DEFAULT_CROWD_THRESHOLD = 8
+
+"""=============================================================================
+
+CLASS DEFINITIONS
+
+============================================================================="""
+class GridMap(object):
+    '''GridMap
+    -------------------------------------
+    A grid of cells covering the world.  Each cell has a terrain cost (how
+    expensive it is to move into the cell), and cells can be marked as
+    obstacles (which can not be moved into at all).  Cell coordinates are
+    the same as entity x and y positions.
+
+    Any time the map changes, the version is increased so anything caching
+    paths over the map knows to throw them away'''
+    def __init__(self, width=None, height=None, default_cost=1):
+        #Default to the same size as the movement bounds
+        if width is None:
+            width = Movement.DEFAULT_BOUNDS[0][1] + 1
+        if height is None:
+            height = Movement.DEFAULT_BOUNDS[1][1] + 1
+
+        self.width = width
+        self.height = height
+        self.default_cost = default_cost
+
+        #costs is a dict of cells to their terrain cost.  Cells not in
+        #   the dict use the default cost
+        self.costs = {}
+        self.obstacles = set()
+        #Cheapest cost of any cell, used to keep the A* heuristic admissible
+        self.min_cost = default_cost
+
+        self.version = 0
+
+    def in_bounds(self, cell):
+        return 0 <= cell[0] < self.width and 0 <= cell[1] < self.height
+
+    def is_walkable(self, cell):
+        return self.in_bounds(cell) and cell not in self.obstacles
+
+    def get_cost(self, cell):
+        return self.costs.get(cell, self.default_cost)
+
+    def set_cost(self, cell, cost):
+        '''set_cost(self, cell, cost)
+        ---------------------------------
+        Sets the terrain cost of moving into the cell'''
+        self.costs[tuple(cell)] = cost
+        self.min_cost = min(self.min_cost, cost)
+        self.version += 1
+
+    def set_obstacle(self, cell, is_obstacle=True):
+        '''set_obstacle(self, cell, is_obstacle)
+        ---------------------------------
+        Marks (or unmarks) the passed in cell as an obstacle'''
+        if is_obstacle:
+            self.obstacles.add(tuple(cell))
+        else:
+            self.obstacles.discard(tuple(cell))
+        self.version += 1
+
+    def get_cell(self, position):
+        '''get_cell(self, position)
+        ---------------------------------
+        Returns the cell an entity position falls in, clamped to the map'''
+        return (
+            min(max(int(round(position[0])), 0), self.width - 1),
+            min(max(int(round(position[1])), 0), self.height - 1),
+        )
+
+    def get_neighbors(self, cell):
+        '''get_neighbors(self, cell)
+        ---------------------------------
+        Returns a list of (neighbor_cell, move_cost) tuples for every cell
+        which can be moved to from the passed in cell.  Diagonal moves can't
+        cut the corner of an obstacle'''
+        neighbors = []
+        for offset_x, offset_y in NEIGHBOR_OFFSETS:
+            neighbor = (cell[0] + offset_x, cell[1] + offset_y)
+            if not self.is_walkable(neighbor):
+                continue
+
+            if offset_x != 0 and offset_y != 0:
+                if not self.is_walkable((cell[0] + offset_x, cell[1])) \
+                    or not self.is_walkable((cell[0], cell[1] + offset_y)):
+                    continue
+                cost = self.get_cost(neighbor) * DIAGONAL_COST
+            else:
+                cost = self.get_cost(neighbor)
+
+            neighbors.append((neighbor, cost))
+
+        return neighbors
+
+    def get_heuristic(self, cell, goal):
+        '''get_heuristic(self, cell, goal)
+        ---------------------------------
+        Octile distance between the two cells, scaled by the cheapest
+        terrain cost so it never over estimates'''
+        dist_x = abs(cell[0] - goal[0])
+        dist_y = abs(cell[1] - goal[1])
+
+        return self.min_cost * (max(dist_x, dist_y)
+            + (DIAGONAL_COST - 1) * min(dist_x, dist_y))
+
+
+class PathSearch(object):
+    '''PathSearch
+    -------------------------------------
+    An A* search from a start cell to a goal cell which can be run a little
+    bit at a time.  Each call to run() expands at most max_expansions
+    nodes, so a long search can be spread over multiple ticks.
+
+    status is one of 'pending', 'found', or 'failed'.  When the status is
+    'found', path is a list of cells from the start (not included) to the
+    goal (included)'''
+    def __init__(self, grid_map, start, goal):
+        self.grid_map = grid_map
+        self.start = tuple(start)
+        self.goal = tuple(goal)
+
+        self.status = 'pending'
+        self.path = None
+        self.expansions = 0
+
+        self.came_from = {self.start: None}
+        self.cost_so_far = {self.start: 0}
+        #Heap of (estimated total cost, tie breaker, cost so far, cell)
+        self.open = [(grid_map.get_heuristic(self.start, self.goal), 0, 0,
+            self.start)]
+        self._counter = 0
+
+        if not grid_map.is_walkable(self.goal):
+            self.status = 'failed'
+
+    def run(self, max_expansions=None):
+        '''run(self, max_expansions)
+        ---------------------------------
+        Continues the search.  Returns the number of nodes expanded'''
+        if self.status != 'pending':
+            return 0
+
+        grid_map = self.grid_map
+        goal = self.goal
+        came_from = self.came_from
+        cost_so_far = self.cost_so_far
+        open_heap = self.open
+
+        expanded = 0
+        while len(open_heap) > 0:
+            if max_expansions is not None and expanded >= max_expansions:
+                break
+
+            estimate, tie, cost, cell = heapq.heappop(open_heap)
+            if cost > cost_so_far[cell]:
+                #Stale heap entry, we've found a cheaper way already
+                continue
+            expanded += 1
+
+            if cell == goal:
+                self.status = 'found'
+                self.path = self.build_path()
+                break
+
+            for neighbor, move_cost in grid_map.get_neighbors(cell):
+                new_cost = cost_so_far[cell] + move_cost
+                if neighbor not in cost_so_far \
+                    or new_cost < cost_so_far[neighbor]:
+                    cost_so_far[neighbor] = new_cost
+                    came_from[neighbor] = cell
+                    self._counter += 1
+                    heapq.heappush(open_heap, (
+                        new_cost + grid_map.get_heuristic(neighbor, goal),
+                        self._counter,
+                        new_cost,
+                        neighbor))
+        else:
+            #Ran out of cells to look at, so there is no path
+            self.status = 'failed'
+
+        self.expansions += expanded
+        return expanded
+
+    def build_path(self):
+        '''build_path(self)
+        ---------------------------------
+        Walks back from the goal to the start and returns the path'''
+        path = []
+        cell = self.goal
+        while cell != self.start:
+            path.append(cell)
+            cell = self.came_from[cell]
+        path.reverse()
+        return path
+
+
+class FlowField(object):
+    '''FlowField
+    -------------------------------------
+    A flow field towards a single goal cell.  Starting from the goal, the
+    integration field (the cost to reach the goal from every cell) is built
+    over the whole grid with Dijkstra's algorithm, and each cell stores the
+    neighbor to move to next.  Once built, any number of entities can get
+    their next step with a single dict lookup, no matter where they are.
+
+    Like PathSearch, building the field can be spread out over multiple
+    calls to run().  status is 'pending' until the whole field is built,
+    then 'found' (or 'failed', if the goal itself can't be walked on)'''
+    def __init__(self, grid_map, goal):
+        self.grid_map = grid_map
+        self.goal = tuple(goal)
+        self.version = grid_map.version
+
+        self.status = 'pending'
+        self.expansions = 0
+
+        #Dict of cells to the cost of reaching the goal from that cell
+        self.costs = {self.goal: 0}
+        #Dict of cells to the next cell to move to
+        self.next_steps = {}
+        self.open = [(0, self.goal)]
+
+        if not grid_map.is_walkable(self.goal):
+            self.status = 'failed'
+
+    def run(self, max_expansions=None):
+        '''run(self, max_expansions)
+        ---------------------------------
+        Continues building the field.  Returns the number of cells
+        expanded'''
+        if self.status != 'pending':
+            return 0
+
+        grid_map = self.grid_map
+        costs = self.costs
+        next_steps = self.next_steps
+        open_heap = self.open
+        is_walkable = grid_map.is_walkable
+
+        expanded = 0
+        while len(open_heap) > 0:
+            if max_expansions is not None and expanded >= max_expansions:
+                break
+
+            cost, cell = heapq.heappop(open_heap)
+            if cost > costs[cell]:
+                #Stale heap entry, we've found a cheaper way already
+                continue
+            expanded += 1
+
+            #Moving from a neighbor into this cell costs this cell's
+            #   terrain cost
+            cell_cost = grid_map.get_cost(cell)
+            for offset_x, offset_y in NEIGHBOR_OFFSETS:
+                neighbor = (cell[0] + offset_x, cell[1] + offset_y)
+                if not is_walkable(neighbor):
+                    continue
+
+                if offset_x != 0 and offset_y != 0:
+                    if not is_walkable((cell[0] + offset_x, cell[1])) \
+                        or not is_walkable((cell[0], cell[1] + offset_y)):
+                        continue
+                    new_cost = cost + cell_cost * DIAGONAL_COST
+                else:
+                    new_cost = cost + cell_cost
+
+                if neighbor not in costs or new_cost < costs[neighbor]:
+                    costs[neighbor] = new_cost
+                    next_steps[neighbor] = cell
+                    heapq.heappush(open_heap, (new_cost, neighbor))
+        else:
+            self.status = 'found'
+            #Don't need the heap anymore
+            self.open = []
+
+        self.expansions += expanded
+        return expanded
+
+    def get_next_step(self, cell):
+        '''get_next_step(self, cell)
+        ---------------------------------
+        Returns the next cell to move to from the passed in cell, or None
+        if the goal can't be reached from the cell'''
+        return self.next_steps.get(cell)
+
+
+class FlowFieldCache(object):
+    '''FlowFieldCache
+    -------------------------------------
+    Least recently used cache of built flow fields, keyed by goal cell.
+    Flow fields cover the whole grid, so we only keep max_size of them'''
+    def __init__(self, max_size=DEFAULT_MAX_FLOW_FIELDS):
+        self.max_size = max_size
+        self.fields = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __contains__(self, goal):
+        return goal in self.fields
+
+    def get(self, goal):
+        '''get(self, goal)
+        ---------------------------------
+        Returns the flow field for the goal (or None), and marks it as the
+        most recently used'''
+        try:
+            field = self.fields.pop(goal)
+        except KeyError:
+            return None
+        self.fields[goal] = field
+        return field
+
+    def peek(self, goal):
+        '''peek(self, goal)
+        ---------------------------------
+        Returns the flow field for the goal (or None), without marking it
+        as used'''
+        return self.fields.get(goal)
+
+    def add(self, field):
+        '''add(self, field)
+        ---------------------------------
+        Adds a built flow field, throwing out the least recently used field
+        if the cache is full'''
+        self.fields.pop(field.goal, None)
+        self.fields[field.goal] = field
+        while len(self.fields) > self.max_size:
+            self.fields.popitem(last=False)
+
+    def clear(self):
+        self.fields.clear()
+
+
+class PathMover(object):
+    '''PathMover
+    -------------------------------------
+    Moves entities along planned paths, one cell per tick.
+
+    Paths are cached per destination as a 'next step' tree: for every cell
+    on any path found to a goal, we store the next cell to move to.  Any
+    part of a shortest path is also a shortest path, so once one entity has
+    found its way to a goal, every other entity which reaches (or starts on)
+    that path can follow it without searching again.
+
+    When crowd_threshold or more entities are heading to the same goal, a
+    FlowField is built for the goal instead, and all of those entities
+    follow it.
+
+    Searches (and flow fields) are queued and only expansions_per_tick
+    nodes are expanded each tick, so a burst of move requests is spread
+    over several ticks instead of blowing the tick budget'''
+    def __init__(self, grid_map,
+        expansions_per_tick=DEFAULT_EXPANSIONS_PER_TICK,
+        max_cached_goals=DEFAULT_MAX_CACHED_GOALS,
+        max_flow_fields=DEFAULT_MAX_FLOW_FIELDS,
+        crowd_threshold=DEFAULT_CROWD_THRESHOLD,
+        max_failed=DEFAULT_MAX_FAILED):
+        self.grid_map = grid_map
+        self.expansions_per_tick = expansions_per_tick
+        self.max_cached_goals = max_cached_goals
+        self.max_failed = max_failed
+        self.crowd_threshold = crowd_threshold
+
+        #Dict of entity IDs to the goal cell they are moving to
+        self.goals = {}
+        #Queue of PathSearch objects waiting to be run
+        self.searches = collections.deque()
+        #Dict of (start, goal) to queued searches, so entities starting at
+        #   the same cell and heading to the same place share a search
+        self.queued_searches = {}
+        #Dict of goal cell to its next step tree, ordered by how recently
+        #   a path to the goal was added (least recent first)
+        self.next_steps = collections.OrderedDict()
+        #Dict of (start, goal) tuples we know there is no path for, least
+        #   recently added first
+        self.failed = collections.OrderedDict()
+        #Built flow fields, and the goals of flow fields which are queued
+        self.flow_fields = FlowFieldCache(max_size=max_flow_fields)
+        self.queued_flow_fields = {}
+        self.cache_version = grid_map.version
+
+    def __len__(self):
+        return len(self.goals)
+
+    '''====================================================================
+
+    Requests
+
+    ======================================================================='''
+    def move_to(self, entity, goal):
+        '''move_to(self, entity, goal)
+        ---------------------------------
+        Start moving the entity to the goal.  Goal can be a position, or
+        an entity (we'll use the entity's current position)'''
+        if not isinstance(goal, (list, tuple)):
+            goal = goal.position
+
+        goal = self.grid_map.get_cell(goal)
+        self.goals[entity.id] = goal
+        self.request_path(self.grid_map.get_cell(entity.position), goal)
+
+    def stop(self, entity):
+        '''stop(self, entity)
+        ---------------------------------
+        Stop moving the entity'''
+        self.goals.pop(entity.id, None)
+
+    def request_path(self, start, goal):
+        '''request_path(self, start, goal)
+        ---------------------------------
+        Queues a search from start to goal, unless we already know the way
+        (or a search is already queued)'''
+        if start == goal or self.get_next_step(start, goal) is not None:
+            return
+        if (start, goal) in self.queued_searches:
+            return
+        #A flow field for the goal is on the way, which will cover start
+        if goal in self.queued_flow_fields:
+            return
+
+        search = PathSearch(self.grid_map, start, goal)
+        self.queued_searches[(start, goal)] = search
+        self.searches.append(search)
+
+    def request_flow_field(self, goal):
+        '''request_flow_field(self, goal)
+        ---------------------------------
+        Queues building a flow field for the goal, unless one is already
+        built or queued.  Flow fields are put at the front of the queue,
+        since a whole crowd is waiting on them'''
+        if goal in self.flow_fields or goal in self.queued_flow_fields:
+            return
+
+        field = FlowField(self.grid_map, goal)
+        self.queued_flow_fields[goal] = field
+        self.searches.appendleft(field)
+
+    '''====================================================================
+
+    Path cache
+
+    ======================================================================='''
+    def check_cache_version(self):
+        '''check_cache_version(self)
+        ---------------------------------
+        If the map has changed, every cached path (and running search) may
+        be wrong, so throw them out'''
+        if self.cache_version != self.grid_map.version:
+            self.next_steps.clear()
+            self.failed.clear()
+            self.flow_fields.clear()
+            self.searches.clear()
+            self.queued_searches.clear()
+            self.queued_flow_fields.clear()
+            self.cache_version = self.grid_map.version
+
+    def get_next_step(self, cell, goal):
+        '''get_next_step(self, cell, goal)
+        ---------------------------------
+        Returns the next cell to move to from cell to reach goal, or None
+        if we don't know the way yet'''
+        field = self.flow_fields.peek(goal)
+        if field is not None:
+            return field.get_next_step(cell)
+
+        try:
+            return self.next_steps[goal].get(cell)
+        except KeyError:
+            return None
+
+    def add_path(self, start, goal, path):
+        '''add_path(self, start, goal, path)
+        ---------------------------------
+        Adds a found path to the goal's next step tree.  Cells already in
+        the tree keep their existing next step (which already leads to the
+        goal)'''
+        try:
+            tree = self.next_steps.pop(goal)
+        except KeyError:
+            tree = {}
+        #Re-add so the goal is the most recently used
+        self.next_steps[goal] = tree
+        if len(self.next_steps) > self.max_cached_goals:
+            self.next_steps.popitem(last=False)
+
+        cells = [start] + path
+        for i in xrange(len(cells) - 1):
+            if cells[i] not in tree:
+                tree[cells[i]] = cells[i + 1]
+
+    def add_failed(self, start, goal):
+        '''add_failed(self, start, goal)
+        ---------------------------------
+        Remembers that there's no path from start to goal.  Only the last
+        max_failed are kept, so entities asking for paths to lots of
+        unreachable places don't grow the cache forever'''
+        self.failed.pop((start, goal), None)
+        self.failed[(start, goal)] = True
+        if len(self.failed) > self.max_failed:
+            self.failed.popitem(last=False)
+
+    '''====================================================================
+
+    Tick
+
+    ======================================================================='''
+    def run_searches(self):
+        '''run_searches(self)
+        ---------------------------------
+        Runs queued searches (and flow fields) until this tick's expansion
+        budget is used up.  Returns the number of nodes expanded'''
+        budget = self.expansions_per_tick
+        expanded = 0
+
+        while len(self.searches) > 0 and expanded < budget:
+            search = self.searches[0]
+
+            if isinstance(search, FlowField):
+                expanded += search.run(budget - expanded)
+                if search.status == 'pending':
+                    break
+                if search.status == 'found':
+                    self.flow_fields.add(search)
+
+                self.searches.popleft()
+                self.queued_flow_fields.pop(search.goal, None)
+                continue
+
+            #Another search may have already found the way
+            if search.status == 'pending' and self.get_next_step(
+                search.start, search.goal) is None:
+                expanded += search.run(budget - expanded)
+                if search.status == 'pending':
+                    #Out of budget, continue next tick
+                    break
+                if search.status == 'found':
+                    self.add_path(search.start, search.goal, search.path)
+                else:
+                    self.add_failed(search.start, search.goal)
+
+            self.searches.popleft()
+            self.queued_searches.pop((search.start, search.goal), None)
+
+        return expanded
+
+    def step(self, entities):
+        '''step(self, entities)
+        ---------------------------------
+        Takes in a dict of entity IDs to entities (e.g., Entity._entities)
+        and moves every entity with a goal one cell closer.  Returns a list
+        of (entity_id, delta_x, delta_y) tuples for every entity that moved,
+        the same as Movement.RandomWalk.step'''
+        self.check_cache_version()
+
+        #Build flow fields for goals a crowd of entities is heading to
+        crowd_sizes = {}
+        for goal in self.goals.itervalues():
+            crowd_sizes[goal] = crowd_sizes.get(goal, 0) + 1
+        for goal in crowd_sizes:
+            if crowd_sizes[goal] >= self.crowd_threshold \
+                and self.flow_fields.get(goal) is None:
+                self.request_flow_field(goal)
+
+        self.run_searches()
+
+        deltas = []
+        for entity_id in self.goals.keys():
+            try:
+                entity = entities[entity_id]
+            except KeyError:
+                #Entity no longer exists
+                del self.goals[entity_id]
+                continue
+
+            goal = self.goals[entity_id]
+            cell = self.grid_map.get_cell(entity.position)
+            if cell == goal:
+                del self.goals[entity_id]
+                continue
+
+            next_cell = self.get_next_step(cell, goal)
+            if next_cell is None:
+                if (cell, goal) in self.failed or goal in self.flow_fields:
+                    #There's no way to get there
+                    del self.goals[entity_id]
+                    continue
+                #Entity isn't on a known path (it may have been moved by
+                #   something else), so look for one
+                self.request_path(cell, goal)
+                continue
+
+            delta_x = next_cell[0] - entity.position[0]
+            delta_y = next_cell[1] - entity.position[1]
+            entity.position[0] = next_cell[0]
+            entity.position[1] = next_cell[1]
+            deltas.append((entity_id, delta_x, delta_y))
+
+            if next_cell == goal:
+                del self.goals[entity_id]
+
+        return deltas
@@ -0,0 +1,395 @@
+"""=============================================================================
+    Planner.py
+    ------------
+    Contains the ActionPlanner class definition.  The action planner lets
+    entities pursue goals (from Goals.py) through multi step plans.  Actions
+    (from Actions.py) are used as the steps of a plan - their requirements
+    and preconditions must be met before they can be performed, and their
+    postconditions describe what is true after.
+
+    Plans are made over an abstract world state: a small set of facts about
+    the entity and its target, such as 'has_target' and 'near_target'.
+    Many entities share the same abstract state and goal, so plans are
+    cached and shared.  Once an entity has met its goals for its target, it
+    moves on to a new target and plans again.
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import collections
+import heapq
+
+#Vasir Engine imports
+import Action
+import Actions
+import Entity
+import Goals
+import Spatial
+
+"""=============================================================================
+
+PLANNER - GLOBAL SETTINGS
+
+============================================================================="""
+#PLANNER_STEPS
+#----------------
+#Steps a plan can use which aren't Actions.  These are performed by calling
+#   the ActionPlanner method with the same name
+PLANNER_STEPS = {
+    'get_target': {
+        'preconditions': {},
+        #A new target is neither near nor known yet
+        'postconditions': {
+            'has_target': True,
+            'near_target': False,
+            'knows_target': False,
+        },
+    },
+}
+
+#Longest plan we'll look for
+MAX_PLAN_LENGTH = 5
+#Default number of (uncached) plans made each tick
+DEFAULT_PLANS_PER_TICK = 100
+#Default number of plans to keep cached
+DEFAULT_MAX_CACHED_PLANS = 1024
+#How far away (in world units) entities look for a new target
+TARGET_RANGE = Actions.CONVERSE_MAX_RANGE
+#Most possible targets looked at when an entity looks for a new target
+MAX_TARGET_CANDIDATES = 8
+
+"""=============================================================================
+
+CLASS DEFINITIONS
+
+============================================================================="""
+class ActionPlanner(object):
+    '''ActionPlanner
+    -------------------------------------
+    Goal oriented action planner.  Finds the cheapest sequence of steps
+    (actions or planner steps) which takes an entity from its current
+    abstract world state to a goal's desired_state.
+
+    Plans are cached by (world state, goal), and only plans_per_tick new
+    plans are searched for each tick.  Entities which don't get a plan this
+    tick try again next tick'''
+    def __init__(self,
+        plans_per_tick=DEFAULT_PLANS_PER_TICK,
+        max_cached_plans=DEFAULT_MAX_CACHED_PLANS):
+        self.plans_per_tick = plans_per_tick
+        self.max_cached_plans = max_cached_plans
+
+        self.steps = self.get_steps()
+
+        #Dict of (world state, goal) to a plan (a tuple of step keys, or
+        #   None if there is no plan), least recently used first
+        self.plan_cache = collections.OrderedDict()
+        #Dict of entity IDs to (goal, remaining plan steps)
+        self.plans = {}
+        self.plans_made = 0
+        #Spatial hash of every entity, used to find targets.  It's built
+        #   the first time it's needed each tick
+        self.spatial_hash = None
+
+    def forget(self, entity_id):
+        '''forget(self, entity_id)
+        ---------------------------------
+        Removes an entity's current plan (e.g., when it's removed)'''
+        self.plans.pop(entity_id, None)
+
+    @classmethod
+    def get_steps(cls):
+        '''get_steps(cls)
+        ---------------------------------
+        Returns a dict of step keys to a dict of preconditions,
+        postconditions, and cost for every action and planner step.
+        Actions which have requirements also need the 'can_<action>' fact'''
+        steps = {}
+        for action_key in Action.Action._ACTIONS:
+            definition = Action.Action._ACTIONS[action_key]
+            if 'postconditions' not in definition:
+                continue
+
+            preconditions = dict(definition.get('preconditions', {}))
+            if definition.get('requirements') is not None:
+                preconditions['can_%s' % (action_key)] = True
+
+            steps[action_key] = {
+                'preconditions': preconditions,
+                'postconditions': definition['postconditions'],
+                'cost': definition.get('cost', 1),
+            }
+
+        for step_key in PLANNER_STEPS:
+            steps[step_key] = {
+                'preconditions': PLANNER_STEPS[step_key]['preconditions'],
+                'postconditions': PLANNER_STEPS[step_key]['postconditions'],
+                'cost': PLANNER_STEPS[step_key].get('cost', 1),
+            }
+
+        return steps
+
+    '''====================================================================
+
+    World State
+
+    ======================================================================='''
+    def get_world_state(self, entity):
+        '''get_world_state(self, entity)
+        ---------------------------------
+        Returns a frozenset of the facts which are true for the entity'''
+        facts = []
+        target = entity.target
+
+        #Only entities are targets for planning
+        if target is not None and target is not entity \
+            and hasattr(target, 'persona'):
+            facts.append('has_target')
+
+            dist_x = entity.position[0] - target.position[0]
+            dist_y = entity.position[1] - target.position[1]
+            if dist_x * dist_x + dist_y * dist_y \
+                <= Actions.CONVERSE_RANGE * Actions.CONVERSE_RANGE:
+                facts.append('near_target')
+
+            if target.id in entity.network:
+                facts.append('knows_target')
+
+        #Requirements are preconditions too
+        for action_key in Action.Action._ACTIONS:
+            definition = Action.Action._ACTIONS[action_key]
+            if definition.get('requirements') is None:
+                continue
+            if Actions.meets_action_requirements(definition, entity,
+                entity.target):
+                facts.append('can_%s' % (action_key))
+
+        return frozenset(facts)
+
+    def is_satisfied(self, state, desired_state):
+        '''is_satisfied(self, state, desired_state)
+        ---------------------------------
+        Returns True if every fact in desired_state has the desired value'''
+        for fact in desired_state:
+            if (fact in state) != desired_state[fact]:
+                return False
+        return True
+
+    def apply_step(self, state, step):
+        '''apply_step(self, state, step)
+        ---------------------------------
+        Returns the world state after performing the step'''
+        facts = set(state)
+        postconditions = step['postconditions']
+        for fact in postconditions:
+            if postconditions[fact]:
+                facts.add(fact)
+            else:
+                facts.discard(fact)
+        return frozenset(facts)
+
+    '''====================================================================
+
+    Planning
+
+    ======================================================================='''
+    def find_plan(self, state, desired_state):
+        '''find_plan(self, state, desired_state)
+        ---------------------------------
+        Searches for the cheapest plan (a tuple of step keys) which takes
+        the world state to the desired state.  Returns None if there isn't
+        one (within MAX_PLAN_LENGTH steps)'''
+        steps = self.steps
+        counter = 0
+        open_heap = [(0, counter, state, ())]
+        best_costs = {state: 0}
+
+        while len(open_heap) > 0:
+            cost, tie, cur_state, plan = heapq.heappop(open_heap)
+            if self.is_satisfied(cur_state, desired_state):
+                return plan
+            if len(plan) >= MAX_PLAN_LENGTH:
+                continue
+
+            for step_key in steps:
+                step = steps[step_key]
+                if not self.is_satisfied(cur_state, step['preconditions']):
+                    continue
+
+                new_state = self.apply_step(cur_state, step)
+                new_cost = cost + step['cost']
+                if new_state not in best_costs \
+                    or new_cost < best_costs[new_state]:
+                    best_costs[new_state] = new_cost
+                    counter += 1
+                    heapq.heappush(open_heap, (new_cost, counter, new_state,
+                        plan + (step_key,)))
+
+        return None
+
+    def get_plan(self, state, goal):
+        '''get_plan(self, state, goal)
+        ---------------------------------
+        Returns the cached plan for the world state and goal, searching for
+        one if it's not cached and we still have budget this tick.  Returns
+        False if we're out of budget'''
+        key = (state, goal)
+        try:
+            plan = self.plan_cache.pop(key)
+            self.plan_cache[key] = plan
+            return plan
+        except KeyError:
+            pass
+
+        if self.plans_made >= self.plans_per_tick:
+            return False
+        self.plans_made += 1
+
+        plan = self.find_plan(state, Goals.GOALS[goal]['desired_state'])
+        self.plan_cache[key] = plan
+        if len(self.plan_cache) > self.max_cached_plans:
+            self.plan_cache.popitem(last=False)
+        return plan
+
+    def get_goal(self, entity, state):
+        '''get_goal(self, entity, state)
+        ---------------------------------
+        Returns the entity's highest priority goal which has a desired
+        state that isn't satisfied yet (or None)'''
+        best_goal = None
+        best_priority = None
+        goals = entity.goals
+        for goal in goals:
+            desired_state = Goals.GOALS[goal].get('desired_state')
+            if desired_state is None \
+                or self.is_satisfied(state, desired_state):
+                continue
+            if best_priority is None \
+                or goals[goal]['priority'] > best_priority:
+                best_goal = goal
+                best_priority = goals[goal]['priority']
+        return best_goal
+
+    def has_desired_state(self, entity):
+        '''has_desired_state(self, entity)
+        ---------------------------------
+        Returns True if any of the entity's goals have a desired state (so
+        the entity has something to plan for)'''
+        for goal in entity.goals:
+            if Goals.GOALS[goal].get('desired_state') is not None:
+                return True
+        return False
+
+    '''====================================================================
+
+    Targets
+
+    ======================================================================='''
+    def get_spatial_hash(self):
+        '''get_spatial_hash(self)
+        ---------------------------------
+        Returns the spatial hash of every entity, building it if it hasn't
+        been built this tick'''
+        if self.spatial_hash is None:
+            self.spatial_hash = Spatial.SpatialHash.from_entities(
+                Entity.Entity._entities,
+                cell_size=TARGET_RANGE)
+        return self.spatial_hash
+
+    def get_target(self, entity):
+        '''get_target(self, entity)
+        ---------------------------------
+        Sets the entity's target to the nearest entity within TARGET_RANGE
+        which isn't in its network yet, and which there's a plan for (so
+        entities don't pick targets they can't e.g. converse with).  Uses
+        the spatial hash, so only nearby entities are looked at instead of
+        every entity, and at most MAX_TARGET_CANDIDATES are tried.  If
+        there isn't one, the entity targets itself (no target), like
+        Entity.get_target.  Returns the new target'''
+        entities = Entity.Entity._entities
+        network = entity.network
+        candidates = 0
+        for key, dist in self.get_spatial_hash().query_radius(
+            entity.position, TARGET_RANGE):
+            if key == entity.id or key in network:
+                continue
+            try:
+                entity.target = entities[key]
+            except KeyError:
+                continue
+
+            #False (out of budget this tick) is given the benefit of the
+            #   doubt
+            state = self.get_world_state(entity)
+            goal = self.get_goal(entity, state)
+            if goal is None or self.get_plan(state, goal) is not None:
+                return entity.target
+
+            candidates += 1
+            if candidates >= MAX_TARGET_CANDIDATES:
+                break
+
+        entity.target = entity
+        return entity.target
+
+    '''====================================================================
+
+    Tick
+
+    ======================================================================='''
+    def perform_step(self, entity, step_key):
+        '''perform_step(self, entity, step_key)
+        ---------------------------------
+        Performs a single plan step for the entity'''
+        if step_key in PLANNER_STEPS:
+            getattr(self, step_key)(entity)
+        else:
+            entity.perform_action(action=step_key, show_log=False)
+
+    def step(self, entities):
+        '''step(self, entities)
+        ---------------------------------
+        Takes in a dict (e.g., Entity._entities) or list of entities and
+        performs the next step of every entity's plan, making new plans
+        for entities which need them.  Returns a dict of entity IDs to the
+        step performed'''
+        if isinstance(entities, dict):
+            entities = entities.values()
+        self.plans_made = 0
+        self.spatial_hash = None
+
+        performed = {}
+        for entity in entities:
+            state = self.get_world_state(entity)
+
+            #Keep following the current plan if its next step can still be
+            #   performed
+            try:
+                goal, plan = self.plans[entity.id]
+                if len(plan) < 1 or not self.is_satisfied(state,
+                    self.steps[plan[0]]['preconditions']):
+                    raise KeyError
+            except KeyError:
+                goal = self.get_goal(entity, state)
+                if goal is None:
+                    self.plans.pop(entity.id, None)
+                    #Every goal is met for this target, so move on to a
+                    #   new one and plan for it next tick
+                    if self.has_desired_state(entity):
+                        self.get_target(entity)
+                        performed[entity.id] = 'get_target'
+                    continue
+
+                plan = self.get_plan(state, goal)
+                if not plan:
+                    #Out of budget (False) or no plan (None or empty)
+                    self.plans.pop(entity.id, None)
+                    continue
+
+            self.perform_step(entity, plan[0])
+            performed[entity.id] = plan[0]
+            self.plans[entity.id] = (goal, plan[1:])
+
+        return performed
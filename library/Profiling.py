@@ -0,0 +1,296 @@
+"""=============================================================================
+    Profiling.py
+    ------------
+    Instrumentation for the game loop.  A TickProfiler times the named
+    phases of each tick (polling, movement, building JSON, publishing,
+    handling requests, etc.) and keeps rolling histograms of the last so
+    many ticks, so it's easy to tell which phase made a tick run long.  A
+    SamplingProfiler can be switched on to find out which functions the
+    game loop spends its time in.
+
+    Both are off until they're enabled.  A disabled TickProfiler only costs
+    an attribute check per phase.
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import collections
+import os
+import sys
+import threading
+import time
+
+"""=============================================================================
+
+PROFILING - GLOBAL SETTINGS
+
+============================================================================="""
+#Number of ticks the rolling histograms cover
+DEFAULT_WINDOW = 1000
+
+#Percentiles reported for each phase
+PERCENTILES = (50, 95, 99)
+
+#Seconds between samples of the sampling profiler
+DEFAULT_SAMPLE_INTERVAL = 0.005
+#Number of functions get_stats() reports
+DEFAULT_TOP_FUNCTIONS = 20
+
+#Name the whole tick is recorded under
+TICK_PHASE = 'tick'
+
+"""=============================================================================
+
+CLASS DEFINITIONS
+
+============================================================================="""
+class RollingHistogram(object):
+    '''RollingHistogram
+    -------------------------------------
+    Keeps the last window values recorded, and reports percentiles of them.
+    Values are only sorted when the stats are asked for'''
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.values = collections.deque(maxlen=window)
+        #Number of values ever recorded (not just the ones in the window)
+        self.count = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def record(self, value):
+        self.values.append(value)
+        self.count += 1
+
+    def get_stats(self):
+        '''get_stats(self)
+        ---------------------------------
+        Returns a dict of the count, mean, max, and PERCENTILES (as p50,
+        p95, etc.) of the values in the window'''
+        values = sorted(self.values)
+        stats = {'count': self.count}
+        if len(values) < 1:
+            return stats
+
+        stats['mean'] = sum(values) / len(values)
+        stats['max'] = values[-1]
+        for percentile in PERCENTILES:
+            #Nearest rank percentile
+            index = int(len(values) * percentile / 100.0 + 0.5) - 1
+            stats['p%s' % (percentile)] = values[
+                min(max(index, 0), len(values) - 1)]
+        return stats
+
+class TickProfiler(object):
+    '''TickProfiler
+    -------------------------------------
+    Times the phases of each tick.  Call start_tick() when a tick starts,
+    mark(phase) when each phase finishes (the time since the previous mark
+    is recorded for the phase), and end_tick() when the tick is done.
+    Phase times are recorded in milliseconds.  Does nothing unless
+    enabled'''
+    def __init__(self, enabled=False, window=DEFAULT_WINDOW):
+        self.enabled = enabled
+        self.window = window
+        #Dict of phase names to RollingHistograms
+        self.phases = {}
+        #Phase names, in the order they were first marked
+        self.phase_order = []
+
+        self.tick_start = None
+        self.last_mark = None
+
+    def reset(self):
+        '''reset(self)
+        ---------------------------------
+        Throws away everything recorded so far'''
+        self.phases = {}
+        self.phase_order = []
+        self.tick_start = None
+        self.last_mark = None
+
+    def start_tick(self):
+        if not self.enabled:
+            return
+        self.tick_start = self.last_mark = time.time()
+
+    def mark(self, phase):
+        '''mark(self, phase)
+        ---------------------------------
+        Records the time since the last mark (or the start of the tick)
+        for phase.  Marking the same phase more than once in a tick records
+        it more than once'''
+        if not self.enabled or self.last_mark is None:
+            return
+        now = time.time()
+        self.record(phase, (now - self.last_mark) * 1000)
+        self.last_mark = now
+
+    def skip(self):
+        '''skip(self)
+        ---------------------------------
+        Leaves the time since the last mark out of every phase (e.g., the
+        delay between ticks)'''
+        if not self.enabled or self.last_mark is None:
+            return
+        self.last_mark = time.time()
+
+    def end_tick(self):
+        if not self.enabled or self.tick_start is None:
+            return
+        self.record(TICK_PHASE, (time.time() - self.tick_start) * 1000)
+        self.tick_start = self.last_mark = None
+
+    def record(self, phase, milliseconds):
+        try:
+            histogram = self.phases[phase]
+        except KeyError:
+            histogram = self.phases[phase] = RollingHistogram(self.window)
+            if phase != TICK_PHASE:
+                self.phase_order.append(phase)
+        histogram.record(milliseconds)
+
+    def get_stats(self):
+        '''get_stats(self)
+        ---------------------------------
+        Returns a dict of whether the profiler is enabled, the stats of
+        the whole tick, and the stats of each phase'''
+        stats = {
+            'enabled': self.enabled,
+            'window': self.window,
+            'phase_order': list(self.phase_order),
+            'phases': {},
+        }
+        for phase in self.phase_order:
+            stats['phases'][phase] = self.phases[phase].get_stats()
+        if TICK_PHASE in self.phases:
+            stats[TICK_PHASE] = self.phases[TICK_PHASE].get_stats()
+        return stats
+
+class SamplingProfiler(object):
+    '''SamplingProfiler
+    -------------------------------------
+    Statistical profiler.  While running, a background thread looks at the
+    profiled thread's stack every interval seconds and counts the function
+    it's in (self) and every function on the stack (total).  Since it
+    only looks every so often, the profiled thread runs at full speed'''
+    def __init__(self, thread_id=None, interval=DEFAULT_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+
+        self.samples = 0
+        #Dicts of (file, line, function name) tuples to sample counts
+        self.self_counts = collections.defaultdict(int)
+        self.total_counts = collections.defaultdict(int)
+
+        #The counts are updated from the sampling thread
+        self.lock = threading.Lock()
+        self.thread = None
+        self.running = False
+
+    def start(self, thread_id=None):
+        '''start(self, thread_id)
+        ---------------------------------
+        Starts sampling thread_id (defaults to the thread_id passed in when
+        the profiler was created, or the calling thread).  Returns False if
+        it's already running'''
+        if self.running:
+            return False
+        if thread_id is None:
+            thread_id = self.thread_id
+        if thread_id is None:
+            thread_id = threading.current_thread().ident
+        self.thread_id = thread_id
+
+        self.running = True
+        self.thread = threading.Thread(target=self.sample_loop)
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+    def stop(self):
+        '''stop(self)
+        ---------------------------------
+        Stops sampling.  Returns False if it wasn't running'''
+        if not self.running:
+            return False
+        self.running = False
+        self.thread.join()
+        self.thread = None
+        return True
+
+    def reset(self):
+        with self.lock:
+            self.samples = 0
+            self.self_counts.clear()
+            self.total_counts.clear()
+
+    def sample_loop(self):
+        while self.running:
+            self.sample()
+            time.sleep(self.interval)
+
+    def sample(self):
+        '''sample(self)
+        ---------------------------------
+        Takes one sample of the profiled thread's stack'''
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+
+        with self.lock:
+            self.samples += 1
+
+            code = frame.f_code
+            self.self_counts[(code.co_filename, frame.f_lineno,
+                code.co_name)] += 1
+
+            #Recursive functions are only counted once per sample
+            seen = set()
+            while frame is not None:
+                code = frame.f_code
+                key = (code.co_filename, code.co_firstlineno, code.co_name)
+                if key not in seen:
+                    seen.add(key)
+                    self.total_counts[key] += 1
+                frame = frame.f_back
+
+    def get_stats(self, top=DEFAULT_TOP_FUNCTIONS):
+        '''get_stats(self, top)
+        ---------------------------------
+        Returns a dict of whether the profiler is running, the number of
+        samples, and the top functions by self and total samples (as lists
+        of dicts with the function, the location, the number of samples
+        and the percent of all samples)'''
+        with self.lock:
+            return {
+                'running': self.running,
+                'interval': self.interval,
+                'samples': self.samples,
+                'self': get_top_functions(self.self_counts, self.samples,
+                    top),
+                'total': get_top_functions(self.total_counts,
+                    self.samples, top),
+            }
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+def get_top_functions(counts, samples, top=DEFAULT_TOP_FUNCTIONS):
+    '''get_top_functions(counts, samples, top)
+    ---------------------------------
+    Returns a list of the top functions in a dict of sample counts, most
+    samples first'''
+    functions = []
+    for key in sorted(counts, key=counts.get, reverse=True)[:top]:
+        filename, line, name = key
+        functions.append({
+            'function': name,
+            'location': '%s:%s' % (os.path.basename(filename), line),
+            'samples': counts[key],
+            'percent': 100.0 * counts[key] / max(samples, 1),
+        })
+    return functions
@@ -0,0 +1,264 @@
+"""=============================================================================
+    RedisIO.py
+    ------------
+    Batched redis I/O.  The server publishes game state updates and stores
+    its snapshot every tick; sent one at a time, each of those is a round
+    trip to redis which the game loop waits on.  A Batch collects the
+    publish and set commands made during a tick and sends them all in one
+    pipeline when it's flushed, so a tick costs one round trip however many
+    messages it sends.  Flushes can also be handed to a background thread,
+    so the game loop doesn't wait on redis at all (unless redis falls
+    behind).
+
+    Every client created with get_client() shares one connection pool, so
+    the game loop (e.g., restoring the game state) and the background
+    thread reuse connections instead of opening their own.
+
+    Large values can be compressed (with zlib) before they're sent.
+    Compressed values start with COMPRESSED_PREFIX, and Batch.get()
+    decompresses them.  Only stored values are compressed by default,
+    since subscribers expect published messages as plain text.
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import thread
+import time
+import zlib
+
+#Vasir Engine imports
+import Lazy
+import Metrics
+
+#Third party
+redis = Lazy.LazyModule('redis')
+#Only needed when flushing in the background
+Queue = Lazy.LazyModule('Queue')
+threading = Lazy.LazyModule('threading')
+
+"""=============================================================================
+
+REDIS IO - GLOBAL SETTINGS
+
+============================================================================="""
+DEFAULT_HOST = 'localhost'
+DEFAULT_PORT = 6379
+#Connections the shared pool opens at most
+DEFAULT_MAX_CONNECTIONS = 8
+
+#Compressed values start with this (it can't be the start of a Schema
+#   document or a JSON message)
+COMPRESSED_PREFIX = 'VZ1:'
+COMPRESSION_LEVEL = 1
+
+#Commands a batch holds before it's flushed without waiting for the end of
+#   the tick
+DEFAULT_MAX_PENDING = 10000
+#Flushes waiting for the background thread before flush() blocks
+DEFAULT_QUEUE_SIZE = 2
+
+#Metrics
+ROUND_TRIPS = Metrics.Counter('vasir_redis_round_trips_total',
+    'Round trips made to redis')
+COMMANDS = Metrics.Counter('vasir_redis_commands_total',
+    'Commands sent to redis, by command', ('command',))
+FLUSH_SECONDS = Metrics.Histogram('vasir_redis_flush_seconds',
+    'Time taken to send a batch of commands to redis')
+ERRORS = Metrics.Counter('vasir_redis_errors_total',
+    'Batches which failed to send in the background')
+COMPRESSED_BYTES = Metrics.Counter('vasir_redis_compressed_bytes_total',
+    'Bytes saved by compressing values sent to redis')
+
+"""=============================================================================
+
+CLASS DEFINITIONS
+
+============================================================================="""
+class Batch(object):
+    '''Batch
+    -------------------------------------
+    Wraps a redis client.  publish() and set() are queued until flush(),
+    which sends them in one pipeline (clients without pipelines, like
+    Replay.NullClient, get the commands one at a time).  get() goes
+    straight to redis.
+
+    If compress_threshold is passed in, stored values at least that many
+    bytes long are compressed (and published messages too, if
+    compress_messages is True).  If background is True, flushes are sent
+    from a background thread'''
+    def __init__(self, client, compress_threshold=None,
+        compress_messages=False, background=False,
+        max_pending=DEFAULT_MAX_PENDING):
+        self.client = client
+        self.compress_threshold = compress_threshold
+        self.compress_messages = compress_messages
+        self.max_pending = max_pending
+
+        #List of (command, args) tuples waiting to be sent
+        self.pending = []
+
+        #Background flushes
+        self.background = background
+        self.queue = None
+        self.thread = None
+        self.lock = thread.allocate_lock()
+
+    def publish(self, channel, message):
+        if self.compress_messages:
+            message = self.compress(message)
+        self.add('publish', (channel, message))
+
+    def set(self, key, value):
+        self.add('set', (key, self.compress(value)))
+
+    def get(self, key):
+        '''get(self, key)
+        ---------------------------------
+        Returns the value stored at key (decompressed), or None.  This is
+        sent straight away, not batched'''
+        ROUND_TRIPS.inc()
+        COMMANDS.labels('get').inc()
+        return decompress(self.client.get(key))
+
+    def add(self, command, args):
+        self.pending.append((command, args))
+        if len(self.pending) >= self.max_pending:
+            self.flush()
+
+    def compress(self, value):
+        if self.compress_threshold is None \
+            or len(value) < self.compress_threshold:
+            return value
+        compressed = COMPRESSED_PREFIX + zlib.compress(value,
+            COMPRESSION_LEVEL)
+        if len(compressed) >= len(value):
+            #Not worth it
+            return value
+        COMPRESSED_BYTES.inc(len(value) - len(compressed))
+        return compressed
+
+    def flush(self):
+        '''flush(self)
+        ---------------------------------
+        Sends the queued commands (or hands them to the background thread).
+        Returns the number of commands'''
+        commands, self.pending = self.pending, []
+        if len(commands) < 1:
+            return 0
+        if self.background:
+            self.start()
+            #Blocks if the background thread has fallen behind
+            self.queue.put(commands)
+        else:
+            self.send(commands)
+        return len(commands)
+
+    def send(self, commands):
+        '''send(self, commands)
+        ---------------------------------
+        Sends a list of (command, args) tuples to redis in one round trip'''
+        start_time = time.time()
+        pipeline = getattr(self.client, 'pipeline', None)
+        if pipeline is not None:
+            #No MULTI / EXEC, the commands don't need to be atomic
+            pipe = pipeline(transaction=False)
+            for command, args in commands:
+                getattr(pipe, command)(*args)
+            pipe.execute()
+            ROUND_TRIPS.inc()
+        else:
+            for command, args in commands:
+                getattr(self.client, command)(*args)
+                ROUND_TRIPS.inc()
+        for command, args in commands:
+            COMMANDS.labels(command).inc()
+        FLUSH_SECONDS.observe(time.time() - start_time)
+
+    '''====================================================================
+
+    Background thread
+
+    ======================================================================='''
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.queue = Queue.Queue(DEFAULT_QUEUE_SIZE)
+            self.thread = threading.Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def run(self):
+        while True:
+            commands = self.queue.get()
+            try:
+                if commands is None:
+                    return
+                try:
+                    self.send(commands)
+                except Exception as error:
+                    #Keep going; the next tick sends a fresh snapshot
+                    ERRORS.inc()
+                    print 'Could not send to redis: %s' % (error)
+            finally:
+                self.queue.task_done()
+
+    def wait(self):
+        '''wait(self)
+        ---------------------------------
+        Waits for the background thread to send everything it's been
+        handed'''
+        if self.queue is not None:
+            self.queue.join()
+
+    def close(self):
+        '''close(self)
+        ---------------------------------
+        Flushes, then stops the background thread (if it's running)'''
+        self.flush()
+        with self.lock:
+            worker, self.thread = self.thread, None
+        if worker is not None:
+            self.queue.put(None)
+            worker.join()
+            self.queue = None
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+#Connection pool shared by every client get_client() creates
+_pool = None
+_pool_lock = thread.allocate_lock()
+
+def get_pool(host=DEFAULT_HOST, port=DEFAULT_PORT,
+    max_connections=DEFAULT_MAX_CONNECTIONS):
+    '''get_pool(host, port, max_connections)
+    ---------------------------------
+    Returns the shared connection pool, creating it (with the passed in
+    settings) the first time.  When every connection is in use, threads
+    wait for one to be given back'''
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = redis.BlockingConnectionPool(host=host, port=port,
+                max_connections=max_connections)
+        return _pool
+
+def get_client(**kwargs):
+    '''get_client(**kwargs)
+    ---------------------------------
+    Returns a redis client which uses the shared connection pool.  kwargs
+    are passed to get_pool()'''
+    return redis.StrictRedis(connection_pool=get_pool(**kwargs))
+
+def decompress(value):
+    '''decompress(value)
+    ---------------------------------
+    Returns a value read from redis, decompressed if it was compressed'''
+    if value is not None and value.startswith(COMPRESSED_PREFIX):
+        return zlib.decompress(value[len(COMPRESSED_PREFIX):])
+    return value
@@ -0,0 +1,251 @@
+"""=============================================================================
+    Registry.py
+    ------------
+    Contains the EntityRegistry class definition.  The registry owns every
+    live entity.  Entities get an integer handle when they spawn, and can be
+    despawned, which removes every reference the engine keeps to them so
+    they can be garbage collected.  Slots of despawned entities are reused
+    by new entities, so the registry doesn't grow on a long running server.
+
+    Handles are generational: the low INDEX_BITS bits are the entity's slot
+    and the rest are the slot's generation, which goes up every time the
+    slot is freed.  Looking up a handle is a list index plus a compare, and
+    a handle kept around after its entity was despawned (a stale handle)
+    never finds the entity which reused the slot.
+============================================================================="""
+"""=============================================================================
+
+REGISTRY - GLOBAL SETTINGS
+
+============================================================================="""
+#Number of bits of a handle used for the slot index (up to ~16 million
+#   live entities)
+INDEX_BITS = 24
+INDEX_MASK = (1 << INDEX_BITS) - 1
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+def make_handle(index, generation):
+    return (generation << INDEX_BITS) | index
+
+def get_handle_index(handle):
+    return handle & INDEX_MASK
+
+def get_handle_generation(handle):
+    return handle >> INDEX_BITS
+
+"""=============================================================================
+
+CLASS DEFINITIONS
+
+============================================================================="""
+class EntityRegistry(object):
+    '''EntityRegistry
+    -------------------------------------
+    Keeps a list of slots (slot index -> entity, or None for a free slot),
+    the current generation of each slot, and a dict of entity IDs to
+    entities (e.g., Entity._entities), which is kept in sync with the
+    slots.
+
+    The registry is the only thing which should hold on to entities for
+    good.  Network entries, memories, and targets of other entities also
+    reference entities, so despawn cleans those up.  Anything else which
+    needs to refer to an entity without keeping it alive should use the
+    entity's handle, ID, or a weakref'''
+    def __init__(self, entities=None):
+        if entities is None:
+            entities = {}
+        #Dict of entity IDs to entities
+        self.entities = entities
+        #List of slot indexes to entities.  Free slots are None
+        self.slots = []
+        #List of slot indexes to the slot's current generation
+        self.generations = []
+        #Indexes of free slots, reused before the slot list grows
+        self.free_slots = []
+
+    def __len__(self):
+        return len(self.entities)
+
+    def clear(self):
+        '''clear(self)
+        ---------------------------------
+        Removes every entity and resets the slots, so handles start from
+        the beginning again (e.g., before replaying a session).  Entities
+        aren't cleaned up, since they're all going away'''
+        self.entities.clear()
+        self.slots = []
+        self.generations = []
+        self.free_slots = []
+
+    def __contains__(self, entity):
+        return self.get_handle(entity) is not None
+
+    '''====================================================================
+
+    Lookup
+
+    ======================================================================='''
+    def get(self, handle):
+        '''get(self, handle)
+        ---------------------------------
+        Returns the entity the passed in handle refers to, or None if the
+        handle is stale (or invalid)'''
+        try:
+            entity = self.slots[handle & INDEX_MASK]
+        except (IndexError, TypeError):
+            return None
+        if entity is None or entity.handle != handle:
+            return None
+        return entity
+
+    def get_by_id(self, entity_id):
+        return self.entities.get(entity_id)
+
+    def resolve(self, entity):
+        '''resolve(self, entity)
+        ---------------------------------
+        Takes in an entity, entity ID, or handle and returns the live entity
+        it refers to (or None)'''
+        handle = self.get_handle(entity)
+        if handle is None:
+            return None
+        return self.slots[handle & INDEX_MASK]
+
+    def get_handle(self, entity):
+        '''get_handle(self, entity)
+        ---------------------------------
+        Takes in an entity, entity ID, or handle and returns the handle of
+        the live entity it refers to (or None)'''
+        if isinstance(entity, basestring):
+            entity = self.entities.get(entity)
+        elif isinstance(entity, (int, long)):
+            entity = self.get(entity)
+        if entity is None:
+            return None
+
+        handle = getattr(entity, 'handle', None)
+        if self.get(handle) is not entity:
+            return None
+        return handle
+
+    '''====================================================================
+
+    Spawn / Despawn
+
+    ======================================================================='''
+    def spawn(self, entity):
+        '''spawn(self, entity)
+        ---------------------------------
+        Adds an entity to the registry, reusing a free slot if there is one.
+        Sets and returns the entity's handle.  The entity's ID is interned,
+        so every network key and message lookup shares the same string'''
+        if isinstance(entity.id, str):
+            entity.id = intern(entity.id)
+
+        if len(self.free_slots) > 0:
+            index = self.free_slots.pop()
+            self.slots[index] = entity
+        else:
+            index = len(self.slots)
+            self.slots.append(entity)
+            self.generations.append(0)
+
+        handle = make_handle(index, self.generations[index])
+        entity.handle = handle
+        self.entities[entity.id] = entity
+        return handle
+
+    def despawn(self, entity):
+        '''despawn(self, entity)
+        ---------------------------------
+        Takes in an entity, entity ID, or handle and removes it.  Returns
+        False if it wasn't a live entity'''
+        return len(self.despawn_many([entity])) > 0
+
+    def despawn_many(self, entities):
+        '''despawn_many(self, entities)
+        ---------------------------------
+        Takes in a list of entities (or entity IDs or handles) and removes
+        them.  Other entities forget them: their network entries are
+        removed, as are the memories of actions with them (memories only
+        come from actions which also add a network entry), and targets
+        pointing at them are cleared.  Returns a list of the IDs of the
+        entities which were removed.
+
+        This takes a single pass over the remaining entities, so despawn
+        entities in batches when removing a lot of them'''
+        dead = {}
+        for entity in entities:
+            handle = self.get_handle(entity)
+            if handle is None:
+                continue
+            index = handle & INDEX_MASK
+            entity = self.slots[index]
+            dead[entity.id] = entity
+
+            #Bump the generation so the old handle goes stale
+            self.slots[index] = None
+            self.generations[index] += 1
+            self.free_slots.append(index)
+            del self.entities[entity.id]
+
+        if len(dead) < 1:
+            return []
+
+        for entity in self.entities.itervalues():
+            #Targets
+            target = entity.target
+            if target is not None:
+                if isinstance(target, list):
+                    #Either a list of entities or a location
+                    alive = [item for item in target
+                        if not self.is_dead(item, dead)]
+                    if len(alive) < len(target):
+                        entity.target = alive or None
+                elif self.is_dead(target, dead):
+                    entity.target = None
+
+            #Network and memories
+            network = entity.network
+            if len(network) < 1:
+                continue
+            removed = False
+            if len(network) < len(dead):
+                for entity_id in network.keys():
+                    if entity_id in dead:
+                        del network[entity_id]
+                        removed = True
+            else:
+                for entity_id in dead:
+                    if network.pop(entity_id, None) is not None:
+                        removed = True
+
+            if removed and len(entity.memory) > 0:
+                entity.memory = [action for action in entity.memory
+                    if not self.is_dead(action.source, dead)
+                        and not self.is_dead(action.target, dead)]
+
+        #The despawned entities let go of everything too, so they don't
+        #   keep other entities alive
+        for entity in dead.itervalues():
+            entity.network = {}
+            entity.memory = []
+            entity.target = None
+            entity.handle = None
+
+        return dead.keys()
+
+    def is_dead(self, entity, dead):
+        '''is_dead(self, entity, dead)
+        ---------------------------------
+        Returns True if the passed in object is one of the entities in the
+        dead dict (of entity IDs to entities)'''
+        try:
+            return dead.get(entity.id) is entity
+        except AttributeError:
+            #Not an entity (e.g., a location)
+            return False
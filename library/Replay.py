@@ -0,0 +1,235 @@
+"""=============================================================================
+    Replay.py
+    ------------
+    Record / replay of server sessions.  A ReplayLog records the world the
+    session started from (if it wasn't empty), the systems it ran, the
+    seeds the server's random number generators were seeded with and every
+    command the server received, along with the tick it was handled on.  A
+    Replayer runs a recorded session again without any networking, as fast
+    as possible, which reproduces it exactly - useful for debugging and for
+    comparing the performance of engine changes on the same workload.
+
+    Replay logs are text files with one JSON object per line:
+
+        {"version": 3}
+        {"tick": 0, "seed": 1234}
+        {"tick": 0, "systems": ["path"]}
+        {"tick": 0, "world": "<base64 Schema.dumps of the world>"}
+        {"tick": 12, "command": "create_entity", "reply": "..."}
+        {"tick": 340, "end": true}
+
+    Usage:
+
+        python Server.py --record session.log
+        python Replay.py session.log
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import base64
+import json
+import optparse
+import time
+
+#Vasir Engine imports
+import Entity
+import Schema
+import Server
+
+"""=============================================================================
+
+REPLAY - GLOBAL SETTINGS
+
+============================================================================="""
+#Version 2 added world entries, and version 3 systems entries.  Older logs
+#   always start from an empty world with the default systems, so they can
+#   still be replayed
+REPLAY_VERSION = 3
+
+"""=============================================================================
+
+CLASS DEFINITIONS
+
+============================================================================="""
+class ReplayLog(object):
+    '''ReplayLog
+    -------------------------------------
+    Records a session to a replay log file.  Lines are flushed as they're
+    written, so the log survives the server crashing'''
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'w')
+        self.write({'version': REPLAY_VERSION})
+
+    def write(self, entry):
+        self.file.write(json.dumps(entry) + '\n')
+        self.file.flush()
+
+    def record_seed(self, tick, seed):
+        self.write({'tick': tick, 'seed': seed})
+
+    def record_systems(self, tick, systems):
+        self.write({'tick': tick, 'systems': systems})
+
+    def record_world(self, tick, seed=None):
+        '''record_world(self, tick, seed)
+        ---------------------------------
+        Records the whole world (serialized with Schema), which the replay
+        loads in place of whatever it had at this tick'''
+        self.write({'tick': tick,
+            'world': base64.b64encode(Schema.dumps(tick, seed))})
+
+    def record(self, tick, command, reply=None):
+        self.write({'tick': tick, 'command': command, 'reply': reply})
+
+    def close(self, tick):
+        '''close(self, tick)
+        ---------------------------------
+        Records the tick the session ended on and closes the file'''
+        if self.file.closed:
+            return
+        self.write({'tick': tick, 'end': True})
+        self.file.close()
+
+class NullClient(object):
+    '''NullClient
+    -------------------------------------
+    Stands in for the redis client when replaying.  Nothing is published or
+    stored, and nothing is ever found'''
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        return True
+
+    def publish(self, channel, message):
+        return 0
+
+class Replayer(object):
+    '''Replayer
+    -------------------------------------
+    Replays a replay log with a headless server: no sockets, no redis, and
+    no delay between ticks.  The world is reset first (and replaced by the
+    recorded world, if the session didn't start from an empty one), so the
+    entities (and their IDs) are created exactly as they were'''
+    def __init__(self, path):
+        self.path = path
+        self.entries = load(path)
+
+        #Last tick of the session
+        self.end_tick = 0
+        for entry in self.entries:
+            self.end_tick = max(self.end_tick, entry['tick'])
+
+        self.server = None
+        #Commands whose reply was different than the recorded reply
+        self.mismatches = []
+
+    def run(self, end_tick=None):
+        '''run(self, end_tick)
+        ---------------------------------
+        Replays the session up to (and including) end_tick, which defaults
+        to the end of the session.  Returns a dict of stats'''
+        if end_tick is None:
+            end_tick = self.end_tick
+
+        Entity.Entity.reset_world()
+        self.server = Server.Server(client=NullClient(), seed=0)
+        self.mismatches = []
+        server = self.server
+
+        start_time = time.time()
+        ticks = 0
+        commands = 0
+        index = 0
+        entries = self.entries
+        for tick in xrange(end_tick + 1):
+            server.tick = tick
+
+            #Seeds, systems, and worlds take effect before the game loop,
+            #   commands after (the same order as Server.run)
+            while index < len(entries) and entries[index]['tick'] == tick \
+                and 'command' not in entries[index] \
+                and 'end' not in entries[index]:
+                entry = entries[index]
+                index += 1
+                if 'world' in entry:
+                    Schema.loads(base64.b64decode(entry['world']))
+                elif 'systems' in entry:
+                    server.set_systems(entry['systems'])
+                else:
+                    server.seed(entry['seed'])
+
+            #The session ended before this tick's game loop ran
+            if index < len(entries) and entries[index]['tick'] == tick \
+                and 'end' in entries[index]:
+                break
+
+            server.step()
+            server.flush()
+            ticks += 1
+
+            while index < len(entries) and entries[index]['tick'] == tick:
+                entry = entries[index]
+                index += 1
+                if 'seed' in entry:
+                    server.seed(entry['seed'])
+                elif 'command' in entry:
+                    commands += 1
+                    reply = server.handle_message(
+                        entry['command'].encode('utf-8'))
+                    if reply != entry['reply']:
+                        self.mismatches.append((tick, entry['command'],
+                            entry['reply'], reply))
+
+        seconds = time.time() - start_time
+        return {
+            'ticks': ticks,
+            'commands': commands,
+            'seconds': seconds,
+            'ticks_per_second': ticks / max(seconds, 1e-9),
+            'mismatches': len(self.mismatches),
+        }
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+def load(path):
+    '''load(path)
+    ---------------------------------
+    Returns a list of the entries in a replay log (without the version
+    line), in order'''
+    entries = []
+    with open(path) as replay_file:
+        header = json.loads(replay_file.readline())
+        if header.get('version') not in (1, 2, REPLAY_VERSION):
+            raise ValueError('Unsupported replay log version: %s' % (
+                header.get('version')))
+        for line in replay_file:
+            if line.strip():
+                entries.append(json.loads(line))
+    return entries
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(usage='%prog [options] replay_log')
+    parser.add_option('--ticks', type='int', default=None,
+        help='Only replay up to this tick')
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('A replay log is required')
+
+    replayer = Replayer(args[0])
+    results = replayer.run(options.ticks)
+    print 'Replayed %s ticks, %s commands in %.2f seconds (%.1f ticks/sec)' \
+        % (results['ticks'], results['commands'], results['seconds'],
+            results['ticks_per_second'])
+    if results['mismatches'] > 0:
+        print '%s replies were different than recorded:' % (
+            results['mismatches'])
+        for tick, command, recorded, reply in replayer.mismatches:
+            print '    tick %s: %s: %s != %s' % (tick, command, recorded,
+                reply)
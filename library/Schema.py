@@ -0,0 +1,610 @@
+"""=============================================================================
+    Schema.py
+    ------------
+    Versioned serialization schema for the world (entities, their networks
+    and memories).  Instead of pickling classes and live objects, the world
+    is turned into a document of plain data (dicts, lists, strings and
+    numbers) with a fixed layout, then marshalled:
+
+        {
+            'version': SCHEMA_VERSION,
+            'tick': 120, 'seed': 7, 'created_count': 2,
+            'entity_fields': ['id', 'name', ...],
+            'entities': [('entity_0_Gon', 'Gon', ...), ...],
+            'event_fields': ['key', 'source', 'target', ...],
+            'events': [('converse', 0, 1, ...), ...],
+        }
+
+    Each entity and event is a tuple, in the order of the document's field
+    list.  References to other entities are stored as their index in the
+    entities list, memories as indexes in the events list, races by name
+    and genders by label.  Decoding looks fields up by name, so fields can
+    be added (missing ones get their default from ENTITY_DEFAULTS) without
+    breaking old documents.
+
+    Changes which can't be handled that way bump SCHEMA_VERSION and
+    register a migration, which upgrades a document from the version before:
+
+        @Schema.register_migration(1)
+        def add_reputation(document):
+            document['entity_fields'].append('reputation')
+            document['entities'] = [entity + (0,)
+                for entity in document['entities']]
+            return document
+
+    Serialized documents start with MAGIC and the schema version, so a
+    document from a newer engine (or something which isn't a document) is
+    rejected instead of being misread.
+
+    dumps() and loads() create (or throw away) millions of small
+    containers, which would set off the garbage collector over and over
+    for nothing (none of them are garbage yet), so it's paused while they
+    run.
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import gc
+import marshal
+import struct
+
+#Vasir Engine imports
+import Action
+import Entity
+import Race
+
+"""=============================================================================
+
+SCHEMA - GLOBAL SETTINGS
+
+============================================================================="""
+SCHEMA_VERSION = 1
+
+#Serialized documents start with MAGIC, then the schema version (an
+#   unsigned short), then the marshalled document
+MAGIC = 'VSW'
+HEADER = struct.Struct('!3sH')
+#marshal format version.  Version 2 is the same for every python 2 release
+MARSHAL_VERSION = 2
+
+#FIELDS
+#----------------
+#Entity fields, in the order they're stored
+ENTITY_FIELDS = (
+    'id',
+    'name',
+    'age',
+    'race',         #race name
+    'gender',       #gender label (e.g., 'Female'), from Entity.GENDER
+    'hunger',
+    'restedness',
+    'stats',
+    'money',
+    'persona',
+    'DEFAULT_ATTRIBUTE_VALUE',
+    'mood',
+    'goals',
+    'position',
+    'target',       #reference (see encode_reference)
+    'network',      #list of (entity index, value)
+    'memory',       #list of event indexes
+)
+#Event (action) fields, in the order they're stored
+EVENT_FIELDS = (
+    'key',          #registered action key, or None
+    'source',       #reference
+    'target',       #reference
+    'values',
+    #Dict of requirements, effects, add_to_memory, and string_repr for
+    #   actions without a registered definition, otherwise None
+    'custom',
+    #True if values or custom contain entity references, which have to
+    #   be decoded
+    'references',
+)
+
+#Entity fields which documents must have
+REQUIRED_ENTITY_FIELDS = ('id', 'name')
+#Functions which return the value of an entity field a document doesn't
+#   have
+ENTITY_DEFAULTS = {
+    'age': lambda: 0,
+    'race': lambda: None,
+    'gender': lambda: None,
+    'hunger': lambda: 0,
+    'restedness': lambda: 0,
+    'stats': dict,
+    'money': lambda: 0,
+    'persona': dict,
+    'DEFAULT_ATTRIBUTE_VALUE': lambda: 0,
+    'mood': dict,
+    'goals': dict,
+    'position': lambda: [0, 0, 0],
+    'target': lambda: None,
+    'network': list,
+    'memory': list,
+}
+
+#Slots of actions without a registered definition, which are stored in
+#   the custom field
+CUSTOM_ACTION_FIELDS = ('requirements', 'effects', 'add_to_memory',
+    'string_repr')
+
+#REFERENCES
+#----------------
+#Targets are stored as None, (REFERENCE_ENTITY, index),
+#   (REFERENCE_ENTITIES, [indexes]), or (REFERENCE_VALUE, value) for
+#   anything else (e.g., a location)
+REFERENCE_ENTITY = 'e'
+REFERENCE_ENTITIES = 'l'
+REFERENCE_VALUE = 'v'
+
+#Entities inside event values are replaced with (ENTITY_MARKER, index)
+ENTITY_MARKER = '__entity__'
+
+#MIGRATIONS
+#----------------
+#Dict of schema versions to functions which upgrade a document from that
+#   version to the next (see register_migration)
+MIGRATIONS = {}
+
+"""=============================================================================
+
+CLASS DEFINITIONS
+
+============================================================================="""
+class SchemaError(ValueError):
+    '''SchemaError
+    -------------------------------------
+    Raised when the world can't be encoded, or a document can't be
+    decoded'''
+    pass
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+def register_migration(version):
+    '''register_migration(version)
+    ---------------------------------
+    Decorator which registers a function that upgrades a document from
+    version to version + 1.  The function is passed the document and
+    returns the upgraded document'''
+    def register(function):
+        if version in MIGRATIONS:
+            raise SchemaError('Migration already registered for version '
+                '%s' % (version))
+        MIGRATIONS[version] = function
+        return function
+    return register
+
+def migrate(document):
+    '''migrate(document)
+    ---------------------------------
+    Upgrades a document to SCHEMA_VERSION, one migration at a time.  Raises
+    a SchemaError if the document is newer than SCHEMA_VERSION, or a
+    migration is missing'''
+    version = document.get('version')
+    if not isinstance(version, int) or version > SCHEMA_VERSION:
+        raise SchemaError('Unsupported schema version: %s' % (version))
+    while version < SCHEMA_VERSION:
+        try:
+            migration = MIGRATIONS[version]
+        except KeyError:
+            raise SchemaError('No migration from schema version %s' % (
+                version))
+        document = migration(document)
+        version += 1
+        document['version'] = version
+    return document
+
+#------------------------------------
+#Encoding
+#------------------------------------
+def encode_reference(value, rows):
+    '''encode_reference(value, rows)
+    ---------------------------------
+    Returns a target (an entity, list of entities, or anything else) in
+    stored form.  rows is a dict of entity IDs to their index.  Entities
+    which aren't in the world are stored as None'''
+    if value is None:
+        return None
+    elif isinstance(value, Entity.Entity):
+        row = rows.get(value.id)
+        if row is None:
+            return None
+        return (REFERENCE_ENTITY, row)
+    elif isinstance(value, (list, tuple)) and len(value) > 0 \
+        and all([isinstance(item, Entity.Entity) for item in value]):
+        return (REFERENCE_ENTITIES, [rows[item.id] for item in value
+            if item.id in rows])
+    return (REFERENCE_VALUE, value)
+
+def encode_value(value, rows):
+    '''encode_value(value, rows)
+    ---------------------------------
+    Returns a copy of value (plain data, which may contain entities) with
+    entities replaced by (ENTITY_MARKER, index)'''
+    if isinstance(value, Entity.Entity):
+        return (ENTITY_MARKER, rows.get(value.id))
+    elif isinstance(value, dict):
+        return dict([(key, encode_value(value[key], rows))
+            for key in value])
+    elif isinstance(value, list):
+        return [encode_value(item, rows) for item in value]
+    elif isinstance(value, tuple):
+        return tuple([encode_value(item, rows) for item in value])
+    return value
+
+def has_entities(value):
+    '''has_entities(value)
+    ---------------------------------
+    Returns True if value (or anything in it) is an entity'''
+    if isinstance(value, Entity.Entity):
+        return True
+    elif isinstance(value, dict):
+        return any([has_entities(item) for item in value.itervalues()])
+    elif isinstance(value, (list, tuple)):
+        return any([has_entities(item) for item in value])
+    return False
+
+def get_document(tick=0, seed=None):
+    '''get_document(tick, seed)
+    ---------------------------------
+    Returns the world as a document (see the module docstring).  Entities
+    are stored in handle order'''
+    entities = sorted(Entity.Entity._entities.itervalues(),
+        key=lambda entity: entity.handle)
+    rows = dict([(entity.id, row) for row, entity in enumerate(entities)])
+
+    #Dict of id(action) to event index, so actions shared between
+    #   memories are only stored once
+    event_indexes = {}
+    events = []
+
+    encoded_entities = []
+    for entity in entities:
+        memory = []
+        for action in entity.memory:
+            index = event_indexes.get(id(action))
+            if index is None:
+                index = event_indexes[id(action)] = len(events)
+                events.append(encode_event(action, rows))
+            memory.append(index)
+        encoded_entities.append(encode_entity(entity, rows, memory))
+
+    return {
+        'version': SCHEMA_VERSION,
+        'tick': tick,
+        'seed': seed,
+        'created_count': Entity.Entity._entity_created_count,
+        'entity_fields': list(ENTITY_FIELDS),
+        'entities': encoded_entities,
+        'event_fields': list(EVENT_FIELDS),
+        'events': events,
+    }
+
+def encode_entity(entity, rows, memory):
+    '''encode_entity(entity, rows, memory)
+    ---------------------------------
+    Returns an entity in stored form (a tuple of ENTITY_FIELDS).  memory is
+    the list of the entity's event indexes'''
+    race = entity.race
+    if race is not None:
+        race = race.name
+
+    gender = entity.gender
+    if gender is not None:
+        gender = gender[1]
+
+    return (
+        entity.id,
+        entity.name,
+        entity.age,
+        race,
+        gender,
+        entity.hunger,
+        entity.restedness,
+        entity.stats,
+        entity.money,
+        entity.persona,
+        entity.DEFAULT_ATTRIBUTE_VALUE,
+        entity.mood,
+        entity.goals,
+        entity.position,
+        encode_reference(entity.target, rows),
+        [(rows[other_id], entity.network[other_id]['value'])
+            for other_id in entity.network if other_id in rows],
+        memory,
+    )
+
+def encode_event(action, rows):
+    '''encode_event(action, rows)
+    ---------------------------------
+    Returns an action in stored form (a tuple of EVENT_FIELDS)'''
+    key = None
+    custom = None
+    if action.definition is not None:
+        key = action.definition['key']
+    else:
+        custom = dict([(field, getattr(action, field))
+            for field in CUSTOM_ACTION_FIELDS])
+
+    values = action.values
+    references = has_entities(values) or has_entities(custom)
+    if references:
+        values = encode_value(values, rows)
+        custom = encode_value(custom, rows)
+
+    return (
+        key,
+        encode_reference(action.source, rows),
+        encode_reference(action.target, rows),
+        values,
+        custom,
+        references,
+    )
+
+def dumps(tick=0, seed=None):
+    '''dumps(tick, seed)
+    ---------------------------------
+    Returns the world, serialized.  Raises a SchemaError if any of it isn't
+    plain data'''
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return encode(get_document(tick, seed))
+    finally:
+        if enabled:
+            gc.enable()
+
+def encode(document):
+    '''encode(document)
+    ---------------------------------
+    Returns a document, serialized'''
+    try:
+        data = marshal.dumps(document, MARSHAL_VERSION)
+    except ValueError as error:
+        raise SchemaError('World contains values the schema can\'t store '
+            '(%s)' % (error))
+    return HEADER.pack(MAGIC, document['version']) + data
+
+#------------------------------------
+#Decoding
+#------------------------------------
+def is_document(data):
+    '''is_document(data)
+    ---------------------------------
+    Returns True if data is a serialized document'''
+    return data is not None and data[:len(MAGIC)] == MAGIC
+
+def decode(data):
+    '''decode(data)
+    ---------------------------------
+    Returns a serialized document, migrated to SCHEMA_VERSION'''
+    if not is_document(data) or len(data) < HEADER.size:
+        raise SchemaError('Not a world document')
+    magic, version = HEADER.unpack_from(data)
+    if version > SCHEMA_VERSION:
+        raise SchemaError('Unsupported schema version: %s' % (version))
+    try:
+        document = marshal.loads(data[HEADER.size:])
+    except (ValueError, EOFError, TypeError) as error:
+        raise SchemaError('Corrupt world document (%s)' % (error))
+    return migrate(document)
+
+def loads(data):
+    '''loads(data)
+    ---------------------------------
+    Replaces the world with a serialized one.  Entities get new handles.
+    Returns the document's header (a dict with version, tick, seed and
+    created_count keys)'''
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return load_document(decode(data))
+    finally:
+        if enabled:
+            gc.enable()
+
+def load_document(document):
+    '''load_document(document)
+    ---------------------------------
+    Replaces the world with a document (which must be at SCHEMA_VERSION).
+    Returns the document's header'''
+    entity_fields = document['entity_fields']
+    for field in REQUIRED_ENTITY_FIELDS:
+        if field not in entity_fields:
+            raise SchemaError('Documents need an entity %s field' % (field))
+
+    #Fields are looked up by name.  Fields this version doesn't know about
+    #   are ignored, and missing fields get their defaults
+    indexes = dict([(field, index) for index, field
+        in enumerate(entity_fields) if field in ENTITY_FIELDS])
+    slots = [(field, indexes[field]) for field in ENTITY_FIELDS
+        if field in indexes and field not in ('race', 'gender', 'target',
+        'network', 'memory', 'position')]
+    defaults = [(field, ENTITY_DEFAULTS[field]) for field in ENTITY_FIELDS
+        if field not in indexes]
+
+    genders = dict([(gender[1], gender) for gender in Entity.Entity.GENDER])
+    races = {}
+
+    #Create every entity first, so references to entities which haven't
+    #   been loaded yet can be filled in
+    encoded_entities = document['entities']
+    entities = [Entity.Entity.__new__(Entity.Entity)
+        for i in xrange(len(encoded_entities))]
+    id_index = indexes['id']
+    race_index = indexes.get('race')
+    gender_index = indexes.get('gender')
+    position_index = indexes.get('position')
+
+    for entity, values in zip(entities, encoded_entities):
+        for field, index in slots:
+            setattr(entity, field, values[index])
+        for field, default in defaults:
+            setattr(entity, field, default())
+        #IDs are interned, the same as when entities spawn
+        entity.id = intern(values[id_index])
+
+        if race_index is not None:
+            name = values[race_index]
+            entity.race = None
+            if name is not None:
+                #Entities of the same race share a Race, the same as when
+                #   they're created
+                race = races.get(name)
+                if race is None:
+                    race = races[name] = Race.Race()
+                    race.name = name
+                entity.race = race
+        if gender_index is not None:
+            label = values[gender_index]
+            entity.gender = None
+            if label is not None:
+                try:
+                    entity.gender = genders[label]
+                except KeyError:
+                    raise SchemaError('Unknown gender: %s' % (label))
+        if position_index is not None:
+            entity.position = list(values[position_index])
+
+    events = [decode_event(event, document['event_fields'], entities)
+        for event in document['events']]
+
+    target_index = indexes.get('target')
+    network_index = indexes.get('network')
+    memory_index = indexes.get('memory')
+    for entity, values in zip(entities, encoded_entities):
+        if target_index is not None:
+            entity.target = decode_reference(values[target_index], entities)
+        if network_index is not None:
+            network = {}
+            for row, value in values[network_index]:
+                other = entities[row]
+                network[other.id] = {'entity': other, 'value': value}
+            entity.network = network
+        if memory_index is not None:
+            entity.memory = [events[index]
+                for index in values[memory_index]]
+
+    Entity.Entity.reset_world()
+    spawn = Entity.Entity._registry.spawn
+    for entity in entities:
+        spawn(entity)
+    Entity.Entity._entity_created_count = document['created_count']
+
+    return dict([(key, document.get(key)) for key in ('version', 'tick',
+        'seed', 'created_count')])
+
+def decode_entity(values, fields, entities, events=()):
+    '''decode_entity(values, fields, entities, events)
+    ---------------------------------
+    Returns a new Entity (which hasn't spawned) from its stored form, for
+    decoding entities one at a time (load_document() decodes them in
+    bulk).  entities is what references are looked up in (a list, or a dict
+    of entity IDs if the references are IDs), and events is the list of
+    decoded events memories refer to'''
+    values = dict(zip(fields, values))
+    for field in REQUIRED_ENTITY_FIELDS:
+        if field not in values:
+            raise SchemaError('Entities need a %s field' % (field))
+
+    entity = Entity.Entity.__new__(Entity.Entity)
+    for field in ENTITY_FIELDS:
+        if field in values:
+            setattr(entity, field, values[field])
+        else:
+            setattr(entity, field, ENTITY_DEFAULTS[field]())
+    entity.id = intern(entity.id)
+    entity.position = list(entity.position)
+
+    if entity.race is not None:
+        name = entity.race
+        entity.race = Race.Race()
+        entity.race.name = name
+    if entity.gender is not None:
+        for gender in Entity.Entity.GENDER:
+            if gender[1] == entity.gender:
+                entity.gender = gender
+                break
+        else:
+            raise SchemaError('Unknown gender: %s' % (entity.gender))
+
+    entity.target = decode_reference(entity.target, entities)
+    network = {}
+    for key, value in entity.network:
+        other = entities[key]
+        network[other.id] = {'entity': other, 'value': value}
+    entity.network = network
+    entity.memory = [events[index] for index in entity.memory]
+    return entity
+
+def decode_reference(value, entities):
+    '''decode_reference(value, entities)
+    ---------------------------------
+    Returns a target from its stored form'''
+    if value is None:
+        return None
+    kind, value = value
+    if kind == REFERENCE_ENTITY:
+        return entities[value]
+    elif kind == REFERENCE_ENTITIES:
+        return [entities[row] for row in value]
+    elif kind == REFERENCE_VALUE:
+        return value
+    raise SchemaError('Unknown reference: %s' % (kind))
+
+def decode_value(value, entities):
+    '''decode_value(value, entities)
+    ---------------------------------
+    Returns a copy of an encoded value with entity markers replaced by the
+    entities'''
+    if isinstance(value, dict):
+        return dict([(key, decode_value(value[key], entities))
+            for key in value])
+    elif isinstance(value, list):
+        return [decode_value(item, entities) for item in value]
+    elif isinstance(value, tuple):
+        if len(value) == 2 and value[0] == ENTITY_MARKER:
+            if value[1] is None:
+                return None
+            return entities[value[1]]
+        return tuple([decode_value(item, entities) for item in value])
+    return value
+
+def decode_event(event, fields, entities):
+    '''decode_event(event, fields, entities)
+    ---------------------------------
+    Returns an Action from its stored form'''
+    event = dict(zip(fields, event))
+    values = event.get('values')
+    custom = event.get('custom')
+    if event.get('references'):
+        values = decode_value(values, entities)
+        custom = decode_value(custom, entities)
+
+    action = Action.Action.__new__(Action.Action)
+    action.source = decode_reference(event.get('source'), entities)
+    action.target = decode_reference(event.get('target'), entities)
+    action.values = values
+
+    key = event.get('key')
+    if key is not None:
+        try:
+            definition = Action.Action._ACTIONS[key]
+        except KeyError:
+            raise SchemaError('Unknown action: %s' % (key))
+        action.definition = definition
+        for field in CUSTOM_ACTION_FIELDS:
+            setattr(action, field, definition[field])
+    else:
+        action.definition = None
+        custom = custom or {}
+        for field in CUSTOM_ACTION_FIELDS:
+            setattr(action, field, custom.get(field))
+    return action
@@ -10,28 +10,135 @@
 IMPORTS
 
 ============================================================================="""
+import json
+import optparse
 import time
 import sys
 import threading
 import random
-#Use cPickle to store python data structs in redis
-import cStringIO
-import cPickle
 
 #----------------------------------------
 #Vasir Engine Imports
 #----------------------------------------
+import Checkpoint
 import Entity
+import Interest
+import Lazy
+import LevelOfDetail
+import Memory
+import Metrics
+import Movement
+import Names
+import Pathfinding
+import Planner
+import Profiling
+import RedisIO
+import Replay
+import Schema
+import Simulation
+import Utility
+import Wire
+import WriteAheadLog
 
 #----------------------------------------
 #Third Party Imports
 #----------------------------------------
 #Note: ZeroMQ is used to receive messages from Django for requests to modify
 #   game state, redis is used to put game state updates to node (via
-#   publish / subscribe)
-import zmq
-import redis
+#   publish / subscribe).  Networking and persistence modules are imported
+#   the first time they're used (when a Server is created), so importing
+#   this module stays fast
+zmq = Lazy.LazyModule('zmq')
 
+"""=============================================================================
+
+SERVER - GLOBAL SETTINGS
+
+============================================================================="""
+#Redis key the game state is stored under (serialized with Schema), and
+#   restored from when the server starts with no entities
+SNAPSHOT_KEY = 'engine:game_state:entities'
+
+#Number of game loop iterations between storing the game state in redis.
+#   Serializing a large world takes tens of milliseconds, so it isn't done
+#   every tick.  When a write-ahead log or checkpoint path is given, the
+#   world is already saved there, so by default it isn't stored at all
+DEFAULT_SNAPSHOT_INTERVAL = 50
+
+#Number of game loop iterations between checkpoints, when a checkpoint
+#   path is given (ticks are about 0.1 seconds apart, so this is about
+#   every five minutes)
+DEFAULT_CHECKPOINT_INTERVAL = 3000
+
+#Systems (see Simulation.py) run each tick, in this order.  Only the enabled
+#   ones are run
+SYSTEMS = ('movement', 'path', 'conversation', 'actions', 'plans')
+#Systems enabled by default.  Entities only move where they're told to;
+#   random movement, ambient conversations, and goal driven actions and
+#   plans have to be switched on
+DEFAULT_SYSTEMS = ('path',)
+
+#Messages which report or control profiling and metrics (see
+#   Server.get_profiling_reply)
+PROFILING_COMMANDS = (
+    'get_stats',
+    'get_metrics',
+    'get_memory',
+    'enable_profiling',
+    'disable_profiling',
+    'reset_stats',
+    'start_sampling',
+    'stop_sampling',
+    'start_memory_tracing',
+    'stop_memory_tracing',
+)
+
+#COMMAND_NAMES
+#----------------
+#Names requests are counted under in the metrics.  Messages are matched
+#   the same way (and in the same order) as in Server.get_reply
+COMMAND_NAMES = (
+    'create_entity',
+    'despawn',
+    'get_info',
+    'get_entities',
+    'get_game_state',
+    'set_target',
+    'move_to',
+    'set_observer',
+    'remove_observer',
+    'subscribe_viewport',
+    'subscribe_entities',
+    'unsubscribe',
+    'converse',
+)
+
+#----------------------------------------
+#Metrics
+#----------------------------------------
+TICKS = Metrics.Counter('vasir_ticks_total',
+    'Game loop iterations')
+TICK_SECONDS = Metrics.Histogram('vasir_tick_seconds',
+    'Time each game loop iteration took, not counting the delay between '
+    'ticks')
+ENTITIES = Metrics.Gauge('vasir_entities',
+    'Number of entities in the world')
+ACTIVE_ENTITIES = Metrics.Gauge('vasir_active_entities',
+    'Number of entities fully simulated in the last tick')
+REQUESTS = Metrics.Counter('vasir_requests_total',
+    'Messages handled, by command', ('command',))
+REQUEST_SECONDS = Metrics.Histogram('vasir_request_seconds',
+    'Time taken to handle a message, by command', ('command',))
+PUBLISH_BYTES = Metrics.Histogram('vasir_publish_bytes',
+    'Size of messages published to redis, by channel', ('channel',),
+    buckets=Metrics.BYTES_BUCKETS)
+SNAPSHOT_SECONDS = Metrics.Histogram('vasir_snapshot_seconds',
+    'Time taken to serialize the game state and store it in redis')
+SNAPSHOT_BYTES = Metrics.Gauge('vasir_snapshot_bytes',
+    'Size of the last serialized game state')
+CHECKPOINTS = Metrics.Counter('vasir_checkpoints_total',
+    'Checkpoints saved by the game loop, by result (saved, or skipped '
+    'because the last one was still being written)', ('result',))
 
 """=============================================================================
 
@@ -46,32 +153,60 @@ class Server(threading.Thread):
     loop and uses zeromq polling to listen / send messages (to Django in this
     case - the client sends and gets messages through django)
     '''
-    def __init__(self):
+    def __init__(self, client=None, socket=None, seed=None, replay_log=None,
+        profile=False, checkpoint_path=None, checkpoint_interval=None,
+        wal=None, compact_interval=None, broadcast=None, wire_format=None,
+        snapshot_interval=None, systems=None):
         '''When this class is instaniated, we'll set up the redis client,
-        ZeroMQ, and any other pre-loop configurations we need to do'''
+        ZeroMQ, and any other pre-loop configurations we need to do.
+
+        client (a redis client, or a RedisIO.Batch) and socket (a ZeroMQ
+        REP socket) can be passed in, otherwise they're created (the socket when the server
+        starts running).  If a Replay.ReplayLog is passed in, the world the
+        session starts from (if it isn't empty), every seed and command is
+        recorded to it, so the session can be replayed.  If
+        profile is True, the phases of each tick are timed from the start
+        (they can also be switched on with the enable_profiling command).
+        If checkpoint_path is passed in, the world is saved to it (as a
+        columnar checkpoint, see Checkpoint.py) every checkpoint_interval
+        ticks.  If a WriteAheadLog.WriteAheadLog is passed in, changes are
+        committed to it every tick, and it's compacted every
+        compact_interval ticks.  The game state is stored in redis every
+        snapshot_interval ticks (0 never stores it; see
+        DEFAULT_SNAPSHOT_INTERVAL for the default).
+
+        Clients which subscribe (see Interest.py) get only the entities
+        they can see on their own channel.  If broadcast is True, every
+        entity is also published to engine:game_state each tick; if it's
+        False, it never is.  By default, the broadcast is only published
+        while no clients are subscribed.  Game state updates are published
+        as JSON, unless wire_format is Wire.FORMAT_BINARY (see Wire.py).
+
+        systems is a list of the SYSTEMS keys enabled each tick (defaults
+        to DEFAULT_SYSTEMS)'''
         super(Server, self).__init__()
         #-----------------------------------------------------------------------
         #Redis
         #-----------------------------------------------------------------------
-        self.client = redis.StrictRedis(
-            host='localhost',
-        )
+        #Publishes and sets are batched, and sent in one round trip at the
+        #   end of each tick (see flush())
+        if client is None:
+            client = RedisIO.get_client()
+        if not isinstance(client, RedisIO.Batch):
+            client = RedisIO.Batch(client)
+        self.client = client
 
         #-----------------------------------------------------------------------
         #REPLY
         #-----------------------------------------------------------------------
-        #Get context for ZeroMQ
-        self.context = zmq.Context()
-        #Get a socket. Use the REP method of zmq
-        self.socket = self.context.socket(zmq.REP)
-        #Bind the socket to a port
-        self.socket.bind('tcp://127.0.0.1:5000')
+        #The socket is set up in connect(), when the server starts running
+        self.socket = socket
+        self.poller = None
 
         #-----------------------------------------------------------------------
-        #Poller
+        #Replay log
         #-----------------------------------------------------------------------
-        self.poller = zmq.Poller()
-        self.poller.register(self.socket, zmq.POLLIN)
+        self.replay_log = replay_log
 
         #-----------------------------------------------------------------------
         #Game State
@@ -86,12 +221,214 @@ class Server(threading.Thread):
             'environment': None,
         }
 
+        #-----------------------------------------------------------------------
+        #Movement
+        #-----------------------------------------------------------------------
+        #Random walk used to move every entity each tick (when enabled)
+        self.random_walk = Movement.RandomWalk()
+
+        #Grid map of the world, and the path mover which moves entities
+        #   along planned paths (one cell per tick) to where they want to go
+        self.world_map = Pathfinding.GridMap()
+        self.path_mover = Pathfinding.PathMover(self.world_map)
+
+        #-----------------------------------------------------------------------
+        #Level of Detail
+        #-----------------------------------------------------------------------
+        #Decides which entities are fully simulated each tick, based on how
+        #   close they are to observers (the parts of the world clients are
+        #   looking at)
+        self.level_of_detail = LevelOfDetail.LevelOfDetail()
+
+        #-----------------------------------------------------------------------
+        #Interest management
+        #-----------------------------------------------------------------------
+        #Which entities each subscribed client sees (a viewport, and / or
+        #   entities it follows), so clients only get what they can see
+        #   instead of every entity
+        if wire_format is None:
+            wire_format = Wire.FORMAT_JSON
+        if wire_format not in Wire.FORMATS:
+            raise ValueError('Unknown wire format %s' % (wire_format))
+        self.wire_format = wire_format
+        self.interest = Interest.InterestManager(wire_format=wire_format)
+        self.broadcast = broadcast
+        #Encodes the broadcast, when it's binary
+        self.encoder = Wire.Encoder()
+
+        #-----------------------------------------------------------------------
+        #AI
+        #-----------------------------------------------------------------------
+        #Decides which actions entities perform, based on their goals
+        self.utility_planner = Utility.get_planner()
+        #Makes multi step plans for entities to reach their goals
+        self.action_planner = Planner.ActionPlanner()
+
+        #-----------------------------------------------------------------------
+        #Systems
+        #-----------------------------------------------------------------------
+        #Run each tick on the entities level of detail picks, the same way
+        #   a Simulation runs them (see SYSTEMS).  Every system is created,
+        #   but only the enabled ones are run (see set_systems)
+        self.systems = [
+            Simulation.MovementSystem(self.random_walk, enabled=False),
+            Simulation.PathSystem(self.path_mover, enabled=False),
+            Simulation.ConversationSystem(enabled=False),
+            Simulation.ActionSystem(self.utility_planner, enabled=False),
+            Simulation.PlanSystem(self.action_planner, enabled=False),
+        ]
+
+        #-----------------------------------------------------------------------
+        #Profiling
+        #-----------------------------------------------------------------------
+        #Times each phase of the game loop (when enabled), and samples
+        #   which functions the game loop is in (when started).  Both are
+        #   reported by the get_stats command
+        self.profiler = Profiling.TickProfiler(enabled=profile)
+        self.sampler = Profiling.SamplingProfiler()
+        #Reports where memory is allocated (when started), for the
+        #   get_memory command
+        self.memory_tracer = Memory.MemoryTracer()
+
+        #The entity count is read when the metrics are rendered
+        ENTITIES.set_function(
+            lambda: len(self.game_state['Entity']._entities))
+
+        #The serialized game state isn't kept around after it's stored
+        if snapshot_interval is None:
+            if checkpoint_path is not None or wal is not None:
+                snapshot_interval = 0
+            else:
+                snapshot_interval = DEFAULT_SNAPSHOT_INTERVAL
+        self.snapshot_interval = snapshot_interval
+
+        #-----------------------------------------------------------------------
+        #Checkpoints
+        #-----------------------------------------------------------------------
+        #The world is copied in the game loop, and the files are written
+        #   from a background thread so the game loop doesn't wait on disk
+        self.checkpoint_path = checkpoint_path
+        if checkpoint_interval is None:
+            checkpoint_interval = DEFAULT_CHECKPOINT_INTERVAL
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_writer = Checkpoint.CheckpointWriter()
+
+        #-----------------------------------------------------------------------
+        #Write-ahead log
+        #-----------------------------------------------------------------------
+        #Changes to the world are logged as they happen (see
+        #   WriteAheadLog.attach) and committed once per tick
+        self.wal = wal
+        if compact_interval is None:
+            compact_interval = WriteAheadLog.DEFAULT_COMPACT_INTERVAL
+        self.compact_interval = compact_interval
+
+        #Number of game loop iterations so far
+        self.tick = 0
+
+        #-----------------------------------------------------------------------
+        #Random number generators
+        #-----------------------------------------------------------------------
+        #Everything random in the simulation comes from generators seeded
+        #   from this seed, so a session can be replayed exactly
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(32)
+        self.seed(seed)
+
+        if systems is None:
+            systems = DEFAULT_SYSTEMS
+        self.set_systems(systems)
+
+        #Sessions which don't start from an empty world (e.g., one
+        #   recovered from a write-ahead log) record the world they started
+        #   from, so they can be replayed
+        if self.replay_log is not None \
+            and len(self.game_state['Entity']._entities) > 0:
+            self.replay_log.record_world(self.tick, self.rng_seed)
+
         #-----------------------------------------------------------------------
         #Game Loop controller - determines if thread is running
         #-----------------------------------------------------------------------
         self.thread_alive = True
 
-    
+    def connect(self):
+        '''connect(self)
+        ---------------------------------
+        Sets up the ZeroMQ REP socket (unless one was passed in) and the
+        poller'''
+        if self.socket is None:
+            #Get context for ZeroMQ
+            self.context = zmq.Context()
+            #Get a socket. Use the REP method of zmq
+            self.socket = self.context.socket(zmq.REP)
+            #Bind the socket to a port
+            self.socket.bind('tcp://127.0.0.1:5000')
+
+        #-----------------------------------------------------------------------
+        #Poller
+        #-----------------------------------------------------------------------
+        self.poller = zmq.Poller()
+        self.poller.register(self.socket, zmq.POLLIN)
+
+    def seed(self, seed):
+        '''seed(self, seed)
+        ---------------------------------
+        Seeds every random number generator the simulation uses (the
+        global random module, used by entities and actions, the shared name
+        generator, movement, and level of detail).  Each gets its own seed,
+        derived from the passed in seed.  The seed is recorded to the replay
+        log'''
+        self.rng_seed = seed
+        seeds = random.Random(seed)
+
+        random.seed(seeds.getrandbits(32))
+        Names.seed(seeds.getrandbits(32))
+        self.random_walk.seed(seeds.getrandbits(32))
+        self.level_of_detail.rng.seed(seeds.getrandbits(32))
+
+        if self.replay_log is not None:
+            self.replay_log.record_seed(self.tick, seed)
+
+    def set_systems(self, systems):
+        '''set_systems(self, systems)
+        ---------------------------------
+        Enables the systems whose SYSTEMS keys are passed in, and disables
+        the rest.  The enabled systems are recorded to the replay log'''
+        for name in systems:
+            if name not in SYSTEMS:
+                raise ValueError('Invalid system: %s' % (name))
+        for system in self.systems:
+            system.enabled = system.name in systems
+
+        if self.replay_log is not None:
+            self.replay_log.record_systems(self.tick, self.get_systems())
+
+    def get_systems(self):
+        '''get_systems(self)
+        ---------------------------------
+        Returns a list of the enabled systems' SYSTEMS keys, in the order
+        they're run'''
+        return [system.name for system in self.systems if system.enabled]
+
+    @property
+    def entities(self):
+        '''Dict of entity IDs to every entity (what systems move)'''
+        return self.game_state['Entity']._entities
+
+    def get_entity(self, entity_key):
+        '''get_entity(self, entity_key)
+        ---------------------------------
+        Returns the entity for an entity key from a message, which can be
+        either the entity's ID or its handle (digits).  Raises a KeyError
+        if there is no such entity (or the handle is stale)'''
+        if entity_key.isdigit():
+            temp_entity = self.game_state['Entity']._registry.get(
+                int(entity_key))
+            if temp_entity is None:
+                raise KeyError(entity_key)
+            return temp_entity
+        return self.game_state['Entity']._entities[entity_key]
+
 
     #------------------------------------
     #Running thread
@@ -104,217 +441,635 @@ class Server(threading.Thread):
         Note: If this function calls itself instead of being in a loop,
             recursion problems crop up.
             The game loop has a sleep delay at the end'''
+        self.connect()
+        #The sampling profiler samples the thread the game loop runs in
+        self.sampler.thread_id = threading.current_thread().ident
 
         while self.thread_alive is True:
+            tick_start = time.time()
+            self.profiler.start_tick()
+
             #Get all available sockets from this object's poller
             #   Used for communication between (web server / client)
             socks = dict(self.poller.poll(1))
+            self.profiler.mark('poll')
+
+            #Game loop
+            self.step()
 
             #-----------------------------------------------------------------------
             #
-            #Game Loop
+            #REPLY socket
             #
+            #Returns certain states or perform actions to the game based on messages
             #-----------------------------------------------------------------------
-            if len(self.game_state['Entity']._entities) < 1:
-                #Get game state from redis (if it exists)
-                if self.client.get('engine:game_state:entities') is not None:
-                    #Get value from redis
-                    redis_cache = self.client.get('engine:game_state:entities')
-                    #Turn into a cString
-                    entities_string = cStringIO.StringIO(redis_cache)
-                    #Load the game state with cPickle
-                    self.game_state = cPickle.load(entities_string)
+            if self.socket in socks and socks[self.socket] == zmq.POLLIN:
+                #When the socket receives a message, get it
+                msg = self.socket.recv()
+                reply = self.handle_message(msg)
+                if reply is not None:
+                    self.socket.send(reply)
+            self.profiler.mark('requests')
 
-            #-----------------------------------------------------------------------
-            #Randomly move entities
-            #-----------------------------------------------------------------------
+            #-------------------------------------------------------------------
+            #Serialize Entities (see Schema) and store / load into redis
+            #   This is only for the python game engine, not sent to client
+            #-------------------------------------------------------------------
+            if self.snapshot_interval > 0 \
+                and self.tick % self.snapshot_interval == 0:
+                self.save_snapshot()
+            self.profiler.mark('snapshot')
 
-            move = False
-            if move:
-                if len(self.game_state['Entity']._entities) > 0:
-                    for entity in self.game_state['Entity']._entities:
-                        cur_entity = self.game_state['Entity']._entities[entity]
-                        #set x and y 
-                        move_x = cur_entity.position[0] + random.randint(-1,1)
-                        if move_x < 0:
-                            move_x = move_x * -1
-                        move_y = cur_entity.position[0] + random.randint(-1,1)
-                        if move_y < 0:
-                            move_y = move_y * -1
-
-                        #Move the entity
-                        cur_entity.perform_action(
-                            action='move',
-                            target=[
-                                move_x,
-                                move_y,
-                                0,
-                            ],
-                            show_log=False
-                        )
+            #Send everything published and stored this tick in one round
+            #   trip
+            self.flush()
+            self.profiler.mark('redis')
 
-            #-----------------------------------------------------------------------
-            #
-            #Publish key updates to redis
-            #   Publish latest game state
-            #   Turn into JSON
-            #-----------------------------------------------------------------------
+            if self.checkpoint_path is not None \
+                and self.tick % self.checkpoint_interval == 0:
+                self.save_checkpoint()
+            self.profiler.mark('checkpoint')
+
+            if self.wal is not None:
+                #Group commit every change made this tick
+                self.wal.commit(self.tick)
+                if self.tick > 0 and self.tick % self.compact_interval == 0:
+                    self.wal.compact(self.tick, self.rng_seed)
+            self.profiler.mark('wal')
+            self.profiler.end_tick()
+
+            TICKS.inc()
+            TICK_SECONDS.observe(time.time() - tick_start)
+
+            #--------------------------------
+            #Delay execution
+            #--------------------------------
+            self.tick += 1
+            time.sleep(.1)
+
+        self.sampler.stop()
+        self.checkpoint_writer.wait()
+        self.client.close()
+        if self.wal is not None:
+            self.wal.close(self.tick)
+        if self.replay_log is not None:
+            self.replay_log.close(self.tick)
+
+    def save_checkpoint(self, path=None):
+        '''save_checkpoint(self, path)
+        ---------------------------------
+        Starts saving the world to path (defaults to the checkpoint path)
+        in the background.  Returns False if the last checkpoint is still
+        being written, in which case this one is skipped'''
+        if path is None:
+            path = self.checkpoint_path
+        if self.checkpoint_writer.is_writing():
+            CHECKPOINTS.labels('skipped').inc()
+            return False
+        #Raise the last background write's error, if it failed
+        self.checkpoint_writer.wait()
+        self.checkpoint_writer.save(path, self.tick, self.rng_seed)
+        CHECKPOINTS.labels('saved').inc()
+        return True
+
+    #------------------------------------
+    #Game loop
+    #------------------------------------
+    def step(self):
+        '''step(self)
+        ---------------------------------
+        Runs one iteration of the game loop (one tick): moves entities,
+        performs actions, and publishes the game state'''
+        #-----------------------------------------------------------------------
+        #
+        #Game Loop
+        #
+        #-----------------------------------------------------------------------
+        if len(self.game_state['Entity']._entities) < 1:
+            #Get game state from redis (if it exists)
+            if self.restore():
+                if self.wal is not None:
+                    #The write-ahead log never saw the restored entities,
+                    #   so checkpoint them before anything refers to them
+                    self.wal.wait()
+                    self.wal.compact(self.tick, self.rng_seed,
+                        background=False)
+                if self.replay_log is not None:
+                    self.replay_log.record_world(self.tick, self.rng_seed)
+            self.profiler.mark('load')
+
+        #-----------------------------------------------------------------------
+        #Level of detail
+        #   Get the entities which should be fully simulated this tick.
+        #   Distant entities only get a coarse update every so often
+        #-----------------------------------------------------------------------
+        active_entities = self.level_of_detail.update(
+            self.game_state['Entity']._entities, self.tick)
+        ACTIVE_ENTITIES.set(len(active_entities))
+        #Coarse updates change entities outside of actions, so they have
+        #   to be logged
+        coarse_updated = self.level_of_detail.coarse_updated
+        if self.wal is not None and len(coarse_updated) > 0:
+            self.wal.record_personas([entity.id
+                for entity in coarse_updated])
+        self.profiler.mark('level_of_detail')
+
+        #-----------------------------------------------------------------------
+        #Systems
+        #   Movement, paths, conversations, actions, and plans (whichever
+        #   are enabled).  Clients are told which entities moved
+        #-----------------------------------------------------------------------
+        for system in self.systems:
+            if not system.enabled:
+                continue
+            system.step(self, active_entities)
+            if len(system.deltas) > 0:
+                self.record_positions(system.deltas)
+                self.publish(
+                    'engine:game_state:movement',
+                    Movement.get_deltas_json(system.deltas),
+                )
+            self.profiler.mark(system.name)
+
+        #-----------------------------------------------------------------------
+        #
+        #Publish key updates to redis
+        #   Publish latest game state
+        #   Turn into JSON
+        #-----------------------------------------------------------------------
+        #Entities which may have changed this tick: the ones simulated,
+        #   and the ones which got a coarse update
+        entities = self.game_state['Entity']._entities
+        changed_entities = active_entities
+        if len(self.level_of_detail.coarse_updated) > 0:
+            changed_entities = dict(active_entities)
+            for entity in self.level_of_detail.coarse_updated:
+                changed_entities[entity.id] = entity
+
+        #Each subscribed client gets the entities it can see on its own
+        #   channel
+        if len(self.interest) > 0:
+            for channel, message in self.interest.get_messages(
+                entities, self.tick, changed_entities):
+                self.publish(channel, message,
+                    label=Interest.CHANNEL_PREFIX)
+            self.profiler.mark('interest')
+
+        if self.is_broadcasting() \
+            and self.wire_format == Wire.FORMAT_BINARY:
+            #Only what changed is sent, except for keyframes, which have
+            #   every entity
+            updated = changed_entities
+            if self.encoder.is_keyframe_due(self.tick):
+                updated = entities
+            self.publish('engine:game_state',
+                self.encoder.encode(updated, self.tick))
+            self.profiler.mark('publish')
+
+        elif self.is_broadcasting():
             #Create an array which we'll use to get all the entities and
-            #   stuff in JSON text
+            #   stuff in JSON text.  The JSON game state is the whole world,
+            #   so every entity is sent, not just the ones simulated
             entities_json = []
 
-            for entity in self.game_state['Entity']._entities:
-                #Get the current JSON, but remove the first and trailing ( )'s
-                #   Because we'll want to return a list, not an individual
-                #   object
-                entities_json.append(self.game_state['Entity']._entities[entity].get_info_json()[1:-1])
+            for entity in entities.itervalues():
+                #Get the current JSON, but remove the first and trailing
+                #   ( )'s Because we'll want to return a list, not an
+                #   individual object
+                entities_json.append(entity.get_info_json()[1:-1])
 
             entities_json = ','.join(entities_json)
+            self.profiler.mark('json')
 
             #Send the entity info
-            self.client.publish(
+            self.publish(
                 'engine:game_state',
                 '({game_state: { entities: [%s] } })' % (entities_json),
             )
+            self.profiler.mark('publish')
 
-            #-----------------------------------------------------------------------
-            #
-            #REPLY socket
-            #
-            #Returns certain states or perform actions to the game based on messages
-            #-----------------------------------------------------------------------
-            if self.socket in socks and socks[self.socket] == zmq.POLLIN:
-                msg = self.socket.recv()
-                #When the socket receives a message, get it
-                #msg = socket.recv()
-                #Print the message
-                print 'Received Message: %s' % (msg)
-
-                #-------------------------------------------------------------------
-                #
-                #Perform actions based on message
-                #
-                #-------------------------------------------------------------------
-                #--------------------------------
-                #Create Entity
-                #--------------------------------
-                if msg == 'create_entity':
-                    #Create a new entity and return its ID (We don't need to
-                    #   save the context or reference to it because it's handled
-                    #   through the class for us)
-                    temp_entity = self.game_state['Entity']()
-
-                    print 'Created entity'
+    def is_broadcasting(self):
+        '''is_broadcasting(self)
+        ---------------------------------
+        Returns True if every entity should be published to
+        engine:game_state this tick (see broadcast in __init__)'''
+        if self.broadcast is None:
+            return len(self.interest) < 1
+        return self.broadcast
+
+    def record_positions(self, deltas):
+        '''record_positions(self, deltas)
+        ---------------------------------
+        Logs the new positions of the entities in a list of movement
+        deltas to the write-ahead log (if there is one)'''
+        if self.wal is not None:
+            self.wal.record_positions([delta[0] for delta in deltas])
+
+    def save_snapshot(self):
+        '''save_snapshot(self)
+        ---------------------------------
+        Serializes the game state (see Schema) and stores it in redis.
+        Returns the size of the serialized game state'''
+        snapshot_start = time.time()
+        data = Schema.dumps(self.tick, self.rng_seed)
+        self.client.set(SNAPSHOT_KEY, data)
+        SNAPSHOT_SECONDS.observe(time.time() - snapshot_start)
+        SNAPSHOT_BYTES.set(len(data))
+        return len(data)
+
+    def restore(self):
+        '''restore(self)
+        ---------------------------------
+        Replaces the world with the game state stored in redis, if there
+        is one.  Game states which can't be decoded (e.g., pickles from
+        older versions of the engine, or documents from newer ones) are
+        skipped.  Returns True if the world was restored'''
+        data = self.client.get(SNAPSHOT_KEY)
+        if data is None:
+            return False
+        try:
+            Schema.loads(data)
+        except Schema.SchemaError as error:
+            print 'Could not restore game state: %s' % (error)
+            return False
+        return True
+
+    def publish(self, channel, message, label=None):
+        '''publish(self, channel, message, label)
+        ---------------------------------
+        Publishes a message to a redis channel, recording its size (under
+        label, if passed in, so per client channels share one metric).  The
+        message is sent when the tick's redis commands are flushed'''
+        if label is None:
+            label = channel
+        PUBLISH_BYTES.labels(label).observe(len(message))
+        self.client.publish(channel, message)
+
+    def flush(self):
+        '''flush(self)
+        ---------------------------------
+        Sends the redis commands batched up this tick (see RedisIO.Batch).
+        Returns the number of commands'''
+        return self.client.flush()
+
+    #------------------------------------
+    #Messages
+    #------------------------------------
+    def handle_message(self, msg):
+        '''handle_message(self, msg)
+        ---------------------------------
+        Performs actions based on a message (from the REP socket) and
+        returns the reply to send back (or None, if the message isn't
+        recognized).  The message and reply are recorded to the replay log
+        (even if handling the message fails, since it may have changed the
+        game state).  Profiling commands don't change the game state, and
+        their replies depend on timing, so they aren't recorded'''
+        #Print the message
+        print 'Received Message: %s' % (msg)
+
+        start_time = time.time()
+        command = get_command_name(msg)
+        REQUESTS.labels(command).inc()
+
+        reply = None
+        try:
+            if command in PROFILING_COMMANDS:
+                reply = self.get_profiling_reply(msg)
+            else:
+                try:
+                    reply = self.get_reply(msg)
+                finally:
+                    if self.replay_log is not None:
+                        self.replay_log.record(self.tick, msg, reply)
+        finally:
+            REQUEST_SECONDS.labels(command).observe(
+                time.time() - start_time)
+        return reply
+
+    def get_profiling_reply(self, msg):
+        '''get_profiling_reply(self, msg)
+        ---------------------------------
+        Switches profiling on or off, or returns the profiling stats or
+        memory report (as JSON) or the metrics (in the Prometheus text
+        format), for a message in PROFILING_COMMANDS'''
+        if msg == 'get_stats':
+            return json.dumps(self.get_stats(), sort_keys=True)
+        elif msg == 'get_metrics':
+            return Metrics.REGISTRY.render()
+        elif msg == 'get_memory':
+            return json.dumps(self.get_memory(), sort_keys=True)
+        elif msg == 'enable_profiling':
+            self.profiler.enabled = True
+        elif msg == 'disable_profiling':
+            self.profiler.enabled = False
+        elif msg == 'reset_stats':
+            self.profiler.reset()
+            self.sampler.reset()
+        elif msg == 'start_sampling':
+            self.sampler.start()
+        elif msg == 'stop_sampling':
+            self.sampler.stop()
+        elif msg == 'start_memory_tracing':
+            self.memory_tracer.start()
+        elif msg == 'stop_memory_tracing':
+            self.memory_tracer.stop()
+
+        print 'Profiling: %s' % (msg)
+        return ('("%s done")' % (msg))
+
+    def get_stats(self):
+        '''get_stats(self)
+        ---------------------------------
+        Returns a dict of the current tick, the number of entities, the
+        phase timings (in milliseconds) of recent ticks, and the sampling
+        profiler's top functions'''
+        return {
+            'tick': self.tick,
+            'entities': len(self.game_state['Entity']._entities),
+            'timings': self.profiler.get_stats(),
+            'sampling': self.sampler.get_stats(),
+        }
+
+    def get_memory(self):
+        '''get_memory(self)
+        ---------------------------------
+        Returns a dict of the estimated bytes used by each subsystem (see
+        Memory.get_report), and the memory tracer's top allocators'''
+        report = Memory.get_report(
+            pending=(self.path_mover, self.action_planner,
+                self.utility_planner),
+            shared=(self.world_map,))
+        report['tick'] = self.tick
+        report['tracing'] = self.memory_tracer.get_stats()
+        return report
+
+    def get_reply(self, msg):
+        '''get_reply(self, msg)
+        ---------------------------------
+        Performs the actions for a message and returns the reply'''
+        reply = None
+
+        #-------------------------------------------------------------------
+        #
+        #Perform actions based on message
+        #
+        #-------------------------------------------------------------------
+        #--------------------------------
+        #Create Entity
+        #--------------------------------
+        if msg == 'create_entity':
+            #Create a new entity and return its ID (We don't need to
+            #   save the context or reference to it because it's handled
+            #   through the class for us)
+            temp_entity = self.game_state['Entity']()
+
+            print 'Created entity'
                     
-                    #Send the message with the entity ID
-                    self.socket.send("({'entity_id': '%s'})" % (temp_entity.id))
-                #--------------------------------
-                #Get Entity Info
-                #--------------------------------
-                elif 'get_info_' in msg:
-                    #The msg will look like 'get_info_entityXYZ', so grab the entity
-                    #   by looking at the Class' _entities dict and the key is just
-                    #   the message with 'get_info_' replaced with '' so it would 
-                    # only contain the entity ID
-                    entity_id = msg.replace('get_info_', '')
-                    try:
-                        temp_entity = self.game_state['Entity']._entities[entity_id]
-
-                        print 'Got entity info: %s' % (entity_id)
-
-                        #Send the entity info
-                        self.socket.send('%s' % (temp_entity.get_info_json()) )
-                    except KeyError:
-                        print 'Invalid entity passed in'
-                        self.socket.send('{}')
-
-                #--------------------------------
-                #Get ALL entities
-                #--------------------------------
-                elif 'get_entities' in msg:
-                    #Get all entities
-                    print 'Retrieved all %s entities' % (len(self.game_state['Entity']._entities))
-
-                    #Create an array which we'll use to get all the entities and
-                    #   stuff in JSON text
-                    entities_json = []
-
-                    for entity in self.game_state['Entity']._entities:
-                        #Get the current JSON, but remove the first and trailing ( )'s
-                        #   Because we'll want to return a list, not an individual
-                        #   object
-                        entities_json.append( self.game_state['Entity']._entities[entity].get_info_json()[1:-1] )
-
-                    entities_json = ','.join(entities_json)
+            #Send the message with the entity ID
+            reply = ("({'entity_id': '%s'})" % (temp_entity.id))
+        #--------------------------------
+        #Despawn Entity
+        #--------------------------------
+        elif 'despawn_' in msg:
+            #The msg will look like 'despawn_entityXYZ' (or a handle)
+            try:
+                temp_entity = self.get_entity(
+                    msg.replace('despawn_', ''))
+            except KeyError:
+                temp_entity = None
+            if temp_entity is not None:
+                entity_id = temp_entity.id
+                temp_entity.despawn()
+                #Throw away anything cached for the entity
+                self.utility_planner.forget(entity_id)
+                self.action_planner.forget(entity_id)
+                self.path_mover.stop(temp_entity)
+
+                print 'Despawned entity: %s' % (entity_id)
+                reply = ('("%s despawned")' % (entity_id))
+            else:
+                print 'Invalid entity passed in'
+                reply = ('{"error": "Invalid entity"}')
+        #--------------------------------
+        #Get Entity Info
+        #--------------------------------
+        elif 'get_info_' in msg:
+            #The msg will look like 'get_info_entityXYZ', so grab the entity
+            #   by looking at the Class' _entities dict and the key is just
+            #   the message with 'get_info_' replaced with '' so it would 
+            # only contain the entity ID (or handle)
+            entity_id = msg.replace('get_info_', '')
+            try:
+                temp_entity = self.get_entity(entity_id)
+
+                print 'Got entity info: %s' % (entity_id)
+
+                #Send the entity info
+                reply = ('%s' % (temp_entity.get_info_json()) )
+            except KeyError:
+                print 'Invalid entity passed in'
+                reply = ('{}')
+
+        #--------------------------------
+        #Get ALL entities
+        #--------------------------------
+        elif 'get_entities' in msg:
+            #Get all entities
+            print 'Retrieved all %s entities' % (len(self.game_state['Entity']._entities))
+
+            #Create an array which we'll use to get all the entities and
+            #   stuff in JSON text
+            entities_json = []
+
+            for entity in self.game_state['Entity']._entities:
+                #Get the current JSON, but remove the first and trailing ( )'s
+                #   Because we'll want to return a list, not an individual
+                #   object
+                entities_json.append( self.game_state['Entity']._entities[entity].get_info_json()[1:-1] )
+
+            entities_json = ','.join(entities_json)
             
-                    #Send the entity info
-                    self.socket.send('([%s])' % (entities_json) )
+            #Send the entity info
+            reply = ('([%s])' % (entities_json) )
 
-                #--------------------------------
-                #Get Game State
-                #--------------------------------
-                elif 'get_game_state' in msg:
-                    #Get all entities
+        #--------------------------------
+        #Get Game State
+        #--------------------------------
+        elif 'get_game_state' in msg:
+            #Get all entities
 
-                    if 'suppress_log' not in msg:
-                        print 'Retrieved all %s entities' % (len(self.game_state['Entity']._entities))
+            if 'suppress_log' not in msg:
+                print 'Retrieved all %s entities' % (len(self.game_state['Entity']._entities))
 
-                    #Create an array which we'll use to get all the entities and
-                    #   stuff in JSON text
-                    entities_json = []
+            #Create an array which we'll use to get all the entities and
+            #   stuff in JSON text
+            entities_json = []
 
-                    for entity in self.game_state['Entity']._entities:
-                        #Get the current JSON, but remove the first and trailing ( )'s
-                        #   Because we'll want to return a list, not an individual
-                        #   object
-                        entities_json.append( self.game_state['Entity']._entities[entity].get_info_json()[1:-1] )
+            for entity in self.game_state['Entity']._entities:
+                #Get the current JSON, but remove the first and trailing ( )'s
+                #   Because we'll want to return a list, not an individual
+                #   object
+                entities_json.append( self.game_state['Entity']._entities[entity].get_info_json()[1:-1] )
 
-                    entities_json = ','.join(entities_json)
+            entities_json = ','.join(entities_json)
             
-                    #Send the entity info
-                    self.socket.send('([%s])' % (entities_json) )
-
-                #--------------------------------
-                #Set target entity
-                #--------------------------------
-                elif 'set_target' in msg:
-                    #Get all entities
-                    entity_ids = msg.replace('set_target_', '').split(',')
-                    self.game_state['Entity']._entities[entity_ids[0]].set_target(
-                        target=entity_ids[1])
-
-                    print 'Setting target'
+            #Send the entity info
+            reply = ('([%s])' % (entities_json) )
+
+        #--------------------------------
+        #Set target entity
+        #--------------------------------
+        elif 'set_target' in msg:
+            #Get all entities
+            entity_ids = msg.replace('set_target_', '').split(',')
+            self.get_entity(entity_ids[0]).set_target(
+                target=self.get_entity(entity_ids[1]))
+
+            print 'Setting target'
             
-                    #Send the entity info
-                    self.socket.send('("%s set target to %s")' % (
-                        entity_ids[0], entity_ids[1]))
-
-                #--------------------------------
-                #converse
-                #--------------------------------
-                elif 'converse' in msg:
-                    entity_id = msg.replace('converse_', '')
-                    if self.game_state['Entity']._entities[entity_id].target is not None:
-                        self.game_state['Entity']._entities[entity_id].perform_action(
-                            'converse') 
-
-                        print 'Conversation performed'
+            #Send the entity info
+            reply = ('("%s set target to %s")' % (
+                entity_ids[0], entity_ids[1]))
+
+        #--------------------------------
+        #Move entity to a position
+        #--------------------------------
+        elif 'move_to_' in msg:
+            #The msg will look like 'move_to_entityXYZ,x,y'
+            move_params = msg.replace('move_to_', '').split(',')
+            try:
+                temp_entity = self.get_entity(move_params[0])
+                self.path_mover.move_to(temp_entity, [
+                    int(move_params[1]),
+                    int(move_params[2]),
+                ])
+
+                print 'Moving entity: %s' % (move_params[0])
+
+                reply = ('("%s moving to %s, %s")' % (
+                    move_params[0], move_params[1], move_params[2]))
+            except (KeyError, IndexError, ValueError):
+                print 'Invalid move passed in'
+                reply = ('{"error": "Invalid move"}')
+
+        #--------------------------------
+        #Add / move an observer
+        #--------------------------------
+        elif 'set_observer_' in msg:
+            #The msg will look like 'set_observer_clientXYZ,x,y'
+            observer_params = msg.replace('set_observer_', '').split(',')
+            try:
+                self.level_of_detail.set_observer(observer_params[0], [
+                    float(observer_params[1]),
+                    float(observer_params[2]),
+                ])
+                reply = ('("observer %s set")' % (
+                    observer_params[0]))
+            except (IndexError, ValueError):
+                reply = ('{"error": "Invalid observer"}')
+
+        #--------------------------------
+        #Remove an observer
+        #--------------------------------
+        elif 'remove_observer_' in msg:
+            observer_id = msg.replace('remove_observer_', '')
+            if self.level_of_detail.remove_observer(observer_id):
+                reply = ('("observer %s removed")' % (
+                    observer_id))
+            else:
+                reply = ('{"error": "Invalid observer"}')
+
+        #--------------------------------
+        #Subscribe a client to a viewport
+        #--------------------------------
+        elif 'subscribe_viewport_' in msg:
+            #The msg will look like 'subscribe_viewport_clientXYZ,x1,y1,x2,y2'
+            #   (any two opposite corners)
+            viewport_params = msg.replace('subscribe_viewport_', '').split(
+                ',')
+            try:
+                self.interest.subscribe_viewport(viewport_params[0], [
+                    float(viewport_params[1]),
+                    float(viewport_params[2]),
+                ], [
+                    float(viewport_params[3]),
+                    float(viewport_params[4]),
+                ])
+                #The viewport's centre is the client's level of detail
+                #   observer, so what it sees is fully simulated
+                self.level_of_detail.set_observer(viewport_params[0],
+                    self.interest.get_viewport_center(viewport_params[0]))
+                reply = ('("%s subscribed to viewport")' % (
+                    Interest.get_channel(viewport_params[0])))
+            except (IndexError, ValueError):
+                reply = ('{"error": "Invalid viewport"}')
+
+        #--------------------------------
+        #Subscribe a client to entities
+        #--------------------------------
+        elif 'subscribe_entities_' in msg:
+            #The msg will look like 'subscribe_entities_clientXYZ,id,id,...'
+            entity_params = msg.replace('subscribe_entities_', '').split(',')
+            entity_ids = [entity_id for entity_id in entity_params[1:]
+                if entity_id]
+            self.interest.subscribe_entities(entity_params[0], entity_ids)
+            reply = ('("%s subscribed to %s entities")' % (
+                Interest.get_channel(entity_params[0]), len(entity_ids)))
+
+        #--------------------------------
+        #Unsubscribe a client
+        #--------------------------------
+        elif 'unsubscribe_' in msg:
+            client_id = msg.replace('unsubscribe_', '')
+            self.level_of_detail.remove_observer(client_id)
+            if self.interest.unsubscribe(client_id):
+                reply = ('("%s unsubscribed")' % (client_id))
+            else:
+                reply = ('{"error": "Invalid subscriber"}')
+
+        #--------------------------------
+        #converse
+        #--------------------------------
+        elif 'converse' in msg:
+            temp_entity = self.get_entity(
+                msg.replace('converse_', ''))
+            #Entities can only converse with another entity (targets can
+            #   also be a list of entities or a location)
+            if isinstance(temp_entity.target, Entity.Entity):
+                temp_entity.perform_action('converse')
+
+                self.level_of_detail.mark_conversation([
+                    temp_entity.id,
+                    temp_entity.target.id,
+                ], self.tick)
+
+                print 'Conversation performed'
             
-                        #Send the entity info
-                        self.socket.send('("conversation action performed")')
-                    else:
-                        self.socket.send('{"error": "No target provided"}')
+                #Send the entity info
+                reply = ('("conversation action performed")')
+            elif temp_entity.target is not None:
+                reply = ('{"error": "Target is not an entity"}')
+            else:
+                reply = ('{"error": "No target provided"}')
 
-            #-------------------------------------------------------------------
-            #Dump Entities with CPickle and store / load into redis
-            #   This is only for the python game engine, not sent to client
-            #-------------------------------------------------------------------
-            self.client.set('engine:game_state', 
-                cPickle.dumps(self.game_state))
-            #--------------------------------
-            #Delay execution
-            #--------------------------------
-            time.sleep(.1)
+        return reply
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+def get_command_name(msg):
+    '''get_command_name(msg)
+    ---------------------------------
+    Returns the name a message is counted under in the metrics (the
+    command, without any entity IDs or parameters)'''
+    if msg in PROFILING_COMMANDS:
+        return msg
+    for name in COMMAND_NAMES:
+        if name in msg:
+            return name
+    return 'unknown'
 
 """=============================================================================
 
@@ -322,7 +1077,86 @@ INITIALIZE
 
 ============================================================================="""
 if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--seed', type='int', default=None,
+        help='Seed for the random number generators')
+    parser.add_option('--record', default=None,
+        help='Record a replay log of this session to the passed in file')
+    parser.add_option('--profile', action='store_true', default=False,
+        help='Time the phases of each tick (see the get_stats command)')
+    parser.add_option('--metrics-port', type='int', default=None,
+        help='Serve Prometheus metrics over HTTP on this port (they can '
+            'also be fetched with the get_metrics command)')
+    parser.add_option('--checkpoint-dir', default=None,
+        help='Save columnar checkpoints of the world to this directory')
+    parser.add_option('--checkpoint-interval', type='int',
+        default=DEFAULT_CHECKPOINT_INTERVAL,
+        help='Number of ticks between checkpoints')
+    parser.add_option('--redis-host', default=RedisIO.DEFAULT_HOST,
+        help='Redis server to publish to and store the game state in')
+    parser.add_option('--redis-port', type='int',
+        default=RedisIO.DEFAULT_PORT)
+    parser.add_option('--redis-background', action='store_true',
+        default=False,
+        help='Send each tick\'s redis commands from a background thread')
+    parser.add_option('--snapshot-interval', type='int', default=None,
+        help='Number of ticks between storing the game state in redis, or '
+            '0 to never store it (default: %d, or 0 with --wal or '
+            '--checkpoint-dir)' % (DEFAULT_SNAPSHOT_INTERVAL))
+    parser.add_option('--compress-threshold', type='int', default=None,
+        help='Compress game states stored in redis which are at least '
+            'this many bytes')
+    parser.add_option('--wal', default=None,
+        help='Log every change to the world to this write-ahead log '
+            'directory, and recover from it on startup')
+    parser.add_option('--compact-interval', type='int',
+        default=WriteAheadLog.DEFAULT_COMPACT_INTERVAL,
+        help='Number of ticks between write-ahead log compactions')
+    parser.add_option('--broadcast', action='store_true', default=None,
+        help='Always publish every entity to engine:game_state (by default '
+            'it\'s only published while no clients are subscribed)')
+    parser.add_option('--no-broadcast', action='store_false',
+        dest='broadcast',
+        help='Only publish to subscribed clients\' channels')
+    parser.add_option('--wire-format', type='choice',
+        choices=Wire.FORMATS, default=Wire.FORMAT_JSON,
+        help='Format game state updates are published in: json, or binary '
+            '(see Wire.py) (default: %default)')
+    parser.add_option('--systems', default=','.join(DEFAULT_SYSTEMS),
+        help='Comma separated systems to run each tick, from: %s '
+            '(default: %%default)' % (', '.join(SYSTEMS)))
+    options, args = parser.parse_args()
+
+    replay_log = None
+    if options.record is not None:
+        replay_log = Replay.ReplayLog(options.record)
+
+    if options.metrics_port is not None:
+        Metrics.start_http_server(options.metrics_port)
+
+    wal = None
+    recovered = {'tick': 0}
+    if options.wal is not None:
+        wal = WriteAheadLog.WriteAheadLog(options.wal)
+        recovered = wal.recover()
+        print 'Recovered %s entities to tick %s' % (
+            len(Entity.Entity._entities), recovered['tick'])
+
+    client = RedisIO.Batch(
+        RedisIO.get_client(host=options.redis_host, port=options.redis_port),
+        compress_threshold=options.compress_threshold,
+        background=options.redis_background)
+
     #Create a server object and run it
-    game_server = Server()
+    game_server = Server(client=client, seed=options.seed, replay_log=replay_log,
+        profile=options.profile, checkpoint_path=options.checkpoint_dir,
+        checkpoint_interval=options.checkpoint_interval, wal=wal,
+        compact_interval=options.compact_interval,
+        broadcast=options.broadcast, wire_format=options.wire_format,
+        snapshot_interval=options.snapshot_interval,
+        systems=[name for name in options.systems.split(',') if name])
+    if wal is not None:
+        game_server.tick = recovered['tick'] + 1
+        wal.attach()
     #TODO: start or run?
     game_server.run()
@@ -0,0 +1,496 @@
+"""=============================================================================
+    Simulation.py
+    ------------
+    Headless simulation.  Advances the world as fast as possible for some
+    number of ticks, without any sockets, redis, or delay between ticks.
+    Each tick, the entities picked by level of detail are run through a list
+    of systems (movement, conversation, decay, etc.), which can be swapped
+    out or added to.  The world can be checkpointed to disk every so often
+    and resumed later, either to a single file (in the versioned schema,
+    see Schema.py) or (with --chunked) to a columnar checkpoint directory
+    (see Checkpoint.py), which is faster to save for big worlds.  Used for
+    offline story generation and capacity testing.
+
+    Usage:
+
+        python Simulation.py --entities 1000 --ticks 10000
+        python Simulation.py --checkpoint world.ckpt --checkpoint-interval 500
+        python Simulation.py --checkpoint world.ckpt --chunked
+        python Simulation.py --resume world.ckpt --ticks 1000
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import optparse
+import os
+import random
+import time
+
+#Vasir Engine imports
+import Checkpoint
+import Entity
+import LevelOfDetail
+import Metrics
+import Movement
+import Names
+import Pathfinding
+import Planner
+import Schema
+import Spatial
+import Utility
+
+"""=============================================================================
+
+SIMULATION - GLOBAL SETTINGS
+
+============================================================================="""
+#Number of ticks between checkpoints (when a checkpoint path is given)
+DEFAULT_CHECKPOINT_INTERVAL = 1000
+#Number of ticks between ticks / second reports
+DEFAULT_REPORT_INTERVAL = 1000
+#Number of ticks between decay updates of fully simulated entities
+DEFAULT_DECAY_INTERVAL = 25
+
+#Systems used when none are passed in
+DEFAULT_SYSTEMS = ('movement', 'conversation', 'decay')
+
+#Metrics
+CHECKPOINT_SECONDS = Metrics.Histogram('vasir_checkpoint_seconds',
+    'Time taken to save a checkpoint')
+CHECKPOINT_BYTES = Metrics.Gauge('vasir_checkpoint_bytes',
+    'Size of the last checkpoint saved')
+
+"""=============================================================================
+
+CLASS DEFINITIONS
+
+============================================================================="""
+class System(object):
+    '''System
+    -------------------------------------
+    Base class for the systems run each tick.  step() is called with the
+    world (a Simulation or Server - anything with entities, tick, and
+    level_of_detail attributes) and a dict of entity IDs to the entities
+    which are fully simulated this tick.  Systems which move entities store
+    the movement deltas from their last step in deltas, so they can be
+    published'''
+    name = None
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.deltas = []
+
+    def seed(self, seed):
+        '''seed(self, seed)
+        ---------------------------------
+        Seeds the system's random number generator (if it has one)'''
+        pass
+
+    def step(self, world, active_entities):
+        raise NotImplementedError
+
+class MovementSystem(System):
+    '''MovementSystem
+    -------------------------------------
+    Moves every active entity a random step'''
+    name = 'movement'
+
+    def __init__(self, random_walk=None, enabled=True):
+        super(MovementSystem, self).__init__(enabled)
+        if random_walk is None:
+            random_walk = Movement.RandomWalk()
+        self.random_walk = random_walk
+
+    def seed(self, seed):
+        self.random_walk.seed(seed)
+
+    def step(self, world, active_entities):
+        if len(active_entities) < 1:
+            self.deltas = []
+            return
+        #Move all the entities in one batch step
+        self.deltas = self.random_walk.step(active_entities)
+
+class PathSystem(System):
+    '''PathSystem
+    -------------------------------------
+    Moves entities along their planned paths.  Every entity with a path
+    is moved, not only the active ones, so entities keep walking to where
+    they were told to go'''
+    name = 'path'
+
+    def __init__(self, path_mover=None, enabled=True):
+        super(PathSystem, self).__init__(enabled)
+        if path_mover is None:
+            path_mover = Pathfinding.PathMover(Pathfinding.GridMap())
+        self.path_mover = path_mover
+
+    def step(self, world, active_entities):
+        if len(self.path_mover) < 1:
+            self.deltas = []
+            return
+        self.deltas = self.path_mover.step(world.entities)
+
+class ConversationSystem(System):
+    '''ConversationSystem
+    -------------------------------------
+    Ambient conversations.  Uses the spatial hash to find every pair of
+    entities close enough to converse, instead of checking distances pair
+    by pair'''
+    name = 'conversation'
+
+    def step(self, world, active_entities):
+        if len(active_entities) < 2:
+            return
+
+        pairs = Spatial.get_interaction_pairs(
+            active_entities,
+            approach_range=None)
+
+        #Each entity only has one conversation per tick.  Pairs are sorted
+        #   closest first, so closer entities get to talk to each other
+        #   first
+        conversed = {}
+        for source, target, dist in pairs['converse']:
+            if source.id in conversed or target.id in conversed:
+                continue
+            conversed[source.id] = True
+            conversed[target.id] = True
+
+            source.perform_action(
+                action='converse',
+                target=target,
+                show_log=False
+            )
+
+        world.level_of_detail.mark_conversation(conversed, world.tick)
+
+class ActionSystem(System):
+    '''ActionSystem
+    -------------------------------------
+    Goal driven actions.  The utility planner decides what every entity
+    should do in one batch, then each entity performs its action'''
+    name = 'actions'
+
+    def __init__(self, utility_planner=None, enabled=True):
+        super(ActionSystem, self).__init__(enabled)
+        if utility_planner is None:
+            utility_planner = Utility.get_planner()
+        self.utility_planner = utility_planner
+
+    def step(self, world, active_entities):
+        if len(active_entities) < 1:
+            return
+
+        decisions = self.utility_planner.decide_all(active_entities)
+        for entity_id in decisions:
+            if decisions[entity_id] is not None:
+                active_entities[entity_id].perform_action(
+                    action=decisions[entity_id],
+                    show_log=False
+                )
+
+class PlanSystem(System):
+    '''PlanSystem
+    -------------------------------------
+    Goal plans.  Entities follow multi step plans towards their goals'''
+    name = 'plans'
+
+    def __init__(self, action_planner=None, enabled=True):
+        super(PlanSystem, self).__init__(enabled)
+        if action_planner is None:
+            action_planner = Planner.ActionPlanner()
+        self.action_planner = action_planner
+
+    def step(self, world, active_entities):
+        if len(active_entities) < 1:
+            return
+        self.action_planner.step(active_entities)
+
+class DecaySystem(System):
+    '''DecaySystem
+    -------------------------------------
+    Every interval ticks, active entities' network values decay and their
+    persona values drift, the same way level of detail updates coarse
+    entities'''
+    name = 'decay'
+
+    def __init__(self, interval=DEFAULT_DECAY_INTERVAL, enabled=True):
+        super(DecaySystem, self).__init__(enabled)
+        self.interval = interval
+
+    def step(self, world, active_entities):
+        if world.tick % self.interval != 0:
+            return
+        world.level_of_detail.coarse_update(active_entities.values(),
+            self.interval)
+
+class Simulation(object):
+    '''Simulation
+    -------------------------------------
+    Runs the world headless.  systems is a list of System objects (or
+    SYSTEMS keys), run in order each tick; it defaults to DEFAULT_SYSTEMS.
+    If a checkpoint path is passed in, the world is saved to it every
+    checkpoint_interval ticks (as a columnar checkpoint directory if
+    chunked is True)'''
+    def __init__(self,
+        systems=None,
+        seed=None,
+        level_of_detail=None,
+        checkpoint_path=None,
+        checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+        chunked=False):
+        self.entities = Entity.Entity._entities
+
+        if level_of_detail is None:
+            level_of_detail = LevelOfDetail.LevelOfDetail()
+        self.level_of_detail = level_of_detail
+
+        if systems is None:
+            systems = DEFAULT_SYSTEMS
+        self.systems = []
+        for system in systems:
+            self.add_system(system)
+
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        self.chunked = chunked
+
+        #Number of ticks simulated so far
+        self.tick = 0
+
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(32)
+        self.seed(seed)
+
+    '''====================================================================
+
+    Systems
+
+    ======================================================================='''
+    def add_system(self, system):
+        '''add_system(self, system)
+        ---------------------------------
+        Adds a System object (or a SYSTEMS key) to the end of the systems
+        run each tick.  Returns the system'''
+        if isinstance(system, basestring):
+            try:
+                system = SYSTEMS[system]()
+            except KeyError:
+                raise ValueError('Invalid system: %s' % (system))
+        self.systems.append(system)
+        return system
+
+    def get_system(self, name):
+        '''get_system(self, name)
+        ---------------------------------
+        Returns the first system with the passed in name, or None'''
+        for system in self.systems:
+            if system.name == name:
+                return system
+        return None
+
+    def seed(self, seed):
+        '''seed(self, seed)
+        ---------------------------------
+        Seeds every random number generator the simulation uses, the same
+        way Server.seed does, then each system'''
+        self.rng_seed = seed
+        seeds = random.Random(seed)
+
+        random.seed(seeds.getrandbits(32))
+        Names.seed(seeds.getrandbits(32))
+        self.level_of_detail.rng.seed(seeds.getrandbits(32))
+        for system in self.systems:
+            system.seed(seeds.getrandbits(32))
+
+    '''====================================================================
+
+    Running
+
+    ======================================================================='''
+    def step(self):
+        '''step(self)
+        ---------------------------------
+        Simulates one tick.  Returns the dict of entities which were fully
+        simulated'''
+        active_entities = self.level_of_detail.update(self.entities,
+            self.tick)
+
+        for system in self.systems:
+            if system.enabled:
+                system.step(self, active_entities)
+
+        self.tick += 1
+        return active_entities
+
+    def run(self, ticks, report_interval=None):
+        '''run(self, ticks, report_interval)
+        ---------------------------------
+        Simulates ticks ticks as fast as possible, checkpointing along the
+        way.  If report_interval is passed in, the ticks / second are
+        printed every report_interval ticks.  Returns a dict of stats'''
+        checkpoints = 0
+        start_time = time.time()
+        report_time = start_time
+
+        for i in xrange(ticks):
+            self.step()
+
+            if self.checkpoint_path is not None \
+                and self.tick % self.checkpoint_interval == 0:
+                self.checkpoint()
+                checkpoints += 1
+
+            if report_interval and self.tick % report_interval == 0:
+                now = time.time()
+                print 'Tick %s: %.1f ticks/sec (%s entities)' % (
+                    self.tick,
+                    report_interval / max(now - report_time, 1e-9),
+                    len(self.entities))
+                report_time = now
+
+        seconds = time.time() - start_time
+        return {
+            'ticks': ticks,
+            'seconds': seconds,
+            'ticks_per_second': ticks / max(seconds, 1e-9),
+            'entities': len(self.entities),
+            'checkpoints': checkpoints,
+        }
+
+    '''====================================================================
+
+    Checkpoints
+
+    ======================================================================='''
+    def checkpoint(self, path=None):
+        '''checkpoint(self, path)
+        ---------------------------------
+        Saves the world to path (defaults to the checkpoint path)'''
+        if path is None:
+            path = self.checkpoint_path
+        if self.chunked:
+            start_time = time.time()
+            Checkpoint.save(path, self.tick, self.rng_seed)
+            CHECKPOINT_SECONDS.observe(time.time() - start_time)
+            CHECKPOINT_BYTES.set(Checkpoint.get_size(path))
+        else:
+            save_checkpoint(path, self.tick, self.rng_seed)
+
+    @classmethod
+    def from_checkpoint(cls, path, systems=None, **kwargs):
+        '''from_checkpoint(cls, path, systems, **kwargs)
+        ---------------------------------
+        Replaces the world with the one saved at path and returns a
+        Simulation which carries on from the checkpoint's tick.  The random
+        number generators' states aren't saved, so they're seeded from the
+        original seed and the tick - resuming the same checkpoint twice
+        gives the same results.  path can be a checkpoint file or a
+        columnar checkpoint directory'''
+        if Checkpoint.is_checkpoint(path):
+            header = Checkpoint.load(path)
+        else:
+            header = load_checkpoint(path)
+        simulation = cls(systems=systems,
+            seed=get_resume_seed(header['seed'], header['tick']),
+            **kwargs)
+        simulation.tick = header['tick']
+        return simulation
+
+#Systems which can be created by name
+SYSTEMS = {
+    'movement': MovementSystem,
+    'path': PathSystem,
+    'conversation': ConversationSystem,
+    'actions': ActionSystem,
+    'plans': PlanSystem,
+    'decay': DecaySystem,
+}
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+def get_resume_seed(seed, tick):
+    '''get_resume_seed(seed, tick)
+    ---------------------------------
+    Returns the seed a simulation resumed from a checkpoint is seeded with'''
+    return random.Random('%s:%s' % (seed, tick)).getrandbits(32)
+
+def save_checkpoint(path, tick, seed):
+    '''save_checkpoint(path, tick, seed)
+    ---------------------------------
+    Saves every entity to path, in the versioned schema (see Schema.py).
+    The file is written next to path first then moved over it, so a crash
+    never leaves a half written checkpoint'''
+    start_time = time.time()
+    data = Schema.dumps(tick, seed)
+
+    temp_path = '%s.tmp' % (path)
+    with open(temp_path, 'wb') as checkpoint_file:
+        checkpoint_file.write(data)
+
+    os.rename(temp_path, path)
+    CHECKPOINT_SECONDS.observe(time.time() - start_time)
+    CHECKPOINT_BYTES.set(len(data))
+
+def load_checkpoint(path):
+    '''load_checkpoint(path)
+    ---------------------------------
+    Replaces the world with the entities saved at path.  Entities get new
+    handles.  Returns the checkpoint's header (a dict with tick and seed
+    keys).  Raises a Schema.SchemaError if the file isn't a checkpoint, or
+    is from a newer version of the engine'''
+    with open(path, 'rb') as checkpoint_file:
+        return Schema.loads(checkpoint_file.read())
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--ticks', type='int', default=1000,
+        help='Number of ticks to simulate')
+    parser.add_option('--entities', type='int', default=100,
+        help='Number of entities to create')
+    parser.add_option('--seed', type='int', default=None,
+        help='Seed for the random number generators')
+    parser.add_option('--systems', default=','.join(DEFAULT_SYSTEMS),
+        help='Comma separated systems to run (%s)' % (
+            ', '.join(sorted(SYSTEMS))))
+    parser.add_option('--checkpoint', default=None,
+        help='Save checkpoints to this file')
+    parser.add_option('--checkpoint-interval', type='int',
+        default=DEFAULT_CHECKPOINT_INTERVAL,
+        help='Number of ticks between checkpoints')
+    parser.add_option('--chunked', action='store_true', default=False,
+        help='Save checkpoints as columnar checkpoint directories')
+    parser.add_option('--resume', default=None,
+        help='Resume from this checkpoint instead of creating entities')
+    parser.add_option('--report-interval', type='int',
+        default=DEFAULT_REPORT_INTERVAL,
+        help='Number of ticks between ticks / second reports')
+    options, args = parser.parse_args()
+
+    systems = [name.strip() for name in options.systems.split(',')
+        if name.strip()]
+    if options.resume is not None:
+        simulation = Simulation.from_checkpoint(options.resume,
+            systems=systems,
+            checkpoint_path=options.checkpoint,
+            checkpoint_interval=options.checkpoint_interval,
+            chunked=options.chunked)
+    else:
+        simulation = Simulation(systems=systems, seed=options.seed,
+            checkpoint_path=options.checkpoint,
+            checkpoint_interval=options.checkpoint_interval,
+            chunked=options.chunked)
+        for i in xrange(options.entities):
+            Entity.Entity()
+
+    results = simulation.run(options.ticks, options.report_interval)
+    print 'Simulated %s ticks of %s entities in %.2f seconds ' \
+        '(%.1f ticks/sec, seed %s)' % (results['ticks'],
+            results['entities'], results['seconds'],
+            results['ticks_per_second'], simulation.rng_seed)
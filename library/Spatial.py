@@ -0,0 +1,347 @@
+"""=============================================================================
+    Spatial.py
+    ------------
+    Contains the SpatialHash class definition.  The spatial hash buckets
+    positions into a uniform grid of cells so we can find everything near a
+    point (or every pair of things near each other) without comparing every
+    entity against every other entity.
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import math
+
+#Vasir Engine imports
+import Actions
+
+"""=============================================================================
+
+CLASS DEFINITIONS
+
+============================================================================="""
+class SpatialHash(object):
+    '''SpatialHash
+    -------------------------------------
+    Buckets keys (usually entity IDs) into square cells of size cell_size,
+    based on their x and y position.  Lookups only need to check the cells
+    which overlap the search radius, so finding neighbors is roughly
+    O(neighbors) instead of O(all entities).
+
+    Best performance is when cell_size is close to the radius being queried'''
+    def __init__(self, cell_size=Actions.CONVERSE_RANGE):
+        self.cell_size = float(cell_size)
+
+        #cells is a dict of cell coordinates, (cx, cy), to a list of keys
+        #   in that cell
+        self.cells = {}
+        #positions is a dict of keys to their (x, y) position
+        self.positions = {}
+        #key_cells is a dict of keys to the cell they are currently in, so
+        #   we can remove or update keys without recalculating the cell
+        self.key_cells = {}
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    @classmethod
+    def from_entities(cls, entities, cell_size=Actions.CONVERSE_RANGE,
+        key='id'):
+        '''from_entities(cls, entities, cell_size, key)
+        ---------------------------------
+        Builds a spatial hash from a dict of entities (e.g.,
+        Entity._entities) or a list of entities.  Keys are the entity
+        attribute named by key (the entity IDs, or e.g. their handles)'''
+        spatial_hash = cls(cell_size=cell_size)
+
+        if isinstance(entities, dict):
+            entities = entities.values()
+
+        for entity in entities:
+            spatial_hash.insert(getattr(entity, key), entity.position)
+
+        return spatial_hash
+
+    '''====================================================================
+
+    Cells
+
+    ======================================================================='''
+    def get_cell(self, position):
+        '''get_cell(self, position)
+        ---------------------------------
+        Returns the (cx, cy) cell coordinates the passed in position falls
+        in.  Position is a list or tuple of at least (x, y)'''
+        return (
+            int(math.floor(position[0] / self.cell_size)),
+            int(math.floor(position[1] / self.cell_size)),
+        )
+
+    def insert(self, key, position):
+        '''insert(self, key, position)
+        ---------------------------------
+        Adds the key to the hash at the passed in position.  If the key
+        already exists, it is moved to the new position'''
+        if key in self.positions:
+            return self.update(key, position)
+
+        cell = self.get_cell(position)
+        self.positions[key] = (position[0], position[1])
+        self.key_cells[key] = cell
+
+        try:
+            self.cells[cell].append(key)
+        except KeyError:
+            self.cells[cell] = [key]
+
+    def remove(self, key):
+        '''remove(self, key)
+        ---------------------------------
+        Removes the key from the hash.  Returns False if the key was not
+        in the hash'''
+        try:
+            cell = self.key_cells.pop(key)
+        except KeyError:
+            return False
+
+        del self.positions[key]
+        self.cells[cell].remove(key)
+        #Don't keep empty cells around, otherwise the cells dict grows
+        #   with every cell an entity has ever been in
+        if len(self.cells[cell]) < 1:
+            del self.cells[cell]
+
+        return True
+
+    def update(self, key, position):
+        '''update(self, key, position)
+        ---------------------------------
+        Updates the position of an existing key.  The key is only moved
+        to a new cell if it has crossed a cell boundary'''
+        if key not in self.positions:
+            return self.insert(key, position)
+
+        cell = self.get_cell(position)
+        self.positions[key] = (position[0], position[1])
+
+        if cell != self.key_cells[key]:
+            old_cell = self.key_cells[key]
+            self.cells[old_cell].remove(key)
+            if len(self.cells[old_cell]) < 1:
+                del self.cells[old_cell]
+
+            self.key_cells[key] = cell
+            try:
+                self.cells[cell].append(key)
+            except KeyError:
+                self.cells[cell] = [key]
+
+    def clear(self):
+        '''clear(self)
+        ---------------------------------
+        Removes everything from the hash'''
+        self.cells = {}
+        self.positions = {}
+        self.key_cells = {}
+
+    '''====================================================================
+
+    Queries
+
+    ======================================================================='''
+    def get_cell_range(self, radius):
+        '''get_cell_range(self, radius)
+        ---------------------------------
+        Returns how many cells out from a cell we need to look to cover the
+        passed in radius'''
+        return int(math.ceil(radius / self.cell_size))
+
+    def query_radius(self, position, radius):
+        '''query_radius(self, position, radius)
+        ---------------------------------
+        Returns a list of [key, distance] lists for every key within radius
+        of the passed in position, sorted by distance'''
+        cell_x, cell_y = self.get_cell(position)
+        cell_range = self.get_cell_range(radius)
+        radius_sq = radius * radius
+        pos_x = position[0]
+        pos_y = position[1]
+
+        found = []
+        for offset_x in xrange(-cell_range, cell_range + 1):
+            for offset_y in xrange(-cell_range, cell_range + 1):
+                try:
+                    cell = self.cells[(cell_x + offset_x, cell_y + offset_y)]
+                except KeyError:
+                    continue
+
+                for key in cell:
+                    key_position = self.positions[key]
+                    dist_x = key_position[0] - pos_x
+                    dist_y = key_position[1] - pos_y
+                    dist_sq = dist_x * dist_x + dist_y * dist_y
+                    if dist_sq <= radius_sq:
+                        found.append([key, math.sqrt(dist_sq)])
+
+        found.sort(key=lambda item: item[1])
+        return found
+
+    def query_rect(self, min_position, max_position):
+        '''query_rect(self, min_position, max_position)
+        ---------------------------------
+        Returns a list of every key inside the rectangle with corners
+        min_position and max_position (both (x, y), edges included)'''
+        min_x, min_y = min_position[0], min_position[1]
+        max_x, max_y = max_position[0], max_position[1]
+        min_cell_x, min_cell_y = self.get_cell(min_position)
+        max_cell_x, max_cell_y = self.get_cell(max_position)
+
+        cells = self.cells
+        positions = self.positions
+        #Look through whichever is smaller, the cells the rectangle covers
+        #   or the cells which have something in them (a huge rectangle
+        #   over a sparse world would otherwise check mostly empty cells)
+        if (max_cell_x - min_cell_x + 1) * (max_cell_y - min_cell_y + 1) \
+            <= len(cells):
+            cell_keys = []
+            for cell_x in xrange(min_cell_x, max_cell_x + 1):
+                for cell_y in xrange(min_cell_y, max_cell_y + 1):
+                    try:
+                        cell_keys.append(cells[(cell_x, cell_y)])
+                    except KeyError:
+                        continue
+        else:
+            cell_keys = [cells[cell] for cell in cells
+                if min_cell_x <= cell[0] <= max_cell_x
+                and min_cell_y <= cell[1] <= max_cell_y]
+
+        found = []
+        for keys in cell_keys:
+            for key in keys:
+                key_position = positions[key]
+                if min_x <= key_position[0] <= max_x \
+                    and min_y <= key_position[1] <= max_y:
+                    found.append(key)
+
+        return found
+
+    def get_pairs(self, radius, min_radius=None):
+        '''get_pairs(self, radius, min_radius)
+        ---------------------------------
+        Returns a list of (key_a, key_b, distance) tuples for every pair of
+        keys within radius of each other.  Each pair is only returned once.
+        If min_radius is passed in, pairs which are closer than (or equal
+        to) min_radius are skipped'''
+        cell_range = self.get_cell_range(radius)
+        radius_sq = radius * radius
+        if min_radius is None:
+            min_radius_sq = -1
+        else:
+            min_radius_sq = min_radius * min_radius
+
+        #Only look at 'half' of the neighboring cells (the ones after the
+        #   current cell).  The other half will see this cell as one of their
+        #   neighbors, so looking at all of them would give us each pair twice
+        neighbor_offsets = []
+        for offset_x in xrange(0, cell_range + 1):
+            for offset_y in xrange(-cell_range, cell_range + 1):
+                if offset_x > 0 or offset_y > 0:
+                    neighbor_offsets.append((offset_x, offset_y))
+
+        positions = self.positions
+        cells = self.cells
+        pairs = []
+
+        for cell in cells:
+            keys = cells[cell]
+            num_keys = len(keys)
+
+            #--------------------------------
+            #Pairs inside the same cell
+            #--------------------------------
+            for i in xrange(num_keys):
+                key_a = keys[i]
+                pos_a = positions[key_a]
+                for j in xrange(i + 1, num_keys):
+                    key_b = keys[j]
+                    pos_b = positions[key_b]
+                    dist_x = pos_a[0] - pos_b[0]
+                    dist_y = pos_a[1] - pos_b[1]
+                    dist_sq = dist_x * dist_x + dist_y * dist_y
+                    if min_radius_sq < dist_sq <= radius_sq:
+                        pairs.append((key_a, key_b, math.sqrt(dist_sq)))
+
+            #--------------------------------
+            #Pairs with neighboring cells
+            #--------------------------------
+            for offset in neighbor_offsets:
+                try:
+                    other_keys = cells[(cell[0] + offset[0],
+                        cell[1] + offset[1])]
+                except KeyError:
+                    continue
+
+                for key_a in keys:
+                    pos_a = positions[key_a]
+                    for key_b in other_keys:
+                        pos_b = positions[key_b]
+                        dist_x = pos_a[0] - pos_b[0]
+                        dist_y = pos_a[1] - pos_b[1]
+                        dist_sq = dist_x * dist_x + dist_y * dist_y
+                        if min_radius_sq < dist_sq <= radius_sq:
+                            pairs.append((key_a, key_b, math.sqrt(dist_sq)))
+
+        return pairs
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+def get_interaction_pairs(entities,
+    converse_range=Actions.CONVERSE_RANGE,
+    approach_range=Actions.CONVERSE_MAX_RANGE):
+    '''get_interaction_pairs(entities, converse_range, approach_range)
+    ---------------------------------
+    Broad phase for ambient conversations.  Takes in a dict (or list) of
+    entities and returns a dict with two lists of (entity_a, entity_b,
+    distance) tuples:
+        'converse': pairs close enough to converse right now
+        'approach': pairs too far away to converse, but close enough that
+            one could move to the other (what Actions.converse would do)
+    Pairs are sorted by distance, closest first.  If approach_range is None,
+    only the 'converse' pairs are looked for (which is much cheaper in a
+    crowded world)'''
+    if isinstance(entities, dict):
+        entities = entities.values()
+    entities_by_id = dict([(entity.id, entity) for entity in entities])
+
+    if approach_range is None:
+        search_range = converse_range
+    else:
+        search_range = max(converse_range, approach_range)
+
+    #Use the search range as the cell size so each lookup only needs to
+    #   check the neighboring cells
+    spatial_hash = SpatialHash.from_entities(entities,
+        cell_size=search_range)
+
+    pairs = {
+        'converse': [],
+        'approach': [],
+    }
+    for key_a, key_b, dist in spatial_hash.get_pairs(search_range):
+        pair = (entities_by_id[key_a], entities_by_id[key_b], dist)
+        if dist <= converse_range:
+            pairs['converse'].append(pair)
+        else:
+            pairs['approach'].append(pair)
+
+    pairs['converse'].sort(key=lambda pair: pair[2])
+    pairs['approach'].sort(key=lambda pair: pair[2])
+
+    return pairs
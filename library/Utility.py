@@ -0,0 +1,261 @@
+"""=============================================================================
+    Utility.py
+    ------------
+    Contains the UtilityPlanner class definition.  The utility planner
+    decides which action an entity should perform, by scoring every action
+    that helps with the entity's goals (weighted by the goal's priority) and
+    picking the best one.
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+#Vasir Engine imports
+import Action
+import Actions
+
+"""=============================================================================
+
+UTILITY - GLOBAL SETTINGS
+
+============================================================================="""
+#RANGE_BUCKETS
+#----------------
+#Distance to the target is bucketed, so small movements don't change the
+#   inputs (and throw away cached scores)
+RANGE_NONE = 'none'
+RANGE_NEAR = 'near'
+RANGE_FAR = 'far'
+RANGE_OUT = 'out'
+
+#FEATURE_MULTIPLIERS
+#----------------
+#For each action, how much to multiply the action's goal score by based on
+#   the (target kind, target range) features.  Missing features mean the
+#   action can't be performed at all
+FEATURE_MULTIPLIERS = {
+    'converse': {
+        ('entity', RANGE_NEAR): 1.0,
+        #Entity has to move closer first, which converse does for us
+        ('entity', RANGE_FAR): 0.6,
+    },
+    'move': {
+        ('entity', RANGE_NEAR): 0.1,
+        ('entity', RANGE_FAR): 1.0,
+        ('entity', RANGE_OUT): 1.0,
+        ('location', RANGE_NEAR): 0.1,
+        ('location', RANGE_FAR): 1.0,
+        ('location', RANGE_OUT): 1.0,
+    },
+}
+
+"""=============================================================================
+
+CLASS DEFINITIONS
+
+============================================================================="""
+class UtilityPlanner(object):
+    '''UtilityPlanner
+    -------------------------------------
+    Scores candidate actions for entities.  An action's score is:
+
+        sum(goal priority * how much the action helps the goal)
+            * feature multiplier
+
+    where candidate actions come from Action._ACTIONS_BY_GOALS and the
+    feature multiplier comes from cheap features (what kind of target the
+    entity has and how far away it is).
+
+    The goal part of the score only changes when the entity's goals change,
+    and decisions only change when the goals or features change, so both
+    are cached per entity.  Goals are compared by value (see get_goals_key),
+    so goals changed in place aren't missed'''
+    def __init__(self):
+        #Dict of entity IDs to (goals key, {action_key: score})
+        self.goal_scores = {}
+        #Dict of entity IDs to (goals key, features, action_key)
+        self.decisions = {}
+
+    def clear(self):
+        self.goal_scores = {}
+        self.decisions = {}
+
+    def forget(self, entity_id):
+        '''forget(self, entity_id)
+        ---------------------------------
+        Removes cached scores for an entity (e.g., when it's removed)'''
+        self.goal_scores.pop(entity_id, None)
+        self.decisions.pop(entity_id, None)
+
+    '''====================================================================
+
+    Scores
+
+    ======================================================================='''
+    def get_features(self, entity, target=None):
+        '''get_features(self, entity, target)
+        ---------------------------------
+        Returns a tuple of (target kind, target range) for the entity and
+        the passed in target (the entity's target, if None)'''
+        if target is None:
+            target = entity.target
+        if target is None or target is entity:
+            return (None, RANGE_NONE)
+
+        if isinstance(target, (list, tuple)):
+            kind = 'location'
+            target_position = target
+        else:
+            try:
+                target_position = target.position
+            except AttributeError:
+                return (None, RANGE_NONE)
+            kind = 'entity'
+
+        dist_x = entity.position[0] - target_position[0]
+        dist_y = entity.position[1] - target_position[1]
+        dist_sq = dist_x * dist_x + dist_y * dist_y
+        if dist_sq <= Actions.CONVERSE_RANGE * Actions.CONVERSE_RANGE:
+            return (kind, RANGE_NEAR)
+        elif dist_sq < Actions.CONVERSE_MAX_RANGE * Actions.CONVERSE_MAX_RANGE:
+            return (kind, RANGE_FAR)
+        return (kind, RANGE_OUT)
+
+    def get_goal_scores(self, entity):
+        '''get_goal_scores(self, entity)
+        ---------------------------------
+        Returns a dict of action keys to the goal part of their score.
+        Cached until the entity's goals change'''
+        goals = entity.goals
+        goals_key = get_goals_key(goals)
+        try:
+            cached_key, scores = self.goal_scores[entity.id]
+            if cached_key == goals_key:
+                return scores
+        except KeyError:
+            pass
+
+        actions = Action.Action._ACTIONS
+        actions_by_goals = Action.Action._ACTIONS_BY_GOALS
+        scores = {}
+        for goal in goals:
+            #Priorities are percentages
+            priority = goals[goal]['priority'] / 100.0
+            for action_key in actions_by_goals.get(goal, ()):
+                scores[action_key] = scores.get(action_key, 0) \
+                    + priority * actions[action_key]['goals'][goal]
+
+        self.goal_scores[entity.id] = (goals_key, scores)
+        return scores
+
+    def score_actions(self, entity, features=None):
+        '''score_actions(self, entity, features)
+        ---------------------------------
+        Returns a dict of action keys to their total score for the entity.
+        Actions which can't be performed are not included'''
+        if features is None:
+            features = self.get_features(entity)
+
+        scores = {}
+        goal_scores = self.get_goal_scores(entity)
+        for action_key in goal_scores:
+            try:
+                multiplier = FEATURE_MULTIPLIERS[action_key][features]
+            except KeyError:
+                continue
+            scores[action_key] = goal_scores[action_key] * multiplier
+
+        return scores
+
+    '''====================================================================
+
+    Decisions
+
+    ======================================================================='''
+    def decide_all(self, entities):
+        '''decide_all(self, entities)
+        ---------------------------------
+        Takes in a dict (e.g., Entity._entities) or list of entities and
+        returns a dict of entity IDs to the action key each entity should
+        perform (or None, if there is nothing useful to do).
+
+        Runs in passes over the whole population: first get every entity's
+        features, then only rescore entities whose inputs changed'''
+        if isinstance(entities, dict):
+            entities = entities.values()
+
+        #Pass 1: features
+        get_features = self.get_features
+        features = [get_features(entity) for entity in entities]
+
+        #Pass 2: decisions (from the cache, when nothing changed)
+        cached_decisions = self.decisions
+        decisions = {}
+        for i in xrange(len(entities)):
+            entity = entities[i]
+            entity_features = features[i]
+
+            goals_key = get_goals_key(entity.goals)
+            try:
+                cached_key, cached_features, action_key = \
+                    cached_decisions[entity.id]
+                if cached_key == goals_key \
+                    and cached_features == entity_features:
+                    decisions[entity.id] = action_key
+                    continue
+            except KeyError:
+                pass
+
+            action_key = get_best_action(self.score_actions(entity,
+                entity_features))
+            cached_decisions[entity.id] = (goals_key, entity_features,
+                action_key)
+            decisions[entity.id] = action_key
+
+        return decisions
+
+    def choose_action(self, entity, target=None):
+        '''choose_action(self, entity, target)
+        ---------------------------------
+        Returns the action key the passed in entity should perform on the
+        passed in target (the entity's target, if None).  Decisions for
+        other targets aren't cached'''
+        if target is None or target is entity.target:
+            return self.decide_all([entity])[entity.id]
+        return get_best_action(self.score_actions(entity,
+            self.get_features(entity, target)))
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+#Planner used by Entity.get_action when no action is passed in
+_planner = UtilityPlanner()
+
+def get_goals_key(goals):
+    '''get_goals_key(goals)
+    ---------------------------------
+    Returns what the goal scores depend on (each goal and its priority),
+    which is cheap to compare with the cached key.  Goals in a different
+    order only cost a cache miss'''
+    return (tuple(goals), [goal['priority'] for goal in goals.itervalues()])
+
+def get_best_action(scores):
+    '''get_best_action(scores)
+    ---------------------------------
+    Returns the action key with the highest score (above 0), or None'''
+    action_key = None
+    best_score = 0
+    for key in scores:
+        if scores[key] > best_score:
+            action_key = key
+            best_score = scores[key]
+    return action_key
+
+def get_planner():
+    '''get_planner()
+    ---------------------------------
+    Returns the shared UtilityPlanner'''
+    return _planner
@@ -0,0 +1,649 @@
+"""=============================================================================
+    Wire.py
+    ------------
+    Binary wire format for game state updates.  The JSON updates are a
+    JavaScript literal with python dict reprs pasted in, which is large and
+    has to be eval'd.  Binary updates are a stream: each channel gets its
+    own Encoder, which remembers what it has already sent, so an update
+    only carries what changed since the last one.
+
+    Each update is:
+
+        HEADER      magic, WIRE_VERSION, tick, flags (FLAG_KEYFRAME)
+        layouts     varint count, then for each layout (the keys of a
+                    dict, in order) added to the layout table by this
+                    update, a varint count and the keys as strings
+        records     varint count, then one record per entity
+        removed     handles of the entities which despawned
+
+    Strings are a varint length, then the string in utf-8.  Lists of
+    handles are a varint count, then each (sorted) handle as a varint of
+    the gap from the one before it.
+
+    Entities are referred to by their integer handle (see Registry.py).
+    Each record is a fixed layout RECORD_HEAD (handle, and the sections
+    which follow) and RECORD_BODY (gender, x, y, z and money), then the
+    sections (in SECTIONS order) which changed since the entity was last
+    sent:
+
+        identity    the ID, then the name, as strings.  Only sent the
+                    first time an entity is seen
+        target      target handle (NO_TARGET for none), unsigned int
+        stats       varint layout index, then the values (signed shorts)
+        persona     same as stats
+        goals       varint layout index, then the priorities (floats)
+        network     varint count, then (varint gap from the last handle,
+                    zigzag varint change in value) for each network entry
+                    which changed (sorted by handle), then the handles
+                    removed from the network
+
+    Every entity has the same stats and persona (and one of a few sets of
+    goals), so their keys are sent once, as a layout, and each entity's
+    values are packed in that order in one go.  Network values are whole
+    numbers (they're rounded), since varints only hold integers.
+
+    Updates only have the entities which changed.  Keyframes have every
+    entity passed in, in full, and reset everything the decoder knows.
+    They're sent every keyframe_interval ticks, so a client which
+    subscribes late (or drops an update) only waits until the next one.
+    Decoder is the reference decoder.
+
+    Like Schema.dumps(), encoding creates lots of small containers (and
+    none of them are garbage), so the garbage collector is paused while it
+    runs.
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import gc
+import struct
+
+#Vasir Engine imports
+import Entity
+
+"""=============================================================================
+
+WIRE - GLOBAL SETTINGS
+
+============================================================================="""
+FORMAT_JSON = 'json'
+FORMAT_BINARY = 'binary'
+FORMATS = (FORMAT_JSON, FORMAT_BINARY)
+
+WIRE_VERSION = 1
+
+#Updates start with MAGIC, the wire version (an unsigned char), the tick
+#   (an unsigned int) and flags (an unsigned char)
+MAGIC = 'VWG'
+HEADER = struct.Struct('!3sBIB')
+FLAG_KEYFRAME = 1
+
+#Handle and sections, then gender (index in Entity.GENDER), x, y, z and
+#   money
+RECORD_HEAD = struct.Struct('!IB')
+RECORD_BODY = struct.Struct('!Bfffi')
+TARGET = struct.Struct('!I')
+#struct formats of the values in stats and persona, and goals sections
+VALUE_FORMAT = 'h'
+PRIORITY_FORMAT = 'f'
+
+#Sections which can follow a record, in the order they're written
+SECTION_IDENTITY = 1
+SECTION_TARGET = 2
+SECTION_STATS = 4
+SECTION_PERSONA = 8
+SECTION_GOALS = 16
+SECTION_NETWORK = 32
+SECTIONS = (SECTION_IDENTITY, SECTION_TARGET, SECTION_STATS,
+    SECTION_PERSONA, SECTION_GOALS, SECTION_NETWORK)
+
+#Target handle sent when the entity has no target (or its target isn't an
+#   entity), and gender sent when it has none
+NO_TARGET = 0xFFFFFFFF
+NO_GENDER = 0xFF
+
+#Number of ticks between keyframes
+DEFAULT_KEYFRAME_INTERVAL = 100
+
+#Single byte varints, by value
+VARINT_BYTES = [chr(value) for value in xrange(0x80)]
+
+"""=============================================================================
+
+CLASS DEFINITIONS
+
+============================================================================="""
+class WireError(ValueError):
+    '''Raised when an update can't be decoded'''
+    pass
+
+class Sent(object):
+    '''Sent
+    -------------------------------------
+    What an Encoder last sent for an entity.  The encoded sections are
+    kept, so they're only encoded again when the entity changes'''
+    __slots__ = (
+        'identity',
+        'body',
+        'target',
+        'stats',
+        'stats_section',
+        'persona',
+        'persona_section',
+        'priorities',
+        'goals_section',
+        'network',
+        'network_section',
+    )
+
+    def __init__(self, entity):
+        self.identity = encode_string(entity.id) + encode_string(
+            entity.name)
+        self.body = None
+        self.target = NO_TARGET
+        self.stats = None
+        self.stats_section = None
+        self.persona = None
+        self.persona_section = None
+        self.priorities = None
+        self.goals_section = None
+        #Dict of handles to network values, and the whole network as a
+        #   section (for keyframes)
+        self.network = {}
+        self.network_section = None
+
+class Encoder(object):
+    '''Encoder
+    -------------------------------------
+    Encodes game state updates for one channel.  The encoder remembers what
+    it has sent for each entity, so only what changed is sent again.  A
+    keyframe (with every entity passed in sent in full) is sent every
+    keyframe_interval ticks'''
+    def __init__(self, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.last_keyframe_tick = None
+
+        #Dict of layouts (tuples of keys) to their index in the layout
+        #   table, as a varint.  Layouts are never removed, so encoded
+        #   sections stay valid
+        self.layouts = {}
+        self.layout_list = []
+        #Dict of handles to what was last sent for each entity (a Sent)
+        self.sent = {}
+
+    def is_keyframe_due(self, tick):
+        return self.last_keyframe_tick is None \
+            or tick - self.last_keyframe_tick >= self.keyframe_interval \
+            or tick < self.last_keyframe_tick
+
+    def get_layout(self, keys, new_layouts):
+        '''get_layout(self, keys, new_layouts)
+        ---------------------------------
+        Returns the index of a layout (a tuple of keys) in the layout
+        table, as a varint, adding it (and appending it to new_layouts) if
+        it isn't there yet'''
+        try:
+            return self.layouts[keys]
+        except KeyError:
+            index = self.layouts[keys] = encode_varint(len(self.layout_list))
+            self.layout_list.append(keys)
+            new_layouts.append(keys)
+            return index
+
+    def encode(self, entities, tick, keyframe=None):
+        '''encode(self, entities, tick, keyframe)
+        ---------------------------------
+        Takes in a dict of entity IDs to entities (or a list of entities)
+        and returns the update for this tick.  Entities which were sent
+        before and have since despawned are sent as removed.  If keyframe
+        is None, a keyframe is sent when one is due'''
+        if keyframe is None:
+            keyframe = self.is_keyframe_due(tick)
+
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self.encode_update(entities, tick, keyframe)
+        finally:
+            if enabled:
+                gc.enable()
+
+    def encode_update(self, entities, tick, keyframe):
+        if isinstance(entities, dict):
+            entities = entities.itervalues()
+
+        new_layouts = []
+        encode_entity = self.encode_entity
+        removed = []
+        if keyframe:
+            self.last_keyframe_tick = tick
+            #The decoder starts over, so entities which aren't in the
+            #   keyframe have to be sent in full (with their ID) next time
+            sent, self.sent = self.sent, {}
+            records = [encode_entity(entity, new_layouts,
+                sent.get(entity.handle)) for entity in entities]
+            #Every layout, since the decoder's layout table is reset too
+            new_layouts = self.layout_list
+        else:
+            records = [encode_entity(entity, new_layouts)
+                for entity in entities]
+            records = [record for record in records if record is not None]
+
+            #Entities which despawned since they were last sent
+            registry_get = Entity.Entity._registry.get
+            for handle in self.sent.keys():
+                if registry_get(handle) is None:
+                    del self.sent[handle]
+                    removed.append(handle)
+
+        parts = [HEADER.pack(MAGIC, WIRE_VERSION, tick,
+            FLAG_KEYFRAME if keyframe else 0)]
+        parts.append(encode_varint(len(new_layouts)))
+        for layout in new_layouts:
+            parts.append(encode_varint(len(layout)))
+            parts.extend([encode_string(key) for key in layout])
+        parts.append(encode_varint(len(records)))
+        parts.extend(records)
+        parts.append(encode_handles(removed))
+        return ''.join(parts)
+
+    def encode_entity(self, entity, new_layouts, keyframe_sent=None):
+        '''encode_entity(self, entity, new_layouts, keyframe_sent)
+        ---------------------------------
+        Returns an entity's record, with the sections which changed since
+        it was last sent, or None if nothing changed.  For keyframes,
+        keyframe_sent is what was sent before the keyframe (if anything),
+        and the record has every section'''
+        handle = entity.handle
+        sections = 0
+        parts = []
+
+        keyframe = keyframe_sent is not None
+        if keyframe:
+            sent = self.sent[handle] = keyframe_sent
+        else:
+            sent = self.sent.get(handle)
+            if sent is None:
+                sent = self.sent[handle] = Sent(entity)
+                keyframe = True
+        if keyframe:
+            sections = SECTION_IDENTITY
+            parts.append(sent.identity)
+
+        #Target
+        target = entity.target
+        if isinstance(target, Entity.Entity):
+            target_handle = target.handle
+        else:
+            target_handle = NO_TARGET
+        if target_handle != sent.target or (keyframe
+            and target_handle != NO_TARGET):
+            sections |= SECTION_TARGET
+            parts.append(TARGET.pack(target_handle))
+            sent.target = target_handle
+
+        #Stats, persona and goals.  Sections are only encoded again when
+        #   the values change
+        stats = entity.stats
+        if stats != sent.stats:
+            sent.stats = dict(stats)
+            sent.stats_section = self.get_layout(tuple(stats),
+                new_layouts) + get_struct(VALUE_FORMAT, len(stats)).pack(
+                *stats.values())
+            sections |= SECTION_STATS
+            parts.append(sent.stats_section)
+        elif keyframe:
+            sections |= SECTION_STATS
+            parts.append(sent.stats_section)
+
+        persona = entity.persona
+        if persona != sent.persona:
+            sent.persona = dict(persona)
+            sent.persona_section = self.get_layout(tuple(persona),
+                new_layouts) + get_struct(VALUE_FORMAT, len(persona)).pack(
+                *persona.values())
+            sections |= SECTION_PERSONA
+            parts.append(sent.persona_section)
+        elif keyframe:
+            sections |= SECTION_PERSONA
+            parts.append(sent.persona_section)
+
+        goals = entity.goals
+        priorities = [goal['priority'] for goal in goals.itervalues()]
+        if priorities != sent.priorities:
+            sent.priorities = priorities
+            sent.goals_section = self.get_layout(tuple(goals),
+                new_layouts) + get_struct(PRIORITY_FORMAT,
+                len(priorities)).pack(*priorities)
+            sections |= SECTION_GOALS
+            parts.append(sent.goals_section)
+        elif keyframe:
+            sections |= SECTION_GOALS
+            parts.append(sent.goals_section)
+
+        #Network, as changes in value (from nothing, for keyframes)
+        network = {}
+        for network_item in entity.network.itervalues():
+            network[network_item['entity'].handle] = int(round(
+                network_item['value']))
+        if network != sent.network:
+            if not keyframe:
+                sections |= SECTION_NETWORK
+                parts.append(encode_network(network, sent.network))
+            sent.network = network
+            sent.network_section = None
+        if keyframe and len(network) > 0:
+            if sent.network_section is None:
+                sent.network_section = encode_network(network, {})
+            sections |= SECTION_NETWORK
+            parts.append(sent.network_section)
+
+        gender = entity.gender
+        if gender is None:
+            gender = NO_GENDER
+        else:
+            gender = gender[0]
+        position = entity.position
+        body = RECORD_BODY.pack(gender, position[0], position[1],
+            position[2], int(entity.money))
+        if sections == 0 and body == sent.body:
+            return None
+        sent.body = body
+
+        return RECORD_HEAD.pack(handle, sections) + body + ''.join(parts)
+
+class Decoder(object):
+    '''Decoder
+    -------------------------------------
+    Reference decoder.  Applies the updates from one channel, in order,
+    and keeps the state of every entity it has been sent.  Updates before
+    the first keyframe are skipped, since they only have changes'''
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        #Layout table (lists of keys)
+        self.layouts = []
+        #Dict of handles to entity dicts
+        self.entities = {}
+        self.tick = None
+        self.ready = False
+
+    def decode(self, data):
+        '''decode(self, data)
+        ---------------------------------
+        Applies an update.  Returns a list of the handles of the entities
+        it updated, or None if it was skipped (waiting for a keyframe)'''
+        try:
+            magic, version, tick, flags = HEADER.unpack_from(data)
+        except struct.error:
+            raise WireError('Update is too short')
+        if magic != MAGIC:
+            raise WireError('Not a game state update')
+        if version != WIRE_VERSION:
+            raise WireError('Unsupported wire version %s' % (version))
+
+        if flags & FLAG_KEYFRAME:
+            self.reset()
+            self.ready = True
+        elif not self.ready:
+            return None
+        self.tick = tick
+
+        try:
+            return self.decode_body(data, HEADER.size)
+        except (IndexError, struct.error):
+            #Can't trust anything until the next keyframe
+            self.ready = False
+            raise WireError('Update is truncated')
+
+    def decode_body(self, data, offset):
+        count, offset = decode_varint(data, offset)
+        for i in xrange(count):
+            length, offset = decode_varint(data, offset)
+            layout = []
+            for j in xrange(length):
+                key, offset = decode_string(data, offset)
+                layout.append(key)
+            self.layouts.append(layout)
+
+        updated = []
+        count, offset = decode_varint(data, offset)
+        for i in xrange(count):
+            handle, offset = self.decode_entity(data, offset)
+            updated.append(handle)
+
+        removed, offset = decode_handles(data, offset)
+        for handle in removed:
+            self.entities.pop(handle, None)
+
+        return updated
+
+    def decode_entity(self, data, offset):
+        '''decode_entity(self, data, offset)
+        ---------------------------------
+        Applies one record.  Returns a tuple of (handle, next offset)'''
+        handle, sections = RECORD_HEAD.unpack_from(data, offset)
+        offset += RECORD_HEAD.size
+        gender, pos_x, pos_y, pos_z, money = RECORD_BODY.unpack_from(data,
+            offset)
+        offset += RECORD_BODY.size
+
+        if sections & SECTION_IDENTITY:
+            entity = self.entities[handle] = {
+                'handle': handle,
+                'target': None,
+                'stats': {},
+                'persona': {},
+                'goals': {},
+                'network': {},
+            }
+            entity['id'], offset = decode_string(data, offset)
+            entity['name'], offset = decode_string(data, offset)
+        else:
+            try:
+                entity = self.entities[handle]
+            except KeyError:
+                self.ready = False
+                raise WireError('Update for unknown entity %s' % (handle))
+
+        entity['gender'] = None
+        if gender != NO_GENDER:
+            entity['gender'] = Entity.Entity.GENDER[gender][1]
+        entity['position'] = [pos_x, pos_y, pos_z]
+        entity['money'] = money
+
+        if sections & SECTION_TARGET:
+            target, = TARGET.unpack_from(data, offset)
+            offset += TARGET.size
+            entity['target'] = None if target == NO_TARGET else target
+
+        for key, section, value_format in (
+            ('stats', SECTION_STATS, VALUE_FORMAT),
+            ('persona', SECTION_PERSONA, VALUE_FORMAT),
+            ('goals', SECTION_GOALS, PRIORITY_FORMAT)):
+            if sections & section:
+                index, offset = decode_varint(data, offset)
+                layout = self.layouts[index]
+                values_struct = get_struct(value_format, len(layout))
+                entity[key] = dict(zip(layout,
+                    values_struct.unpack_from(data, offset)))
+                offset += values_struct.size
+
+        if sections & SECTION_NETWORK:
+            network = entity['network']
+            count, offset = decode_varint(data, offset)
+            other = 0
+            for i in xrange(count):
+                gap, offset = decode_varint(data, offset)
+                change, offset = decode_zigzag(data, offset)
+                other += gap
+                network[other] = network.get(other, 0) + change
+            removed, offset = decode_handles(data, offset)
+            for other in removed:
+                network.pop(other, None)
+
+        return handle, offset
+
+    def get_entity(self, handle):
+        '''get_entity(self, handle)
+        ---------------------------------
+        Returns a dict of an entity's info, in the same shape as the JSON
+        updates (the target and network use entity IDs, for the entities
+        the decoder knows about)'''
+        entity = dict(self.entities[handle])
+        target = entity['target']
+        if target is not None:
+            entity['target'] = self.get_id(target)
+        entity['network'] = dict([(self.get_id(other), value)
+            for other, value in entity['network'].iteritems()])
+        return entity
+
+    def get_entities(self):
+        '''get_entities(self)
+        ---------------------------------
+        Returns a list of every entity's info (see get_entity)'''
+        return [self.get_entity(handle) for handle in sorted(self.entities)]
+
+    def get_id(self, handle):
+        '''get_id(self, handle)
+        ---------------------------------
+        Returns the ID of the entity with the passed in handle, or the
+        handle if the decoder hasn't been sent that entity'''
+        try:
+            return self.entities[handle]['id']
+        except KeyError:
+            return handle
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+def is_update(data):
+    '''is_update(data)
+    ---------------------------------
+    Returns True if the passed in message is a binary game state update'''
+    return data is not None and data[:len(MAGIC)] == MAGIC
+
+#Structs by (format, count), for packing stats, persona and goals
+_structs = {}
+
+def get_struct(value_format, count):
+    '''get_struct(value_format, count)
+    ---------------------------------
+    Returns a struct for count values of the passed in format'''
+    try:
+        return _structs[(value_format, count)]
+    except KeyError:
+        values_struct = _structs[(value_format, count)] = struct.Struct(
+            '!%s%s' % (count, value_format))
+        return values_struct
+
+'''========================================================================
+
+Encoding
+
+========================================================================'''
+def encode_varint(value):
+    '''encode_varint(value)
+    ---------------------------------
+    Returns a non negative integer as a varint: 7 bits per byte, lowest
+    first, with the high bit set on every byte but the last'''
+    if value < 0x80:
+        return VARINT_BYTES[value]
+    parts = []
+    while value >= 0x80:
+        parts.append(chr((value & 0x7F) | 0x80))
+        value >>= 7
+    parts.append(chr(value))
+    return ''.join(parts)
+
+def encode_zigzag(value):
+    '''encode_zigzag(value)
+    ---------------------------------
+    Returns an integer as a zigzag varint (0, -1, 1, -2, ... become 0, 1,
+    2, 3, ...), so small negative numbers stay small'''
+    if value < 0:
+        return encode_varint(-value * 2 - 1)
+    return encode_varint(value * 2)
+
+def encode_string(value):
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return encode_varint(len(value)) + value
+
+def encode_handles(handles):
+    '''encode_handles(handles)
+    ---------------------------------
+    Returns a list of handles as a varint count, then the gap between each
+    (sorted) handle and the one before it'''
+    handles = sorted(handles)
+    parts = [encode_varint(len(handles))]
+    last_handle = 0
+    for handle in handles:
+        parts.append(encode_varint(handle - last_handle))
+        last_handle = handle
+    return ''.join(parts)
+
+def encode_network(network, sent_network):
+    '''encode_network(network, sent_network)
+    ---------------------------------
+    Returns a network section: the changes from sent_network to network
+    (both dicts of handles to values)'''
+    changed = [other for other in network
+        if network[other] != sent_network.get(other)]
+    changed.sort()
+    parts = [encode_varint(len(changed))]
+    last_handle = 0
+    for other in changed:
+        parts.append(encode_varint(other - last_handle))
+        parts.append(encode_zigzag(
+            network[other] - sent_network.get(other, 0)))
+        last_handle = other
+    parts.append(encode_handles([other for other in sent_network
+        if other not in network]))
+    return ''.join(parts)
+
+'''========================================================================
+
+Decoding
+
+========================================================================'''
+def decode_varint(data, offset):
+    '''decode_varint(data, offset)
+    ---------------------------------
+    Returns a tuple of (value, next offset) for the varint at offset'''
+    value = 0
+    shift = 0
+    while True:
+        byte = ord(data[offset])
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+def decode_zigzag(data, offset):
+    value, offset = decode_varint(data, offset)
+    if value & 1:
+        return -(value >> 1) - 1, offset
+    return value >> 1, offset
+
+def decode_string(data, offset):
+    length, offset = decode_varint(data, offset)
+    if offset + length > len(data):
+        raise IndexError(offset + length)
+    return data[offset:offset + length].decode('utf-8'), offset + length
+
+def decode_handles(data, offset):
+    count, offset = decode_varint(data, offset)
+    handles = []
+    handle = 0
+    for i in xrange(count):
+        gap, offset = decode_varint(data, offset)
+        handle += gap
+        handles.append(handle)
+    return handles, offset
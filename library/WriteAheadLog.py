@@ -0,0 +1,576 @@
+"""=============================================================================
+    WriteAheadLog.py
+    ------------
+    Crash safe, incremental persistence.  Instead of saving the whole world
+    every tick, every change to it is appended to a log as it happens:
+
+        spawn       an entity was created (its full state)
+        action      an action was performed (its key, source, target and
+                    values - performing it again has the same effects)
+        target      an entity's target was set
+        despawn     an entity was despawned
+        positions   entities were moved (their new positions)
+        personas    entities' persona and network values changed outside of
+                    actions (e.g., by a coarse level of detail update)
+        tick        the end of a tick (written by commit())
+
+    Records are buffered in memory and written (and fsynced) together by
+    commit(), which the server calls once per tick (group commit), so
+    durability costs one write and one fsync per tick no matter how many
+    changes there were.  A crash loses at most the changes since the last
+    commit.
+
+    Every so often, compact() saves the world to a checkpoint (in the
+    versioned schema, see Schema.py) and starts a new log segment, and the
+    old checkpoint and segments are deleted.  recover() loads the newest
+    checkpoint and replays the segments after it.  A log directory looks
+    like:
+
+        world.wal/
+            checkpoint.3        world at the start of segment 3
+            log.3               changes since then
+            log.4               (if a checkpoint is being written)
+
+    Each record in a segment is a header (the payload's length and CRC32),
+    then the payload (a marshalled tuple).  A record torn by a crash fails
+    its length or CRC check, and the log is cut off before it.
+
+    Usage:
+
+        python Server.py --wal world.wal
+        python WriteAheadLog.py world.wal
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import marshal
+import optparse
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+
+#Vasir Engine imports
+import Action
+import Entity
+import Metrics
+import Schema
+
+"""=============================================================================
+
+WRITE AHEAD LOG - GLOBAL SETTINGS
+
+============================================================================="""
+LOG_VERSION = 1
+
+#Segments start with MAGIC and LOG_VERSION
+MAGIC = 'VWL'
+SEGMENT_HEADER = struct.Struct('!3sH')
+#Records start with the length and CRC32 of their payload
+RECORD_HEADER = struct.Struct('!II')
+#marshal format version (see Schema.MARSHAL_VERSION)
+MARSHAL_VERSION = Schema.MARSHAL_VERSION
+
+CHECKPOINT_PREFIX = 'checkpoint.'
+SEGMENT_PREFIX = 'log.'
+FILE_PATTERN = re.compile(r'^(checkpoint|log)\.(\d+)$')
+
+#Buffered records are committed early once they add up to this many bytes
+DEFAULT_BATCH_BYTES = 1048576
+
+#Number of server ticks between compactions (when the server has a log)
+DEFAULT_COMPACT_INTERVAL = 3000
+
+#Record types
+SPAWN = 'spawn'
+ACTION = 'action'
+TARGET = 'target'
+DESPAWN = 'despawn'
+POSITIONS = 'positions'
+PERSONAS = 'personas'
+TICK = 'tick'
+
+#Metrics
+RECORDS = Metrics.Counter('vasir_wal_records_total',
+    'Records appended to the write-ahead log, by type', ('type',))
+COMMIT_SECONDS = Metrics.Histogram('vasir_wal_commit_seconds',
+    'Time taken to write and fsync a batch of write-ahead log records')
+COMMIT_BYTES = Metrics.Histogram('vasir_wal_commit_bytes',
+    'Size of each batch of write-ahead log records',
+    buckets=Metrics.BYTES_BUCKETS)
+COMPACT_SECONDS = Metrics.Histogram('vasir_wal_compact_seconds',
+    'Time the game loop spent copying the world for a compaction')
+
+"""=============================================================================
+
+CLASS DEFINITIONS
+
+============================================================================="""
+class CorruptLogError(ValueError):
+    '''CorruptLogError
+    -------------------------------------
+    Raised when a log segment (other than the end of the last one) can't be
+    read'''
+    pass
+
+class EntityIds(object):
+    '''EntityIds
+    -------------------------------------
+    Stands in for the dict of entity IDs to rows Schema encodes references
+    with, so log records refer to entities by ID.  Only entities which are
+    in the world are found'''
+    def __contains__(self, entity_id):
+        return entity_id in Entity.Entity._entities
+
+    def __getitem__(self, entity_id):
+        if entity_id not in Entity.Entity._entities:
+            raise KeyError(entity_id)
+        return entity_id
+
+    def get(self, entity_id, default=None):
+        if entity_id in Entity.Entity._entities:
+            return entity_id
+        return default
+
+class WriteAheadLog(object):
+    '''WriteAheadLog
+    -------------------------------------
+    Appends changes to the world to the log directory path.  Call recover()
+    first (to load what's already been logged), then attach() to start
+    logging changes'''
+    def __init__(self, path, batch_bytes=DEFAULT_BATCH_BYTES, sync=True):
+        self.path = path
+        self.batch_bytes = batch_bytes
+        #If False, commits aren't fsynced (they survive the engine
+        #   crashing, but not the machine)
+        self.sync = sync
+
+        self.rows = EntityIds()
+        #Records waiting to be committed, and their total size
+        self.pending = []
+        self.pending_bytes = 0
+
+        #Current segment's generation and file
+        self.generation = 0
+        self.file = None
+        self.attached = False
+
+        #Thread writing the last compaction's checkpoint, and the error it
+        #   failed with (if any)
+        self.compact_thread = None
+        self.compact_error = None
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    '''====================================================================
+
+    Files
+
+    ======================================================================='''
+    def get_generations(self):
+        '''get_generations(self)
+        ---------------------------------
+        Returns a tuple of (sorted checkpoint generations, sorted segment
+        generations) in the log directory'''
+        checkpoints = []
+        segments = []
+        for filename in os.listdir(self.path):
+            match = FILE_PATTERN.match(filename)
+            if match is None:
+                continue
+            if match.group(1) == 'checkpoint':
+                checkpoints.append(int(match.group(2)))
+            else:
+                segments.append(int(match.group(2)))
+        return sorted(checkpoints), sorted(segments)
+
+    def get_checkpoint_path(self, generation):
+        return os.path.join(self.path, '%s%s' % (CHECKPOINT_PREFIX,
+            generation))
+
+    def get_segment_path(self, generation):
+        return os.path.join(self.path, '%s%s' % (SEGMENT_PREFIX, generation))
+
+    def open_segment(self, generation):
+        '''open_segment(self, generation)
+        ---------------------------------
+        Starts appending to the segment for generation (creating it if it
+        doesn't exist)'''
+        if self.file is not None:
+            self.file.close()
+        self.generation = generation
+        path = self.get_segment_path(generation)
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(SEGMENT_HEADER.pack(MAGIC, LOG_VERSION))
+            self.flush()
+            self.sync_directory()
+
+    def flush(self):
+        self.file.flush()
+        if self.sync:
+            os.fsync(self.file.fileno())
+
+    def sync_directory(self):
+        '''sync_directory(self)
+        ---------------------------------
+        Makes sure files created in (or renamed into) the log directory
+        survive a crash'''
+        if not self.sync or not hasattr(os, 'O_DIRECTORY'):
+            return
+        handle = os.open(self.path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(handle)
+        finally:
+            os.close(handle)
+
+    '''====================================================================
+
+    Logging
+
+    ======================================================================='''
+    def attach(self):
+        '''attach(self)
+        ---------------------------------
+        Starts logging changes to the world.  Opens the latest segment
+        (or the first one) if one isn't open'''
+        if self.file is None:
+            checkpoints, segments = self.get_generations()
+            self.open_segment(max(checkpoints + segments + [0]))
+        Entity.Entity._journal = self
+        Action.Action._journal = self
+        self.attached = True
+
+    def detach(self):
+        '''detach(self)
+        ---------------------------------
+        Stops logging changes (committing the ones which are buffered)'''
+        if Entity.Entity._journal is self:
+            Entity.Entity._journal = None
+        if Action.Action._journal is self:
+            Action.Action._journal = None
+        self.attached = False
+        if self.file is not None:
+            self.commit()
+
+    def close(self, tick=None):
+        '''close(self, tick)
+        ---------------------------------
+        Stops logging, commits, and waits for any compaction to finish'''
+        self.detach()
+        if tick is not None:
+            self.commit(tick)
+        self.wait()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def append(self, record):
+        '''append(self, record)
+        ---------------------------------
+        Buffers a record (a tuple whose first item is its type).  Commits
+        once the buffered records add up to batch_bytes'''
+        payload = marshal.dumps(record, MARSHAL_VERSION)
+        self.pending.append(RECORD_HEADER.pack(len(payload),
+            zlib.crc32(payload) & 0xffffffff))
+        self.pending.append(payload)
+        self.pending_bytes += RECORD_HEADER.size + len(payload)
+        RECORDS.labels(record[0]).inc()
+        if self.pending_bytes >= self.batch_bytes:
+            self.commit()
+
+    def commit(self, tick=None):
+        '''commit(self, tick)
+        ---------------------------------
+        Writes the buffered records to the log and fsyncs it.  If tick is
+        passed in, a tick record is written first, so recovery knows which
+        tick the log got to'''
+        if tick is not None:
+            self.append((TICK, tick))
+        if len(self.pending) < 1:
+            return 0
+        start_time = time.time()
+        data = ''.join(self.pending)
+        self.pending = []
+        self.pending_bytes = 0
+        self.file.write(data)
+        self.flush()
+        COMMIT_SECONDS.observe(time.time() - start_time)
+        COMMIT_BYTES.observe(len(data))
+        return len(data)
+
+    #------------------------------------
+    #Records (called by Entity, Action and Server)
+    #------------------------------------
+    def record_spawn(self, entity):
+        self.append((SPAWN, Schema.encode_entity(entity, self.rows, []),
+            Entity.Entity._entity_created_count))
+
+    def record_action(self, action):
+        self.append((ACTION,) + Schema.encode_event(action, self.rows))
+
+    def record_target(self, entity):
+        self.append((TARGET, entity.id,
+            Schema.encode_reference(entity.target, self.rows)))
+
+    def record_despawn(self, entity_id):
+        self.append((DESPAWN, entity_id))
+
+    def record_positions(self, entity_ids):
+        '''record_positions(self, entity_ids)
+        ---------------------------------
+        Records the current positions of the entities with the passed in
+        IDs (e.g., the ones a movement system just moved)'''
+        entities = Entity.Entity._entities
+        positions = []
+        for entity_id in entity_ids:
+            entity = entities.get(entity_id)
+            if entity is not None:
+                positions.append((entity_id, list(entity.position)))
+        if len(positions) > 0:
+            self.append((POSITIONS, positions))
+
+    def record_personas(self, entity_ids):
+        '''record_personas(self, entity_ids)
+        ---------------------------------
+        Records the current persona and network values of the entities
+        with the passed in IDs (e.g., the ones a coarse update just
+        changed)'''
+        entities = Entity.Entity._entities
+        personas = []
+        for entity_id in entity_ids:
+            entity = entities.get(entity_id)
+            if entity is not None:
+                network = entity.network
+                personas.append((entity_id, dict(entity.persona),
+                    [(other_id, network[other_id]['value'])
+                        for other_id in network]))
+        if len(personas) > 0:
+            self.append((PERSONAS, personas))
+
+    '''====================================================================
+
+    Compaction
+
+    ======================================================================='''
+    def compact(self, tick=0, seed=None, background=True):
+        '''compact(self, tick, seed, background)
+        ---------------------------------
+        Saves the world to a checkpoint and starts a new segment.  The
+        world is copied here; the checkpoint is written (and the old files
+        deleted) in a background thread if background is True.  Returns
+        False if the last compaction is still being written'''
+        if self.is_compacting():
+            return False
+        #Raise the last compaction's error, if it failed
+        self.wait()
+
+        start_time = time.time()
+        self.commit(tick)
+        generation = self.generation + 1
+        self.open_segment(generation)
+        data = Schema.dumps(tick, seed)
+        COMPACT_SECONDS.observe(time.time() - start_time)
+
+        if not background:
+            self.write_checkpoint(generation, data)
+            return True
+        self.compact_error = None
+        self.compact_thread = threading.Thread(target=self.write_checkpoint,
+            args=(generation, data))
+        self.compact_thread.daemon = True
+        self.compact_thread.start()
+        return True
+
+    def write_checkpoint(self, generation, data):
+        '''write_checkpoint(self, generation, data)
+        ---------------------------------
+        Writes a checkpoint, then deletes the checkpoints and segments it
+        replaces'''
+        try:
+            path = self.get_checkpoint_path(generation)
+            temp_path = '%s.tmp' % (path)
+            with open(temp_path, 'wb') as checkpoint_file:
+                checkpoint_file.write(data)
+                checkpoint_file.flush()
+                if self.sync:
+                    os.fsync(checkpoint_file.fileno())
+            os.rename(temp_path, path)
+            self.sync_directory()
+
+            checkpoints, segments = self.get_generations()
+            for old in checkpoints:
+                if old < generation:
+                    os.remove(self.get_checkpoint_path(old))
+            for old in segments:
+                if old < generation:
+                    os.remove(self.get_segment_path(old))
+        except Exception as error:
+            self.compact_error = error
+
+    def is_compacting(self):
+        return self.compact_thread is not None \
+            and self.compact_thread.is_alive()
+
+    def wait(self):
+        '''wait(self)
+        ---------------------------------
+        Waits for the compaction being written (if any) to finish.  Raises
+        the error it failed with, if it failed'''
+        if self.compact_thread is not None:
+            self.compact_thread.join()
+            self.compact_thread = None
+        if self.compact_error is not None:
+            error, self.compact_error = self.compact_error, None
+            raise error
+
+    '''====================================================================
+
+    Recovery
+
+    ======================================================================='''
+    def recover(self):
+        '''recover(self)
+        ---------------------------------
+        Replaces the world with the newest checkpoint, then replays the
+        segments after it.  The end of the last segment is cut off if a
+        crash left a torn record there.  Returns a dict of the tick and
+        seed recovered to, the checkpoint generation used (None if there
+        was no checkpoint), and the number of records replayed'''
+        if self.attached:
+            raise RuntimeError('Detach the log before recovering')
+        checkpoints, segments = self.get_generations()
+
+        results = {'tick': 0, 'seed': None, 'checkpoint': None,
+            'records': 0}
+        Entity.Entity.reset_world()
+        start = 0
+        if len(checkpoints) > 0:
+            start = checkpoints[-1]
+            with open(self.get_checkpoint_path(start), 'rb') \
+                as checkpoint_file:
+                header = Schema.loads(checkpoint_file.read())
+            results['tick'] = header['tick']
+            results['seed'] = header['seed']
+            results['checkpoint'] = start
+
+        segments = [generation for generation in segments
+            if generation >= start]
+        for generation in segments:
+            last = generation == segments[-1]
+            path = self.get_segment_path(generation)
+            for record in read_segment(path, truncate=last):
+                if record[0] == TICK:
+                    results['tick'] = record[1]
+                else:
+                    apply_record(record)
+                results['records'] += 1
+
+        if len(segments) > 0:
+            self.open_segment(segments[-1])
+        else:
+            self.open_segment(start)
+        return results
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+def read_segment(path, truncate=False):
+    '''read_segment(path, truncate)
+    ---------------------------------
+    Yields the records in a segment.  If the segment ends with a torn
+    record, the segment is cut off before it (if truncate is True) or a
+    CorruptLogError is raised'''
+    with open(path, 'rb') as segment_file:
+        data = segment_file.read()
+
+    if len(data) < SEGMENT_HEADER.size:
+        #Crashed before the header was written
+        offset = 0
+        end = 0
+    else:
+        magic, version = SEGMENT_HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise CorruptLogError('Not a log segment: %s' % (path))
+        if version != LOG_VERSION:
+            raise CorruptLogError('Unsupported log version: %s' % (version))
+        offset = SEGMENT_HEADER.size
+        end = len(data)
+
+    while offset < end:
+        if offset + RECORD_HEADER.size > end:
+            break
+        length, crc = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length \
+            or zlib.crc32(payload) & 0xffffffff != crc:
+            break
+        yield marshal.loads(payload)
+        offset = start + length
+
+    if offset < len(data) or len(data) < SEGMENT_HEADER.size:
+        if not truncate:
+            raise CorruptLogError('Torn record at byte %s of %s' % (
+                offset, path))
+        with open(path, 'r+b') as segment_file:
+            if len(data) < SEGMENT_HEADER.size:
+                segment_file.truncate(0)
+                segment_file.write(SEGMENT_HEADER.pack(MAGIC, LOG_VERSION))
+            else:
+                segment_file.truncate(offset)
+
+def apply_record(record):
+    '''apply_record(record)
+    ---------------------------------
+    Applies a logged change to the world'''
+    entities = Entity.Entity._entities
+    kind = record[0]
+    if kind == SPAWN:
+        entity = Schema.decode_entity(record[1], Schema.ENTITY_FIELDS,
+            entities)
+        Entity.Entity._registry.spawn(entity)
+        Entity.Entity._entity_created_count = record[2]
+    elif kind == ACTION:
+        action = Schema.decode_event(record[1:], Schema.EVENT_FIELDS,
+            entities)
+        action.perform()
+    elif kind == TARGET:
+        entities[record[1]].target = Schema.decode_reference(record[2],
+            entities)
+    elif kind == DESPAWN:
+        Entity.Entity._registry.despawn(record[1])
+    elif kind == POSITIONS:
+        for entity_id, position in record[1]:
+            entities[entity_id].position = position
+    elif kind == PERSONAS:
+        for entity_id, persona, network_values in record[1]:
+            entity = entities[entity_id]
+            entity.persona = persona
+            for other_id, value in network_values:
+                entity.network[other_id]['value'] = value
+    else:
+        raise CorruptLogError('Unknown record type: %s' % (kind))
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(usage='%prog [options] log_directory')
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('A log directory is required')
+
+    log = WriteAheadLog(args[0])
+    start_time = time.time()
+    results = log.recover()
+    log.close()
+    print 'Recovered %s entities to tick %s in %.2f seconds ' \
+        '(checkpoint %s, %s records replayed)' % (
+        len(Entity.Entity._entities), results['tick'],
+        time.time() - start_time, results['checkpoint'],
+        results['records'])
@@ -0,0 +1,8 @@
+"""=============================================================================
+    benchmarks
+    ------------
+    Benchmarks for the Vasir engine.  Run them from the library directory,
+    e.g.:
+
+        python -m benchmarks.memory --count 1000000
+============================================================================="""
@@ -0,0 +1,274 @@
+"""=============================================================================
+    engine.py
+    ------------
+    Engine hot path benchmark.  Times the entity operations the game loop
+    leans on (creating entities, goals, similarity, nearest entities,
+    conversations, performing actions, JSON info) and a full Server tick
+    (with no redis or ZeroMQ), for worlds of different sizes.  Everything is
+    seeded, so runs with the same seed time the same work.
+
+    Results can be saved as JSON, and compared against a saved baseline.
+    Anything slower than the baseline by more than the threshold is flagged
+    as a regression (and the exit status is 1).
+
+    Usage (from the library directory):
+
+        python -m benchmarks.engine --output baseline.json
+        python -m benchmarks.engine --baseline baseline.json
+        python -m benchmarks.engine --sizes 100,1000 --seed 7
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import json
+import optparse
+import platform
+import random
+import sys
+import time
+
+#Vasir Engine imports
+import Action
+import Actions
+import Entity
+import Names
+import Replay
+import Server
+import Simulation
+
+"""=============================================================================
+
+ENGINE - GLOBAL SETTINGS
+
+============================================================================="""
+DEFAULT_SIZES = (100, 1000, 10000, 100000)
+DEFAULT_SEED = 1234
+
+#Number of times each per entity operation is timed
+DEFAULT_OPS = 1000
+#Operations which loop over every entity are timed fewer times in bigger
+#   worlds, so about this many entity visits are timed
+WORLD_OPS_BUDGET = 1000000
+#Number of server ticks timed
+DEFAULT_TICKS = 10
+
+#A benchmark which takes more than this fraction longer than the baseline
+#   is a regression
+DEFAULT_THRESHOLD = 0.2
+
+#BENCHMARKS
+#----------------
+#Benchmark names, in the order they're run and printed
+BENCHMARKS = (
+    'Entity.__init__',
+    'Entity.get_goals',
+    'Entity.get_similarity_total',
+    'Entity.get_nearest_entities',
+    'Actions.converse',
+    'Action.perform',
+    'Entity.get_info_json',
+    'Server.step',
+)
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+def time_calls(function, args_list):
+    '''time_calls(function, args_list)
+    ---------------------------------
+    Calls function once with each tuple of args in args_list.  Returns a
+    dict of the number of calls and the seconds each call took'''
+    start_time = time.time()
+    for args in args_list:
+        function(*args)
+    seconds = time.time() - start_time
+    return {
+        'ops': len(args_list),
+        'seconds_per_op': seconds / max(len(args_list), 1),
+    }
+
+def create_world(size, seed):
+    '''create_world(size, seed)
+    ---------------------------------
+    Replaces the world with size new entities, seeded with seed.  Returns
+    the time_calls result for creating them'''
+    Entity.Entity.reset_world()
+    random.seed(seed)
+    Names.seed(seed)
+    return time_calls(Entity.Entity, [()] * size)
+
+def get_pairs(entities, rng, ops):
+    '''get_pairs(entities, rng, ops)
+    ---------------------------------
+    Returns ops (source, target) tuples of different entities'''
+    pairs = []
+    for i in xrange(ops):
+        source, target = rng.sample(entities, 2)
+        pairs.append((source, target))
+    return pairs
+
+def run_size(size, seed=DEFAULT_SEED, ops=DEFAULT_OPS,
+    ticks=DEFAULT_TICKS):
+    '''run_size(size, seed, ops, ticks)
+    ---------------------------------
+    Runs every benchmark in a world of size entities.  Returns a dict of
+    benchmark names to time_calls results'''
+    results = {}
+    results['Entity.__init__'] = create_world(size, seed)
+
+    #The entities and pairs each benchmark uses are picked from their own
+    #   generator, so they don't depend on what the benchmarks do with the
+    #   global one
+    rng = random.Random(seed)
+    entities = sorted(Entity.Entity._entities.itervalues(),
+        key=lambda entity: entity.handle)
+    samples = [(rng.choice(entities),) for i in xrange(ops)]
+    pairs = get_pairs(entities, rng, ops)
+    world_ops = max(1, min(ops, WORLD_OPS_BUDGET // size))
+
+    results['Entity.get_goals'] = time_calls(Entity.Entity.get_goals,
+        samples)
+    results['Entity.get_similarity_total'] = time_calls(
+        Entity.Entity.get_similarity_total, pairs)
+    results['Entity.get_nearest_entities'] = time_calls(
+        Entity.Entity.get_nearest_entities, samples[:world_ops])
+
+    #Conversations need the entities to be in range of each other, so every
+    #   paired entity is moved to the same spot (and put back afterwards)
+    positions = {}
+    for pair in pairs:
+        for entity in pair:
+            if entity.id not in positions:
+                positions[entity.id] = entity.position
+                entity.position = list(pairs[0][0].position)
+    results['Actions.converse'] = time_calls(
+        lambda source, target: Actions.converse(source=source,
+            target=target),
+        pairs)
+
+    actions = [(Action.Action._create_action('converse', source, target),)
+        for source, target in pairs]
+    results['Action.perform'] = time_calls(Action.Action.perform, actions)
+    for entity_id in positions:
+        Entity.Entity._entities[entity_id].position = positions[entity_id]
+
+    results['Entity.get_info_json'] = time_calls(
+        Entity.Entity.get_info_json, samples)
+
+    server = Server.Server(client=Replay.NullClient(), seed=seed)
+    def step():
+        server.step()
+        server.flush()
+        server.tick += 1
+    results['Server.step'] = time_calls(step,
+        [()] * max(1, min(ticks, WORLD_OPS_BUDGET // size)))
+
+    Entity.Entity.reset_world()
+    return results
+
+def run(sizes=DEFAULT_SIZES, seed=DEFAULT_SEED, ops=DEFAULT_OPS,
+    ticks=DEFAULT_TICKS):
+    '''run(sizes, seed, ops, ticks)
+    ---------------------------------
+    Returns a dict of results, with the results of each world size under
+    'sizes' (keyed by the size as a string, so they survive JSON)'''
+    results = {
+        'seed': seed,
+        'ops': ops,
+        'ticks': ticks,
+        'python': platform.python_version(),
+        'sizes': {},
+    }
+    for size in sizes:
+        results['sizes'][str(size)] = run_size(size, seed, ops, ticks)
+    return results
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    '''compare(results, baseline, threshold)
+    ---------------------------------
+    Compares results against baseline results.  Returns a list of
+    (size, benchmark, seconds per op, baseline seconds per op) tuples for
+    every benchmark which got more than threshold slower.  Benchmarks which
+    aren't in both are skipped'''
+    regressions = []
+    for size in sorted(results['sizes'], key=int):
+        if size not in baseline['sizes']:
+            continue
+        for name in BENCHMARKS:
+            try:
+                seconds = results['sizes'][size][name]['seconds_per_op']
+                baseline_seconds = baseline['sizes'][size][name][
+                    'seconds_per_op']
+            except KeyError:
+                continue
+            if seconds > baseline_seconds * (1 + threshold):
+                regressions.append((int(size), name, seconds,
+                    baseline_seconds))
+    return regressions
+
+def print_results(results, baseline=None):
+    for size in sorted(results['sizes'], key=int):
+        print '%s entities' % (size)
+        for name in BENCHMARKS:
+            result = results['sizes'][size][name]
+            line = '    %-30s %12.2f us/op (%s ops)' % (name,
+                result['seconds_per_op'] * 1e6, result['ops'])
+            try:
+                baseline_seconds = baseline['sizes'][size][name][
+                    'seconds_per_op']
+                line += ' %+6.1f%%' % ((result['seconds_per_op']
+                    / baseline_seconds - 1) * 100)
+            except (KeyError, TypeError, ZeroDivisionError):
+                pass
+            print line
+
+def main(args=None):
+    parser = optparse.OptionParser()
+    parser.add_option('-s', '--sizes',
+        default=','.join([str(size) for size in DEFAULT_SIZES]),
+        help='Comma separated numbers of entities (default: %default)')
+    parser.add_option('--seed', type='int', default=DEFAULT_SEED,
+        help='Seed for the random number generators (default: %default)')
+    parser.add_option('--ops', type='int', default=DEFAULT_OPS,
+        help='Number of times to time each entity operation '
+            '(default: %default)')
+    parser.add_option('--ticks', type='int', default=DEFAULT_TICKS,
+        help='Number of server ticks to time (default: %default)')
+    parser.add_option('-o', '--output', default=None,
+        help='Save the results as JSON to this file')
+    parser.add_option('-b', '--baseline', default=None,
+        help='Compare the results against the JSON results in this file')
+    parser.add_option('-t', '--threshold', type='float',
+        default=DEFAULT_THRESHOLD,
+        help='Fraction slower than the baseline which counts as a '
+            'regression (default: %default)')
+    options, args = parser.parse_args(args)
+
+    baseline = None
+    if options.baseline is not None:
+        with open(options.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    sizes = [int(size) for size in options.sizes.split(',') if size.strip()]
+    results = run(sizes, options.seed, options.ops, options.ticks)
+    print_results(results, baseline)
+
+    if options.output is not None:
+        with open(options.output, 'w') as output_file:
+            json.dump(results, output_file, indent=4, sort_keys=True)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, options.threshold)
+        for size, name, seconds, baseline_seconds in regressions:
+            print 'REGRESSION: %s at %s entities: %.2f us/op ' \
+                '(baseline %.2f us/op)' % (name, size, seconds * 1e6,
+                    baseline_seconds * 1e6)
+        if len(regressions) > 0:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
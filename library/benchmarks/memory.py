@@ -0,0 +1,141 @@
+"""=============================================================================
+    memory.py
+    ------------
+    Memory benchmark.  Creates a lot of entities and reports how many bytes
+    each one uses, both measured (the growth in the process's max resident
+    set size) and estimated (sys.getsizeof of the entity and its
+    containers).  The estimate is also worked out for an entity which keeps
+    its attributes in a per instance __dict__, for comparison with the
+    __slots__ layout Entity uses.
+
+    Usage (from the library directory):
+
+        python -m benchmarks.memory [--count 1000000]
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import optparse
+import sys
+import time
+
+#resource is only available on unix
+try:
+    import resource
+except ImportError:
+    resource = None
+
+#Vasir Engine imports
+import Entity
+
+"""=============================================================================
+
+MEMORY - GLOBAL SETTINGS
+
+============================================================================="""
+DEFAULT_COUNT = 1000000
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+def get_max_rss():
+    '''get_max_rss()
+    ---------------------------------
+    Returns the max resident set size of this process, in bytes (or None if
+    it can't be measured on this platform)'''
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #OS X reports bytes, linux reports kilobytes
+    if sys.platform == 'darwin':
+        return max_rss
+    return max_rss * 1024
+
+def get_container_size(entity):
+    '''get_container_size(entity)
+    ---------------------------------
+    Returns the estimated size, in bytes, of the containers an entity owns
+    (its dicts and lists, but not shared objects like strings or races)'''
+    size = 0
+    for container in (entity.stats, entity.persona, entity.memory,
+        entity.network, entity.mood, entity.goals, entity.position):
+        size += sys.getsizeof(container)
+    for goal in entity.goals.itervalues():
+        size += sys.getsizeof(goal)
+    return size
+
+def get_estimated_size(entity):
+    '''get_estimated_size(entity)
+    ---------------------------------
+    Returns a tuple of the estimated (slots size, dict size) of an entity,
+    in bytes.  The dict size is what the same entity would use if its
+    attributes were stored in a __dict__ instead of __slots__'''
+    containers = get_container_size(entity)
+    slots_size = sys.getsizeof(entity) + containers
+
+    attributes = {}
+    for slot in Entity.Entity.__slots__:
+        try:
+            attributes[slot] = getattr(entity, slot)
+        except AttributeError:
+            pass
+    #A plain object with a __dict__ (and a __weakref__ slot)
+    dict_size = sys.getsizeof(object()) + 2 * sys.getsizeof(None) \
+        + sys.getsizeof(attributes) + containers
+
+    return (slots_size, dict_size)
+
+def run(count=DEFAULT_COUNT):
+    '''run(count)
+    ---------------------------------
+    Creates count entities and returns a dict of results'''
+    start_rss = get_max_rss()
+    start_time = time.time()
+
+    for i in xrange(count):
+        Entity.Entity()
+
+    elapsed = time.time() - start_time
+    end_rss = get_max_rss()
+
+    entities = Entity.Entity._entities
+    slots_size, dict_size = get_estimated_size(entities.itervalues().next())
+
+    results = {
+        'count': count,
+        'seconds': elapsed,
+        'estimated_bytes_per_entity': slots_size,
+        'estimated_dict_bytes_per_entity': dict_size,
+        'measured_bytes_per_entity': None,
+    }
+    if start_rss is not None:
+        results['measured_bytes_per_entity'] = \
+            (end_rss - start_rss) / float(count)
+
+    return results
+
+def print_results(results):
+    print 'Entities created:                 %s (%.2f seconds)' % (
+        results['count'], results['seconds'])
+    if results['measured_bytes_per_entity'] is not None:
+        print 'Measured bytes per entity:        %.1f' % (
+            results['measured_bytes_per_entity'])
+    print 'Estimated bytes per entity:       %s' % (
+        results['estimated_bytes_per_entity'])
+    print 'Estimated bytes with a __dict__:  %s' % (
+        results['estimated_dict_bytes_per_entity'])
+
+def main(args=None):
+    parser = optparse.OptionParser()
+    parser.add_option('-c', '--count', type='int', default=DEFAULT_COUNT,
+        help='Number of entities to create (default: %default)')
+    options, args = parser.parse_args(args)
+
+    print_results(run(options.count))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""=============================================================================
+    names.py
+    ------------
+    Name generation benchmark.  Reports how many names per second the
+    Markov name generator makes, with and without uniqueness checks, and
+    how the batch size generate_name() uses (Names.NAME_BUFFER_SIZE)
+    trades the wait for a batch against names per second.
+
+    Usage (from the library directory):
+
+        python -m benchmarks.names [--count 1000000]
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import optparse
+import time
+
+#Vasir Engine imports
+import Names
+
+"""=============================================================================
+
+NAMES - GLOBAL SETTINGS
+
+============================================================================="""
+DEFAULT_COUNT = 1000000
+#Batch sizes compared for generate_name()'s buffer
+BUFFER_SIZES = (16, 64, 256, 1024, 4096)
+#Names generated for each batch size
+BUFFER_COUNT = 100000
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+def time_generator(generator, count):
+    '''time_generator(generator, count)
+    ---------------------------------
+    Returns the number of names per second the generator makes'''
+    start_time = time.time()
+    generator.generate(count)
+    return count / (time.time() - start_time)
+
+def time_buffer_size(size, count=BUFFER_COUNT):
+    '''time_buffer_size(size, count)
+    ---------------------------------
+    Returns a tuple of (milliseconds to make one batch, names per second)
+    for batches of size names, made by a generator like the shared one
+    generate_name() uses (without numpy)'''
+    generator = Names.NameGenerator(seed=0, use_numpy=False)
+    start_time = time.time()
+    generator.generate(size)
+    batch_ms = (time.time() - start_time) * 1000
+
+    batches = max(count // size, 1)
+    start_time = time.time()
+    for i in xrange(batches):
+        generator.generate(size)
+    return batch_ms, batches * size / (time.time() - start_time)
+
+def run(count=DEFAULT_COUNT):
+    '''run(count)
+    ---------------------------------
+    Returns a dict of results'''
+    results = {
+        'count': count,
+        'names_per_second': time_generator(Names.NameGenerator(seed=0),
+            count),
+        'unique_names_per_second': time_generator(Names.NameGenerator(
+            seed=0, unique=True, capacity=count), count),
+    }
+    if Names.numpy is not None:
+        results['python_names_per_second'] = time_generator(
+            Names.NameGenerator(seed=0, use_numpy=False), count // 10)
+    results['buffer_sizes'] = [(size,) + time_buffer_size(size)
+        for size in BUFFER_SIZES]
+    return results
+
+def print_results(results):
+    print 'Names generated:          %s' % (results['count'])
+    print 'Names per second:         %.0f' % (results['names_per_second'])
+    print 'Unique names per second:  %.0f' % (
+        results['unique_names_per_second'])
+    if 'python_names_per_second' in results:
+        print 'Without numpy:            %.0f' % (
+            results['python_names_per_second'])
+    print 'generate_name() batches (NAME_BUFFER_SIZE is %s):' % (
+        Names.NAME_BUFFER_SIZE)
+    for size, batch_ms, names_per_second in results['buffer_sizes']:
+        print '    %5s names: %6.2f ms per batch, %.0f names per second' % (
+            size, batch_ms, names_per_second)
+
+def main(args=None):
+    parser = optparse.OptionParser()
+    parser.add_option('-c', '--count', type='int', default=DEFAULT_COUNT,
+        help='Number of names to generate (default: %default)')
+    options, args = parser.parse_args(args)
+
+    print_results(run(options.count))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""=============================================================================
+    persistence.py
+    ------------
+    Persistence benchmark.  Creates a world of entities which know each
+    other and remember talking, then saves and restores it with the
+    versioned schema (see Schema.py) and with pickle (each entity's state
+    pickled, with references to other entities stored as IDs).  Reports the
+    save time, restore time, and size of each.
+
+    Usage (from the library directory):
+
+        python -m benchmarks.persistence [--count 10000]
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import cPickle
+import cStringIO
+import optparse
+import random
+import time
+
+#Vasir Engine imports
+import Entity
+import Schema
+
+"""=============================================================================
+
+PERSISTENCE - GLOBAL SETTINGS
+
+============================================================================="""
+DEFAULT_COUNT = 10000
+DEFAULT_SEED = 1
+#Number of times each save / restore is timed (the fastest is reported)
+DEFAULT_REPEAT = 3
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+def create_world(count, seed=DEFAULT_SEED):
+    '''create_world(count, seed)
+    ---------------------------------
+    Creates count entities.  Every other entity talks to the next one (so
+    both remember it, and know each other) and targets it'''
+    Entity.Entity.reset_world()
+    random.seed(seed)
+    entities = [Entity.Entity() for i in xrange(count)]
+    for entity, other in zip(entities[::2], entities[1::2]):
+        other.position = list(entity.position)
+        entity.perform_action('converse', other, show_log=False)
+        entity.target = other
+
+def pickle_world():
+    '''pickle_world()
+    ---------------------------------
+    Returns every entity's state, pickled'''
+    entities = sorted(Entity.Entity._entities.itervalues(),
+        key=lambda entity: entity.handle)
+    output = cStringIO.StringIO()
+    pickler = cPickle.Pickler(output, 2)
+
+    def get_persistent_id(obj):
+        if isinstance(obj, Entity.Entity):
+            return obj.id
+        return None
+    pickler.persistent_id = get_persistent_id
+
+    pickler.dump([entity.id for entity in entities])
+    for entity in entities:
+        pickler.dump(entity.__getstate__())
+    return output.getvalue()
+
+def unpickle_world(data):
+    '''unpickle_world(data)
+    ---------------------------------
+    Replaces the world with the one pickled by pickle_world()'''
+    unpickler = cPickle.Unpickler(cStringIO.StringIO(data))
+    ids = unpickler.load()
+    entities = dict([(entity_id, Entity.Entity.__new__(Entity.Entity))
+        for entity_id in ids])
+    unpickler.persistent_load = entities.__getitem__
+
+    Entity.Entity.reset_world()
+    for entity_id in ids:
+        entity = entities[entity_id]
+        entity.__setstate__(unpickler.load())
+        Entity.Entity._registry.spawn(entity)
+
+def time_function(function, args=(), repeat=DEFAULT_REPEAT):
+    '''time_function(function, args, repeat)
+    ---------------------------------
+    Returns a tuple of (fastest time in seconds, the last result)'''
+    best = None
+    result = None
+    for i in xrange(repeat):
+        start_time = time.time()
+        result = function(*args)
+        elapsed = time.time() - start_time
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+def run(count=DEFAULT_COUNT, repeat=DEFAULT_REPEAT):
+    '''run(count, repeat)
+    ---------------------------------
+    Returns a dict of format names to dicts of save_seconds,
+    restore_seconds and bytes'''
+    create_world(count)
+    results = {}
+    for name, save, restore in (
+        ('schema', Schema.dumps, Schema.loads),
+        ('pickle', pickle_world, unpickle_world)):
+        save_seconds, data = time_function(save, repeat=repeat)
+        restore_seconds, result = time_function(restore, (data,), repeat)
+        results[name] = {
+            'save_seconds': save_seconds,
+            'restore_seconds': restore_seconds,
+            'bytes': len(data),
+        }
+    return results
+
+def print_results(count, results):
+    print '%s entities' % (count)
+    print '%-8s %12s %12s %12s' % ('format', 'save (ms)', 'restore (ms)',
+        'size (KB)')
+    for name in ('schema', 'pickle'):
+        print '%-8s %12.1f %12.1f %12.1f' % (name,
+            results[name]['save_seconds'] * 1000,
+            results[name]['restore_seconds'] * 1000,
+            results[name]['bytes'] / 1024.0)
+    print 'Schema restore is %.1fx faster, and %.0f%% of the size' % (
+        results['pickle']['restore_seconds']
+            / max(results['schema']['restore_seconds'], 1e-9),
+        100.0 * results['schema']['bytes']
+            / max(results['pickle']['bytes'], 1))
+
+def main(args=None):
+    parser = optparse.OptionParser()
+    parser.add_option('-c', '--count', type='int', default=DEFAULT_COUNT,
+        help='Number of entities to create (default: %default)')
+    parser.add_option('-r', '--repeat', type='int', default=DEFAULT_REPEAT,
+        help='Number of times to time each save / restore '
+            '(default: %default)')
+    options, args = parser.parse_args(args)
+
+    print_results(options.count, run(options.count, options.repeat))
+
+if __name__ == '__main__':
+    main()
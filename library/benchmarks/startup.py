@@ -0,0 +1,111 @@
+"""=============================================================================
+    startup.py
+    ------------
+    Cold start benchmark.  Starts fresh python processes which import the
+    engine (and create an entity), and reports how long that takes against
+    STARTUP_BUDGET_MS.  Heavy optional modules (numpy, zmq, redis) should be
+    loaded lazily, so they shouldn't count against the budget.
+
+    Usage (from the library directory):
+
+        python -m benchmarks.startup [--runs 10]
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import optparse
+import os
+import subprocess
+import sys
+
+"""=============================================================================
+
+STARTUP - GLOBAL SETTINGS
+
+============================================================================="""
+#Cold start budget, in milliseconds, for a process which only simulates
+#   entities
+STARTUP_BUDGET_MS = 50
+
+#STARTUP_SCRIPTS
+#----------------
+#Name, and the code to time in a fresh process
+STARTUP_SCRIPTS = (
+    ('import Entity', 'import Entity'),
+    ('create entity', 'import Entity; Entity.Entity()'),
+    ('import Server', 'import Server'),
+)
+
+#Modules which should not be loaded by any of the startup scripts
+HEAVY_MODULES = ('numpy', 'zmq', 'redis')
+
+#Runs the code and prints the time it took (in ms) and the heavy modules it
+#   loaded
+TIMER = '''
+import sys, time
+start_time = time.time()
+%s
+print (time.time() - start_time) * 1000
+print ','.join([name for name in %r if name in sys.modules])
+'''
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+def time_startup(code):
+    '''time_startup(code)
+    ---------------------------------
+    Runs code in a fresh python process.  Returns a tuple of (milliseconds,
+    list of heavy modules loaded)'''
+    library_path = os.path.dirname(os.path.dirname(os.path.abspath(
+        __file__)))
+    output = subprocess.check_output([sys.executable, '-c',
+        TIMER % (code, HEAVY_MODULES)], cwd=library_path)
+    lines = output.splitlines()
+    loaded = [name for name in lines[-1].split(',') if name]
+    return (float(lines[-2]), loaded)
+
+def run(runs=10):
+    '''run(runs)
+    ---------------------------------
+    Returns a dict of script names to a dict of the median milliseconds
+    over runs processes and the heavy modules loaded'''
+    results = {}
+    for name, code in STARTUP_SCRIPTS:
+        times = []
+        for i in xrange(runs):
+            milliseconds, loaded = time_startup(code)
+            times.append(milliseconds)
+        times.sort()
+        results[name] = {
+            'milliseconds': times[len(times) // 2],
+            'loaded': loaded,
+        }
+    return results
+
+def print_results(results):
+    for name, code in STARTUP_SCRIPTS:
+        result = results[name]
+        status = 'OK'
+        if result['milliseconds'] > STARTUP_BUDGET_MS:
+            status = 'OVER BUDGET'
+        print '%-16s %6.1f ms (budget %s ms) %s' % (name,
+            result['milliseconds'], STARTUP_BUDGET_MS, status)
+        if len(result['loaded']) > 0:
+            print '    loaded: %s' % (', '.join(result['loaded']))
+
+def main(args=None):
+    parser = optparse.OptionParser()
+    parser.add_option('-r', '--runs', type='int', default=10,
+        help='Number of processes to time each script with '
+            '(default: %default)')
+    options, args = parser.parse_args(args)
+
+    print_results(run(options.runs))
+
+if __name__ == '__main__':
+    main()
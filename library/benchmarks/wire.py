@@ -0,0 +1,132 @@
+"""=============================================================================
+    wire.py
+    ------------
+    Wire format benchmark.  Creates a world of entities which know each
+    other (see benchmarks/persistence.py), then compares publishing it as a
+    JSON game state update with binary updates (see Wire.py): a keyframe
+    from a new encoder, a keyframe from an encoder which has sent the world
+    before, and a regular update after some of the entities have moved.
+    Reports the encode time and size of each, and how long the reference
+    decoder takes to read the keyframe.
+
+    Usage (from the library directory):
+
+        python -m benchmarks.wire [--count 10000] [--moved 0.05]
+============================================================================="""
+"""=============================================================================
+
+IMPORTS
+
+============================================================================="""
+import optparse
+import random
+
+#Vasir Engine imports
+import Entity
+import Wire
+from benchmarks import persistence
+
+"""=============================================================================
+
+WIRE - GLOBAL SETTINGS
+
+============================================================================="""
+DEFAULT_COUNT = 10000
+#Fraction of the entities which move between updates
+DEFAULT_MOVED = 0.05
+DEFAULT_REPEAT = 3
+
+"""=============================================================================
+
+FUNCTIONS
+
+============================================================================="""
+def encode_json(entities):
+    '''encode_json(entities)
+    ---------------------------------
+    Returns the entities as a JSON game state update, the same way
+    Server.step() builds it'''
+    return '({game_state: { entities: [%s] } })' % (','.join([
+        entity.get_info_json()[1:-1] for entity in entities.itervalues()]))
+
+def encode_cold_keyframe(entities):
+    return Wire.Encoder().encode(entities, 0)
+
+def decode(data):
+    decoder = Wire.Decoder()
+    decoder.decode(data)
+    return decoder
+
+def move_entities(entities, fraction, seed=persistence.DEFAULT_SEED):
+    '''move_entities(entities, fraction, seed)
+    ---------------------------------
+    Moves a random fraction of the entities one step along x'''
+    rng = random.Random(seed)
+    for entity in entities.itervalues():
+        if rng.random() < fraction:
+            entity.position[0] += 1
+
+def run(count=DEFAULT_COUNT, moved=DEFAULT_MOVED, repeat=DEFAULT_REPEAT):
+    '''run(count, moved, repeat)
+    ---------------------------------
+    Returns a dict of names to dicts of seconds (to encode) and bytes'''
+    persistence.create_world(count)
+    entities = Entity.Entity._entities
+    time_function = persistence.time_function
+
+    results = {}
+    for name, function in (
+        ('json', encode_json),
+        ('keyframe (new encoder)', encode_cold_keyframe)):
+        seconds, data = time_function(function, (entities,), repeat)
+        results[name] = {'seconds': seconds, 'bytes': len(data)}
+
+    encoder = Wire.Encoder()
+    keyframe = encoder.encode(entities, 0)
+    seconds, data = time_function(encoder.encode, (entities, 0, True),
+        repeat)
+    results['keyframe'] = {'seconds': seconds, 'bytes': len(data)}
+
+    #Each update only has what changed since the last one, so the first
+    #   is timed once
+    move_entities(entities, moved)
+    seconds, data = time_function(encoder.encode, (entities, 1), 1)
+    results['update'] = {'seconds': seconds, 'bytes': len(data)}
+
+    seconds, decoder = time_function(decode, (keyframe,), repeat)
+    results['decode keyframe'] = {'seconds': seconds,
+        'bytes': len(keyframe)}
+    return results
+
+def print_results(count, moved, results):
+    print '%s entities, %.0f%% moved between updates' % (count,
+        moved * 100)
+    print '%-24s %12s %12s' % ('format', 'time (ms)', 'size (KB)')
+    for name in ('json', 'keyframe (new encoder)', 'keyframe', 'update',
+        'decode keyframe'):
+        print '%-24s %12.1f %12.1f' % (name,
+            results[name]['seconds'] * 1000,
+            results[name]['bytes'] / 1024.0)
+    json_result = results['json']
+    for name in ('keyframe', 'update'):
+        print '%s is %.1fx faster to encode, and %.1f%% of the size' % (
+            name.capitalize(),
+            json_result['seconds'] / max(results[name]['seconds'], 1e-9),
+            100.0 * results[name]['bytes'] / max(json_result['bytes'], 1))
+
+def main(args=None):
+    parser = optparse.OptionParser()
+    parser.add_option('-c', '--count', type='int', default=DEFAULT_COUNT,
+        help='Number of entities to create (default: %default)')
+    parser.add_option('-m', '--moved', type='float', default=DEFAULT_MOVED,
+        help='Fraction of the entities which move between updates '
+            '(default: %default)')
+    parser.add_option('-r', '--repeat', type='int', default=DEFAULT_REPEAT,
+        help='Number of times to time each encode (default: %default)')
+    options, args = parser.parse_args(args)
+
+    print_results(options.count, options.moved,
+        run(options.count, options.moved, options.repeat))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""=============================================================================
+    test_actions.py
+    ------------
+    Contains tests specific for the action registry and compiled actions
+============================================================================="""
+"""=============================================================================
+
+IMPORTS / CONSTANTS
+
+============================================================================="""
+import random
+import unittest
+
+import Action
+import Actions
+import Entity
+
+#Key the test action is registered under
+TEST_ACTION = 'test_action'
+
+"""=============================================================================
+
+TESTS
+
+============================================================================="""
+def get_test_values(source=None, target=None):
+    '''Action function for the test action: returns the dynamic values the
+    effects use, or False when there's no target'''
+    if target is None:
+        return False
+    return {
+        'friendship': 5,
+        'position': [7, 8, 0],
+        'mood': -3,
+    }
+
+class testActions(unittest.TestCase):
+    '''Actions Test'''
+    def setUp(self):
+        '''Start the test object. Called on every test_ function'''
+        Entity.Entity.reset_world()
+        random.seed(1)
+        self.definition = Actions.register_action(TEST_ACTION,
+            function=get_test_values,
+            target_required=Actions.POSSIBLE_TARGETS['entity'],
+            requirements={
+                'source': {
+                    'persona': {
+                        'extraversion_min': 10,
+                        'neuroticism_max': 20,
+                    },
+                },
+                'target': {
+                    'persona': {
+                        'agreeableness': 0,
+                    },
+                },
+            },
+            effects={
+                'source_effects': {
+                    'target': 'source',
+                    'network': ('target', 'friendship'),
+                    'persona': {'neuroticism': 'mood'},
+                },
+                'target_effects': {
+                    'target': 'target',
+                    'position': 'position',
+                    'stats': {'wisdom': 2},
+                },
+            },
+            add_to_memory=False,
+            string_repr='Tested',
+            cost=3)
+
+        self.source, self.target = Entity.Entity(), Entity.Entity()
+        self.source.persona['extraversion'] = 50
+        self.source.persona['neuroticism'] = 0
+        self.target.persona['agreeableness'] = 50
+
+    def tearDown(self):
+        del Actions.ACTIONS[TEST_ACTION]
+        Entity.Entity.reset_world()
+
+    def test_register_action(self):
+        '''Test that registered actions can be created and keep their
+        extra keyword arguments'''
+        assert Action.Action._ACTIONS[TEST_ACTION] is self.definition
+        assert self.definition['cost'] == 3
+        assert self.definition['string_repr'] == 'Tested'
+
+        action = Action.Action._create_action(TEST_ACTION, self.source,
+            self.target)
+        assert action.definition is self.definition
+        assert action.values['friendship'] == 5
+        assert Action.Action._create_action(TEST_ACTION,
+            self.source) is False
+
+    def test_compile_requirements(self):
+        '''Test that min_ and max_ are parsed, and plain items are
+        minimums'''
+        compiled = self.definition['compiled_requirements']
+        assert sorted(compiled['source']) == [
+            ('persona', 'extraversion', False, 10),
+            ('persona', 'neuroticism', True, 20)]
+        assert compiled['target'] == (
+            ('persona', 'agreeableness', False, 0),)
+        assert Actions.compile_requirements() == {}
+
+    def test_meets_requirements(self):
+        '''Test that requirements pass and fail for the source and the
+        target'''
+        definition = self.definition
+        assert Actions.meets_action_requirements(definition, self.source,
+            self.target)
+        #Targets which aren't entities have no requirements
+        assert Actions.meets_action_requirements(definition, self.source,
+            [1, 2, 0])
+
+        self.source.persona['neuroticism'] = 21
+        assert not Actions.meets_action_requirements(definition,
+            self.source, self.target)
+        self.source.persona['neuroticism'] = 20
+        self.source.persona['extraversion'] = 9
+        assert not Actions.meets_action_requirements(definition,
+            self.source, self.target)
+        self.source.persona['extraversion'] = 10
+        self.target.persona['agreeableness'] = -1
+        assert not Actions.meets_action_requirements(definition,
+            self.source, self.target)
+        assert Actions.meets_action_requirements(definition, self.source)
+
+    def test_action_meets_requirements(self):
+        '''Test that the uncompiled requirement checks on an Action give
+        the same results as the compiled ones'''
+        action = Action.Action._create_action(TEST_ACTION, self.source,
+            self.target)
+        assert action.action_meets_requirements(target=self.target,
+            requirements={'persona': {'agreeableness': 50}})
+        assert not action.action_meets_requirements(target=self.target,
+            requirements={'persona': {'agreeableness_min': 51}})
+        assert not action.action_meets_requirements(target=self.target,
+            requirements={'persona': {'agreeableness_max': 49}})
+        #Actions aren't entities, so they have no requirements
+        assert action.action_meets_requirements(
+            requirements={'persona': {'agreeableness_min': 51}})
+
+    def test_compile_effects(self):
+        '''Test that every kind of effect compiles to its operation'''
+        compiled = dict(self.definition['compiled_effects'])
+        assert sorted(compiled['source']) == [
+            ('add', 'persona', 'neuroticism', 'mood', False),
+            ('network', 'target', 'friendship')]
+        assert sorted(compiled['target']) == [
+            ('add', 'stats', 'wisdom', 2, True),
+            ('position', 'position')]
+        self.assertRaises(ValueError, Actions.compile_effects,
+            {'effect': {'target': 'bystander'}})
+
+    def test_perform_compiled(self):
+        '''Test that each operation is applied to the right entity'''
+        wisdom = self.target.stats['wisdom']
+        action = Action.Action._create_action(TEST_ACTION, self.source,
+            self.target)
+        assert action.perform_compiled() == True
+
+        #Network (new and existing entries)
+        assert self.source.network[self.target.id] == {
+            'entity': self.target, 'value': 5}
+        action.perform_compiled()
+        assert self.source.network[self.target.id]['value'] == 10
+        assert self.source.id not in self.target.network
+
+        #Position
+        assert self.target.position == [7, 8, 0]
+        assert self.source.position != [7, 8, 0]
+
+        #Add (value names and constants)
+        assert self.source.persona['neuroticism'] == -6
+        assert self.target.stats['wisdom'] == wisdom + 4
+
+        #Not added to memory
+        assert action not in self.source.memory
+
+"""=============================================================================
+
+RUN TESTS
+
+============================================================================="""
+if __name__ == '__main__':
+    unittest.main()
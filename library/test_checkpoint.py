@@ -0,0 +1,191 @@
+"""=============================================================================
+    test_checkpoint.py
+    ------------
+    Contains tests specific for columnar world checkpoints
+============================================================================="""
+"""=============================================================================
+
+IMPORTS / CONSTANTS
+
+============================================================================="""
+import os
+import shutil
+import tempfile
+import unittest
+
+import Checkpoint
+import Entity
+import Replay
+import Server
+import Simulation
+
+"""=============================================================================
+
+TESTS
+
+============================================================================="""
+class testCheckpoint(unittest.TestCase):
+    '''Checkpoint Test'''
+    def setUp(self):
+        '''Start the test object. Called on every test_ function'''
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'world.ckpt')
+        Entity.Entity.reset_world()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        Entity.Entity.reset_world()
+
+    def create_world(self, count=20):
+        '''Creates entities which know each other and remember talking'''
+        entities = [Entity.Entity() for i in xrange(count)]
+        for entity, other in zip(entities[::2], entities[1::2]):
+            other.position = list(entity.position)
+            entity.perform_action('converse', other, show_log=False)
+            entity.target = other
+        return entities
+
+    def get_world(self):
+        '''Returns the state of every entity.  Entities get new handles when
+        a checkpoint is loaded, so handles are left out'''
+        world = []
+        for entity in Entity.Entity._entities.itervalues():
+            world.append((
+                entity.id,
+                entity.name,
+                entity.gender,
+                entity.race.name,
+                list(entity.position),
+                entity.money,
+                sorted(entity.persona.items()),
+                sorted(entity.stats.items()),
+                sorted(entity.goals.items()),
+                sorted((target_id, entity.network[target_id]['value'],
+                    entity.network[target_id]['entity'].id)
+                    for target_id in entity.network),
+                entity.target and entity.target.id,
+                [(action.source.id, action.target.id, action.values)
+                    for action in entity.memory],
+            ))
+        return sorted(world)
+
+    def test_round_trip(self):
+        '''Test that loading a checkpoint gives back the same world'''
+        entities = self.create_world()
+        #Entities which don't share persona keys keep theirs in extra
+        entities[3].persona['curious'] = 7
+        assert len(entities[0].memory) > 0
+        world = self.get_world()
+        created_count = Entity.Entity._entity_created_count
+
+        Checkpoint.save(self.path, tick=42, seed=7, chunk_size=8)
+        Entity.Entity.reset_world()
+        manifest = Checkpoint.load(self.path)
+
+        assert manifest['tick'] == 42
+        assert manifest['seed'] == 7
+        assert self.get_world() == world
+        assert Entity.Entity._entity_created_count == created_count
+        #Memories of the same conversation are the same event
+        source = Entity.Entity._entities[entities[0].id]
+        target = Entity.Entity._entities[entities[1].id]
+        assert source.memory[0] is target.memory[0]
+        assert source.target is target
+
+    def test_reader(self):
+        '''Test reading columns without loading the world'''
+        entities = self.create_world(count=10)
+        Checkpoint.save(self.path, chunk_size=4)
+        reader = Checkpoint.CheckpointReader(self.path)
+        try:
+            assert reader.get_rows('entities') == 10
+            assert reader.get_chunk_count('entities', 'money') == 3
+            assert reader.get_chunk_count('entities', 'nonsense') == 0
+            assert list(reader.get_column('entities', 'money')) == [
+                entity.money for entity in entities]
+            assert list(reader.get_column('entities', 'id')) == [
+                entity.id for entity in entities]
+            assert 'persona.extraversion' in reader.get_columns('entities')
+        finally:
+            reader.close()
+        #Loading doesn't change the world
+        assert len(Entity.Entity._entities) == 10
+
+    def test_empty(self):
+        '''Test saving and loading an empty world'''
+        Checkpoint.save(self.path)
+        Entity.Entity()
+        Checkpoint.load(self.path)
+        assert len(Entity.Entity._entities) == 0
+
+    def test_writer(self):
+        '''Test saving in the background'''
+        self.create_world(count=4)
+        world = self.get_world()
+        writer = Checkpoint.CheckpointWriter()
+        assert writer.save(self.path, tick=1) == True
+        writer.wait()
+        assert writer.saved == 1
+        assert Checkpoint.is_checkpoint(self.path)
+        assert not Checkpoint.is_checkpoint(self.directory)
+
+        #Saving over an existing checkpoint replaces it
+        Entity.Entity()
+        writer.save(self.path, tick=2)
+        writer.wait()
+        Entity.Entity.reset_world()
+        assert Checkpoint.load(self.path)['tick'] == 2
+        assert len(Entity.Entity._entities) == 5
+        assert os.listdir(self.directory) == ['world.ckpt']
+
+    def test_old_checkpoint(self):
+        '''Test that the previous checkpoint is loaded if a crash left it
+        at <path>.old, without a new one in place'''
+        self.create_world(count=4)
+        world = self.get_world()
+        Checkpoint.save(self.path, tick=3)
+        #What's left after dying between moving the old checkpoint out of
+        #   the way and moving the new one into place
+        os.rename(self.path, Checkpoint.get_old_path(self.path))
+        Entity.Entity.reset_world()
+
+        assert Checkpoint.is_checkpoint(self.path)
+        assert Checkpoint.load(self.path)['tick'] == 3
+        assert self.get_world() == world
+
+        #Saving again replaces it
+        Checkpoint.save(self.path, tick=4)
+        assert os.listdir(self.directory) == ['world.ckpt']
+        assert Checkpoint.load(self.path)['tick'] == 4
+
+    def test_simulation(self):
+        '''Test resuming a simulation from a columnar checkpoint'''
+        simulation = Simulation.Simulation(seed=1, chunked=True,
+            checkpoint_path=self.path, checkpoint_interval=5)
+        for i in xrange(10):
+            Entity.Entity()
+        assert simulation.run(10)['checkpoints'] == 2
+        world = self.get_world()
+
+        resumed = Simulation.Simulation.from_checkpoint(self.path)
+        assert resumed.tick == 10
+        assert self.get_world() == world
+
+    def test_server(self):
+        '''Test the server's checkpoints'''
+        server = Server.Server(client=Replay.NullClient(), seed=1,
+            checkpoint_path=self.path)
+        Entity.Entity()
+        assert server.save_checkpoint() == True
+        server.checkpoint_writer.wait()
+        Entity.Entity.reset_world()
+        assert Checkpoint.load(self.path)['seed'] == 1
+        assert len(Entity.Entity._entities) == 1
+
+"""=============================================================================
+
+RUN TESTS
+
+============================================================================="""
+if __name__ == '__main__':
+    unittest.main()
@@ -8,6 +8,8 @@
 IMPORTS / CONSTANTS
 
 ============================================================================="""
+import cPickle
+import pickle
 import unittest
 import Entity
 
@@ -87,6 +89,32 @@ class testEntity(unittest.TestCase):
 
         print 'test_action_meets_requirement OK'
 
+    def test_pickle(self):
+        '''Test that entities and the actions in their memories (both use
+        __slots__) come back the same after pickling'''
+        other = Entity.Entity()
+        other.position = list(self.entity.position)
+        self.entity.perform_action(action='converse', target=other,
+            show_log=False)
+        assert len(self.entity.memory) > 0
+
+        for module in (pickle, cPickle):
+            for protocol in (0, 2):
+                entity, copy_other = module.loads(module.dumps(
+                    [self.entity, other], protocol))
+                assert entity.get_info_json() == \
+                    self.entity.get_info_json()
+                assert copy_other.get_info_json() == other.get_info_json()
+                assert entity.network[other.id]['entity'] is copy_other
+
+                action = entity.memory[-1]
+                original = self.entity.memory[-1]
+                assert action.source is entity
+                assert action.target is copy_other
+                assert action.definition == original.definition
+                assert action.values == original.values
+                assert repr(action) == repr(original)
+
     def tearDown(self):
         '''Done with test'''
         self.entity = None
@@ -0,0 +1,221 @@
+"""=============================================================================
+    test_interest.py
+    ------------
+    Contains tests specific for interest managed (per client) game state
+    updates
+============================================================================="""
+"""=============================================================================
+
+IMPORTS / CONSTANTS
+
+============================================================================="""
+import random
+import unittest
+
+import Entity
+import Interest
+import Schema
+import Server
+import Wire
+
+"""=============================================================================
+
+TESTS
+
+============================================================================="""
+class RecordingClient(object):
+    '''Stands in for a redis client, keeping every published message'''
+    def __init__(self):
+        self.messages = []
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        return True
+
+    def publish(self, channel, message):
+        self.messages.append((channel, message))
+        return 0
+
+def create_entity(position):
+    entity = Entity.Entity()
+    entity.position = [position[0], position[1], 0]
+    return entity
+
+class testInterestManager(unittest.TestCase):
+    '''InterestManager Test'''
+    def setUp(self):
+        '''Start the test object. Called on every test_ function'''
+        Entity.Entity.reset_world()
+        random.seed(1)
+        self.interest = Interest.InterestManager(cell_size=5)
+        self.near = create_entity((1, 1))
+        self.edge = create_entity((10, 4))
+        self.far = create_entity((80, 80))
+
+    def tearDown(self):
+        Entity.Entity.reset_world()
+
+    def test_viewport(self):
+        '''Test that a viewport only sees the entities inside it (corners
+        can be passed in any order)'''
+        self.interest.subscribe_viewport('a', (10, 10), (0, 0))
+        visible = self.interest.get_visible(Entity.Entity._entities)
+        assert sorted(visible['a']) == sorted([self.near.id, self.edge.id])
+
+        #Moving the viewport
+        self.interest.subscribe_viewport('a', (70, 70), (90, 90))
+        visible = self.interest.get_visible(Entity.Entity._entities)
+        assert visible['a'] == [self.far.id]
+
+    def test_followed_entities(self):
+        '''Test that followed entities are sent wherever they are, once,
+        and despawned ones are skipped'''
+        self.interest.subscribe_viewport('a', (0, 0), (10, 10))
+        self.interest.subscribe_entities('a', [self.far.id, self.near.id,
+            'entity_missing'])
+        self.interest.subscribe_entities('b', [self.far.id])
+        visible = self.interest.get_visible(Entity.Entity._entities)
+        assert sorted(visible['a']) == sorted([self.near.id, self.edge.id,
+            self.far.id])
+        assert visible['b'] == [self.far.id]
+
+    def test_unsubscribe(self):
+        '''Test that clients can unsubscribe'''
+        self.interest.subscribe_viewport('a', (0, 0), (10, 10))
+        self.interest.subscribe_entities('a', [self.far.id])
+        assert len(self.interest) == 1
+        assert self.interest.unsubscribe('a') == True
+        assert self.interest.unsubscribe('a') == False
+        assert len(self.interest) == 0
+        assert self.interest.get_messages(Entity.Entity._entities) == []
+
+    def test_messages(self):
+        '''Test that each client gets a message on its own channel with
+        only the entities it sees'''
+        self.interest.subscribe_viewport('a', (0, 0), (10, 10))
+        self.interest.subscribe_viewport('b', (70, 70), (90, 90))
+        messages = dict(self.interest.get_messages(Entity.Entity._entities))
+        assert sorted(messages) == [
+            Interest.get_channel('a'), Interest.get_channel('b')]
+        assert self.near.id in messages[Interest.get_channel('a')]
+        assert self.far.id not in messages[Interest.get_channel('a')]
+        assert messages[Interest.get_channel('b')] == \
+            '({game_state: { entities: [%s] } })' % (
+                self.far.get_info_json()[1:-1])
+
+    def test_unchanged_entities(self):
+        '''Test that JSON messages have every entity the client sees, even
+        ones which didn't change this tick'''
+        self.interest.subscribe_entities('a', [self.far.id])
+        changed = {self.near.id: self.near}
+        messages = dict(self.interest.get_messages(Entity.Entity._entities,
+            1, changed))
+        assert self.far.id in messages[Interest.get_channel('a')]
+
+    def test_binary_keyframes(self):
+        '''Test that binary keyframes have every entity the client sees,
+        and updates only look at the ones which changed'''
+        self.interest = Interest.InterestManager(cell_size=5,
+            wire_format=Wire.FORMAT_BINARY)
+        self.interest.subscribe_viewport('a', (0, 0), (10, 10))
+        self.interest.subscribe_entities('a', [self.far.id])
+        channel = Interest.get_channel('a')
+        decoder = Wire.Decoder()
+        changed = {self.near.id: self.near}
+        decoder.decode(dict(self.interest.get_messages(
+            Entity.Entity._entities, 0, changed))[channel])
+        assert sorted(decoder.entities) == sorted([self.near.handle,
+            self.edge.handle, self.far.handle])
+
+        self.near.position[0] += 1
+        self.edge.position[0] += 1
+        assert decoder.decode(dict(self.interest.get_messages(
+            Entity.Entity._entities, 1, changed))[channel]) == [
+                self.near.handle]
+
+class testServerInterest(unittest.TestCase):
+    '''Server interest management Test'''
+    def setUp(self):
+        '''Start the test object. Called on every test_ function'''
+        Entity.Entity.reset_world()
+        random.seed(1)
+        self.client = RecordingClient()
+        self.server = Server.Server(client=self.client, seed=1)
+        self.near = create_entity((1, 1))
+        self.far = create_entity((80, 80))
+
+    def tearDown(self):
+        Entity.Entity.reset_world()
+
+    def step(self):
+        del self.client.messages[:]
+        self.server.step()
+        self.server.flush()
+        return dict(self.client.messages)
+
+    def test_broadcast_until_subscribed(self):
+        '''Test that the global broadcast stops once a client subscribes,
+        and starts again when the last one unsubscribes'''
+        messages = self.step()
+        assert messages.keys() == ['engine:game_state']
+
+        reply = self.server.handle_message(
+            'subscribe_viewport_clientA,0,0,10,10')
+        assert 'error' not in reply
+        messages = self.step()
+        assert messages.keys() == [Interest.get_channel('clientA')]
+        assert self.near.id in messages[Interest.get_channel('clientA')]
+        assert self.far.id not in messages[Interest.get_channel('clientA')]
+
+        assert 'error' not in self.server.handle_message(
+            'unsubscribe_clientA')
+        assert 'error' in self.server.handle_message('unsubscribe_clientA')
+        messages = self.step()
+        assert messages.keys() == ['engine:game_state']
+
+    def test_broadcast_every_entity(self):
+        '''Test that the broadcast has every entity, even ones which aren't
+        simulated this tick'''
+        self.server.handle_message('set_observer_clientA,0,0')
+        messages = self.step()
+        assert self.near.id in messages['engine:game_state']
+        assert self.far.id in messages['engine:game_state']
+
+    def test_followed_entities(self):
+        '''Test that followed entities are sent even when they aren't
+        simulated this tick'''
+        self.server.handle_message('set_observer_clientA,0,0')
+        self.server.handle_message('subscribe_entities_clientB,%s' % (
+            self.far.id))
+        messages = self.step()
+        assert self.far.id in messages[Interest.get_channel('clientB')]
+
+    def test_commands(self):
+        '''Test the subscription commands, and that they're counted under
+        their own names'''
+        assert 'error' in self.server.handle_message(
+            'subscribe_viewport_clientA,0,0')
+        self.server.handle_message('subscribe_entities_clientB,%s' % (
+            self.far.id))
+        assert Server.get_command_name('subscribe_entities_clientB,%s' % (
+            self.far.id)) == 'subscribe_entities'
+        assert Server.get_command_name('unsubscribe_clientB') == \
+            'unsubscribe'
+
+        #Always broadcasting
+        self.server.broadcast = True
+        messages = self.step()
+        assert sorted(messages.keys()) == sorted(['engine:game_state',
+            Interest.get_channel('clientB')])
+        assert self.near.id not in messages[Interest.get_channel('clientB')]
+        assert self.far.id in messages[Interest.get_channel('clientB')]
+
+"""=============================================================================
+
+RUN TESTS
+
+============================================================================="""
+if __name__ == '__main__':
+    unittest.main()
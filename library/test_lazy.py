@@ -0,0 +1,73 @@
+"""=============================================================================
+    test_lazy.py
+    ------------
+    Contains tests specific for lazy imports and engine startup
+============================================================================="""
+"""=============================================================================
+
+IMPORTS / CONSTANTS
+
+============================================================================="""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import Lazy
+from benchmarks import startup
+
+"""=============================================================================
+
+TESTS
+
+============================================================================="""
+class testLazy(unittest.TestCase):
+    '''Lazy import Test'''
+    def test_lazy_module(self):
+        '''Test that modules are imported when first used'''
+        module = Lazy.LazyModule('colorsys')
+        assert not Lazy.is_loaded(module)
+        assert module.rgb_to_hsv(0, 0, 0) == (0, 0, 0)
+        assert Lazy.is_loaded(module)
+        assert module.rgb_to_hsv is sys.modules['colorsys'].rgb_to_hsv
+
+    def test_missing(self):
+        '''Test that missing optional modules are None'''
+        assert Lazy.lazy_import('not_a_real_module_xyz') is None
+        assert Lazy.lazy_import('also_not.a_real_module') is None
+
+    def test_broken(self):
+        '''Test that modules which are installed but can't be imported
+        (e.g., one of their dependencies is missing) load as None'''
+        path = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(path, 'lazy_broken_xyz.py'), 'w') as f:
+                f.write('import not_a_real_module_xyz\n')
+            sys.path.insert(0, path)
+            module = Lazy.lazy_import('lazy_broken_xyz')
+            assert module is not None
+            assert Lazy.load(module) is None
+            assert Lazy.load(None) is None
+        finally:
+            sys.path.remove(path)
+            sys.modules.pop('lazy_broken_xyz', None)
+            shutil.rmtree(path)
+
+        module = Lazy.lazy_import('colorsys')
+        assert Lazy.load(module) is module
+        assert Lazy.is_loaded(module)
+
+    def test_startup(self):
+        '''Test that simulating entities doesn't load heavy modules'''
+        milliseconds, loaded = startup.time_startup(
+            'import Entity; import Server; Entity.Entity()')
+        assert loaded == []
+
+"""=============================================================================
+
+RUN TESTS
+
+============================================================================="""
+if __name__ == '__main__':
+    unittest.main()
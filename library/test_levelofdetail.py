@@ -0,0 +1,107 @@
+"""=============================================================================
+    test_levelofdetail.py
+    ------------
+    Contains tests specific for the LevelOfDetail class
+============================================================================="""
+"""=============================================================================
+
+IMPORTS / CONSTANTS
+
+============================================================================="""
+import random
+import unittest
+
+import Entity
+import LevelOfDetail
+import Replay
+import Server
+
+"""=============================================================================
+
+TESTS
+
+============================================================================="""
+class testLevelOfDetail(unittest.TestCase):
+    '''LevelOfDetail Test'''
+    def setUp(self):
+        '''Start the test object. Called on every test_ function'''
+        Entity.Entity.reset_world()
+        random.seed(1)
+        self.level_of_detail = LevelOfDetail.LevelOfDetail(seed=1)
+        self.entity, self.other = Entity.Entity(), Entity.Entity()
+        self.entity.network[self.other.id] = {'entity': self.other,
+            'value': 10}
+
+    def tearDown(self):
+        Entity.Entity.reset_world()
+
+    def test_network_decay(self):
+        '''Test that small network values still decay towards 0'''
+        for i in xrange(200):
+            self.level_of_detail.coarse_update([self.entity],
+                self.level_of_detail.coarse_interval)
+        value = self.entity.network[self.other.id]['value']
+        assert isinstance(value, int)
+        assert 0 <= value < 10
+
+    def test_coarse_updated(self):
+        '''Test that the entities given a coarse update are kept'''
+        self.level_of_detail.set_observer('a', (1000, 1000))
+        coarse = []
+        for tick in xrange(self.level_of_detail.coarse_interval):
+            assert self.level_of_detail.update(Entity.Entity._entities,
+                tick) == {}
+            coarse.extend(self.level_of_detail.coarse_updated)
+        assert sorted(coarse) == sorted([self.entity, self.other])
+
+class testServerLevelOfDetail(unittest.TestCase):
+    '''Server level of detail Test'''
+    def setUp(self):
+        '''Start the test object. Called on every test_ function'''
+        Entity.Entity.reset_world()
+        random.seed(1)
+        self.server = Server.Server(client=Replay.NullClient(), seed=1)
+        self.entity, self.other = Entity.Entity(), Entity.Entity()
+
+    def tearDown(self):
+        Entity.Entity.reset_world()
+
+    def test_converse(self):
+        '''Test that entities only converse with an entity target, and are
+        then kept at full detail'''
+        recent_conversations = self.server.level_of_detail.recent_conversations
+        self.entity.target = [80, 80, 0]
+        assert 'error' in self.server.handle_message('converse_%s' % (
+            self.entity.id))
+        assert self.entity.id not in recent_conversations
+
+        self.entity.target = self.other
+        assert 'error' not in self.server.handle_message('converse_%s' % (
+            self.entity.id))
+        assert sorted(recent_conversations) == sorted([self.entity.id,
+            self.other.id])
+
+    def test_viewport_observers(self):
+        '''Test that subscribed viewports are level of detail observers,
+        centred on the viewport'''
+        observers = self.server.level_of_detail.observers
+        self.server.handle_message('subscribe_viewport_a,0,0,100,50')
+        assert observers == {'a': (50.0, 25.0)}
+        self.server.handle_message('subscribe_viewport_a,100,100,200,200')
+        assert observers == {'a': (150.0, 150.0)}
+
+        self.entity.position = [150, 150, 0]
+        self.other.position = [1000, 1000, 0]
+        assert self.server.level_of_detail.update(Entity.Entity._entities,
+            0).keys() == [self.entity.id]
+
+        self.server.handle_message('unsubscribe_a')
+        assert observers == {}
+
+"""=============================================================================
+
+RUN TESTS
+
+============================================================================="""
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""=============================================================================
+    test_memory.py
+    ------------
+    Contains tests specific for memory accounting
+============================================================================="""
+"""=============================================================================
+
+IMPORTS / CONSTANTS
+
+============================================================================="""
+import json
+import sys
+import unittest
+
+import Entity
+import Memory
+import Replay
+import Server
+
+"""=============================================================================
+
+TESTS
+
+============================================================================="""
+class testMemory(unittest.TestCase):
+    '''Memory Test'''
+    def setUp(self):
+        '''Start the test object. Called on every test_ function'''
+        Entity.Entity.reset_world()
+
+    def tearDown(self):
+        Entity.Entity.reset_world()
+
+    def test_get_size(self):
+        '''Test that objects are only counted once'''
+        shared = [1, 2, 3]
+        seen = set()
+        size = Memory.get_size({'a': shared, 'b': shared}, seen)
+        assert size == sys.getsizeof({'a': shared, 'b': shared}) \
+            + sys.getsizeof('a') + sys.getsizeof('b') \
+            + sys.getsizeof(shared) + 3 * sys.getsizeof(1)
+        #Everything has been seen now
+        assert Memory.get_size(shared, seen) == 0
+
+        #Entities are never walked into
+        assert Memory.get_size(Entity.Entity(), set()) == 0
+
+    def test_report(self):
+        '''Test that subsystems grow with the world'''
+        Entity.Entity()
+        small = Memory.get_report()
+        for i in xrange(20):
+            Entity.Entity()
+        report = Memory.get_report()
+
+        assert report['entities'] == 21
+        assert report['total'] == sum(report['subsystems'].values())
+        for subsystem in ('entities', 'personas'):
+            assert report['subsystems'][subsystem] \
+                > small['subsystems'][subsystem]
+
+        #Sampled reports are scaled up to the whole world
+        sampled = Memory.get_report(sample_size=7)
+        assert sampled['sampled_entities'] == 7
+        assert sampled['subsystems']['personas'] > \
+            report['subsystems']['personas'] / 2
+
+    def test_tracer(self):
+        '''Test that the tracer finds growing allocators'''
+        tracer = Memory.MemoryTracer()
+        assert tracer.get_stats() == {'enabled': False}
+        assert tracer.start() == True
+        tracer.get_stats()
+        leak = [{} for i in xrange(10000)]
+        stats = tracer.get_stats()
+        assert len(stats['top']) > 0
+        assert stats['growth'][0]['bytes'] > 0
+        assert tracer.stop() == True
+
+    def test_server(self):
+        '''Test the server's get_memory command'''
+        server = Server.Server(client=Replay.NullClient(), seed=1)
+        server.handle_message('create_entity')
+        server.handle_message('move_to_0,5,5')
+        report = json.loads(server.handle_message('get_memory'))
+        assert report['entities'] == 1
+        assert report['subsystems']['pending_actions'] > 0
+        assert report['tracing'] == {'enabled': False}
+
+        server.handle_message('start_memory_tracing')
+        report = json.loads(server.handle_message('get_memory'))
+        assert report['tracing']['enabled'] == True
+        server.handle_message('stop_memory_tracing')
+
+"""=============================================================================
+
+RUN TESTS
+
+============================================================================="""
+if __name__ == '__main__':
+    unittest.main()
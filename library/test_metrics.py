@@ -0,0 +1,141 @@
+"""=============================================================================
+    test_metrics.py
+    ------------
+    Contains tests specific for engine metrics
+============================================================================="""
+"""=============================================================================
+
+IMPORTS / CONSTANTS
+
+============================================================================="""
+import threading
+import unittest
+import urllib2
+
+import Entity
+import Metrics
+import Replay
+import Server
+
+"""=============================================================================
+
+TESTS
+
+============================================================================="""
+class testMetrics(unittest.TestCase):
+    '''Metrics Test'''
+    def setUp(self):
+        '''Start the test object. Called on every test_ function'''
+        self.registry = Metrics.Registry()
+
+    def tearDown(self):
+        Entity.Entity.reset_world()
+
+    def test_counter(self):
+        '''Test counters, with and without labels'''
+        counter = Metrics.Counter('test_total', 'Test counter',
+            registry=self.registry)
+        counter.inc()
+        counter.inc(2)
+        assert counter.get() == 3
+
+        labelled = Metrics.Counter('test_labelled_total', 'Test counter',
+            ('command',), registry=self.registry)
+        labelled.labels('create_entity').inc()
+        labelled.labels('say "hi"').inc(5)
+        self.assertRaises(ValueError, labelled.labels, 'a', 'b')
+
+        output = self.registry.render()
+        assert '# TYPE test_total counter\ntest_total 3\n' in output
+        assert 'test_labelled_total{command="create_entity"} 1\n' in output
+        assert 'test_labelled_total{command="say \\"hi\\""} 5\n' in output
+
+        #Names can only be registered once
+        self.assertRaises(ValueError, Metrics.Counter, 'test_total',
+            'Test counter', registry=self.registry)
+
+    def test_gauge(self):
+        '''Test setting gauges and reading them from functions'''
+        gauge = Metrics.Gauge('test_gauge', 'Test gauge',
+            registry=self.registry)
+        gauge.set(4.5)
+        assert gauge.get() == 4.5
+        values = [7]
+        gauge.set_function(lambda: values[0])
+        values[0] = 8
+        assert 'test_gauge 8\n' in self.registry.render()
+
+    def test_histogram(self):
+        '''Test that histogram buckets are cumulative'''
+        histogram = Metrics.Histogram('test_seconds', 'Test histogram',
+            registry=self.registry, buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+        counts, count, total = histogram.get()
+        assert counts == [2, 3, 4]
+        assert count == 4
+        assert total == 2.65
+
+        output = self.registry.render()
+        assert 'test_seconds_bucket{le="0.1"} 2\n' in output
+        assert 'test_seconds_bucket{le="1.0"} 3\n' in output
+        assert 'test_seconds_bucket{le="+Inf"} 4\n' in output
+        assert 'test_seconds_count 4\n' in output
+
+    def test_threads(self):
+        '''Test that updates from different threads are all counted'''
+        counter = Metrics.Counter('test_total', 'Test counter',
+            registry=self.registry)
+        def count():
+            for i in xrange(10000):
+                counter.inc()
+        threads = [threading.Thread(target=count) for i in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert counter.get() == 40000
+        assert len(counter.child.cells) == 4
+
+    def test_http(self):
+        '''Test serving the metrics over HTTP'''
+        Metrics.Counter('test_total', 'Test counter',
+            registry=self.registry).inc()
+        http_server = Metrics.start_http_server(0, registry=self.registry)
+        try:
+            response = urllib2.urlopen('http://127.0.0.1:%s/metrics' % (
+                http_server.server_address[1]))
+            assert 'test_total 1' in response.read()
+        finally:
+            http_server.shutdown()
+
+    def test_server(self):
+        '''Test the server's metrics'''
+        Entity.Entity.reset_world()
+        server = Server.Server(client=Replay.NullClient(), seed=1)
+        requests = Server.REQUESTS.labels('create_entity').get()
+        conversations = Server.REQUEST_SECONDS.labels('converse').get()[1]
+        server.handle_message('create_entity')
+        server.handle_message('converse_0')
+        Entity.Entity()
+        server.step()
+
+        assert Server.REQUESTS.labels('create_entity').get() == requests + 1
+        assert Server.get_command_name('get_info_entity_0_Hir') == 'get_info'
+        assert Server.get_command_name('nonsense') == 'unknown'
+
+        output = server.handle_message('get_metrics')
+        assert 'vasir_entities 2\n' in output
+        assert 'vasir_active_entities 2\n' in output
+        assert 'vasir_publish_bytes_count{channel="engine:game_state"}' \
+            in output
+        assert 'vasir_request_seconds_count{command="converse"} %s' % (
+            conversations + 1) in output
+
+"""=============================================================================
+
+RUN TESTS
+
+============================================================================="""
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""=============================================================================
+    test_movement.py
+    ------------
+    Contains tests specific for the Movement systems
+============================================================================="""
+"""=============================================================================
+
+IMPORTS / CONSTANTS
+
+============================================================================="""
+import unittest
+
+import Entity
+import Movement
+
+"""=============================================================================
+
+TESTS
+
+============================================================================="""
+class testRandomWalk(unittest.TestCase):
+    '''RandomWalk Test'''
+    def setUp(self):
+        '''Start the test object. Called on every test_ function'''
+        self.entities = [Entity.Entity() for i in range(50)]
+        for entity in self.entities:
+            entity.position = [1, 1, 0]
+
+    def check_walk(self, walk):
+        '''Moves the test entities a few times and makes sure they stay in
+        bounds and the returned deltas match their movement'''
+        for i in range(5):
+            old_positions = dict([(entity.id, list(entity.position)) \
+                for entity in self.entities])
+            deltas = walk.step(self.entities)
+
+            for entity_id, delta_x, delta_y in deltas:
+                assert delta_x != 0 or delta_y != 0
+                assert old_positions[entity_id][0] + delta_x \
+                    == Entity.Entity._entities[entity_id].position[0]
+                assert old_positions[entity_id][1] + delta_y \
+                    == Entity.Entity._entities[entity_id].position[1]
+
+            for entity in self.entities:
+                assert 0 <= entity.position[0] <= 3
+                assert 0 <= entity.position[1] <= 3
+                #z is never touched
+                assert entity.position[2] == 0
+
+    def test_step_python(self):
+        '''Test the pure python step'''
+        self.check_walk(Movement.RandomWalk(bounds=((0, 3), (0, 3)),
+            step_size=2, seed=1, use_numpy=False))
+        self.check_walk(Movement.RandomWalk(bounds=((0, 3), (0, 3)),
+            step_distribution='gaussian', seed=1, use_numpy=False))
+
+    def test_step_numpy(self):
+        '''Test the vectorized step (if numpy is installed)'''
+        if Movement.numpy is None:
+            return
+        self.check_walk(Movement.RandomWalk(bounds=((0, 3), (0, 3)),
+            step_size=2, seed=1))
+        self.check_walk(Movement.RandomWalk(bounds=((0, 3), (0, 3)),
+            step_distribution='gaussian', seed=1))
+
+    def test_invalid_distribution(self):
+        '''Test that unknown step distributions are rejected'''
+        self.assertRaises(ValueError, Movement.RandomWalk,
+            step_distribution='teleport')
+
+    def tearDown(self):
+        '''Done with test'''
+        self.entities = None
+
+"""=============================================================================
+
+RUN TESTS
+
+============================================================================="""
+if __name__ == '__main__':
+    unittest.main()
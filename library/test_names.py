@@ -0,0 +1,75 @@
+"""=============================================================================
+    test_names.py
+    ------------
+    Contains tests specific for name generation
+============================================================================="""
+"""=============================================================================
+
+IMPORTS / CONSTANTS
+
+============================================================================="""
+import unittest
+
+import Names
+
+"""=============================================================================
+
+TESTS
+
+============================================================================="""
+class testNameGenerator(unittest.TestCase):
+    '''NameGenerator Test'''
+    def setUp(self):
+        '''Start the test object. Called on every test_ function'''
+        self.generator = Names.NameGenerator(seed=42)
+
+    def check_names(self, names, count):
+        assert len(names) == count
+        for name in names:
+            assert self.generator.min_length <= len(name) \
+                <= self.generator.max_length
+            assert '\0' not in name
+
+    def test_generate(self):
+        '''Test that names are generated in bulk'''
+        self.check_names(self.generator.generate(5000), 5000)
+
+    def test_seed(self):
+        '''Test that the same seed generates the same names'''
+        names = self.generator.generate(100)
+        assert Names.NameGenerator(seed=42).generate(100) == names
+
+    def test_python(self):
+        '''Test that names are generated without numpy too'''
+        self.generator = Names.NameGenerator(seed=42, use_numpy=False)
+        self.check_names(self.generator.generate(500), 500)
+
+    def test_unique(self):
+        '''Test that unique generators never repeat a name'''
+        self.generator = Names.NameGenerator(seed=42, unique=True,
+            capacity=10000)
+        names = self.generator.generate(2000) + self.generator.generate(2000)
+        self.check_names(names, 4000)
+        assert len(set(names)) == 4000
+
+    def test_generate_name(self):
+        '''Test the shared generator'''
+        assert len(Names.generate_name()) >= Names.DEFAULT_MIN_LENGTH
+
+class testBloomFilter(unittest.TestCase):
+    '''BloomFilter Test'''
+    def test_add(self):
+        bloom_filter = Names.BloomFilter(capacity=1000)
+        assert not bloom_filter.add('Aragorn')
+        assert bloom_filter.add('Aragorn')
+        assert 'Aragorn' in bloom_filter
+        assert 'Gimli' not in bloom_filter
+        assert len(bloom_filter) == 1
+
+"""=============================================================================
+
+RUN TESTS
+
+============================================================================="""
+if __name__ == '__main__':
+    unittest.main()
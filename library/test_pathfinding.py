@@ -0,0 +1,203 @@
+"""=============================================================================
+    test_pathfinding.py
+    ------------
+    Contains tests specific for the Pathfinding classes
+============================================================================="""
+"""=============================================================================
+
+IMPORTS / CONSTANTS
+
+============================================================================="""
+import unittest
+
+import Entity
+import Pathfinding
+
+"""=============================================================================
+
+TESTS
+
+============================================================================="""
+class testPathfinding(unittest.TestCase):
+    '''Pathfinding Test'''
+    def setUp(self):
+        '''Start the test object. Called on every test_ function'''
+        self.grid_map = Pathfinding.GridMap(width=10, height=10)
+        #Wall across the middle with a gap at the top
+        for y in range(0, 9):
+            self.grid_map.set_obstacle((5, y))
+
+    def test_search(self):
+        '''Test that A* goes around obstacles'''
+        search = Pathfinding.PathSearch(self.grid_map, (0, 0), (9, 0))
+        search.run()
+        assert search.status == 'found'
+        assert search.path[-1] == (9, 0)
+        assert (5, 9) in search.path
+        for cell in search.path:
+            assert self.grid_map.is_walkable(cell)
+
+    def test_search_budget(self):
+        '''Test that a search can be spread over multiple runs'''
+        search = Pathfinding.PathSearch(self.grid_map, (0, 0), (9, 0))
+        runs = 0
+        while search.status == 'pending':
+            assert search.run(5) <= 5
+            runs += 1
+        assert runs > 1
+        assert search.status == 'found'
+
+    def test_search_blocked(self):
+        '''Test that a search fails when there is no way to the goal'''
+        self.grid_map.set_obstacle((5, 9))
+        search = Pathfinding.PathSearch(self.grid_map, (0, 0), (9, 0))
+        search.run()
+        assert search.status == 'failed'
+
+    def test_search_stale_entries(self):
+        '''Test that cells are only expanded once, even when a cheaper way
+        to them is found after they were queued'''
+        self.grid_map.set_obstacle((5, 9))
+        for x in range(0, 5):
+            for y in range(0, 10):
+                self.grid_map.set_cost((x, y), 1 + (x * 7 + y * 3) % 5)
+        search = Pathfinding.PathSearch(self.grid_map, (0, 0), (9, 0))
+        search.run()
+        assert search.status == 'failed'
+        assert search.expansions == len(search.cost_so_far)
+
+    def test_terrain_cost(self):
+        '''Test that expensive terrain is avoided'''
+        grid_map = Pathfinding.GridMap(width=10, height=3)
+        for x in range(1, 9):
+            grid_map.set_cost((x, 1), 100)
+        search = Pathfinding.PathSearch(grid_map, (0, 1), (9, 1))
+        search.run()
+        assert search.status == 'found'
+        for cell in search.path[:-1]:
+            assert cell[1] != 1
+
+    def test_path_mover(self):
+        '''Test that entities move one cell per tick and share paths'''
+        path_mover = Pathfinding.PathMover(self.grid_map)
+        entity_a = Entity.Entity()
+        entity_a.position = [0, 0, 0]
+        entity_b = Entity.Entity()
+        entity_b.position = [0, 0, 0]
+
+        path_mover.move_to(entity_a, [9, 0])
+        path_mover.move_to(entity_b, [9, 0])
+        #Both entities start at the same place, so only one search is needed
+        assert len(path_mover.searches) == 1
+
+        ticks = 0
+        while len(path_mover) > 0:
+            old_position = list(entity_a.position)
+            path_mover.step(Entity.Entity._entities)
+            assert abs(entity_a.position[0] - old_position[0]) <= 1
+            assert abs(entity_a.position[1] - old_position[1]) <= 1
+            ticks += 1
+            assert ticks < 100
+
+        assert entity_a.position[:2] == [9, 0]
+        assert entity_b.position[:2] == [9, 0]
+
+    def test_flow_field(self):
+        '''Test that every reachable cell flows to the goal'''
+        field = Pathfinding.FlowField(self.grid_map, (9, 0))
+        while field.status == 'pending':
+            field.run(50)
+        assert field.status == 'found'
+
+        for start in [(0, 0), (4, 4), (0, 9), (7, 3)]:
+            cell = start
+            steps = 0
+            while cell != (9, 0):
+                next_cell = field.get_next_step(cell)
+                assert self.grid_map.is_walkable(next_cell)
+                assert abs(next_cell[0] - cell[0]) <= 1
+                assert abs(next_cell[1] - cell[1]) <= 1
+                cell = next_cell
+                steps += 1
+                assert steps < 100
+
+        #Flow field costs should match A*
+        search = Pathfinding.PathSearch(self.grid_map, (0, 0), (9, 0))
+        search.run()
+        assert abs(search.cost_so_far[(9, 0)] - field.costs[(0, 0)]) < 1e-9
+
+    def test_flow_field_cache(self):
+        '''Test that the least recently used flow field is thrown out'''
+        cache = Pathfinding.FlowFieldCache(max_size=2)
+        for goal in [(0, 0), (1, 1), (2, 2)]:
+            cache.add(Pathfinding.FlowField(self.grid_map, goal))
+            if goal == (1, 1):
+                #Use (0, 0) so (1, 1) is the least recently used
+                cache.get((0, 0))
+        assert (0, 0) in cache
+        assert (1, 1) not in cache
+        assert (2, 2) in cache
+
+    def test_path_mover_crowd(self):
+        '''Test that a crowd heading to the same goal uses a flow field'''
+        path_mover = Pathfinding.PathMover(self.grid_map, crowd_threshold=3)
+        crowd = []
+        for i in range(5):
+            entity = Entity.Entity()
+            entity.position = [0, i, 0]
+            crowd.append(entity)
+            path_mover.move_to(entity, [9, 0])
+
+        path_mover.step(Entity.Entity._entities)
+        assert (9, 0) in path_mover.flow_fields
+        assert len(path_mover.searches) == 0
+
+        ticks = 0
+        while len(path_mover) > 0:
+            path_mover.step(Entity.Entity._entities)
+            ticks += 1
+            assert ticks < 100
+        for entity in crowd:
+            assert entity.position[:2] == [9, 0]
+
+    def test_path_mover_cache_invalidation(self):
+        '''Test that changing the map throws away cached paths'''
+        path_mover = Pathfinding.PathMover(self.grid_map)
+        path_mover.add_path((0, 0), (1, 0), [(1, 0)])
+        assert path_mover.get_next_step((0, 0), (1, 0)) == (1, 0)
+        self.grid_map.set_cost((3, 3), 2)
+        path_mover.check_cache_version()
+        assert path_mover.get_next_step((0, 0), (1, 0)) is None
+
+    def test_path_mover_failed(self):
+        '''Test that only the last max_failed unreachable paths are
+        remembered'''
+        path_mover = Pathfinding.PathMover(self.grid_map, max_failed=2)
+        for start in ((0, 0), (1, 0), (2, 0)):
+            path_mover.add_failed(start, (9, 0))
+        path_mover.add_failed((1, 0), (9, 0))
+        assert path_mover.failed.keys() == [((2, 0), (9, 0)),
+            ((1, 0), (9, 0))]
+
+        #Unreachable goals are found (and remembered) by searching
+        self.grid_map.set_obstacle((5, 9))
+        path_mover.check_cache_version()
+        entity = Entity.Entity()
+        entity.position = [0, 0, 0]
+        path_mover.move_to(entity, (9, 0))
+        path_mover.step({entity.id: entity})
+        assert ((0, 0), (9, 0)) in path_mover.failed
+        path_mover.step({entity.id: entity})
+        assert len(path_mover) == 0
+
+    def tearDown(self):
+        '''Done with test'''
+        self.grid_map = None
+
+"""=============================================================================
+
+RUN TESTS
+
+============================================================================="""
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+"""=============================================================================
+    test_planner.py
+    ------------
+    Contains tests specific for the ActionPlanner class
+============================================================================="""
+"""=============================================================================
+
+IMPORTS / CONSTANTS
+
+============================================================================="""
+import random
+import unittest
+
+import Entity
+import Planner
+import Replay
+import Server
+
+#Knowing the target is every planning goal's desired state
+DESIRED_STATE = {'knows_target': True}
+
+"""=============================================================================
+
+TESTS
+
+============================================================================="""
+class testActionPlanner(unittest.TestCase):
+    '''ActionPlanner Test'''
+    def setUp(self):
+        '''Start the test object. Called on every test_ function'''
+        Entity.Entity.reset_world()
+        random.seed(1)
+        self.planner = Planner.ActionPlanner()
+        self.entity = self.get_entity([0, 0, 0])
+        self.other = self.get_entity([10, 0, 0])
+
+    def tearDown(self):
+        Entity.Entity.reset_world()
+
+    def get_entity(self, position):
+        '''Returns an entity which can converse, and only wants friends'''
+        entity = Entity.Entity()
+        entity.position = list(position)
+        entity.persona['extraversion'] = 0
+        entity.persona['agreeableness'] = 0
+        entity.goals.clear()
+        entity.goals['friendship'] = {'priority': 100}
+        return entity
+
+    def test_find_plan(self):
+        '''Test that the cheapest plan is found'''
+        state = frozenset(['can_converse'])
+        assert self.planner.find_plan(state, DESIRED_STATE) == (
+            'get_target', 'move', 'converse')
+        state = frozenset(['can_converse', 'has_target', 'near_target'])
+        assert self.planner.find_plan(state, DESIRED_STATE) == (
+            'converse',)
+        assert self.planner.find_plan(state, {'near_target': True}) == ()
+
+    def test_find_plan_unreachable(self):
+        '''Test that there's no plan when an action's requirements can't
+        be met'''
+        assert self.planner.find_plan(frozenset(), DESIRED_STATE) is None
+
+    def test_find_plan_max_length(self):
+        '''Test that plans longer than MAX_PLAN_LENGTH aren't found'''
+        max_plan_length = Planner.MAX_PLAN_LENGTH
+        Planner.MAX_PLAN_LENGTH = 2
+        try:
+            assert self.planner.find_plan(frozenset(['can_converse']),
+                DESIRED_STATE) is None
+        finally:
+            Planner.MAX_PLAN_LENGTH = max_plan_length
+
+    def test_get_plan_cache(self):
+        '''Test that plans are only searched for once'''
+        state = frozenset(['can_converse'])
+        plan = self.planner.get_plan(state, 'friendship')
+        assert plan == ('get_target', 'move', 'converse')
+        assert self.planner.plans_made == 1
+
+        #Hit
+        assert self.planner.get_plan(state, 'friendship') == plan
+        assert self.planner.plans_made == 1
+
+        #Miss (there's no plan, which is cached too)
+        assert self.planner.get_plan(frozenset(), 'friendship') is None
+        assert self.planner.get_plan(frozenset(), 'friendship') is None
+        assert self.planner.plans_made == 2
+        assert len(self.planner.plan_cache) == 2
+
+    def test_get_plan_cache_size(self):
+        '''Test that the least recently used plan is thrown away'''
+        planner = Planner.ActionPlanner(max_cached_plans=1)
+        planner.get_plan(frozenset(['can_converse']), 'friendship')
+        planner.get_plan(frozenset(), 'friendship')
+        assert planner.plan_cache.keys() == [(frozenset(), 'friendship')]
+
+    def test_plans_per_tick(self):
+        '''Test that only plans_per_tick plans are searched for each tick,
+        and entities over budget get one next tick'''
+        planner = Planner.ActionPlanner(plans_per_tick=1)
+        assert planner.get_plan(frozenset(['can_converse']),
+            'friendship') is not None
+        assert planner.get_plan(frozenset(), 'friendship') is False
+        #Cached plans are free
+        assert planner.get_plan(frozenset(['can_converse']),
+            'friendship') is not None
+
+        self.other.persona['extraversion'] = -100
+        self.entity.target = self.other
+        performed = planner.step([self.entity])
+        assert performed == {}
+        assert planner.plans_made == 1
+
+    def test_step(self):
+        '''Test that entities follow their plans, then move on to a new
+        target once their goals are met'''
+        third = self.get_entity([20, 0, 0])
+        for step_key in ('get_target', 'move', 'converse'):
+            performed = self.planner.step([self.entity])
+            assert performed == {self.entity.id: step_key}
+        assert self.entity.target is self.other
+        assert self.other.id in self.entity.network
+
+        #The entity already knows its target, so it finds a new one
+        performed = self.planner.step([self.entity])
+        assert performed == {self.entity.id: 'get_target'}
+        assert self.entity.target is third
+
+    def test_get_target(self):
+        '''Test that the nearest entity which isn't known (and can be
+        planned for) is targeted, or none'''
+        third = self.get_entity([20, 0, 0])
+        self.other.persona['agreeableness'] = -100
+        assert self.planner.get_target(self.entity) is third
+
+        self.entity.network[third.id] = {'entity': third, 'value': 1}
+        self.planner.spatial_hash = None
+        assert self.planner.get_target(self.entity) is self.entity
+
+        self.get_entity([Planner.TARGET_RANGE + 1, 0, 0])
+        self.planner.spatial_hash = None
+        assert self.planner.get_target(self.entity) is self.entity
+
+    def test_forget(self):
+        '''Test that forgotten entities lose their plans'''
+        self.planner.step([self.entity])
+        assert self.entity.id in self.planner.plans
+        self.planner.forget(self.entity.id)
+        assert self.entity.id not in self.planner.plans
+        self.planner.forget(self.entity.id)
+
+    def test_server_plans(self):
+        '''Test that the server only follows plans when the plans system is
+        enabled'''
+        server = Server.Server(client=Replay.NullClient(), seed=1)
+        server.step()
+        assert self.entity.target is None
+
+        server = Server.Server(client=Replay.NullClient(), seed=1,
+            systems=['plans'])
+        for tick in xrange(3):
+            server.step()
+        assert self.other.id in self.entity.network
+        assert self.entity.id in self.other.network
+
+"""=============================================================================
+
+RUN TESTS
+
+============================================================================="""
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+"""=============================================================================
+    test_profiling.py
+    ------------
+    Contains tests specific for tick profiling
+============================================================================="""
+"""=============================================================================
+
+IMPORTS / CONSTANTS
+
+============================================================================="""
+import json
+import os
+import tempfile
+import time
+import unittest
+
+import Entity
+import Profiling
+import Replay
+import Server
+
+"""=============================================================================
+
+TESTS
+
+============================================================================="""
+class testProfiling(unittest.TestCase):
+    '''Profiling Test'''
+    def tearDown(self):
+        Entity.Entity.reset_world()
+
+    def test_histogram(self):
+        '''Test the percentiles of a rolling histogram'''
+        histogram = Profiling.RollingHistogram(window=100)
+        assert histogram.get_stats() == {'count': 0}
+
+        for value in xrange(1, 201):
+            histogram.record(float(value))
+        #Only the last 100 values are kept
+        assert len(histogram) == 100
+        stats = histogram.get_stats()
+        assert stats['count'] == 200
+        assert stats['p50'] == 150
+        assert stats['p95'] == 195
+        assert stats['p99'] == 199
+        assert stats['max'] == 200
+        assert stats['mean'] == 150.5
+
+    def test_disabled(self):
+        '''Test that a disabled profiler records nothing'''
+        profiler = Profiling.TickProfiler()
+        profiler.start_tick()
+        profiler.mark('movement')
+        profiler.end_tick()
+        assert profiler.phases == {}
+
+    def test_phases(self):
+        '''Test that phases are timed in the order they're marked'''
+        profiler = Profiling.TickProfiler(enabled=True)
+        for i in xrange(3):
+            profiler.start_tick()
+            profiler.mark('poll')
+            time.sleep(0.01)
+            profiler.mark('movement')
+            profiler.skip()
+            profiler.end_tick()
+
+        stats = profiler.get_stats()
+        assert stats['phase_order'] == ['poll', 'movement']
+        assert stats['phases']['movement']['count'] == 3
+        assert stats['phases']['movement']['p50'] >= 10
+        assert stats['tick']['p50'] >= stats['phases']['movement']['p50']
+
+    def test_sampling(self):
+        '''Test that the sampling profiler finds a busy function'''
+        sampler = Profiling.SamplingProfiler(interval=0.001)
+        def busy_function():
+            end_time = time.time() + 0.1
+            while time.time() < end_time:
+                pass
+        assert sampler.start() == True
+        assert sampler.start() == False
+        busy_function()
+        assert sampler.stop() == True
+        assert sampler.stop() == False
+
+        stats = sampler.get_stats()
+        assert stats['samples'] > 0
+        assert 'busy_function' in [function['function'] for function
+            in stats['total']]
+
+    def test_get_stats(self):
+        '''Test the server's profiling commands'''
+        Entity.Entity.reset_world()
+        handle, path = tempfile.mkstemp(suffix='.log')
+        os.close(handle)
+        replay_log = Replay.ReplayLog(path)
+        server = Server.Server(client=Replay.NullClient(), seed=1,
+            replay_log=replay_log)
+        Entity.Entity()
+
+        server.step()
+        stats = json.loads(server.handle_message('get_stats'))
+        assert stats['entities'] == 1
+        assert stats['timings']['enabled'] == False
+        assert stats['timings']['phases'] == {}
+
+        server.handle_message('enable_profiling')
+        for i in xrange(5):
+            server.profiler.start_tick()
+            server.step()
+            server.profiler.end_tick()
+        stats = json.loads(server.handle_message('get_stats'))
+        assert stats['timings']['tick']['count'] == 5
+        assert 'level_of_detail' in stats['timings']['phases']
+        assert 'json' in stats['timings']['phases']
+        assert 'p99' in stats['timings']['phases']['publish']
+
+        server.handle_message('reset_stats')
+        stats = json.loads(server.handle_message('get_stats'))
+        assert 'tick' not in stats['timings']
+
+        #Profiling commands aren't recorded to the replay log
+        replay_log.close(server.tick)
+        entries = Replay.load(path)
+        os.remove(path)
+        assert [entry for entry in entries if 'command' in entry] == []
+
+"""=============================================================================
+
+RUN TESTS
+
+============================================================================="""
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+"""=============================================================================
+    test_redisio.py
+    ------------
+    Contains tests specific for batched redis I/O
+============================================================================="""
+"""=============================================================================
+
+IMPORTS / CONSTANTS
+
+============================================================================="""
+import unittest
+
+import Entity
+import RedisIO
+import Replay
+import Schema
+import Server
+
+"""=============================================================================
+
+TESTS
+
+============================================================================="""
+class FakePipeline(object):
+    '''Queues commands until execute(), like a redis pipeline'''
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def publish(self, channel, message):
+        self.commands.append(('publish', channel, message))
+
+    def set(self, key, value):
+        self.commands.append(('set', key, value))
+
+    def execute(self):
+        self.redis.round_trips += 1
+        for command in self.commands:
+            self.redis.apply(command)
+        return [True] * len(self.commands)
+
+class FakeRedis(object):
+    '''Stands in for a redis client, counting round trips'''
+    def __init__(self):
+        self.round_trips = 0
+        self.values = {}
+        self.messages = []
+
+    def apply(self, command):
+        if command[0] == 'set':
+            self.values[command[1]] = command[2]
+        else:
+            self.messages.append(command[1:])
+
+    def pipeline(self, transaction=True):
+        assert transaction == False
+        return FakePipeline(self)
+
+    def get(self, key):
+        self.round_trips += 1
+        return self.values.get(key)
+
+class testRedisIO(unittest.TestCase):
+    '''RedisIO Test'''
+    def setUp(self):
+        '''Start the test object. Called on every test_ function'''
+        self.redis = FakeRedis()
+        Entity.Entity.reset_world()
+
+    def tearDown(self):
+        Entity.Entity.reset_world()
+
+    def test_batch(self):
+        '''Test that a batch is sent in one round trip'''
+        batch = RedisIO.Batch(self.redis)
+        for i in xrange(3):
+            batch.publish('engine:game_state', 'message %s' % (i))
+        batch.set('engine:game_state:entities', 'state')
+        assert self.redis.round_trips == 0
+
+        assert batch.flush() == 4
+        assert self.redis.round_trips == 1
+        assert self.redis.messages == [('engine:game_state', 'message %s' % (
+            i)) for i in xrange(3)]
+        assert batch.get('engine:game_state:entities') == 'state'
+        assert batch.flush() == 0
+        assert self.redis.round_trips == 2
+
+        #Big batches are sent early
+        batch.max_pending = 2
+        batch.publish('a', '1')
+        batch.publish('a', '2')
+        assert batch.pending == []
+
+    def test_no_pipeline(self):
+        '''Test clients without pipelines'''
+        batch = RedisIO.Batch(Replay.NullClient())
+        batch.publish('a', '1')
+        batch.set('b', '2')
+        assert batch.flush() == 2
+        assert batch.get('b') is None
+
+    def test_compression(self):
+        '''Test that large stored values are compressed'''
+        batch = RedisIO.Batch(self.redis, compress_threshold=100)
+        value = 'entity ' * 100
+        batch.set('big', value)
+        batch.set('small', 'entity')
+        batch.publish('channel', value)
+        batch.flush()
+
+        assert self.redis.values['big'].startswith(RedisIO.COMPRESSED_PREFIX)
+        assert len(self.redis.values['big']) < len(value)
+        assert batch.get('big') == value
+        assert self.redis.values['small'] == 'entity'
+        #Subscribers get plain messages unless asked for
+        assert self.redis.messages == [('channel', value)]
+
+    def test_background(self):
+        '''Test sending batches from a background thread'''
+        batch = RedisIO.Batch(self.redis, background=True)
+        for tick in xrange(5):
+            batch.publish('engine:game_state', str(tick))
+            batch.set('state', str(tick))
+            batch.flush()
+        batch.wait()
+        assert self.redis.round_trips == 5
+        assert self.redis.values['state'] == '4'
+        batch.publish('engine:game_state', 'last')
+        batch.close()
+        assert batch.thread is None
+        assert self.redis.messages[-1] == ('engine:game_state', 'last')
+
+    def test_server(self):
+        '''Test that a tick's messages go in one round trip'''
+        server = Server.Server(client=self.redis, seed=1)
+        assert isinstance(server.client, RedisIO.Batch)
+        entities = [Entity.Entity() for i in xrange(3)]
+        entities[0].position = [0, 0, 0]
+        server.handle_message('move_to_%s,0,5' % (entities[0].id))
+        server.step()
+        server.step()
+        server.client.set(Server.SNAPSHOT_KEY, Schema.dumps())
+        assert server.flush() > 2
+        assert self.redis.round_trips == 1
+        assert Server.SNAPSHOT_KEY in self.redis.values
+        assert 'engine:game_state:movement' in [message[0] for message
+            in self.redis.messages]
+
+"""=============================================================================
+
+RUN TESTS
+
+============================================================================="""
+if __name__ == '__main__':
+    unittest.main()
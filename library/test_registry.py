@@ -0,0 +1,124 @@
+"""=============================================================================
+    test_registry.py
+    ------------
+    Contains tests specific for the EntityRegistry class
+============================================================================="""
+"""=============================================================================
+
+IMPORTS / CONSTANTS
+
+============================================================================="""
+import cPickle
+import gc
+import unittest
+import weakref
+
+import Entity
+import Registry
+
+"""=============================================================================
+
+TESTS
+
+============================================================================="""
+class testRegistry(unittest.TestCase):
+    '''EntityRegistry Test'''
+    def setUp(self):
+        '''Start the test object. Called on every test_ function'''
+        self.registry = Entity.Entity._registry
+        self.entity_a = Entity.Entity()
+        self.entity_b = Entity.Entity()
+        self.entity_b.position = list(self.entity_a.position)
+
+    def tearDown(self):
+        self.registry.despawn_many([self.entity_a, self.entity_b])
+
+    def test_spawn(self):
+        '''Test that entities get a handle and are in the entities dict'''
+        handle = self.entity_a.handle
+        assert self.registry.get(handle) is self.entity_a
+        assert self.registry.get_handle(self.entity_a.id) == handle
+        assert self.entity_a in self.registry
+        assert Entity.Entity._entities[self.entity_a.id] is self.entity_a
+        #IDs are interned
+        assert intern('%s' % (self.entity_a.id)) is self.entity_a.id
+
+    def test_despawn(self):
+        '''Test that despawning cleans up networks, memories, and targets'''
+        self.entity_a.set_target(self.entity_b)
+        self.entity_a.perform_action('converse', show_log=False)
+        assert self.entity_a.id in self.entity_b.network
+        assert len(self.entity_b.memory) > 0
+
+        handle = self.entity_a.handle
+        entity_id = self.entity_a.id
+        assert self.entity_a.despawn()
+        assert not self.entity_a.despawn()
+
+        assert entity_id not in Entity.Entity._entities
+        assert self.registry.get(handle) is None
+        assert entity_id not in self.entity_b.network
+        assert len(self.entity_b.memory) == 0
+        assert self.entity_a.handle is None
+
+    def test_despawn_target(self):
+        '''Test that targets pointing at despawned entities are cleared'''
+        self.entity_b.set_target(self.entity_a)
+        self.entity_a.despawn()
+        assert self.entity_b.target is None
+
+    def test_slot_reuse(self):
+        '''Test that new entities reuse the slots of despawned entities'''
+        handle = self.entity_a.handle
+        slot_count = len(self.registry.slots)
+        self.entity_a.despawn()
+
+        entity = Entity.Entity()
+        assert Registry.get_handle_index(entity.handle) \
+            == Registry.get_handle_index(handle)
+        assert Registry.get_handle_generation(entity.handle) \
+            == Registry.get_handle_generation(handle) + 1
+        assert len(self.registry.slots) == slot_count
+        entity.despawn()
+
+    def test_stale_handle(self):
+        '''Test that old handles don't find the entity which reused the slot'''
+        handle = self.entity_a.handle
+        self.entity_a.despawn()
+        entity = Entity.Entity()
+
+        assert self.registry.get(handle) is None
+        assert self.registry.resolve(handle) is None
+        assert self.registry.resolve(entity.handle) is entity
+
+        #Stale handles clear targets
+        self.entity_b.set_target(handle)
+        assert self.entity_b.target is None
+        self.entity_b.set_target(entity.handle)
+        assert self.entity_b.target is entity
+        entity.despawn()
+
+    def test_garbage_collected(self):
+        '''Test that nothing keeps a despawned entity alive'''
+        self.entity_a.set_target(self.entity_b)
+        self.entity_a.perform_action('converse', show_log=False)
+
+        entity_ref = weakref.ref(self.entity_a)
+        self.entity_a.despawn()
+        self.entity_a = None
+        gc.collect()
+        assert entity_ref() is None
+
+    def test_pickle(self):
+        '''Test that entities can still be pickled'''
+        entity = cPickle.loads(cPickle.dumps(self.entity_a, 2))
+        assert entity.id == self.entity_a.id
+        assert entity.handle == self.entity_a.handle
+
+"""=============================================================================
+
+RUN TESTS
+
+============================================================================="""
+if __name__ == '__main__':
+    unittest.main()
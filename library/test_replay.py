@@ -0,0 +1,115 @@
+"""=============================================================================
+    test_replay.py
+    ------------
+    Contains tests specific for recording and replaying sessions
+============================================================================="""
+"""=============================================================================
+
+IMPORTS / CONSTANTS
+
+============================================================================="""
+import os
+import tempfile
+import unittest
+
+import Entity
+import Replay
+import Server
+
+"""=============================================================================
+
+TESTS
+
+============================================================================="""
+class testReplay(unittest.TestCase):
+    '''Replay Test'''
+    def setUp(self):
+        '''Start the test object. Called on every test_ function'''
+        handle, self.path = tempfile.mkstemp(suffix='.log')
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+        Entity.Entity.reset_world()
+
+    def record_session(self, seed, count=0, systems=None):
+        '''Runs a short session (starting with count entities, running the
+        passed in systems), returning the info of every entity'''
+        Entity.Entity.reset_world()
+        for i in xrange(count):
+            Entity.Entity()
+        replay_log = Replay.ReplayLog(self.path)
+        server = Server.Server(client=Replay.NullClient(), seed=seed,
+            replay_log=replay_log, systems=systems)
+
+        for tick in xrange(20):
+            server.step()
+            if tick in (1, 2, 3):
+                server.handle_message('create_entity')
+            elif tick == 5:
+                server.handle_message('set_target_0,%s' % (
+                    Entity.Entity._registry.slots[1].handle))
+            elif tick == 6:
+                server.handle_message('converse_0')
+            elif tick == 8:
+                server.handle_message('get_game_state')
+            server.tick += 1
+        replay_log.close(server.tick)
+
+        return sorted([entity.get_info_json() for entity
+            in Entity.Entity._entities.itervalues()])
+
+    def test_replay(self):
+        '''Test that replaying a session ends with the same world'''
+        recorded = self.record_session(seed=1234)
+
+        replayer = Replay.Replayer(self.path)
+        results = replayer.run()
+        assert results['ticks'] == 20
+        assert results['commands'] == 6
+        assert results['mismatches'] == 0
+        assert sorted([entity.get_info_json() for entity
+            in Entity.Entity._entities.itervalues()]) == recorded
+
+    def test_starting_world(self):
+        '''Test that a session which didn't start from an empty world is
+        replayed from the world it started from'''
+        recorded = self.record_session(seed=1234, count=4)
+        assert len(recorded) == 7
+
+        results = Replay.Replayer(self.path).run()
+        assert results['mismatches'] == 0
+        assert sorted([entity.get_info_json() for entity
+            in Entity.Entity._entities.itervalues()]) == recorded
+
+    def test_seed(self):
+        '''Test that sessions with different seeds are different'''
+        recorded = self.record_session(seed=1)
+        assert self.record_session(seed=2) != recorded
+        assert self.record_session(seed=1) == recorded
+
+    def test_systems(self):
+        '''Test that sessions are replayed with the systems they ran'''
+        recorded = self.record_session(seed=1234, count=4,
+            systems=('movement', 'conversation'))
+        assert recorded != self.record_session(seed=1234, count=4)
+        self.record_session(seed=1234, count=4,
+            systems=('movement', 'conversation'))
+
+        replayer = Replay.Replayer(self.path)
+        assert replayer.run()['mismatches'] == 0
+        assert replayer.server.get_systems() == ['movement',
+            'conversation']
+        assert sorted([entity.get_info_json() for entity
+            in Entity.Entity._entities.itervalues()]) == recorded
+
+        self.assertRaises(ValueError, replayer.server.set_systems,
+            ['flying'])
+
+"""=============================================================================
+
+RUN TESTS
+
+============================================================================="""
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+"""=============================================================================
+    test_schema.py
+    ------------
+    Contains tests specific for the versioned world schema
+============================================================================="""
+"""=============================================================================
+
+IMPORTS / CONSTANTS
+
+============================================================================="""
+import unittest
+
+import Action
+import Entity
+import Replay
+import Schema
+import Server
+
+"""=============================================================================
+
+TESTS
+
+============================================================================="""
+class DictClient(Replay.NullClient):
+    '''Stores values, like redis'''
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value):
+        self.values[key] = value
+        return True
+
+class testSchema(unittest.TestCase):
+    '''Schema Test'''
+    def setUp(self):
+        '''Start the test object. Called on every test_ function'''
+        Entity.Entity.reset_world()
+
+    def tearDown(self):
+        Entity.Entity.reset_world()
+
+    def create_world(self, count=10):
+        '''Creates entities which know each other and remember talking'''
+        entities = [Entity.Entity() for i in xrange(count)]
+        for entity, other in zip(entities[::2], entities[1::2]):
+            other.position = list(entity.position)
+            entity.perform_action('converse', other, show_log=False)
+            entity.target = other
+        return entities
+
+    def get_world(self):
+        '''Returns the state of every entity.  Entities get new handles when
+        a document is loaded, so handles are left out'''
+        world = []
+        for entity in Entity.Entity._entities.itervalues():
+            world.append((
+                entity.id,
+                entity.name,
+                entity.gender,
+                entity.race.name,
+                list(entity.position),
+                entity.money,
+                sorted(entity.persona.items()),
+                sorted(entity.stats.items()),
+                sorted(entity.goals.items()),
+                sorted((target_id, entity.network[target_id]['value'],
+                    entity.network[target_id]['entity'].id)
+                    for target_id in entity.network),
+                entity.target and entity.target.id,
+                [(action.source.id, action.target.id, action.values,
+                    action.string_repr) for action in entity.memory],
+            ))
+        return sorted(world)
+
+    def test_round_trip(self):
+        '''Test that loading a document gives back the same world'''
+        entities = self.create_world()
+        world = self.get_world()
+        data = Schema.dumps(tick=12, seed=3)
+        assert Schema.is_document(data)
+
+        Entity.Entity.reset_world()
+        header = Schema.loads(data)
+        assert header == {'version': Schema.SCHEMA_VERSION, 'tick': 12,
+            'seed': 3, 'created_count': 10}
+        assert self.get_world() == world
+
+        #Shared objects are still shared
+        source = Entity.Entity._entities[entities[0].id]
+        target = Entity.Entity._entities[entities[1].id]
+        assert source.memory[0] is target.memory[0]
+        assert source.memory[0].definition is Action.Action._ACTIONS[
+            'converse']
+        assert source.target is target
+        assert source.race is target.race
+
+    def test_references(self):
+        '''Test storing targets and actions which aren't registered'''
+        first, second = Entity.Entity(), Entity.Entity()
+        first.target = (4, 5, 0)
+        second.target = [first]
+        action = Action.Action(source=first, target=second,
+            effects=[{'target': second, 'money': 5}],
+            string_repr='Paid', values={'payer': first})
+        first.memory.append(action)
+
+        Schema.loads(Schema.dumps())
+        first = Entity.Entity._entities[first.id]
+        second = Entity.Entity._entities[second.id]
+        assert first.target == (4, 5, 0)
+        assert second.target == [first]
+        action = first.memory[0]
+        assert action.definition is None
+        assert action.string_repr == 'Paid'
+        assert action.effects == [{'target': second, 'money': 5}]
+        assert action.values == {'payer': first}
+
+    def test_fields(self):
+        '''Test that missing fields get defaults, and unknown ones are
+        ignored'''
+        entity = Entity.Entity()
+        document = Schema.get_document()
+        fields = document['entity_fields']
+        mood = fields.index('mood')
+        del fields[mood]
+        fields.append('reputation')
+        document['entities'] = [values[:mood] + values[mood + 1:] + (9,)
+            for values in document['entities']]
+
+        Schema.loads(Schema.encode(document))
+        entity = Entity.Entity._entities[entity.id]
+        assert entity.mood == {}
+        assert entity.name == document['entities'][0][1]
+
+    def test_migration(self):
+        '''Test that old documents are migrated, and newer ones refused'''
+        Entity.Entity()
+        document = Schema.get_document()
+        document['version'] = 0
+        document['entity_fields'][0] = 'key'
+
+        self.assertRaises(Schema.SchemaError, Schema.decode,
+            Schema.encode(document))
+
+        @Schema.register_migration(0)
+        def rename_key(document):
+            document['entity_fields'][0] = 'id'
+            return document
+        try:
+            self.assertRaises(Schema.SchemaError, Schema.register_migration(0),
+                rename_key)
+            migrated = Schema.decode(Schema.encode(document))
+            assert migrated['version'] == Schema.SCHEMA_VERSION
+            assert migrated['entity_fields'][0] == 'id'
+        finally:
+            del Schema.MIGRATIONS[0]
+
+        document['version'] = Schema.SCHEMA_VERSION + 1
+        self.assertRaises(Schema.SchemaError, Schema.decode,
+            Schema.encode(document))
+        self.assertRaises(Schema.SchemaError, Schema.decode, 'not a world')
+        self.assertRaises(Schema.SchemaError, Schema.decode,
+            Schema.MAGIC + '\x00\x01garbage')
+
+    def test_server(self):
+        '''Test that the server stores its game state and restores it'''
+        client = DictClient()
+        server = Server.Server(client=client, seed=1)
+        self.create_world(count=4)
+        world = self.get_world()
+        size = server.save_snapshot()
+        server.flush()
+        assert size == len(client.get(Server.SNAPSHOT_KEY))
+
+        Entity.Entity.reset_world()
+        server.step()
+        assert self.get_world() == world
+
+        #Game states which can't be decoded are skipped
+        Entity.Entity.reset_world()
+        client.set(Server.SNAPSHOT_KEY, 'an old pickle')
+        assert server.restore() == False
+        assert len(Entity.Entity._entities) == 0
+
+        #Servers which save the world elsewhere don't store it by default
+        assert server.snapshot_interval == Server.DEFAULT_SNAPSHOT_INTERVAL
+        assert Server.Server(client=client,
+            checkpoint_path='checkpoints').snapshot_interval == 0
+
+"""=============================================================================
+
+RUN TESTS
+
+============================================================================="""
+if __name__ == '__main__':
+    unittest.main()
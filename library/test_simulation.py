@@ -0,0 +1,117 @@
+"""=============================================================================
+    test_simulation.py
+    ------------
+    Contains tests specific for the headless simulation
+============================================================================="""
+"""=============================================================================
+
+IMPORTS / CONSTANTS
+
+============================================================================="""
+import os
+import tempfile
+import unittest
+
+import Entity
+import Simulation
+
+"""=============================================================================
+
+TESTS
+
+============================================================================="""
+class testSimulation(unittest.TestCase):
+    '''Simulation Test'''
+    def setUp(self):
+        '''Start the test object. Called on every test_ function'''
+        handle, self.path = tempfile.mkstemp(suffix='.ckpt')
+        os.close(handle)
+        Entity.Entity.reset_world()
+
+    def tearDown(self):
+        os.remove(self.path)
+        Entity.Entity.reset_world()
+
+    def get_world(self):
+        '''Returns the state of every entity.  Entities get new handles when
+        a checkpoint is loaded, so handles are left out'''
+        world = []
+        for entity in Entity.Entity._entities.itervalues():
+            world.append((
+                entity.id,
+                entity.name,
+                list(entity.position),
+                entity.money,
+                sorted(entity.persona.items()),
+                sorted(entity.goals.items()),
+                sorted((target_id, entity.network[target_id]['value'])
+                    for target_id in entity.network),
+            ))
+        return sorted(world)
+
+    def run_simulation(self, seed, ticks=20, **kwargs):
+        '''Creates a few entities and runs a short simulation'''
+        Entity.Entity.reset_world()
+        simulation = Simulation.Simulation(seed=seed, **kwargs)
+        for i in xrange(10):
+            Entity.Entity()
+        results = simulation.run(ticks)
+        return simulation, results
+
+    def test_run(self):
+        '''Test that run simulates the requested number of ticks'''
+        simulation, results = self.run_simulation(seed=1)
+        assert simulation.tick == 20
+        assert results['ticks'] == 20
+        assert results['entities'] == 10
+        assert results['checkpoints'] == 0
+        assert results['ticks_per_second'] > 0
+
+    def test_seed(self):
+        '''Test that the same seed gives the same world'''
+        self.run_simulation(seed=1)
+        world = self.get_world()
+        self.run_simulation(seed=1)
+        assert self.get_world() == world
+        self.run_simulation(seed=2)
+        assert self.get_world() != world
+
+    def test_systems(self):
+        '''Test adding, finding and disabling systems'''
+        simulation = Simulation.Simulation(systems=['movement'], seed=1)
+        assert simulation.get_system('movement') is not None
+        assert simulation.get_system('decay') is None
+        simulation.add_system('decay')
+        assert simulation.get_system('decay') is not None
+        self.assertRaises(ValueError, simulation.add_system, 'not_a_system')
+
+        entity = Entity.Entity()
+        position = list(entity.position)
+        simulation.get_system('movement').enabled = False
+        simulation.step()
+        assert entity.position == position
+
+    def test_checkpoint(self):
+        '''Test that a checkpoint restores the world and can be resumed'''
+        simulation, results = self.run_simulation(seed=3, ticks=10,
+            checkpoint_path=self.path, checkpoint_interval=5)
+        assert results['checkpoints'] == 2
+        world = self.get_world()
+
+        Entity.Entity.reset_world()
+        resumed = Simulation.Simulation.from_checkpoint(self.path)
+        assert resumed.tick == 10
+        assert self.get_world() == world
+
+        resumed.run(5)
+        after = self.get_world()
+        Simulation.Simulation.from_checkpoint(self.path).run(5)
+        assert self.get_world() == after
+
+"""=============================================================================
+
+RUN TESTS
+
+============================================================================="""
+if __name__ == '__main__':
+    unittest.main()
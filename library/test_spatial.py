@@ -0,0 +1,111 @@
+"""=============================================================================
+    test_spatial.py
+    ------------
+    Contains tests specific for the SpatialHash class
+============================================================================="""
+"""=============================================================================
+
+IMPORTS / CONSTANTS
+
+============================================================================="""
+import itertools
+import math
+import random
+import unittest
+
+import Spatial
+
+"""=============================================================================
+
+TESTS
+
+============================================================================="""
+class testSpatialHash(unittest.TestCase):
+    '''SpatialHash Test'''
+    def setUp(self):
+        '''Start the test object. Called on every test_ function'''
+        self.spatial_hash = Spatial.SpatialHash(cell_size=3)
+
+    def test_insert_remove(self):
+        '''Test that keys can be added, moved, and removed'''
+        self.spatial_hash.insert('a', [1, 1, 0])
+        self.spatial_hash.insert('b', [10, 10, 0])
+        assert len(self.spatial_hash) == 2
+        assert 'a' in self.spatial_hash
+
+        self.spatial_hash.update('a', [9, 9, 0])
+        assert self.spatial_hash.key_cells['a'] == (3, 3)
+        #Old cell should be cleaned up
+        assert (0, 0) not in self.spatial_hash.cells
+
+        assert self.spatial_hash.remove('a') == True
+        assert self.spatial_hash.remove('a') == False
+        assert len(self.spatial_hash) == 1
+
+    def test_query_radius(self):
+        '''Test that query_radius finds keys in range, closest first'''
+        self.spatial_hash.insert('a', [0, 0, 0])
+        self.spatial_hash.insert('b', [2, 0, 0])
+        self.spatial_hash.insert('c', [0, 7, 0])
+
+        found = self.spatial_hash.query_radius([0, 0], 3)
+        assert [item[0] for item in found] == ['a', 'b']
+
+        found = self.spatial_hash.query_radius([0, 0], 7)
+        assert [item[0] for item in found] == ['a', 'b', 'c']
+
+    def test_query_rect(self):
+        '''Test that query_rect finds the keys inside a rectangle, whether
+        it covers fewer cells than are occupied or more'''
+        random.seed(7)
+        positions = {}
+        for i in range(200):
+            positions[i] = (random.uniform(-30, 30), random.uniform(-30, 30))
+            self.spatial_hash.insert(i, positions[i])
+
+        for min_position, max_position in (
+            ((-2, -2), (2, 2)),
+            ((-10, 0), (10, 6)),
+            ((-100, -100), (100, 100))):
+            expected = set([key for key in positions
+                if min_position[0] <= positions[key][0] <= max_position[0]
+                and min_position[1] <= positions[key][1] <= max_position[1]])
+            found = self.spatial_hash.query_rect(min_position, max_position)
+            assert len(found) == len(expected)
+            assert set(found) == expected
+
+    def test_get_pairs_matches_brute_force(self):
+        '''Test that get_pairs returns the same pairs as checking every
+        pair of keys'''
+        random.seed(42)
+        positions = {}
+        for i in range(200):
+            positions[i] = (random.uniform(-30, 30), random.uniform(-30, 30))
+            self.spatial_hash.insert(i, positions[i])
+
+        for radius in (3, 5, 10):
+            expected = set()
+            for key_a, key_b in itertools.combinations(positions, 2):
+                dist = math.sqrt(
+                    (positions[key_a][0] - positions[key_b][0]) ** 2
+                    + (positions[key_a][1] - positions[key_b][1]) ** 2)
+                if dist <= radius:
+                    expected.add(frozenset((key_a, key_b)))
+
+            pairs = self.spatial_hash.get_pairs(radius)
+            found = set([frozenset((pair[0], pair[1])) for pair in pairs])
+            #Each pair should only be returned once
+            assert len(pairs) == len(found)
+            assert found == expected
+
+    def tearDown(self):
+        '''Done with test'''
+        self.spatial_hash = None
+
+"""=============================================================================
+
+RUN TESTS
+
+============================================================================="""
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""=============================================================================
+    test_utility.py
+    ------------
+    Contains tests specific for the UtilityPlanner class
+============================================================================="""
+"""=============================================================================
+
+IMPORTS / CONSTANTS
+
+============================================================================="""
+import random
+import unittest
+
+import Entity
+import Replay
+import Server
+import Utility
+
+"""=============================================================================
+
+TESTS
+
+============================================================================="""
+class testUtilityPlanner(unittest.TestCase):
+    '''UtilityPlanner Test'''
+    def setUp(self):
+        '''Start the test object. Called on every test_ function'''
+        Entity.Entity.reset_world()
+        random.seed(1)
+        self.planner = Utility.UtilityPlanner()
+        self.entity, self.other = Entity.Entity(), Entity.Entity()
+        self.other.position = list(self.entity.position)
+        self.entity.target = self.other
+
+    def tearDown(self):
+        Entity.Entity.reset_world()
+
+    def test_goals_changed_in_place(self):
+        '''Test that cached scores are thrown away when the entity's goals
+        change, even if it's the same dict'''
+        goals = self.entity.goals
+        goals.clear()
+        goals['friendship'] = {'priority': 100}
+        assert self.planner.get_goal_scores(self.entity).keys() == [
+            'converse']
+        assert self.planner.choose_action(self.entity) == 'converse'
+
+        goals['friendship']['priority'] = 0
+        goals['wealth'] = {'priority': 100}
+        assert self.planner.get_goal_scores(self.entity)['move'] > 0
+        self.entity.target = [1000, 1000, 0]
+        assert self.planner.choose_action(self.entity) == 'move'
+
+    def test_target(self):
+        '''Test that actions are scored against the target passed in, not
+        the entity's target'''
+        self.entity.goals.clear()
+        self.entity.goals['friendship'] = {'priority': 100}
+        self.entity.target = None
+        assert self.planner.choose_action(self.entity) is None
+        assert self.planner.choose_action(self.entity,
+            self.other) == 'converse'
+        assert self.entity.get_action(target=self.other) != False
+        #The entity's own decision is still cached for its own target
+        assert self.planner.choose_action(self.entity) is None
+
+    def test_decide_all(self):
+        '''Test that every entity gets a decision, which is only kept
+        while its inputs don't change'''
+        self.entity.goals.clear()
+        self.entity.goals['friendship'] = {'priority': 100}
+        self.other.goals.clear()
+        decisions = self.planner.decide_all(Entity.Entity._entities)
+        assert decisions == {self.entity.id: 'converse',
+            self.other.id: None}
+        assert self.planner.decide_all([self.entity]) == {
+            self.entity.id: 'converse'}
+
+        self.entity.target = None
+        assert self.planner.decide_all([self.entity]) == {
+            self.entity.id: None}
+
+    def test_server_actions(self):
+        '''Test that the server only performs the utility planner's
+        decisions when the actions system is enabled'''
+        self.entity.goals.clear()
+        self.entity.goals['friendship'] = {'priority': 100}
+        self.other.goals.clear()
+
+        server = Server.Server(client=Replay.NullClient(), seed=1)
+        server.step()
+        assert self.other.id not in self.entity.network
+
+        server = Server.Server(client=Replay.NullClient(), seed=1,
+            systems=['actions'])
+        server.step()
+        assert self.other.id in self.entity.network
+
+"""=============================================================================
+
+RUN TESTS
+
+============================================================================="""
+if __name__ == '__main__':
+    unittest.main()
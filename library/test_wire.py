@@ -0,0 +1,217 @@
+"""=============================================================================
+    test_wire.py
+    ------------
+    Contains tests specific for the binary wire format
+============================================================================="""
+"""=============================================================================
+
+IMPORTS / CONSTANTS
+
+============================================================================="""
+import random
+import unittest
+
+import Entity
+import Interest
+import Schema
+import Server
+import Wire
+from test_interest import RecordingClient
+
+"""=============================================================================
+
+TESTS
+
+============================================================================="""
+class testWire(unittest.TestCase):
+    '''Wire Test'''
+    def setUp(self):
+        '''Start the test object. Called on every test_ function'''
+        Entity.Entity.reset_world()
+        random.seed(3)
+        self.entities = [Entity.Entity() for i in xrange(6)]
+        for entity, other in zip(self.entities[::2], self.entities[1::2]):
+            other.position = list(entity.position)
+            entity.perform_action('converse', other, show_log=False)
+            entity.target = other
+        self.encoder = Wire.Encoder()
+        self.decoder = Wire.Decoder()
+
+    def tearDown(self):
+        Entity.Entity.reset_world()
+
+    def assert_decoded(self):
+        '''Asserts the decoder has the same state as every entity'''
+        assert sorted(self.decoder.entities) == sorted(
+            [entity.handle for entity in Entity.Entity._entities.values()])
+        for entity in Entity.Entity._entities.itervalues():
+            info = self.decoder.get_entity(entity.handle)
+            assert info['id'] == entity.id
+            assert info['name'] == entity.name
+            assert info['gender'] == entity.gender[1]
+            assert info['position'] == entity.position
+            assert info['money'] == entity.money
+            assert info['stats'] == entity.stats
+            assert info['persona'] == entity.persona
+            assert sorted(info['goals']) == sorted(entity.goals)
+            for goal in entity.goals:
+                assert abs(info['goals'][goal]
+                    - entity.goals[goal]['priority']) < 1e-4
+            assert info['network'] == dict([(other_id,
+                entity.network[other_id]['value'])
+                for other_id in entity.network])
+            assert info['target'] == (entity.target and entity.target.id)
+
+    def test_varints(self):
+        '''Test that varints and zigzag varints round trip'''
+        for value in (0, 1, 127, 128, 300, 16383, 16384, 2 ** 40):
+            data = Wire.encode_varint(value)
+            assert Wire.decode_varint(data, 0) == (value, len(data))
+        for value in (0, -1, 1, -64, 64, -100000):
+            data = Wire.encode_zigzag(value)
+            assert Wire.decode_zigzag(data, 0) == (value, len(data))
+        assert len(Wire.encode_zigzag(-1)) == 1
+
+    def test_round_trip(self):
+        '''Test that a keyframe, then updates, give the decoder the same
+        state as the entities'''
+        assert self.decoder.decode(self.encoder.encode(
+            Entity.Entity._entities, 0)) is not None
+        self.assert_decoded()
+
+        #Move an entity, change a network value, targets, and a stat
+        first, second = self.entities[0], self.entities[1]
+        first.position[0] += 2
+        first.network[second.id]['value'] += 7
+        first.target = None
+        second.target = self.entities[5]
+        self.entities[4].stats['strength'] += 1
+        data = self.encoder.encode(Entity.Entity._entities, 1)
+        updated = self.decoder.decode(data)
+        assert sorted(updated) == sorted([first.handle, second.handle,
+            self.entities[4].handle])
+        self.assert_decoded()
+
+        #Nothing changed, so nothing is sent
+        assert self.decoder.decode(self.encoder.encode(
+            Entity.Entity._entities, 2)) == []
+
+    def test_update_is_smaller(self):
+        '''Test that updates are much smaller than keyframes and the JSON'''
+        keyframe = self.encoder.encode(Entity.Entity._entities, 0)
+        self.entities[0].position[1] += 1
+        update = self.encoder.encode(Entity.Entity._entities, 1)
+        assert len(update) * 5 < len(keyframe)
+
+        entities_json = ','.join([entity.get_info_json()[1:-1]
+            for entity in self.entities])
+        assert len(keyframe) * 3 < len(entities_json)
+
+    def test_despawn(self):
+        '''Test that despawned entities are removed, and new entities are
+        sent with their ID'''
+        self.decoder.decode(self.encoder.encode(Entity.Entity._entities, 0))
+        self.entities[1].despawn()
+        Entity.Entity()
+        self.decoder.decode(self.encoder.encode(Entity.Entity._entities, 1))
+        assert self.entities[1].handle not in self.decoder.entities
+        self.assert_decoded()
+
+    def test_keyframes(self):
+        '''Test that updates before the first keyframe are skipped, and that
+        keyframes reset the decoder'''
+        self.encoder.keyframe_interval = 10
+        self.encoder.encode(Entity.Entity._entities, 0)
+        self.entities[0].position[0] += 1
+        assert self.decoder.decode(self.encoder.encode(
+            Entity.Entity._entities, 1)) is None
+
+        #Keyframe with only some of the entities
+        assert self.encoder.is_keyframe_due(10)
+        data = self.encoder.encode(self.entities[:2], 10)
+        self.decoder.decode(data)
+        assert sorted(self.decoder.entities) == sorted(
+            [entity.handle for entity in self.entities[:2]])
+
+        #The rest are sent in full the next time they're passed in
+        self.decoder.decode(self.encoder.encode(Entity.Entity._entities, 11))
+        self.assert_decoded()
+
+    def test_errors(self):
+        '''Test that updates which can't be decoded raise a WireError'''
+        data = self.encoder.encode(Entity.Entity._entities, 0)
+        self.assertRaises(Wire.WireError, self.decoder.decode, 'nope')
+        self.assertRaises(Wire.WireError, self.decoder.decode,
+            'XYZ' + data[3:])
+        self.assertRaises(Wire.WireError, self.decoder.decode,
+            Wire.HEADER.pack(Wire.MAGIC, Wire.WIRE_VERSION + 1, 0, 0))
+        self.assertRaises(Wire.WireError, self.decoder.decode,
+            data[:len(data) // 2])
+        #Waits for the next keyframe
+        assert self.decoder.ready == False
+        assert Wire.is_update(data)
+        assert not Wire.is_update('({game_state: { entities: [] } })')
+
+class testServerWire(unittest.TestCase):
+    '''Server binary updates Test'''
+    def setUp(self):
+        '''Start the test object. Called on every test_ function'''
+        Entity.Entity.reset_world()
+        random.seed(1)
+        self.client = RecordingClient()
+        self.server = Server.Server(client=self.client, seed=1,
+            wire_format=Wire.FORMAT_BINARY)
+        self.near = Entity.Entity()
+        self.near.position = [1, 1, 0]
+        self.far = Entity.Entity()
+        self.far.position = [80, 80, 0]
+
+    def tearDown(self):
+        Entity.Entity.reset_world()
+
+    def step(self):
+        del self.client.messages[:]
+        self.server.step()
+        self.server.flush()
+        return dict(self.client.messages)
+
+    def test_broadcast(self):
+        '''Test that the broadcast is a binary update stream'''
+        decoder = Wire.Decoder()
+        decoder.decode(self.step()['engine:game_state'])
+        assert sorted(decoder.entities) == sorted([self.near.handle,
+            self.far.handle])
+
+        self.far.position[0] += 1
+        assert decoder.decode(self.step()['engine:game_state']) == [
+            self.far.handle]
+        assert decoder.get_entity(self.far.handle)['position'] == [81, 80, 0]
+
+        self.assertRaises(ValueError, Server.Server,
+            client=self.client, wire_format='xml')
+
+    def test_subscribers(self):
+        '''Test that each subscribed client gets its own binary stream'''
+        self.server.handle_message('subscribe_viewport_clientA,0,0,10,10')
+        decoder = Wire.Decoder()
+        channel = Interest.get_channel('clientA')
+        decoder.decode(self.step()[channel])
+        assert decoder.entities.keys() == [self.near.handle]
+
+        #A client which subscribes later gets a keyframe
+        self.server.handle_message('subscribe_entities_clientB,%s' % (
+            self.far.id))
+        messages = self.step()
+        later_decoder = Wire.Decoder()
+        assert later_decoder.decode(messages[Interest.get_channel(
+            'clientB')]) == [self.far.handle]
+        #Nothing changed for clientA
+        assert decoder.decode(messages[channel]) == []
+
+"""=============================================================================
+
+RUN TESTS
+
+============================================================================="""
+if __name__ == '__main__':
+    unittest.main()
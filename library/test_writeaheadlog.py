@@ -0,0 +1,204 @@
+"""=============================================================================
+    test_writeaheadlog.py
+    ------------
+    Contains tests specific for the write-ahead log
+============================================================================="""
+"""=============================================================================
+
+IMPORTS / CONSTANTS
+
+============================================================================="""
+import os
+import shutil
+import tempfile
+import unittest
+
+import Entity
+import Replay
+import Schema
+import Server
+import WriteAheadLog
+from test_schema import DictClient
+
+"""=============================================================================
+
+TESTS
+
+============================================================================="""
+class testWriteAheadLog(unittest.TestCase):
+    '''WriteAheadLog Test'''
+    def setUp(self):
+        '''Start the test object. Called on every test_ function'''
+        self.path = tempfile.mkdtemp()
+        Entity.Entity.reset_world()
+        self.log = self.open_log()
+
+    def tearDown(self):
+        self.log.close()
+        shutil.rmtree(self.path)
+        Entity.Entity.reset_world()
+
+    def open_log(self):
+        '''Recovers the world from the log and starts logging again'''
+        log = WriteAheadLog.WriteAheadLog(self.path, sync=False)
+        self.results = log.recover()
+        log.attach()
+        return log
+
+    def reopen_log(self):
+        '''Simulates a restart: the world is lost, then recovered'''
+        self.log.close()
+        Entity.Entity.reset_world()
+        self.log = self.open_log()
+
+    def create_world(self, count=6):
+        '''Creates entities which know each other and remember talking'''
+        entities = [Entity.Entity() for i in xrange(count)]
+        for entity, other in zip(entities[::2], entities[1::2]):
+            #Moves made outside of actions have to be logged
+            other.position = list(entity.position)
+            self.log.record_positions([other.id])
+            entity.perform_action('converse', other, show_log=False)
+            entity.set_target(other)
+        return entities
+
+    def test_recover(self):
+        '''Test that replaying the log gives back the same world'''
+        entities = self.create_world()
+        entities[2].despawn()
+        entities[1].position = [40, 41, 0]
+        self.log.record_positions([entities[1].id])
+        self.log.commit(tick=3)
+        world = Schema.get_document()
+
+        self.reopen_log()
+        assert self.results['tick'] == 3
+        assert self.results['checkpoint'] is None
+        assert Schema.get_document() == world
+        assert entities[2].id not in Entity.Entity._entities
+
+        #New entities carry on from the recovered count
+        assert Entity.Entity().id.startswith('entity_6_')
+
+    def test_group_commit(self):
+        '''Test that records are only written when they're committed'''
+        segment = self.log.get_segment_path(self.log.generation)
+        size = os.path.getsize(segment)
+        self.create_world()
+        assert os.path.getsize(segment) == size
+        assert self.log.commit() > 0
+        assert os.path.getsize(segment) > size
+        assert self.log.commit() == 0
+
+        #Big batches are committed early
+        self.log.batch_bytes = 1
+        Entity.Entity()
+        assert self.log.pending == []
+
+        #Uncommitted changes are lost
+        self.log.batch_bytes = WriteAheadLog.DEFAULT_BATCH_BYTES
+        committed = Schema.get_document()
+        Entity.Entity()
+        self.log.pending = []
+        self.reopen_log()
+        assert Schema.get_document() == committed
+
+    def test_compact(self):
+        '''Test that compaction replaces the old log with a checkpoint'''
+        entities = self.create_world()
+        assert self.log.compact(tick=10, seed=5) == True
+        self.log.wait()
+        entities[0].perform_action('converse', entities[1], show_log=False)
+        self.log.commit(tick=11)
+        world = Schema.get_document()
+        assert sorted(os.listdir(self.path)) == ['checkpoint.1', 'log.1']
+
+        self.reopen_log()
+        assert self.results['checkpoint'] == 1
+        assert self.results['tick'] == 11
+        assert self.results['seed'] == 5
+        assert Schema.get_document() == world
+
+    def test_torn_record(self):
+        '''Test that a record torn by a crash is cut off'''
+        self.create_world()
+        self.log.commit(tick=1)
+        world = Schema.get_document()
+        segment = self.log.get_segment_path(self.log.generation)
+        size = os.path.getsize(segment)
+        self.log.close()
+
+        with open(segment, 'ab') as segment_file:
+            segment_file.write('\x00\x00\x01\x00torn')
+        Entity.Entity.reset_world()
+        self.log = self.open_log()
+        assert Schema.get_document() == world
+        assert os.path.getsize(segment) == size
+
+        #Only the end of the last segment can be torn
+        self.assertRaises(WriteAheadLog.CorruptLogError, list,
+            WriteAheadLog.read_segment(__file__))
+
+    def test_server(self):
+        '''Test that the server's changes are logged'''
+        server = Server.Server(client=Replay.NullClient(), seed=1,
+            wal=self.log)
+        server.handle_message('create_entity')
+        server.handle_message('create_entity')
+        first, second = sorted(Entity.Entity._entities)
+        server.handle_message('set_target_%s,%s' % (first, second))
+        self.log.commit(tick=2)
+        world = Schema.get_document()
+
+        self.reopen_log()
+        assert Schema.get_document() == world
+        assert Entity.Entity._entities[first].target.id == second
+
+    def test_coarse_updates(self):
+        '''Test that coarse level of detail updates are logged'''
+        self.create_world()
+        data = Schema.dumps()
+        server = Server.Server(client=Replay.NullClient(), seed=1,
+            wal=self.log)
+        server.handle_message('set_observer_clientA,1000,1000')
+        for tick in xrange(server.level_of_detail.coarse_interval):
+            server.step()
+            server.tick += 1
+        self.log.commit(tick=server.tick)
+        assert Schema.dumps() != data
+        world = Schema.get_document()
+
+        self.reopen_log()
+        assert Schema.get_document() == world
+
+    def test_server_restore(self):
+        '''Test that a world the server restores from redis is logged'''
+        self.create_world(count=4)
+        first, second = sorted(Entity.Entity._entities)[:2]
+        client = DictClient()
+        client.set(Server.SNAPSHOT_KEY, Schema.dumps())
+
+        #Start over with an empty world and an empty log
+        self.log.close()
+        shutil.rmtree(self.path)
+        os.mkdir(self.path)
+        Entity.Entity.reset_world()
+        self.log = self.open_log()
+
+        server = Server.Server(client=client, seed=1, wal=self.log)
+        server.step()
+        server.handle_message('set_target_%s,%s' % (first, second))
+        server.handle_message('converse_%s' % (first))
+        self.log.commit(tick=1)
+        world = Schema.get_document()
+
+        self.reopen_log()
+        assert Schema.get_document() == world
+
+"""=============================================================================
+
+RUN TESTS
+
+============================================================================="""
+if __name__ == '__main__':
+    unittest.main()